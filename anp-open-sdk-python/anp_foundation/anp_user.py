@@ -215,10 +215,16 @@ class ANPUser:
             logger.error(error_msg)
             return False, "", error_msg
 
-    async def check_hosted_did_results(self) -> Tuple[bool, List[Dict[str, Any]], str]:
+    async def check_hosted_did_results(self, wait: float = 0) -> Tuple[bool, List[Dict[str, Any]], str]:
         """
         检查托管DID处理结果（第二步：检查结果）
         
+        并发检查所有托管服务；wait > 0 时使用服务端长轮询，
+        任一服务返回结果后即结束本轮，其余服务的结果留给下一轮
+        
+        Args:
+            wait: 长轮询等待秒数，0 表示立即返回
+            
         Returns:
             tuple: (是否成功, 结果列表, 错误信息)
         """
@@ -244,23 +250,43 @@ class ANPUser:
             ]
             
             import httpx
-            for target_host, target_port in target_services:
+
+            async def check_service(client, target_host: str, target_port: int) -> List[Dict[str, Any]]:
                 try:
                     check_url = f"http://{target_host}:{target_port}/wba/hosted-did/check/{requester_id}"
+                    response = await client.get(check_url, params={"wait": wait} if wait > 0 else None,
+                                                timeout=10.0 + wait)
                     
-                    async with httpx.AsyncClient() as client:
-                        response = await client.get(check_url, timeout=10.0)
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            if result.get('success') and result.get('results'):
-                                for res in result['results']:
-                                    res['source_host'] = target_host
-                                    res['source_port'] = target_port
-                                all_results.extend(result['results'])
+                    if response.status_code == 200:
+                        result = response.json()
+                        if result.get('success') and result.get('results'):
+                            for res in result['results']:
+                                res['source_host'] = target_host
+                                res['source_port'] = target_port
+                            return result['results']
                         
                 except Exception as e:
                     logger.warning(f"检查托管服务 {target_host}:{target_port} 失败: {e}")
+                return []
+
+            # 长轮询时任一服务返回结果即可结束本轮；立即检查时收集所有服务的结果
+            async with httpx.AsyncClient() as client:
+                pending = {
+                    asyncio.create_task(check_service(client, target_host, target_port))
+                    for target_host, target_port in target_services
+                }
+                try:
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            all_results.extend(task.result())
+                        if all_results and wait > 0:
+                            break
+                finally:
+                    for task in pending:
+                        task.cancel()
+                    if pending:
+                        await asyncio.gather(*pending, return_exceptions=True)
             
             return True, all_results, ""
             
@@ -275,8 +301,10 @@ class ANPUser:
         
         使用现有的create_hosted_did方法保存到本地
         在anp_users/下创建user_hosted_{host}_{port}_{id}/目录
+        已保存的结果按托管服务分组批量确认
         """
         processed_count = 0
+        to_acknowledge: Dict[Tuple[str, int], List[str]] = {}
         
         for result in results:
             try:
@@ -292,10 +320,8 @@ class ANPUser:
                     )
                     
                     if success:
-                        # 确认收到结果
-                        await self._acknowledge_hosted_did_result(
-                            result.get('result_id', ''), source_host, source_port
-                        )
+                        if result.get('result_id'):
+                            to_acknowledge.setdefault((source_host, source_port), []).append(result['result_id'])
                         
                         logger.debug(f"托管DID已保存: {hosted_result}")
                         logger.debug(f"托管DID ID: {hosted_did_doc.get('id')}")
@@ -308,21 +334,37 @@ class ANPUser:
             except Exception as e:
                 logger.error(f"处理托管DID结果失败: {e}")
         
+        # 确认收到结果
+        for (source_host, source_port), result_ids in to_acknowledge.items():
+            await self._acknowledge_hosted_did_results(result_ids, source_host, source_port)
+        
         return processed_count
 
     async def _acknowledge_hosted_did_result(self, result_id: str, source_host: str, source_port: int):
         """确认收到托管DID结果"""
+        if result_id:
+            await self._acknowledge_hosted_did_results([result_id], source_host, source_port)
+
+    async def _acknowledge_hosted_did_results(self, result_ids: List[str], source_host: str, source_port: int):
+        """批量确认收到托管DID结果；不支持批量接口的旧版服务（404/405）逐条确认"""
         try:
-            if not result_id:
+            if not result_ids:
                 return
                 
-            ack_url = f"http://{source_host}:{source_port}/wba/hosted-did/acknowledge/{result_id}"
+            ack_url = f"http://{source_host}:{source_port}/wba/hosted-did/acknowledge"
             
             import httpx
             async with httpx.AsyncClient() as client:
-                response = await client.post(ack_url, timeout=10.0)
-                if response.status_code == 200:
-                    logger.debug(f"已确认托管DID结果: {result_id}")
+                response = await client.post(ack_url, json={"result_ids": result_ids}, timeout=10.0)
+                if response.status_code in (404, 405):
+                    for result_id in result_ids:
+                        response = await client.post(f"{ack_url}/{result_id}", timeout=10.0)
+                        if response.status_code == 200:
+                            logger.debug(f"已确认托管DID结果: {result_id}")
+                        else:
+                            logger.warning(f"确认托管DID结果失败: {result_id} {response.status_code}")
+                elif response.status_code == 200:
+                    logger.debug(f"已确认托管DID结果: {result_ids}")
                 else:
                     logger.warning(f"确认托管DID结果失败: {response.status_code}")
                     
@@ -333,18 +375,23 @@ class ANPUser:
         """
         轮询托管DID结果
         
+        每轮向托管服务发起长轮询，结果发布后立即返回；
+        不支持长轮询的服务会立即返回，此时补足剩余的间隔再进行下一轮
+        
         Args:
-            interval: 轮询间隔（秒）
+            interval: 轮询间隔（秒），同时也是每轮长轮询的最长等待时间
             max_polls: 最大轮询次数
             
         Returns:
             int: 总共处理的结果数量
         """
         total_processed = 0
+        loop = asyncio.get_running_loop()
         
         for i in range(max_polls):
+            started = loop.time()
             try:
-                success, results, error = await self.check_hosted_did_results()
+                success, results, error = await self.check_hosted_did_results(wait=interval)
                 
                 if success and results:
                     processed = await self.process_hosted_did_results(results)
@@ -352,9 +399,11 @@ class ANPUser:
                     
                     if processed > 0:
                         logger.debug(f"轮询第{i+1}次: 处理了{processed}个托管DID结果")
+                        continue
                 
-                if i < max_polls - 1:  # 不是最后一次
-                    await asyncio.sleep(interval)
+                remaining = interval - (loop.time() - started)
+                if i < max_polls - 1 and remaining > 0:  # 不是最后一次
+                    await asyncio.sleep(remaining)
                     
             except Exception as e:
                 logger.error(f"轮询托管DID结果失败: {e}")
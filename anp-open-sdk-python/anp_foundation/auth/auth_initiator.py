@@ -1,4 +1,3 @@
-import json
 import logging
 from urllib.parse import unquote
 
@@ -7,6 +6,8 @@ from agent_connect.authentication import resolve_did_wba_document
 from anp_foundation.did.agent_connect_hotpatch.authentication.did_wba import extract_auth_header_parts_two_way, \
     verify_auth_header_signature_two_way
 from ..anp_user_local_data import get_user_data_manager
+from ..utils import json_codec
+from ..utils.tracing import span
 
 from anp_foundation.did.did_tool import AuthenticationContext, verify_timestamp, \
      create_did_auth_header_from_user_data
@@ -53,12 +54,18 @@ async def send_authenticated_request(
             else:
                 return status, response_data, "token认证请求", status == 200
     """
-    status, response, info, is_auth_pass = await _execute_wba_auth_flow(
-        caller_agent,target_agent,request_url,
-        method,json_data,
-        custom_headers,
-        use_two_way_auth
-    )
+    with span("outbound.request", method=method) as outbound:
+        # 把 trace 上下文传给对端，对端的请求 span 沿用同一个 trace_id
+        custom_headers = dict(custom_headers or {})
+        if outbound.traceparent:
+            custom_headers.setdefault("traceparent", outbound.traceparent)
+        status, response, info, is_auth_pass = await _execute_wba_auth_flow(
+            caller_agent,target_agent,request_url,
+            method,json_data,
+            custom_headers,
+            use_two_way_auth
+        )
+        outbound.set_attribute("status", status)
     logger.info(f"request:{request_url} \n status: {status}, ,auth_status {is_auth_pass} \ninfo: {info}")
 
     return  status, response, info, is_auth_pass
@@ -125,7 +132,7 @@ async def _execute_wba_auth_flow(
             if status_code == 200:
                 auth_value, token = _parse_token_from_response(response_auth_header)
                 if token:
-                    response_auth_header = json.loads(response_auth_header.get("Authorization"))
+                    response_auth_header = json_codec.loads(response_auth_header.get("Authorization"))
                     response_auth_header = response_auth_header.get("resp_did_auth_header")
                     response_auth_header = response_auth_header.get("Authorization")
                     if await _verify_response_auth_header(response_auth_header):
@@ -170,14 +177,14 @@ async def _send_request_with_token(target_url: str, token: str, sender_did: str,
             "resp_did": f"{targeter_did}"
         }
 
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=json_codec.dumps) as session:
             if method.upper() == "GET":
                 async with session.get(
                     target_url,
                     headers=headers
                 ) as response:
                     status = response.status
-                    response_data = await response.json() if status == 200 else {}
+                    response_data = await response.json(loads=json_codec.loads) if status == 200 else {}
                     return status, response_data
             elif method.upper() == "POST":
                 async with session.post(
@@ -186,7 +193,7 @@ async def _send_request_with_token(target_url: str, token: str, sender_did: str,
                     json=json_data
                 ) as response:
                     status = response.status
-                    response_data = await response.json() if status == 200 else {}
+                    response_data = await response.json(loads=json_codec.loads) if status == 200 else {}
                     return status, response_data
             else:
                 logger.debug(f"Unsupported HTTP method: {method}")
@@ -220,7 +227,7 @@ def _parse_token_from_response(response_header: Dict) -> Tuple[Optional[str], Op
             return "单向认证", token
             # 如果不是Bearer格式，尝试解析为JSON
         try:
-            auth_data = json.loads(auth_value)
+            auth_data = json_codec.loads(auth_value)
             # 解析后应该是字典格式
             if isinstance(auth_data, dict):
                 token = auth_data.get("access_token")
@@ -231,11 +238,11 @@ def _parse_token_from_response(response_header: Dict) -> Tuple[Optional[str], Op
                     return "AuthDict无法识别", None
             else:
                 return "JSON解析后格式错误", None
-        except json.JSONDecodeError:
+        except json_codec.JSONDecodeError:
             return ("JSON解析AuthToken失败"), None
     else:
         try:
-            auth_value= json.loads(auth_value)
+            auth_value= json_codec.loads(auth_value)
             token = auth_value.get("access_token")
             did_auth_header =auth_value.get("resp_did_auth_header", {}).get("Authorization")
             if did_auth_header and token:
@@ -274,11 +281,11 @@ async def _verify_response_auth_header(auth_value: str) -> bool:
         # 尝试解析JSON格式的auth_value
         if isinstance(auth_value, str) and auth_value.startswith('{') and auth_value.endswith('}'):
             try:
-                auth_json = json.loads(auth_value)
+                auth_json = json_codec.loads(auth_value)
                 # 检查是否有嵌套的Authorization头
                 if 'resp_did_auth_header' in auth_json and 'Authorization' in auth_json['resp_did_auth_header']:
                     auth_value = auth_json['resp_did_auth_header']['Authorization']
-            except json.JSONDecodeError:
+            except json_codec.JSONDecodeError:
                 # 如果不是有效的JSON，保持原样
                 pass
 
@@ -358,16 +365,16 @@ async def _send_wba_http_request(context: AuthenticationContext) -> Tuple[bool,
         else:
             merged_headers = auth_headers
         # 发送带认证头的请求
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=json_codec.dumps) as session:
             if method.upper() == "GET":
                 async with session.get(request_url, headers=merged_headers) as response:
                     status = response.status
                     try:
-                        response_data = await response.json()
+                        response_data = await response.json(loads=json_codec.loads)
                     except Exception:
                         response_text = await response.text()
                         try:
-                            response_data = json.loads(response_text)
+                            response_data = json_codec.loads(response_text)
                         except Exception:
                             response_data = {"text": response_text}
                             # 检查 Authorization header
@@ -376,11 +383,11 @@ async def _send_wba_http_request(context: AuthenticationContext) -> Tuple[bool,
                 async with session.post(request_url, headers=merged_headers, json=json_data) as response:
                     status = response.status
                     try:
-                        response_data = await response.json()
+                        response_data = await response.json(loads=json_codec.loads)
                     except Exception:
                         response_text = await response.text()
                         try:
-                            response_data = json.loads(response_text)
+                            response_data = json_codec.loads(response_text)
                         except Exception:
                             response_data = {"text": response_text}
                     return status, response.headers, response_data
@@ -430,7 +437,7 @@ async def _resolve_did_document_insecurely(did: str) -> Optional[Dict]:
         async with aiohttp.ClientSession() as session:
             async with session.get(http_url, ssl=False) as response:
                 if response.status == 200:
-                    did_document = await response.json()
+                    did_document = await response.json(loads=json_codec.loads)
                     logger.debug(f"通过DID标识解析的{http_url}获取{did}的DID文档")
                     return did_document
                 else:
@@ -31,6 +31,7 @@ from anp_foundation.did.did_tool import AuthenticationContext, \
     create_access_token, \
     create_did_auth_header_from_user_data, verify_timestamp, extract_did_from_auth_header
 from ..did.url_analyzer import get_url_analyzer
+from ..utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -47,92 +48,97 @@ INSECURELY_DID_FORMAT = [
 ]
 
 async def _verify_wba_header(auth_header: str, context: AuthenticationContext) -> Tuple[bool, str]:
-    logger.debug(f"_verify_wba_header -- url {context.request_url} \n header {auth_header}")
+    logger.debug("_verify_wba_header -- url %s \n header %s", context.request_url, auth_header)
 
     try:
         from anp_foundation.did.agent_connect_hotpatch.authentication.did_wba import (
             extract_auth_header_parts_two_way, verify_auth_header_signature_two_way, resolve_did_wba_document
         )
-        if context.use_two_way_auth:
-            # 1. 尝试解析为两路认证
-            try:
-                header_parts = extract_auth_header_parts_two_way(auth_header)
-                if not header_parts:
-                    return False, "Invalid authorization header format"
-                did, nonce, timestamp, resp_did, keyid, signature = header_parts
-                is_two_way_auth = True
-            except (ValueError, TypeError) as e:
-                return False, f"Authentication parsing failed as two way header: {e}"
-        else:
-            # 回退到标准认证
-            try:
-                header_parts = extract_auth_header_parts(auth_header)
-                if not header_parts or len(header_parts) < 4:
-                    return False, "Invalid standard authorization header"
-                did, nonce, timestamp, keyid, signature = header_parts
-                resp_did = context.target_did
-                is_two_way_auth = False
-            except Exception as fallback_error:
-                return False, f"Authentication parsing failed as one way header: {fallback_error}"
-
-        logger.debug(f"_verify_wba_header -- parts parsing passed: two_way mode: {is_two_way_auth} ")
+        with span("auth.parse"):
+            if context.use_two_way_auth:
+                # 1. 尝试解析为两路认证
+                try:
+                    header_parts = extract_auth_header_parts_two_way(auth_header)
+                    if not header_parts:
+                        return False, "Invalid authorization header format"
+                    did, nonce, timestamp, resp_did, keyid, signature = header_parts
+                    is_two_way_auth = True
+                except (ValueError, TypeError) as e:
+                    return False, f"Authentication parsing failed as two way header: {e}"
+            else:
+                # 回退到标准认证
+                try:
+                    header_parts = extract_auth_header_parts(auth_header)
+                    if not header_parts or len(header_parts) < 4:
+                        return False, "Invalid standard authorization header"
+                    did, nonce, timestamp, keyid, signature = header_parts
+                    resp_did = context.target_did
+                    is_two_way_auth = False
+                except Exception as fallback_error:
+                    return False, f"Authentication parsing failed as one way header: {fallback_error}"
+
+        logger.debug("_verify_wba_header -- parts parsing passed: two_way mode: %s ", is_two_way_auth)
 
         # 2. 验证时间戳
-        is_valid, error_msg = verify_timestamp(timestamp)
-        if not is_valid:
-            return False, error_msg
-
-        # Verify nonce validity
-        if not is_valid_server_nonce(nonce):
-            logger.debug(f"Invalid or expired nonce: {nonce}")
-            return False, f"Invalid nonce: {nonce}"
-        else:
-            logger.debug(f"nonce通过防重放验证{nonce}")
+        with span("auth.nonce"):
+            is_valid, error_msg = verify_timestamp(timestamp)
+            if not is_valid:
+                return False, error_msg
 
-        logger.debug(f"_verify_wba_header -- server_nonce passed: {nonce} ")
+            # Verify nonce validity
+            if not is_valid_server_nonce(nonce):
+                logger.debug("Invalid or expired nonce: %s", nonce)
+                return False, f"Invalid nonce: {nonce}"
+            else:
+                logger.debug("nonce通过防重放验证%s", nonce)
+
+        logger.debug("_verify_wba_header -- server_nonce passed: %s ", nonce)
 
 
         # 3. 解析DID文档
 
         did_document = None
-        if is_insecurely(did):
-            logger.debug(f"_verify_wba_header -- DID {did} matches insecure pattern, resolving insecurely.")
-            did_document = await _resolve_did_document_insecurely(did)
-        else:
-            logger.debug(f"_verify_wba_header -- DID {did} does not match insecure pattern, resolving via standard method.")
-            try:
-                did_document = await resolve_did_wba_document(did)
-            except Exception as e:
-                return False, f"Failed to resolve DID document: {e}"
+        with span("auth.did_resolve"):
+            if is_insecurely(did):
+                logger.debug("_verify_wba_header -- DID %s matches insecure pattern, resolving insecurely.", did)
+                did_document = await _resolve_did_document_insecurely(did)
+            else:
+                logger.debug("_verify_wba_header -- DID %s does not match insecure pattern, resolving via standard method.", did)
+                try:
+                    did_document = await resolve_did_wba_document(did)
+                except Exception as e:
+                    return False, f"Failed to resolve DID document: {e}"
 
         if not did_document:
             return False, "Failed to resolve DID document"
 
 
         # 4. 验证签名
-        try:
-            if is_two_way_auth:
-                is_valid, message = verify_auth_header_signature_two_way(
-                    auth_header=auth_header,
-                    did_document=did_document,
-                    service_domain=context.domain if hasattr(context, 'domain') else None
-                )
-            else:
-                from anp_foundation.did.agent_connect_hotpatch.authentication.did_wba import verify_auth_header_signature
-
-                # from agent_connect.authentication.did_wba import verify_auth_header_signature
-                is_valid, message = verify_auth_header_signature(
-                    auth_header,
-                    did_document=did_document,
-                    service_domain=context.domain if hasattr(context, 'domain') else None
-                )
-            if not is_valid:
-                return False, f"Invalid signature: {message}"
-        except Exception as e:
-            return False, f"Error verifying signature: {e}"
+        with span("auth.verify"):
+            try:
+                if is_two_way_auth:
+                    is_valid, message = verify_auth_header_signature_two_way(
+                        auth_header=auth_header,
+                        did_document=did_document,
+                        service_domain=context.domain if hasattr(context, 'domain') else None
+                    )
+                else:
+                    from anp_foundation.did.agent_connect_hotpatch.authentication.did_wba import verify_auth_header_signature
+
+                    # from agent_connect.authentication.did_wba import verify_auth_header_signature
+                    is_valid, message = verify_auth_header_signature(
+                        auth_header,
+                        did_document=did_document,
+                        service_domain=context.domain if hasattr(context, 'domain') else None
+                    )
+                if not is_valid:
+                    return False, f"Invalid signature: {message}"
+            except Exception as e:
+                return False, f"Error verifying signature: {e}"
 
-        logger.debug(f"_verify_wba_header -- signature_verify passed ")
-        header_parts = await _generate_wba_auth_response(did, is_two_way_auth, resp_did)
+        logger.debug("_verify_wba_header -- signature_verify passed ")
+        with span("auth.token_mint"):
+            header_parts = await _generate_wba_auth_response(did, is_two_way_auth, resp_did)
         logger.debug(f"_verify_wba_header -- return header\n {header_parts}")
 
         return True, header_parts
@@ -346,7 +352,8 @@ async def _authenticate_request(request: Request) -> Tuple[Union[bool, str], str
         target_did =request.headers.get("resp_did")
         token = auth_header[len("Bearer "):]
         try:
-            result = await _verify_bearer_token(token, req_did, target_did)
+            with span("auth.bearer"):
+                result = await _verify_bearer_token(token, req_did, target_did)
             return True, "Bearer token verified", result
         except Exception as e:
             logger.debug(f"Bearer认证失败: {e}")
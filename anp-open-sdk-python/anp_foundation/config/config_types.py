@@ -41,6 +41,30 @@ class AnpSdkConfig(Protocol):
     use_transformer_server: bool  # 是否使用transformer_server
     transformer_server_url: str  # transformer_server的URL
     fallback_to_local: bool  # 转发失败时是否回退到本地处理
+    transformer_timeouts: Dict[str, float]  # 按路由(group/api/message/stream)的转发超时（秒）
+    transformer_failure_threshold: int  # 连续失败多少次后熔断
+    transformer_recovery_timeout: float  # 熔断后多久放行探测请求（秒）
+    group_listener_queue_size: int  # 每个群组监听者最多积压的消息数
+    group_listener_overflow: str  # 积压超限策略: drop_oldest/disconnect/coalesce
+    group_replay_buffer_size: int  # 每个群组保留的最近事件数（SSE 续传）
+    group_sse_heartbeat_interval: float  # SSE 空闲心跳间隔（秒）
+    group_msg_path: str  # 群组消息日志根目录
+    group_log_enabled: bool  # 是否把群组消息写入持久化日志
+    group_log_segment_bytes: int  # 日志分段文件滚动大小（字节）
+    group_log_retention_seconds: float  # 日志按时间保留（秒）
+    group_log_retention_bytes: int  # 每个群组日志的总大小上限（字节）
+    group_log_fsync: bool  # 每批消息写入后是否 fsync
+    group_shard_count: int  # 群组运行器分片数
+    group_shard_mode: str  # 分片执行方式: task（事件循环内协程，默认）/ thread（每分片独立线程与事件循环）
+    tracing_enabled: bool  # 是否记录请求链路各阶段耗时
+    tracing_otlp_endpoint: Optional[str]  # OTLP/HTTP 收集器地址，为空时不导出
+    tracing_service_name: str  # 导出到 OTLP 时的 service.name
+    agent_record_capacity: int  # API调用/搜索记录环形缓冲区容量
+    agent_session_capacity: int  # 活跃会话数上限，也是已关闭会话的保留数
+    agent_session_message_limit: int  # 每个会话保留的最近消息数
+    agent_record_spill_path: Optional[str]  # 被覆盖的记录写入的目录，为空时不落盘
+    agent_record_spill_max_bytes: int  # 溢出文件滚动大小（字节）
+    agent_record_spill_backups: int  # 溢出文件保留的滚动份数
 
 
 class AnpSdkProxyConfig(Protocol):
@@ -145,6 +169,10 @@ class LogConfig(Protocol):
     """日志配置协议"""
     log_level: Optional[str]
     detail: LogDetailConfig
+    format: Optional[str]  # text / json
+    async_queue: Optional[bool]  # 是否经由队列由后台线程写日志
+    queue_size: Optional[int]  # 日志队列容量，满时丢弃
+    debug_sampling: Optional[Dict[str, float]]  # 日志记录器名前缀 -> DEBUG 日志保留比例
 
 
 
@@ -375,10 +375,11 @@ def generate_auth_header_two_way(
     
     # Normalize JSON using JCS
     canonical_json = jcs.canonicalize(data_to_sign)
-    logger.debug(f"generate_auth_header Canonical JSON: {canonical_json}")
-    logger.debug(f"[签名] canonical_json:{canonical_json}")
+    logger.debug("generate_auth_header Canonical JSON: %s", canonical_json)
+    logger.debug("[签名] canonical_json:%s", canonical_json)
     content_hash = hashlib.sha256(canonical_json).digest()
-    logger.debug(f"[签名] content_hash:{content_hash.hex()} ")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[签名] content_hash:%s ", content_hash.hex())
     # Calculate SHA-256 hash
     # Create verifier and encode signature
     verifier = create_verification_method(method_dict)
@@ -396,7 +397,7 @@ def generate_auth_header_two_way(
     )
     
     #logger.debug("Successfully generated DID authentication header.")
-    logger.debug(f"生成认证头: 提交方 {did} -> 认证方 {resp_did}")
+    logger.debug("生成认证头: 提交方 %s -> 认证方 %s", did, resp_did)
     #logger.debug(f"生成认证头: {auth_header}")
     
     return auth_header
@@ -509,7 +510,7 @@ def _extract_ec_public_key_from_jwk(jwk: Dict) -> ec.EllipticCurvePublicKey:
         public_numbers = ec.EllipticCurvePublicNumbers(x, y, curve)
         return public_numbers.public_key()
     except Exception as e:
-        logger.debug(f"Invalid JWK parameters: {str(e)}\nStack trace:\n{traceback.format_exc()}")
+        logger.debug("Invalid JWK parameters: %s\nStack trace:\n%s", str(e), traceback.format_exc())
         raise ValueError(f"Invalid JWK parameters: {str(e)}")
 
 def _extract_ed25519_public_key_from_multibase(multibase: str) -> ed25519.Ed25519PublicKey:
@@ -531,7 +532,7 @@ def _extract_ed25519_public_key_from_multibase(multibase: str) -> ed25519.Ed2551
         key_bytes = base58.b58decode(multibase[1:])
         return ed25519.Ed25519PublicKey.from_public_bytes(key_bytes)
     except Exception as e:
-        logger.debug(f"Invalid multibase key: {str(e)}\nStack trace:\n{traceback.format_exc()}")
+        logger.debug("Invalid multibase key: %s\nStack trace:\n%s", str(e), traceback.format_exc())
         raise ValueError(f"Invalid multibase key: {str(e)}")
 
 def _extract_ed25519_public_key_from_base58(base58_key: str) -> ed25519.Ed25519PublicKey:
@@ -551,7 +552,7 @@ def _extract_ed25519_public_key_from_base58(base58_key: str) -> ed25519.Ed25519P
         key_bytes = base58.b58decode(base58_key)
         return ed25519.Ed25519PublicKey.from_public_bytes(key_bytes)
     except Exception as e:
-        logger.debug(f"Invalid base58 key: {str(e)}\nStack trace:\n{traceback.format_exc()}")
+        logger.debug("Invalid base58 key: %s\nStack trace:\n%s", str(e), traceback.format_exc())
         raise ValueError(f"Invalid base58 key: {str(e)}")
 def _extract_secp256k1_public_key_from_multibase(multibase: str) -> ec.EllipticCurvePublicKey:
     """
@@ -584,7 +585,7 @@ def _extract_secp256k1_public_key_from_multibase(multibase: str) -> ec.EllipticC
             key_bytes
         )
     except Exception as e:
-        logger.debug(f"Invalid multibase key: {str(e)}\nStack trace:\n{traceback.format_exc()}")
+        logger.debug("Invalid multibase key: %s\nStack trace:\n%s", str(e), traceback.format_exc())
         raise ValueError(f"Invalid multibase key: {str(e)}")
 
 def _extract_public_key(verification_method: Dict) -> Union[ec.EllipticCurvePublicKey, ed25519.Ed25519PublicKey]:
@@ -670,7 +671,7 @@ def extract_auth_header_parts_two_way(auth_header: str) -> Tuple[str, str, str,
     Raises:
         ValueError: If any required field is missing in the auth header
     """
-    logger.debug(f"Extracting auth header parts from: {auth_header}")
+    logger.debug("Extracting auth header parts from: %s", auth_header)
     
     required_fields = {
         'did': r'(?i)did="([^"]+)"',
@@ -692,7 +693,7 @@ def extract_auth_header_parts_two_way(auth_header: str) -> Tuple[str, str, str,
             raise ValueError(f"Missing required field in auth header: {field}")
         parts[field] = match.group(1)
     
-    logger.debug(f"Extracted auth header parts: {parts}")
+    logger.debug("Extracted auth header parts: %s", parts)
     return (parts['did'], parts['nonce'], parts['timestamp'], 
             parts['resp_did'], parts['verification_method'], parts['signature'])
 
@@ -735,8 +736,9 @@ def verify_auth_header_signature_two_way(
 
         canonical_json = jcs.canonicalize(data_to_verify)
         content_hash = hashlib.sha256(canonical_json).digest()
-        logger.debug(f"[验签] canonical_json:{canonical_json}")
-        logger.debug(f"[验签] content_hash:{content_hash.hex()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[验签] canonical_json:%s", canonical_json)
+            logger.debug("[验签] content_hash:%s", content_hash.hex())
 
         verification_method_id = f"{client_did}#{verification_method}"
         method_dict = _find_verification_method(did_document, verification_method_id)
@@ -754,10 +756,10 @@ def verify_auth_header_signature_two_way(
             return False, f"Verification error: {str(e)}"
             
     except ValueError as e:
-        logger.debug(f"Error extracting auth header parts: {str(e)}")
+        logger.debug("Error extracting auth header parts: %s", str(e))
         return False, str(e)
     except Exception as e:
-        logger.debug(f"Error during verification process: {str(e)}")
+        logger.debug("Error during verification process: %s", str(e))
         return False, f"Verification process error: {str(e)}"
 
 def generate_auth_json(
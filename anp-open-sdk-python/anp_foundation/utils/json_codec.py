@@ -0,0 +1,177 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""JSON 编解码层
+
+统一服务端与客户端热路径上的 JSON 编解码：
+- 优先使用 orjson，其次 msgspec，最后回退到标准库 json
+- 快速后端无法处理的对象（如超过 64 位的整数）自动回退到标准库
+- 解码错误统一抛出 json.JSONDecodeError，调用方无需关心具体后端
+- 提供基于当前后端的 FastJSONResponse，作为 FastAPI 的默认响应类
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Union
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+logger = logging.getLogger(__name__)
+
+JSONDecodeError = json.JSONDecodeError
+
+
+class JSONCodec:
+    """JSON 编解码后端基类（标准库实现）"""
+
+    name = "json"
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """基于 orjson 的编解码后端"""
+
+    name = "orjson"
+
+    def __init__(self):
+        self._options = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, option=self._options)
+
+    def loads(self, data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        # orjson.JSONDecodeError 本身就是 json.JSONDecodeError 的子类
+        return orjson.loads(data)
+
+
+class MsgspecCodec(JSONCodec):
+    """基于 msgspec 的编解码后端"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def loads(self, data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError as e:
+            doc = data if isinstance(data, str) else bytes(data).decode("utf-8", errors="replace")
+            raise JSONDecodeError(str(e), doc, 0) from None
+
+
+_CODEC_FACTORIES: Dict[str, Callable[[], JSONCodec]] = {"json": JSONCodec}
+if orjson is not None:
+    _CODEC_FACTORIES["orjson"] = OrjsonCodec
+if msgspec is not None:
+    _CODEC_FACTORIES["msgspec"] = MsgspecCodec
+
+_PREFERRED_ORDER = ("orjson", "msgspec", "json")
+_stdlib_codec = JSONCodec()
+_codec: JSONCodec = _stdlib_codec
+
+
+def available_codecs() -> list:
+    """返回当前环境可用的后端名称"""
+    return [name for name in _PREFERRED_ORDER if name in _CODEC_FACTORIES]
+
+
+def register_codec(name: str, factory: Callable[[], JSONCodec]):
+    """注册自定义编解码后端"""
+    _CODEC_FACTORIES[name] = factory
+
+
+def set_json_codec(name: Optional[str] = None) -> JSONCodec:
+    """切换当前使用的编解码后端
+
+    Args:
+        name: 后端名称，None 表示按 orjson -> msgspec -> json 自动选择
+
+    Returns:
+        JSONCodec: 生效的后端实例
+    """
+    global _codec
+    if name is None:
+        name = available_codecs()[0]
+    factory = _CODEC_FACTORIES.get(name)
+    if factory is None:
+        raise ValueError(f"不支持的JSON编解码后端: {name}，可用: {available_codecs()}")
+    _codec = factory()
+    logger.debug(f"JSON编解码后端: {_codec.name}")
+    return _codec
+
+
+def get_json_codec() -> JSONCodec:
+    """获取当前使用的编解码后端"""
+    return _codec
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """序列化为 UTF-8 编码的紧凑 JSON 字节串"""
+    try:
+        return _codec.dumps_bytes(obj)
+    except TypeError:
+        if _codec is _stdlib_codec:
+            raise
+        # 快速后端不支持的类型（大整数、子类化容器等）回退到标准库
+        return _stdlib_codec.dumps_bytes(obj)
+
+
+def dumps(obj: Any, ascii_only: bool = False) -> str:
+    """序列化为紧凑 JSON 字符串
+
+    Args:
+        obj: 待序列化对象
+        ascii_only: 结果需要放入 HTTP 头等只接受 ASCII 的位置时设为 True
+    """
+    text = dumps_bytes(obj).decode("utf-8")
+    if ascii_only and not text.isascii():
+        return json.dumps(obj, ensure_ascii=True, separators=(",", ":"))
+    return text
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """反序列化 JSON，解析失败时抛出 json.JSONDecodeError"""
+    return _codec.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """使用当前编解码后端渲染的 JSONResponse"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+
+set_json_codec()
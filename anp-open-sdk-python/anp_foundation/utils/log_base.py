@@ -12,12 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""日志配置
+
+setup_logging() 在根日志记录器上安装非阻塞的日志管道：
+- 根记录器只挂一个 QueueHandler，记录放入有界队列后立即返回，队列满时丢弃并计数，不阻塞事件循环
+- 控制台与文件 Handler 由 QueueListener 在后台线程中格式化和写出，消息的 % 格式化也在后台线程完成
+- log_settings.debug_sampling 按日志记录器名前缀对 DEBUG 日志采样（例如只保留认证模块 10% 的调试日志）
+- log_settings.format: json 时输出结构化 JSON 行，带上当前请求的 trace_id
+"""
+
+import atexit
+import copy
 import logging
 import logging.handlers
+import queue
+import random
 import sys
+from typing import Dict, List, Optional
 
 # 从我们的类型定义中导入协议
 from anp_foundation.config import get_global_config
+from anp_foundation.utils import json_codec
+from anp_foundation.utils.tracing import current_trace_id
+
+DEFAULT_QUEUE_SIZE = 10000
 
 
 class ColoredFormatter(logging.Formatter):
@@ -39,8 +57,99 @@ class ColoredFormatter(logging.Formatter):
         return f"{color}{message}{self.COLORS['RESET']}"
 
 
+class JsonFormatter(logging.Formatter):
+    """结构化 JSON 行格式化器"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None) or current_trace_id.get()
+        if trace_id:
+            entry["trace_id"] = trace_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json_codec.dumps(entry)
+
+
+class SamplingFilter(logging.Filter):
+    """按日志记录器名前缀对 DEBUG 日志采样，rates: {"anp_foundation.auth": 0.1}，最长前缀优先"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+        self._prefixes = sorted(self.rates, key=len, reverse=True)
+        self._cache: Dict[str, float] = {}
+
+    def rate_for(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            for prefix in self._prefixes:
+                if name == prefix or name.startswith(prefix + "."):
+                    rate = float(self.rates[prefix])
+                    break
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录而不阻塞调用方；入队时固定消息文本，格式化器输出推迟到后台线程"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 复制记录并捕获调用方上下文；args 可能在入队后被调用方修改，这里先完成 msg % args，
+        # 调用方仍通过 %-参数与级别判断保持惰性，时间戳与 JSON 等格式化器输出留给 QueueListener 线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.trace_id = current_trace_id.get()
+        if record.exc_info:
+            # 异常对象不跨线程保留，先渲染为文本
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogQueueListener(logging.handlers.QueueListener):
+    """后台写日志线程；停止时阻塞等待队列腾出位置放入结束标记，保证剩余记录都被写出"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
 # 一个防止重复配置的全局标志
 _is_logging_configured = False
+_queue_listener: Optional[LogQueueListener] = None
+
+
+def _sampling_rates(log_config) -> Dict[str, float]:
+    rates = getattr(log_config, "debug_sampling", None) if log_config else None
+    if rates is not None and not isinstance(rates, dict):
+        rates = dict(getattr(rates, "_data", {}))
+    return rates or {}
 
 
 def setup_logging():
@@ -54,7 +163,7 @@ def setup_logging():
     """
     config = get_global_config()
 
-    global _is_logging_configured
+    global _is_logging_configured, _queue_listener
     if _is_logging_configured:
         return
 
@@ -65,9 +174,15 @@ def setup_logging():
     log_level_str = "INFO"
     log_file = None
     max_size_mb = 10
+    log_format = "text"
+    use_queue = True
+    queue_size = DEFAULT_QUEUE_SIZE
 
     if log_config:
         log_level_str = getattr(log_config, 'log_level', 'INFO').upper()
+        log_format = getattr(log_config, 'format', 'text') or 'text'
+        use_queue = getattr(log_config, 'async_queue', True)
+        queue_size = getattr(log_config, 'queue_size', DEFAULT_QUEUE_SIZE)
         if hasattr(log_config, 'detail'):
             log_file = getattr(log_config.detail, 'file', None)
             max_size_mb = getattr(log_config.detail, 'max_size', 10)
@@ -83,13 +198,19 @@ def setup_logging():
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
 
+    handlers: List[logging.Handler] = []
+    messages = []
+
     # --- 配置控制台 Handler ---
-    console_formatter = ColoredFormatter(
-        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - \n ------------------------------ %(message)s"
-    )
+    if log_format == "json":
+        console_formatter = JsonFormatter()
+    else:
+        console_formatter = ColoredFormatter(
+            "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - \n ------------------------------ %(message)s"
+        )
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(console_formatter)
-    root_logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # --- 配置可选的文件 Handler ---
     if log_file:
@@ -100,9 +221,12 @@ def setup_logging():
             # 确保目录存在，不再使用 sudo
             log_file_path.parent.mkdir(parents=True, exist_ok=True)
 
-            file_formatter = logging.Formatter(
-                "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s"
-            )
+            if log_format == "json":
+                file_formatter = JsonFormatter()
+            else:
+                file_formatter = logging.Formatter(
+                    "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s"
+                )
             file_handler = logging.handlers.RotatingFileHandler(
                 log_file_path,
                 maxBytes=max_size_mb * 1024 * 1024,
@@ -110,11 +234,56 @@ def setup_logging():
                 encoding="utf-8",
             )
             file_handler.setFormatter(file_formatter)
-            root_logger.addHandler(file_handler)
-            root_logger.info(f"日志将记录到文件: {log_file_path}")
+            handlers.append(file_handler)
+            messages.append((logging.INFO, "日志将记录到文件: %s", log_file_path))
         except Exception as e:
-            root_logger.error(f"设置文件日志记录器失败 ({log_file}): {e}")
+            messages.append((logging.ERROR, "设置文件日志记录器失败 (%s): %s", log_file, e))
+
+    sampling = _sampling_rates(log_config)
+    if use_queue:
+        # --- 非阻塞队列：调用方只入队，后台线程格式化并写出 ---
+        queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        if sampling:
+            queue_handler.addFilter(SamplingFilter(sampling))
+        root_logger.addHandler(queue_handler)
+        _queue_listener = LogQueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _queue_listener.start()
+        atexit.register(stop_logging)
+    else:
+        for handler in handlers:
+            if sampling:
+                handler.addFilter(SamplingFilter(sampling))
+            root_logger.addHandler(handler)
 
     _is_logging_configured = True
-    root_logger.info(f"日志系统配置完成，级别: {log_level_str}。")
+    for level, msg, *args in messages:
+        root_logger.log(level, msg, *args)
+    root_logger.info("日志系统配置完成，级别: %s，输出: %s，异步队列: %s", log_level_str, log_format, use_queue)
+
+
+def stop_logging():
+    """停止后台写日志线程并写出队列中剩余的记录（进程退出时自动调用）
+
+    之后的日志直接由控制台/文件 Handler 同步写出
+    """
+    global _queue_listener
+    if _queue_listener is None:
+        return
+    listener, _queue_listener = _queue_listener, None
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root_logger.removeHandler(handler)
+            for target in listener.handlers:
+                for log_filter in handler.filters:
+                    target.addFilter(log_filter)
+                root_logger.addHandler(target)
+    listener.stop()
+
 
+def get_dropped_log_count() -> int:
+    """因队列已满被丢弃的日志条数"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler.dropped
+    return 0
@@ -0,0 +1,203 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""固定容量的环形缓冲区
+
+长时间运行的服务端用于保存调用、搜索、会话等内省记录：
+- RingBuffer 预分配槽位，写满后覆盖最旧的记录，内存占用恒定
+- 可按 key（例如 DID）建立二级索引，被覆盖的记录按先进先出顺序从索引头部移除，均摊 O(1)
+- recent(n) 只访问最新的 n 个槽位，与已写入的总量无关
+- 可选 RotatingSpill：被覆盖的记录以 JSON Lines 写入按大小滚动的磁盘文件，供离线分析
+"""
+
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Generic, Iterable, Iterator, List, Optional, TypeVar, Union
+
+from anp_foundation.utils import json_codec
+
+import logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+KeyFunc = Callable[[Any], Iterable[str]]
+
+
+class RotatingSpill:
+    """按大小滚动的 JSON Lines 文件：path、path.1 ... path.{backup_count}"""
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{i}")
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._open()
+
+    def write(self, records: Iterable[Any]):
+        """写入一批记录，记录需可被 json_codec 编码或提供 to_dict()"""
+        lines = b"".join(
+            json_codec.dumps_bytes(r.to_dict() if hasattr(r, "to_dict") else r) + b"\n" for r in records)
+        if not lines:
+            return
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._open()
+                if self._size and self._size + len(lines) > self.max_bytes:
+                    self._rotate()
+                self._file.write(lines)
+                self._file.flush()
+                self._size += len(lines)
+            except OSError as e:
+                logger.warning(f"记录溢出写入失败 {self.path}: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RingBuffer(Generic[T]):
+    """固定容量环形缓冲区，可选按 key 的二级索引与溢出落盘"""
+
+    def __init__(self, capacity: int, key_funcs: Optional[Dict[str, KeyFunc]] = None,
+                 spill: Optional[RotatingSpill] = None):
+        if capacity <= 0:
+            raise ValueError(f"环形缓冲区容量必须大于0: {capacity}")
+        self.capacity = capacity
+        self._slots: List[Optional[T]] = [None] * capacity
+        self._next = 0  # 下一条记录的绝对序号
+        self._lock = threading.Lock()
+        self._key_funcs = key_funcs or {}
+        # 索引名 -> key -> 该 key 下记录的绝对序号（从旧到新）
+        self._indexes: Dict[str, Dict[str, Deque[int]]] = {name: {} for name in self._key_funcs}
+        self.spill = spill
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return min(self._next, self.capacity)
+
+    @property
+    def total(self) -> int:
+        """累计写入的记录数（包括已被覆盖的）"""
+        return self._next
+
+    def _keys(self, name: str, item: T) -> List[str]:
+        keys = self._key_funcs[name](item)
+        return [k for k in dict.fromkeys(keys) if k is not None]
+
+    def append(self, item: T) -> Optional[T]:
+        """写入一条记录，返回被覆盖的最旧记录（未写满时为 None）"""
+        with self._lock:
+            seq = self._next
+            slot = seq % self.capacity
+            evicted = self._slots[slot] if seq >= self.capacity else None
+            if evicted is not None:
+                self._unindex(evicted)
+                self.evicted += 1
+            self._slots[slot] = item
+            self._next = seq + 1
+            for name, index in self._indexes.items():
+                for key in self._keys(name, item):
+                    index.setdefault(key, deque()).append(seq)
+        if evicted is not None and self.spill is not None:
+            self.spill.write((evicted,))
+        return evicted
+
+    def _unindex(self, item: T):
+        # 被覆盖的总是最旧的记录，它在每个 key 的序号队列中也位于头部
+        for name, index in self._indexes.items():
+            for key in self._keys(name, item):
+                seqs = index.get(key)
+                if seqs:
+                    seqs.popleft()
+                    if not seqs:
+                        del index[key]
+
+    def _get(self, seq: int) -> T:
+        return self._slots[seq % self.capacity]
+
+    def __getitem__(self, i: int) -> T:
+        size = len(self)
+        if i < 0:
+            i += size
+        if not 0 <= i < size:
+            raise IndexError("环形缓冲区索引超出范围")
+        return self._get(self._next - size + i)
+
+    def __iter__(self) -> Iterator[T]:
+        """从旧到新遍历（遍历期间的并发写入可能被部分看到）"""
+        return iter(self.snapshot())
+
+    def snapshot(self) -> List[T]:
+        with self._lock:
+            start = self._next - len(self)
+            return [self._get(seq) for seq in range(start, self._next)]
+
+    def recent(self, limit: int) -> List[T]:
+        """最近 limit 条记录（从旧到新），只访问 limit 个槽位"""
+        with self._lock:
+            count = max(0, min(limit, len(self)))
+            return [self._get(seq) for seq in range(self._next - count, self._next)]
+
+    def recent_by(self, index: str, key: str, limit: int) -> List[T]:
+        """按二级索引取某个 key 最近 limit 条记录（从旧到新）"""
+        with self._lock:
+            seqs = self._indexes[index].get(key)
+            if not seqs or limit <= 0:
+                return []
+            count = min(limit, len(seqs))
+            return [self._get(seqs[i]) for i in range(len(seqs) - count, len(seqs))]
+
+    def count_by(self, index: str, key: str) -> int:
+        with self._lock:
+            return len(self._indexes[index].get(key, ()))
+
+    def keys(self, index: str) -> List[str]:
+        with self._lock:
+            return list(self._indexes[index])
+
+    def clear(self):
+        with self._lock:
+            self._slots = [None] * self.capacity
+            self._next = 0
+            for index in self._indexes.values():
+                index.clear()
+
+    def flush(self):
+        """把仍在缓冲区中的记录写入溢出文件（例如停机前），缓冲区内容不变"""
+        if self.spill is not None:
+            self.spill.write(self.snapshot())
@@ -0,0 +1,407 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""请求链路耗时追踪
+
+轻量的 span 接口，覆盖认证中间件、路由、Agent 处理器与出站认证请求：
+- trace_id 与当前 span 保存在 contextvars 中，随协程/任务自动传递，入站请求可沿用 traceparent 头
+- 每个阶段（span 名）一个 HDR 风格的对数分桶直方图，记录开销固定、分位数相对误差约 1.6%
+- render_prometheus() 输出 Prometheus 文本格式，由 /metrics 暴露
+- 安装 opentelemetry-sdk 与 OTLP 导出器并配置 tracing_otlp_endpoint 时，span 同时导出到 OTLP 收集器
+"""
+
+import contextvars
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+except ImportError:
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+METRIC_PREFIX = "anp_stage_latency_seconds"
+
+# 直方图每个指数区间的子桶数（2^7），决定分位数精度
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+current_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_trace_id", default=None)
+current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar(
+    "current_span", default=None)
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """解析 W3C traceparent 头，返回 (trace_id, parent_span_id)，格式不合法时返回 None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32:
+        return None
+    return parts[1], parts[2]
+
+
+def format_traceparent(trace_id: str, span_id: str) -> str:
+    return f"00-{trace_id}-{span_id}-01"
+
+
+class LatencyHistogram:
+    """HDR 风格的对数-线性分桶直方图，单位微秒
+
+    值按二进制指数分区，每个区间再均分为 SUB_BUCKET_HALF 个子桶，
+    桶宽随数值增大而增大，任意量级的相对误差都不超过 1/SUB_BUCKET_HALF
+    """
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_us = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+        bucket = max(0, value.bit_length() - SUB_BUCKET_BITS)
+        return bucket * SUB_BUCKET_HALF + (value >> bucket)
+
+    @staticmethod
+    def _value_at(index: int) -> int:
+        """桶内最大可表示值，用于分位数（与 HDR highestEquivalentValue 一致）"""
+        bucket = max(0, index // SUB_BUCKET_HALF - 1)
+        sub = index - bucket * SUB_BUCKET_HALF
+        return ((sub + 1) << bucket) - 1
+
+    def record(self, value_us: int):
+        value_us = max(0, int(value_us))
+        index = self._index(value_us)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.total_us += value_us
+            if self.min_us is None or value_us < self.min_us:
+                self.min_us = value_us
+            if value_us > self.max_us:
+                self.max_us = value_us
+
+    def percentiles(self, quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[float, int]:
+        """一次遍历计算多个分位数（微秒）"""
+        with self._lock:
+            items = sorted(self._counts.items())
+            count, max_us = self.count, self.max_us
+        result = {}
+        if not count:
+            return {q: 0 for q in quantiles}
+        targets = sorted((max(1, math.ceil(q * count)), q) for q in quantiles)
+        seen = 0
+        position = 0
+        for index, bucket_count in items:
+            seen += bucket_count
+            while position < len(targets) and seen >= targets[position][0]:
+                result[targets[position][1]] = min(self._value_at(index), max_us)
+                position += 1
+            if position == len(targets):
+                break
+        return result
+
+    def percentile(self, quantile: float) -> int:
+        return self.percentiles((quantile,))[quantile]
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self.count = 0
+            self.total_us = 0
+            self.min_us = None
+            self.max_us = 0
+
+
+class Span:
+    """一个计时区间，结束时把耗时记入所属阶段的直方图"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes",
+                 "start", "end", "error", "_tracer", "_tokens", "_otel_span")
+
+    def __init__(self, tracer: 'Tracer', name: str, trace_id: Optional[str] = None,
+                 parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.span_id = new_span_id()
+        self.attributes = attributes or {}
+        self.start = 0.0
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        self._tokens = None
+        self._otel_span = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    @property
+    def traceparent(self) -> str:
+        return format_traceparent(self.trace_id, self.span_id)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, value)
+
+    def __enter__(self) -> 'Span':
+        parent = current_span.get()
+        if self.trace_id is None:
+            self.trace_id = parent.trace_id if parent is not None else (current_trace_id.get() or new_trace_id())
+        if self.parent_id is None and parent is not None:
+            self.parent_id = parent.span_id
+        self._tokens = (current_trace_id.set(self.trace_id), current_span.set(self))
+        self._otel_span = self._tracer._start_otel(self, parent)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        trace_token, span_token = self._tokens
+        current_span.reset(span_token)
+        current_trace_id.reset(trace_token)
+        self._tracer._finish(self)
+        return False
+
+
+class _NoopSpan:
+    """追踪关闭时返回的空 span"""
+
+    name = None
+    trace_id = None
+    span_id = None
+    traceparent = None
+    duration_ms = 0.0
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """按阶段汇总 span 耗时，并可选导出到 OTLP"""
+
+    def __init__(self, enabled: bool = True, quantiles: Iterable[float] = DEFAULT_QUANTILES,
+                 otlp_endpoint: Optional[str] = None, service_name: str = "anp-open-sdk"):
+        self.enabled = enabled
+        self.quantiles = tuple(quantiles)
+        self.service_name = service_name
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._otel_tracer = None
+        self._otel_provider = None
+        if otlp_endpoint:
+            self.enable_otlp(otlp_endpoint)
+
+    def enable_otlp(self, endpoint: str) -> bool:
+        """启用 OTLP 导出（需要 opentelemetry-sdk 与 opentelemetry-exporter-otlp-proto-http）"""
+        if otel_trace is None:
+            logger.warning("未安装 opentelemetry-sdk/opentelemetry-exporter-otlp，OTLP 导出未启用")
+            return False
+        provider = TracerProvider(resource=Resource.create({"service.name": self.service_name}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        self._otel_provider = provider
+        self._otel_tracer = provider.get_tracer(__name__)
+        logger.info(f"链路追踪 OTLP 导出已启用: {endpoint}")
+        return True
+
+    def span(self, name: str, traceparent: Optional[str] = None, **attributes) -> Any:
+        """创建一个 span，作为上下文管理器使用；traceparent 用于沿用调用方的 trace_id"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        trace_id = parent_id = None
+        parsed = parse_traceparent(traceparent)
+        if parsed is not None:
+            trace_id, parent_id = parsed
+        return Span(self, name, trace_id, parent_id, attributes)
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def record(self, name: str, duration_ms: float, error: bool = False):
+        """直接记录一个阶段耗时（用于无法包裹为 span 的场景）"""
+        if not self.enabled:
+            return
+        self.histogram(name).record(int(duration_ms * 1000))
+        if error:
+            with self._lock:
+                self._errors[name] = self._errors.get(name, 0) + 1
+
+    def _start_otel(self, span: Span, parent: Optional[Span]):
+        if self._otel_tracer is None:
+            return None
+        context = None
+        if parent is not None and parent._otel_span is not None:
+            context = otel_trace.set_span_in_context(parent._otel_span)
+        otel_span = self._otel_tracer.start_span(span.name, context=context)
+        otel_span.set_attribute("anp.trace_id", span.trace_id)
+        for key, value in span.attributes.items():
+            otel_span.set_attribute(key, value)
+        return otel_span
+
+    def _finish(self, span: Span):
+        self.record(span.name, span.duration_ms, error=span.error is not None)
+        if span._otel_span is not None:
+            if span.error is not None:
+                span._otel_span.set_attribute("error", span.error)
+            span._otel_span.end()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段的次数、错误数与分位数（毫秒）"""
+        result = {}
+        for name, histogram in sorted(self._histograms.items()):
+            percentiles = histogram.percentiles(self.quantiles)
+            result[name] = {
+                "count": histogram.count,
+                "errors": self._errors.get(name, 0),
+                "mean_ms": round(histogram.total_us / histogram.count / 1000, 3) if histogram.count else 0.0,
+                "max_ms": histogram.max_us / 1000,
+                **{f"p{q * 100:g}_ms": value / 1000 for q, value in percentiles.items()},
+            }
+        return result
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式：每个阶段一个 summary（分位数、_sum、_count）和错误计数"""
+        lines: List[str] = [
+            f"# HELP {METRIC_PREFIX} 请求链路各阶段耗时",
+            f"# TYPE {METRIC_PREFIX} summary",
+        ]
+        errors: List[str] = []
+        for name, histogram in sorted(self._histograms.items()):
+            stage = _escape_label(name)
+            for q, value in histogram.percentiles(self.quantiles).items():
+                lines.append(f'{METRIC_PREFIX}{{stage="{stage}",quantile="{q:g}"}} {value / 1e6:.6f}')
+            lines.append(f'{METRIC_PREFIX}_sum{{stage="{stage}"}} {histogram.total_us / 1e6:.6f}')
+            lines.append(f'{METRIC_PREFIX}_count{{stage="{stage}"}} {histogram.count}')
+            errors.append(f'anp_stage_errors_total{{stage="{stage}"}} {self._errors.get(name, 0)}')
+        lines.append("# HELP anp_stage_errors_total 请求链路各阶段异常次数")
+        lines.append("# TYPE anp_stage_errors_total counter")
+        lines.extend(errors)
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._errors.clear()
+
+    def shutdown(self):
+        if self._otel_provider is not None:
+            self._otel_provider.shutdown()
+            self._otel_provider = None
+            self._otel_tracer = None
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def tracing_settings() -> Dict[str, Any]:
+    """从全局配置读取追踪设置，未设置全局配置时使用默认值"""
+    settings = {"enabled": True, "otlp_endpoint": None, "service_name": "anp-open-sdk"}
+    try:
+        from anp_foundation.config import get_global_config
+        config = get_global_config()
+    except RuntimeError:
+        return settings
+    settings.update({
+        "enabled": getattr(config.anp_sdk, "tracing_enabled", True),
+        "otlp_endpoint": getattr(config.anp_sdk, "tracing_otlp_endpoint", None),
+        "service_name": getattr(config.anp_sdk, "tracing_service_name", "anp-open-sdk"),
+    })
+    return settings
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """全局 Tracer，首次使用时按配置创建"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(**tracing_settings())
+    return _tracer
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    """替换全局 Tracer（测试或自定义导出时使用），传 None 时下次按配置重建"""
+    global _tracer
+    _tracer = tracer
+
+
+def span(name: str, traceparent: Optional[str] = None, **attributes):
+    """在全局 Tracer 上创建 span"""
+    return get_tracer().span(name, traceparent=traceparent, **attributes)
+
+
+def traced(name: str) -> Callable:
+    """把异步函数整体包裹在一个 span 中"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -19,7 +19,6 @@ import warnings
 from typing import Dict, Any, Callable, Optional
 from datetime import datetime
 from fastapi import Request
-from starlette.responses import JSONResponse
 
 try:
     import nest_asyncio
@@ -27,6 +26,8 @@ except ImportError:
     nest_asyncio = None
 
 from anp_foundation.anp_user import ANPUser
+from anp_foundation.utils.json_codec import FastJSONResponse
+from anp_foundation.utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -285,6 +286,7 @@ class Agent:
             except Exception as e:
                 logger.error(f"群事件处理器出错: {e}")
     
+    @traced("agent.handle_request")
     async def handle_request(self, req_did: str, request_data: Dict[str, Any], request: Request):
         """请求处理核心逻辑
         
@@ -317,13 +319,14 @@ class Agent:
             api_path = request_data.get("path")
             
             # 调试信息：显示当前Agent的所有API路由
-            logger.debug(f"🔍 Agent {self.name} 查找API路径: {api_path}")
-            logger.debug(f"🔍 Agent {self.name} 当前所有API路由:")
-            for route_path, route_handler in self.api_routes.items():
-                logger.debug(f"   - {route_path}: {getattr(route_handler, '__name__', 'unknown')}")
+            logger.debug("🔍 Agent %s 查找API路径: %s", self.name, api_path)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔍 Agent %s 当前所有API路由:", self.name)
+                for route_path, route_handler in self.api_routes.items():
+                    logger.debug("   - %s: %s", route_path, getattr(route_handler, '__name__', 'unknown'))
             
             handler = self.api_routes.get(api_path)
-            logger.debug(f"🔍 Agent {self.name} API{api_path} 对应处理器 {handler}:")
+            logger.debug("🔍 Agent %s API%s 对应处理器 %s:", self.name, api_path, handler)
             if handler:
                 try:
                     # 检查是否是类方法
@@ -338,7 +341,7 @@ class Agent:
                         
                     if isinstance(result, dict):
                         status_code = result.pop('status_code', 200)
-                        return JSONResponse(
+                        return FastJSONResponse(
                             status_code=status_code,
                             content=result
                         )
@@ -350,12 +353,12 @@ class Agent:
                         f"完整请求为 url: {request.url} \n"
                         f"body: {await request.body()}")
                     logger.error(f"API调用错误: {e}")
-                    return JSONResponse(
+                    return FastJSONResponse(
                         status_code=500,
                         content={"status": "error", "error_message": str(e)}
                     )
             else:
-                return JSONResponse(
+                return FastJSONResponse(
                     status_code=404,
                     content={"status": "error", "message": f"未找到API: {api_path}"}
                 )
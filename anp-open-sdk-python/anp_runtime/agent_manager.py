@@ -7,7 +7,8 @@ from pathlib import Path
 
 import yaml
 import logging
-from typing import Dict, Optional, Tuple, Any, List
+from typing import Deque, Dict, Optional, Tuple, Any, List
+from collections import deque
 from datetime import datetime
 
 from starlette.requests import Request
@@ -15,6 +16,8 @@ from starlette.requests import Request
 from anp_foundation.anp_user_local_data import get_user_data_manager
 from anp_foundation.anp_user import ANPUser
 from anp_foundation.config import UnifiedConfig
+from anp_foundation.utils.ring_buffer import RingBuffer, RotatingSpill
+from anp_foundation.utils.tracing import current_span, traced
 from anp_server.baseline.anp_router_baseline.router_did import url_did_format
 from anp_runtime.agent import Agent
 logger = logging.getLogger(__name__)
@@ -37,25 +40,92 @@ async def save_interface_files(user_full_path: str, interface_data: dict, intefa
     logger.debug(f"接口文件{inteface_file_name}已保存在: {template_ad_path}")
 
 
+class _SlotRecord:
+    """__slots__ 记录基类，保留按键取值的旧用法（record["caller_did"]）"""
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def record_buffer_settings() -> Dict[str, Any]:
+    """从全局配置读取内省记录缓冲区设置，未设置全局配置时使用默认值"""
+    settings = {
+        "capacity": 1000,
+        "session_capacity": 1000,
+        "session_message_limit": 100,
+        "spill_path": None,
+        "spill_max_bytes": 10 * 1024 * 1024,
+        "spill_backups": 3,
+    }
+    try:
+        from anp_foundation.config import get_global_config
+        config = get_global_config()
+    except RuntimeError:
+        return settings
+    settings.update({
+        "capacity": getattr(config.anp_sdk, "agent_record_capacity", 1000),
+        "session_capacity": getattr(config.anp_sdk, "agent_session_capacity", 1000),
+        "session_message_limit": getattr(config.anp_sdk, "agent_session_message_limit", 100),
+        "spill_path": getattr(config.anp_sdk, "agent_record_spill_path", None),
+        "spill_max_bytes": getattr(config.anp_sdk, "agent_record_spill_max_bytes", 10 * 1024 * 1024),
+        "spill_backups": getattr(config.anp_sdk, "agent_record_spill_backups", 3),
+    })
+    return settings
+
+
+def _record_spill(name: str, settings: Dict[str, Any]) -> Optional[RotatingSpill]:
+    """配置了 agent_record_spill_path 时，被覆盖的记录写入 <spill_path>/<name>.jsonl"""
+    if not settings.get("spill_path"):
+        return None
+    path = Path(UnifiedConfig.resolve_path(settings["spill_path"])) / f"{name}.jsonl"
+    return RotatingSpill(path, settings["spill_max_bytes"], settings["spill_backups"])
+
+
+class SearchEntry(_SlotRecord):
+    """一条搜索记录"""
+
+    __slots__ = ("timestamp", "searcher_did", "query", "results", "result_count")
+
+    def __init__(self, searcher_did: str, query: str, results: List[str]):
+        self.timestamp = datetime.now().isoformat()
+        self.searcher_did = searcher_did
+        self.query = query
+        self.results = results
+        self.result_count = len(results)
+
+
 class AgentSearchRecord:
-    """智能体搜索记录"""
+    """智能体搜索记录，保留最近 capacity 条"""
 
-    def __init__(self):
-        self.search_history = []
+    def __init__(self, capacity: Optional[int] = None, spill: Optional[RotatingSpill] = None):
+        settings = record_buffer_settings()
+        self.search_history: RingBuffer[SearchEntry] = RingBuffer(
+            capacity or settings["capacity"],
+            key_funcs={"did": lambda r: (r.searcher_did,)},
+            spill=spill if spill is not None else _record_spill("agent_searches", settings))
 
     def record_search(self, searcher_did: str, query: str, results: List[str]):
         """记录搜索行为"""
-        self.search_history.append({
-            "timestamp": datetime.now().isoformat(),
-            "searcher_did": searcher_did,
-            "query": query,
-            "results": results,
-            "result_count": len(results)
-        })
+        self.search_history.append(SearchEntry(searcher_did, query, results))
 
     def get_recent_searches(self, limit: int = 10):
         """获取最近的搜索记录"""
-        return self.search_history[-limit:]
+        return [r.to_dict() for r in self.search_history.recent(limit)]
+
+    def get_searches_by(self, searcher_did: str, limit: int = 10):
+        """获取某个DID最近的搜索记录"""
+        return [r.to_dict() for r in self.search_history.recent_by("did", searcher_did, limit)]
 
 
 class AgentContactBook:
@@ -93,69 +163,149 @@ class AgentContactBook:
         return self.contacts
 
 
-class SessionRecord:
-    """会话记录"""
+class SessionEntry(_SlotRecord):
+    """一个会话，消息只保留最近 message_limit 条"""
 
-    def __init__(self):
-        self.sessions = {}  # session_id -> 会话信息
+    __slots__ = ("session_id", "req_did", "resp_did", "start_time", "end_time", "messages", "status")
+
+    def __init__(self, session_id: str, req_did: str, resp_did: str, message_limit: int):
+        self.session_id = session_id
+        self.req_did = req_did
+        self.resp_did = resp_did
+        self.start_time = datetime.now().isoformat()
+        self.end_time = None
+        self.messages: Deque[Dict] = deque(maxlen=message_limit)
+        self.status = "active"
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = super().to_dict()
+        data["messages"] = list(self.messages)
+        return data
+
+
+class SessionRecord:
+    """会话记录
+
+    活跃会话保存在 sessions 中（最多 capacity 个，超出时最旧的会话标记为 expired），
+    已关闭的会话进入环形缓冲区，两者都按 DID 建立索引
+    """
+
+    def __init__(self, capacity: Optional[int] = None, message_limit: Optional[int] = None,
+                 spill: Optional[RotatingSpill] = None):
+        settings = record_buffer_settings()
+        self.capacity = capacity or settings["session_capacity"]
+        self.message_limit = message_limit or settings["session_message_limit"]
+        self.sessions: Dict[str, SessionEntry] = {}  # session_id -> 活跃会话，按创建顺序
+        self._active_by_did: Dict[str, Dict[str, SessionEntry]] = {}
+        self.closed_sessions: RingBuffer[SessionEntry] = RingBuffer(
+            self.capacity,
+            key_funcs={"did": lambda r: (r.req_did, r.resp_did), "session": lambda r: (r.session_id,)},
+            spill=spill if spill is not None else _record_spill("agent_sessions", settings))
 
     def create_session(self, req_did: str, resp_did: str):
         """创建会话"""
         session_id = f"{req_did}_{resp_did}_{int(time.time())}"
-        self.sessions[session_id] = {
-            "session_id": session_id,
-            "req_did": req_did,
-            "resp_did": resp_did,
-            "start_time": datetime.now().isoformat(),
-            "end_time": None,
-            "messages": [],
-            "status": "active"
-        }
+        if session_id in self.sessions:
+            self._retire(self.sessions[session_id], "closed")
+        elif len(self.sessions) >= self.capacity:
+            self._retire(next(iter(self.sessions.values())), "expired")
+        session = SessionEntry(session_id, req_did, resp_did, self.message_limit)
+        self.sessions[session_id] = session
+        for did in {req_did, resp_did}:
+            self._active_by_did.setdefault(did, {})[session_id] = session
         return session_id
 
+    def _retire(self, session: SessionEntry, status: str):
+        self.sessions.pop(session.session_id, None)
+        for did in {session.req_did, session.resp_did}:
+            by_did = self._active_by_did.get(did)
+            if by_did is not None:
+                by_did.pop(session.session_id, None)
+                if not by_did:
+                    del self._active_by_did[did]
+        session.end_time = datetime.now().isoformat()
+        session.status = status
+        self.closed_sessions.append(session)
+
     def add_message(self, session_id: str, message: Dict):
         """添加消息"""
-        if session_id in self.sessions:
-            self.sessions[session_id]["messages"].append({
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.messages.append({
                 "timestamp": datetime.now().isoformat(),
                 "content": message,
-                "direction": "outgoing" if message.get("sender") == self.sessions[session_id]["req_did"] else "incoming"
+                "direction": "outgoing" if message.get("sender") == session.req_did else "incoming"
             })
 
     def close_session(self, session_id: str):
         """关闭会话"""
-        if session_id in self.sessions:
-            self.sessions[session_id]["end_time"] = datetime.now().isoformat()
-            self.sessions[session_id]["status"] = "closed"
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self._retire(session, "closed")
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """按 session_id 获取活跃或最近关闭的会话"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            found = self.closed_sessions.recent_by("session", session_id, 1)
+            session = found[0] if found else None
+        return session.to_dict() if session is not None else None
 
     def get_active_sessions(self):
         """获取活跃会话"""
-        return {sid: session for sid, session in self.sessions.items() if session["status"] == "active"}
+        return {sid: session.to_dict() for sid, session in self.sessions.items()}
 
+    def get_sessions_for(self, did: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """获取某个DID参与的活跃会话和最近关闭的会话"""
+        active = list(self._active_by_did.get(did, {}).values())
+        closed = self.closed_sessions.recent_by("did", did, max(0, limit - len(active)))
+        return [s.to_dict() for s in closed + active[-limit:]]
 
-class ApiCallRecord:
-    """API调用记录"""
 
-    def __init__(self):
-        self.api_calls = []
-
-    def record_api_call(self, caller_did: str, target_did: str, api_path: str, method: str, params: Dict, response: Dict, duration_ms: int):
-        """记录API调用"""
-        self.api_calls.append({
-            "timestamp": datetime.now().isoformat(),
-            "caller_did": caller_did,
-            "target_did": target_did,
-            "api_path": api_path,
-            "method": method,
-            "params": params,
-            "response_status": response.get("status"),
-            "duration_ms": duration_ms,
-            "success": response.get("status") == "success"
-        })
+class ApiCallEntry(_SlotRecord):
+    """一条API调用记录"""
+
+    __slots__ = ("timestamp", "caller_did", "target_did", "api_path", "method", "params",
+                 "response_status", "duration_ms", "success")
+
+    def __init__(self, caller_did: str, target_did: str, api_path: str, method: str, params: Dict,
+                 response_status: Any, duration_ms: Optional[int]):
+        self.timestamp = datetime.now().isoformat()
+        self.caller_did = caller_did
+        self.target_did = target_did
+        self.api_path = api_path
+        self.method = method
+        self.params = params
+        self.response_status = response_status
+        self.duration_ms = duration_ms
+        self.success = response_status == "success"
+
+
+class ApiCallRecord:
+    """API调用记录，保留最近 capacity 条，按调用方与目标 DID 索引"""
+
+    def __init__(self, capacity: Optional[int] = None, spill: Optional[RotatingSpill] = None):
+        settings = record_buffer_settings()
+        self.api_calls: RingBuffer[ApiCallEntry] = RingBuffer(
+            capacity or settings["capacity"],
+            key_funcs={"did": lambda r: (r.caller_did, r.target_did)},
+            spill=spill if spill is not None else _record_spill("api_calls", settings))
+
+    def record_api_call(self, caller_did: str, target_did: str, api_path: str, method: str, params: Dict, response: Dict, duration_ms: Optional[int] = None):
+        """记录API调用，未传 duration_ms 时取当前 span 已经过的耗时"""
+        if duration_ms is None:
+            active = current_span.get()
+            duration_ms = round(active.duration_ms) if active is not None else None
+        self.api_calls.append(ApiCallEntry(
+            caller_did, target_did, api_path, method, params, response.get("status"), duration_ms))
 
     def get_recent_calls(self, limit: int = 20):
         """获取最近的API调用记录"""
-        return self.api_calls[-limit:]
+        return [r.to_dict() for r in self.api_calls.recent(limit)]
+
+    def get_calls_for_did(self, did: str, limit: int = 20):
+        """获取某个DID作为调用方或目标的最近API调用记录"""
+        return [r.to_dict() for r in self.api_calls.recent_by("did", did, limit)]
 
 
 class AgentRouter:
@@ -364,6 +514,7 @@ class AgentRouter:
 
         return None
 
+    @traced("router.route_request")
     async def route_request(self, req_did: str, resp_did: str, request_data: Dict, request: Request) -> Any:
         """增强的路由请求处理，支持域名优先级查找和共享DID路由"""
 
@@ -379,7 +530,7 @@ class AgentRouter:
 
         # 消息类型请求不使用共享DID路由，直接路由到Agent
         if request_type == "message" or api_path.startswith("/message/"):
-            self.logger.debug(f"📨 消息路由: 直接路由到 {resp_did}")
+            self.logger.debug("📨 消息路由: 直接路由到 %s", resp_did)
             agent = self._find_message_capable_agent(resp_did, domain, port)
         else:
             # 尝试从AgentManager获取共享DID信息
@@ -396,7 +547,7 @@ class AgentRouter:
                                 agent_obj.prefix):
                             # 找到匹配的Agent
                             agent = agent_obj
-                            self.logger.debug(f"✅ 根据路径前缀 {agent_obj.prefix} 找到共享DID Agent: {agent_name}")
+                            self.logger.debug("✅ 根据路径前缀 %s 找到共享DID Agent: %s", agent_obj.prefix, agent_name)
                             break
                     else:
                         # 如果没有找到匹配的Agent，使用常规路由
@@ -424,7 +575,7 @@ class AgentRouter:
                             # 注册到router_agent
                             self.register_agent_with_domain(agent_obj, domain, port)
                             agent = agent_obj
-                            self.logger.debug(f"✅ 从AgentManager中找到并注册智能体: {resp_did} -> {agent_name}")
+                            self.logger.debug("✅ 从AgentManager中找到并注册智能体: %s -> %s", resp_did, agent_name)
                             break
             except (ImportError, Exception) as e:
                 self.logger.warning(f"尝试从AgentManager查找Agent失败: {e}")
@@ -448,9 +599,11 @@ class AgentRouter:
 
         # 6. 执行路由
         try:
-            self.logger.debug(f"🚀 路由请求: {req_did} -> {resp_did} @ {domain}:{port}")
-            self.logger.debug(f"route_request -- forward to {agent.anp_user_did}'s handler, forward data:{request_data}\n")
-            self.logger.debug(f"route_request -- url: {request.url} \nbody: {await request.body()}")
+            self.logger.debug("🚀 路由请求: %s -> %s @ %s:%s", req_did, resp_did, domain, port)
+            self.logger.debug("route_request -- forward to %s's handler, forward data:%s\n", agent.anp_user_did, request_data)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                # 读取请求体只为调试输出，非 DEBUG 级别时跳过
+                self.logger.debug("route_request -- url: %s \nbody: %s", request.url, await request.body())
 
             result = await agent.handle_request(req_did, request_data, request)
             return result
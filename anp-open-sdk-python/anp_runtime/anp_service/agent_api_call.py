@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
 # !/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from typing import Optional, Dict, Any
@@ -21,6 +20,7 @@ from urllib.parse import urlencode, quote
 from aiohttp import ClientResponse
 
 from anp_foundation.anp_user import RemoteANPUser, ANPUser
+from anp_foundation.utils import json_codec
 import logging
 logger = logging.getLogger(__name__)
 
@@ -53,7 +53,7 @@ async def agent_api_call(
             url_params = {
                 "req_did": caller_agent_obj.id,
                 "resp_did": target_agent_obj.id,
-                "params": json.dumps(params) if params else ""
+                "params": json_codec.dumps(params) if params else ""
             }
             url_params = urlencode(url_params)
             url = f"http://{target_agent_obj.host}:{target_agent_obj.port}/agent/api/{target_agent_path}{api_path}?{url_params}"
@@ -75,8 +75,8 @@ async def response_to_dict(response: Any) -> Dict:
         # 新增：处理字符串响应
         try:
             # 尝试解析为 JSON
-            return json.loads(response)
-        except json.JSONDecodeError:
+            return json_codec.loads(response)
+        except json_codec.JSONDecodeError:
             # 不是 JSON，返回包装后的字符串
             return {
                 "type": "text",
@@ -91,12 +91,12 @@ async def response_to_dict(response: Any) -> Dict:
                 return {"error": f"HTTP {response.status}", "message": error_text}
             content_type = response.headers.get('Content-Type', '')
             if 'application/json' in content_type:
-                return await response.json()
+                return await response.json(loads=json_codec.loads)
             else:
                 text = await response.text()
                 logger.warning(f"非JSON响应，Content-Type: {content_type}")
                 return {"content": text, "content_type": content_type}
-        except json.JSONDecodeError as e:
+        except json_codec.JSONDecodeError as e:
             logger.error(f"JSON解析失败: {e}")
             text = await response.text()
             return {"error": "JSON解析失败", "raw_text": text}
@@ -0,0 +1,339 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""群组消息扇出
+
+每个监听者一个有界队列，广播时用 put_nowait 扇出，不会被慢消费者阻塞；
+队列满时按溢出策略处理：
+- drop_oldest: 丢弃最旧的一条
+- disconnect: 断开该监听者，消费端 get() 抛出 ListenerDisconnected
+- coalesce: 移除队列中同一合并键（默认 sender_id + type）的旧消息并追加新消息，
+  没有可合并的消息时丢弃最旧的一条
+
+监听者按 agent 登记，每个 agent 在一个群组中只有一个监听队列：同一 agent 经另一传输（SSE/WebSocket）
+或新连接再次监听时，旧队列被断开（close_reason 为 LISTENER_REPLACED），而不是静默停止接收。
+
+SSE 场景下消息在发布时只编码一次为 GroupEvent（带序号的不可变 SSE 帧），
+所有监听者共享同一个 bytes 对象；ReplayBuffer 保存最近的事件用于 Last-Event-ID 续传。
+"""
+
+import asyncio
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from anp_foundation.utils import json_codec
+
+import logging
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+COALESCE = "coalesce"
+OVERFLOW_POLICIES = (DROP_OLDEST, DISCONNECT, COALESCE)
+
+DEFAULT_QUEUE_SIZE = 256
+
+# 监听队列断开的原因
+BACKLOG_EXCEEDED = "backlog limit exceeded"
+LISTENER_REPLACED = "replaced by a newer listener"
+
+DEFAULT_REPLAY_SIZE = 1024
+DEFAULT_HEARTBEAT_INTERVAL = 15.0
+
+# SSE 注释行，客户端会忽略，用于保持连接不被中间代理断开
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+
+_CLOSED = object()
+
+
+class GroupEvent:
+    """已编码的群组事件：序号 + 原始消息 + 只编码一次的 SSE 帧
+
+    WebSocket 帧在第一次使用时基于同一份 JSON 编码拼接并缓存
+    """
+
+    __slots__ = ("seq", "group_id", "message", "data", "frame", "_ws_frame")
+
+    def __init__(self, seq: int, message: Dict[str, Any], group_id: Optional[str] = None,
+                 data: Optional[bytes] = None):
+        self.seq = seq
+        self.group_id = group_id
+        self.message = message
+        self.data = json_codec.dumps_bytes(message) if data is None else data
+        self.frame = b"id: %d\ndata: %s\n\n" % (seq, self.data)
+        self._ws_frame: Optional[bytes] = None
+
+    @classmethod
+    def from_encoded(cls, seq: int, data: bytes, group_id: Optional[str] = None) -> 'GroupEvent':
+        """由已编码的 JSON（如持久化日志中的记录）构造事件，不再重新编码"""
+        return cls(seq, json_codec.loads(data), group_id, data)
+
+    @property
+    def ws_frame(self) -> bytes:
+        """WebSocket 事件帧: {"op":"event","group_id":...,"seq":...,"message":...}"""
+        if self._ws_frame is None:
+            self._ws_frame = b'{"op":"event","group_id":%s,"seq":%d,"message":%s}' % (
+                json_codec.dumps_bytes(self.group_id), self.seq, self.data)
+        return self._ws_frame
+
+    def __repr__(self):
+        return f"GroupEvent(seq={self.seq})"
+
+
+class ReplayBuffer:
+    """按序号保存最近事件的有界缓冲区，用于断线续传"""
+
+    def __init__(self, maxlen: int = DEFAULT_REPLAY_SIZE, group_id: Optional[str] = None):
+        self.group_id = group_id
+        self._events: deque = deque(maxlen=max(0, maxlen))
+        self._next_seq = 1
+
+    @property
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+    @property
+    def first_seq(self) -> int:
+        """缓冲区中最早事件的序号，缓冲区为空时为下一个序号"""
+        return self._events[0].seq if self._events else self._next_seq
+
+    def advance_to(self, next_seq: int):
+        """把下一个序号推进到 next_seq（与持久化日志的偏移量对齐）"""
+        if next_seq > self._next_seq:
+            self._events.clear()
+            self._next_seq = next_seq
+
+    def publish(self, message: Dict[str, Any], data: Optional[bytes] = None) -> GroupEvent:
+        """编码消息（或使用已编码的 data）并追加到缓冲区"""
+        event = GroupEvent(self._next_seq, message, self.group_id, data)
+        self._next_seq += 1
+        if self._events.maxlen:
+            self._events.append(event)
+        return event
+
+    def since(self, last_seq: int) -> List[GroupEvent]:
+        """返回序号大于 last_seq 的缓冲事件；早于缓冲区的部分已丢失，只返回仍保留的事件"""
+        if not self._events or last_seq >= self.last_seq:
+            return []
+        first_seq = self._events[0].seq
+        start = max(0, last_seq - first_seq + 1)
+        return list(islice(self._events, start, None))
+
+    def __len__(self):
+        return len(self._events)
+
+
+class ListenerDisconnected(Exception):
+    """监听者因积压超限被断开"""
+
+
+def default_coalesce_key(item: Any) -> Optional[Hashable]:
+    """默认的合并键：同一发送者的同类消息"""
+    if isinstance(item, GroupEvent):
+        item = item.message
+    if isinstance(item, dict):
+        return item.get("sender_id"), item.get("type")
+    return None
+
+
+class ListenerQueue(asyncio.Queue):
+    """带溢出策略与积压指标的有界监听队列"""
+
+    def __init__(self, maxsize: int = DEFAULT_QUEUE_SIZE, overflow: str = DROP_OLDEST,
+                 coalesce_key: Callable[[Any], Optional[Hashable]] = default_coalesce_key):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"不支持的溢出策略: {overflow}，可用: {OVERFLOW_POLICIES}")
+        super().__init__(maxsize=max(1, maxsize))
+        self.overflow = overflow
+        self.coalesce_key = coalesce_key
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        self.enqueued = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.created_at = time.time()
+        self.last_delivered_at: Optional[float] = None
+
+    def _put(self, item):
+        super()._put(item)
+        if item is not _CLOSED:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self.qsize())
+
+    def _get(self):
+        item = super()._get()
+        if item is not _CLOSED:
+            self.delivered += 1
+            self.last_delivered_at = time.time()
+        return item
+
+    def put_nowait(self, item):
+        """入队，不阻塞；已满时按溢出策略处理，断开时抛出 ListenerDisconnected"""
+        if self.closed:
+            raise ListenerDisconnected()
+        if self.full():
+            if self.overflow == DISCONNECT:
+                self.close(BACKLOG_EXCEEDED)
+                raise ListenerDisconnected()
+            if self.overflow == COALESCE and self._coalesce(item):
+                return
+            self._queue.popleft()
+            self._discard(1)
+        super().put_nowait(item)
+
+    async def put(self, item):
+        """与 asyncio.Queue 接口兼容，但从不等待"""
+        self.put_nowait(item)
+
+    async def get(self):
+        item = await super().get()
+        if item is _CLOSED:
+            raise ListenerDisconnected()
+        return item
+
+    def get_nowait(self):
+        item = super().get_nowait()
+        if item is _CLOSED:
+            raise ListenerDisconnected()
+        return item
+
+    def _discard(self, count: int):
+        """记录被丢弃的消息并把它们标记为已完成，使 join() 不会等待永远不会被消费的消息"""
+        self.dropped += count
+        for _ in range(count):
+            self.task_done()
+
+    def _coalesce(self, item) -> bool:
+        key = self.coalesce_key(item)
+        if key is None:
+            return False
+        # 从最新往前找，移除同一合并键的旧消息，新消息追加到队尾以保持顺序（替换不改变未完成计数）
+        for index in range(len(self._queue) - 1, -1, -1):
+            if self.coalesce_key(self._queue[index]) == key:
+                del self._queue[index]
+                self._queue.append(item)
+                self.enqueued += 1
+                self.coalesced += 1
+                return True
+        return False
+
+    def close(self, reason: str = BACKLOG_EXCEEDED):
+        """断开监听者：清空积压并唤醒等待中的消费端"""
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        self._discard(self.qsize())
+        self._queue.clear()
+        self._put(_CLOSED)
+        self._wakeup_next(self._getters)
+
+    @property
+    def lag(self) -> int:
+        """已入队但尚未被消费的消息数"""
+        return self.qsize() if not self.closed else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "overflow": self.overflow,
+            "maxsize": self.maxsize,
+            "depth": self.lag,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "closed": self.closed,
+            "last_delivered_at": self.last_delivered_at,
+        }
+
+
+def replace_listener(listeners: Dict[str, asyncio.Queue], agent_id: str, queue: asyncio.Queue):
+    """登记 agent 的监听队列；已有其他队列时将其断开，旧连接的消费端收到 ListenerDisconnected"""
+    previous = listeners.get(agent_id)
+    listeners[agent_id] = queue
+    if previous is not None and previous is not queue:
+        if isinstance(previous, ListenerQueue):
+            previous.close(LISTENER_REPLACED)
+        logger.info(f"监听者 {agent_id} 的旧监听队列已被新的连接替换")
+
+
+def listener_queue_settings() -> Dict[str, Any]:
+    """从全局配置读取监听队列、重放缓冲与心跳设置，未设置全局配置时使用默认值"""
+    settings = {
+        "maxsize": DEFAULT_QUEUE_SIZE,
+        "overflow": DROP_OLDEST,
+        "replay_size": DEFAULT_REPLAY_SIZE,
+        "heartbeat_interval": DEFAULT_HEARTBEAT_INTERVAL,
+    }
+    try:
+        from anp_foundation.config import get_global_config
+        config = get_global_config()
+    except RuntimeError:
+        return settings
+    settings.update({
+        "maxsize": getattr(config.anp_sdk, "group_listener_queue_size", DEFAULT_QUEUE_SIZE),
+        "overflow": getattr(config.anp_sdk, "group_listener_overflow", DROP_OLDEST),
+        "replay_size": getattr(config.anp_sdk, "group_replay_buffer_size", DEFAULT_REPLAY_SIZE),
+        "heartbeat_interval": getattr(config.anp_sdk, "group_sse_heartbeat_interval", DEFAULT_HEARTBEAT_INTERVAL),
+    })
+    return settings
+
+
+def parse_last_event_id(value: Any) -> int:
+    """解析 Last-Event-ID，非法值视为 0（从缓冲区最早的事件开始）"""
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def offer(queue: asyncio.Queue, item: Any) -> bool:
+    """向单个监听者投递，返回 False 表示该监听者应被移除"""
+    try:
+        queue.put_nowait(item)
+        return True
+    except ListenerDisconnected:
+        return False
+    except asyncio.QueueFull:
+        # 调用方自行传入的普通有界 asyncio.Queue：丢弃最旧的一条
+        try:
+            queue.get_nowait()
+            queue.put_nowait(item)
+        except (asyncio.QueueEmpty, asyncio.QueueFull):
+            pass
+        return True
+
+
+def fan_out(listeners: Dict[str, asyncio.Queue], item: Any,
+            exclude: Optional[Iterable[str]] = None) -> list:
+    """把同一个消息对象扇出给所有监听者
+
+    Returns:
+        list: 因积压超限被断开、需要注销的监听者 ID
+    """
+    exclude = set(exclude or ())
+    disconnected = []
+    for agent_id, queue in list(listeners.items()):
+        if agent_id in exclude:
+            continue
+        if not offer(queue, item):
+            disconnected.append(agent_id)
+    for agent_id in disconnected:
+        logger.warning(f"监听者积压超限已断开: {agent_id}")
+    return disconnected
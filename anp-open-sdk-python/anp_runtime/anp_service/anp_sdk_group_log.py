@@ -0,0 +1,446 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""群组消息持久化日志
+
+每个群组一个目录，消息按追加顺序写入分段文件 {base_offset:020d}.log，偏移量从 1 开始单调递增，
+与 SSE/WebSocket 事件序号一致。记录格式:
+    offset(u64) | timestamp(f64) | length(u32) | crc32(u32) | payload(JSON bytes)
+- 每个分段在内存中保存偏移量 -> 文件位置的索引，读取时通过 mmap 直接切片
+- 活动分段超过 segment_bytes 后滚动到新分段
+- 保留策略按整段删除：最后一条消息早于 retention_seconds 的分段，以及总大小超过 retention_bytes 时最旧的分段
+- 打开时校验每条记录，截断崩溃留下的不完整尾部
+- append 只在内存中分配偏移量并放入待写队列，不做文件 I/O；所有日志共用一个后台写线程，
+  把积累的消息合并为一次 write/flush（开启 fsync 时每批一次）。读取范围覆盖未写入的消息时先同步写入，
+  后台写入失败后下一次 append 抛出 OSError
+"""
+
+import atexit
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+import logging
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<QdII")
+SEGMENT_SUFFIX = ".log"
+
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+DEFAULT_RETENTION_BYTES = 1024 * 1024 * 1024
+RETENTION_CHECK_INTERVAL = 60.0
+
+
+class LogRecord(NamedTuple):
+    """日志中的一条消息"""
+    offset: int
+    timestamp: float
+    data: bytes
+
+
+class _Segment:
+    """一个分段文件及其偏移量索引"""
+
+    def __init__(self, path: Path, base_offset: int):
+        self.path = path
+        self.base_offset = base_offset
+        self.positions = array("Q")
+        self.size = 0
+        self.first_timestamp: Optional[float] = None
+        self.last_timestamp: Optional[float] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._mapped_size = 0
+
+    @property
+    def next_offset(self) -> int:
+        return self.base_offset + len(self.positions)
+
+    def recover(self):
+        """扫描分段建立索引，截断校验失败的尾部"""
+        size = self.path.stat().st_size
+        position = 0
+        if size:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                while position + RECORD_HEADER.size <= size:
+                    offset, timestamp, length, crc = RECORD_HEADER.unpack_from(view, position)
+                    end = position + RECORD_HEADER.size + length
+                    if offset != self.next_offset or end > size:
+                        break
+                    if zlib.crc32(view[position + RECORD_HEADER.size:end]) != crc:
+                        break
+                    self._track(position, timestamp)
+                    position = end
+        if position < size:
+            logger.warning(f"群组日志分段尾部不完整，已截断: {self.path} ({size} -> {position})")
+            with open(self.path, "r+b") as f:
+                f.truncate(position)
+        self.size = position
+
+    def _track(self, position: int, timestamp: float):
+        self.positions.append(position)
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+
+    def view(self, end: int) -> Optional[mmap.mmap]:
+        """返回至少覆盖到 end 位置的只读映射，只有读取范围超出已映射部分时才重新映射"""
+        if end == 0:
+            return None
+        if self._mmap is None or self._mapped_size < end:
+            self.unmap()
+            with open(self.path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_size = len(self._mmap)
+        return self._mmap
+
+    def read(self, offset: int, end_offset: int) -> List[LogRecord]:
+        first, last = offset - self.base_offset, end_offset - self.base_offset
+        view = self.view(self.positions[last] if last < len(self.positions) else self.size)
+        if view is None or first >= last:
+            return []
+        records = []
+        for index in range(first, last):
+            position = self.positions[index]
+            record_offset, timestamp, length, _ = RECORD_HEADER.unpack_from(view, position)
+            start = position + RECORD_HEADER.size
+            records.append(LogRecord(record_offset, timestamp, view[start:start + length]))
+        return records
+
+    def unmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+            self._mapped_size = 0
+
+
+class _LogFlusher:
+    """所有群组日志共用的后台写线程，依次写入有待写消息的日志"""
+
+    def __init__(self):
+        self._dirty: Dict[int, 'GroupMessageLog'] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, log: 'GroupMessageLog'):
+        with self._condition:
+            if id(log) in self._dirty:
+                return
+            self._dirty[id(log)] = log
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="group-log-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _take(self) -> List['GroupMessageLog']:
+        with self._condition:
+            logs = list(self._dirty.values())
+            self._dirty.clear()
+            return logs
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty:
+                    self._condition.wait()
+            for log in self._take():
+                try:
+                    log.flush()
+                except OSError:
+                    # flush 已记录错误，由下一次 append 抛出
+                    pass
+                except Exception as e:
+                    logger.error(f"群组日志后台写入失败 {log.directory}: {e}")
+
+    def flush_all(self):
+        """进程退出前同步写入所有待写消息"""
+        for log in self._take():
+            try:
+                log.flush()
+            except Exception as e:
+                logger.error(f"群组日志退出前写入失败 {log.directory}: {e}")
+
+
+_flusher = _LogFlusher()
+atexit.register(_flusher.flush_all)
+
+
+class GroupMessageLog:
+    """单个群组的追加式消息日志"""
+
+    def __init__(self, directory: Path, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 retention_seconds: Optional[float] = DEFAULT_RETENTION_SECONDS,
+                 retention_bytes: Optional[int] = DEFAULT_RETENTION_BYTES, fsync: bool = False):
+        self.directory = Path(directory)
+        self.segment_bytes = max(1, segment_bytes)
+        self.retention_seconds = retention_seconds
+        self.retention_bytes = retention_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # 串行化写入，保证批次按偏移量顺序落盘
+        self._flush_lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._pending: List[tuple] = []
+        self._next_offset = 1
+        self._error: Optional[OSError] = None
+        self._writer = None
+        self._last_retention_check = 0.0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+            try:
+                base_offset = int(path.stem)
+            except ValueError:
+                continue
+            segment = _Segment(path, base_offset)
+            segment.recover()
+            self._segments.append(segment)
+        if not self._segments:
+            self._segments.append(self._new_segment(1))
+        self._next_offset = self._segments[-1].next_offset
+        self._open_writer()
+        self.enforce_retention()
+
+    @property
+    def first_offset(self) -> int:
+        """仍保留的最早偏移量；已写入的部分为空时等于第一条待写消息的偏移量"""
+        for segment in self._segments:
+            if segment.positions:
+                return segment.base_offset
+        return self._segments[-1].next_offset
+
+    @property
+    def next_offset(self) -> int:
+        """下一条消息将使用的偏移量（包括尚未写入文件的消息）"""
+        return self._next_offset
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(segment.size for segment in self._segments)
+
+    def _new_segment(self, base_offset: int) -> _Segment:
+        path = self.directory / f"{base_offset:020d}{SEGMENT_SUFFIX}"
+        path.touch()
+        return _Segment(path, base_offset)
+
+    def _open_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = open(self._segments[-1].path, "ab")
+
+    def append(self, data: bytes, timestamp: Optional[float] = None) -> int:
+        """追加一条已编码的消息，返回其偏移量；消息由后台写线程写入文件"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if self._error is not None:
+                raise OSError(f"群组日志写入已失败: {self._error}")
+            if self._writer is None:
+                raise OSError("群组日志已关闭")
+            offset = self._next_offset
+            self._next_offset += 1
+            self._pending.append((offset, timestamp, data))
+        _flusher.schedule(self)
+        return offset
+
+    def flush(self) -> int:
+        """把待写消息写入分段文件，返回写入的条数；失败时记录错误并抛出 OSError"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            # 失败之后文件尾部可能不完整，不再继续写入
+            if not batch or self._writer is None or self._error is not None:
+                return 0
+            try:
+                self._write(batch)
+            except OSError as e:
+                self._error = e
+                logger.error(f"群组日志写入失败，丢弃 {len(batch)} 条消息: {self.directory}: {e}")
+                raise
+            timestamp = batch[-1][1]
+            if timestamp - self._last_retention_check >= RETENTION_CHECK_INTERVAL:
+                self._enforce_retention(timestamp)
+            return len(batch)
+
+    def _write(self, batch: List[tuple]):
+        """按分段把一批消息合并为一次写入，写入后才更新索引使其对读取可见"""
+        index = 0
+        while index < len(batch):
+            segment = self._segments[-1]
+            if segment.size >= self.segment_bytes:
+                segment = self._roll()
+            buffer = bytearray()
+            tracked = []
+            while index < len(batch) and segment.size + len(buffer) < self.segment_bytes:
+                offset, timestamp, data = batch[index]
+                tracked.append((segment.size + len(buffer), timestamp))
+                buffer += RECORD_HEADER.pack(offset, timestamp, len(data), zlib.crc32(data))
+                buffer += data
+                index += 1
+            self._writer.write(buffer)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            with self._lock:
+                for position, timestamp in tracked:
+                    segment._track(position, timestamp)
+                segment.size += len(buffer)
+
+    def _roll(self) -> _Segment:
+        segment = self._new_segment(self._segments[-1].next_offset)
+        with self._lock:
+            self._segments.append(segment)
+        self._open_writer()
+        return segment
+
+    def read(self, offset: int, limit: int = 100) -> List[LogRecord]:
+        """从 offset 起读取最多 limit 条消息；早于保留范围的部分从最早的消息开始"""
+        if offset + max(0, limit) > self._segments[-1].next_offset:
+            self.flush()
+        with self._lock:
+            offset = max(offset, self.first_offset)
+            end_offset = min(self._segments[-1].next_offset, offset + max(0, limit))
+            records = []
+            for segment in self._segments:
+                if offset >= end_offset:
+                    break
+                if segment.next_offset <= offset:
+                    continue
+                stop = min(end_offset, segment.next_offset)
+                records.extend(segment.read(offset, stop))
+                offset = stop
+            return records
+
+    def iter_range(self, start: int, end: int, page_size: int = 256) -> Iterator[LogRecord]:
+        """按页迭代 [start, end) 之间的消息"""
+        offset = start
+        while offset < end:
+            records = self.read(offset, min(page_size, end - offset))
+            if not records:
+                return
+            yield from records
+            offset = records[-1].offset + 1
+
+    def cursor(self, offset: Optional[int] = None) -> 'LogCursor':
+        """创建读取游标，默认从最早保留的消息开始"""
+        return LogCursor(self, self.first_offset if offset is None else offset)
+
+    def enforce_retention(self, now: Optional[float] = None) -> int:
+        """先写入待写消息，再按时间和大小删除过期的整段（活动分段除外），返回删除的消息数"""
+        self.flush()
+        return self._enforce_retention(time.time() if now is None else now)
+
+    def _enforce_retention(self, now: float) -> int:
+        removed = 0
+        with self._lock:
+            self._last_retention_check = now
+            while len(self._segments) > 1:
+                oldest = self._segments[0]
+                expired = (self.retention_seconds is not None and oldest.last_timestamp is not None
+                           and oldest.last_timestamp < now - self.retention_seconds)
+                oversized = self.retention_bytes is not None and self.size_bytes > self.retention_bytes
+                if not (expired or oversized or not oldest.positions):
+                    break
+                oldest.unmap()
+                try:
+                    oldest.path.unlink()
+                except OSError as e:
+                    logger.warning(f"删除过期群组日志分段失败 {oldest.path}: {e}")
+                    break
+                removed += len(oldest.positions)
+                self._segments.pop(0)
+        if removed:
+            logger.debug(f"群组日志保留策略删除 {removed} 条消息: {self.directory}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "first_offset": self.first_offset,
+            "next_offset": self.next_offset,
+            "segments": len(self._segments),
+            "size_bytes": self.size_bytes,
+            "pending": len(self._pending),
+        }
+
+    def close(self):
+        """写入剩余消息并关闭文件"""
+        try:
+            self.flush()
+        except OSError:
+            pass
+        with self._flush_lock, self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for segment in self._segments:
+                segment.unmap()
+
+
+class LogCursor:
+    """在群组日志上顺序翻页的游标"""
+
+    def __init__(self, log: GroupMessageLog, offset: int):
+        self.log = log
+        self.offset = offset
+
+    def read(self, limit: int = 100) -> List[LogRecord]:
+        """读取下一页并前移游标"""
+        records = self.log.read(self.offset, limit)
+        if records:
+            self.offset = records[-1].offset + 1
+        else:
+            self.offset = max(self.offset, self.log.first_offset)
+        return records
+
+    def seek(self, offset: int):
+        self.offset = offset
+
+    @property
+    def lag(self) -> int:
+        """游标之后尚未读取的消息数"""
+        return max(0, self.log.next_offset - max(self.offset, self.log.first_offset))
+
+
+def group_log_settings() -> Dict[str, Any]:
+    """从全局配置读取群组日志设置，未设置全局配置时不启用"""
+    settings = {
+        "enabled": False,
+        "path": None,
+        "segment_bytes": DEFAULT_SEGMENT_BYTES,
+        "retention_seconds": DEFAULT_RETENTION_SECONDS,
+        "retention_bytes": DEFAULT_RETENTION_BYTES,
+        "fsync": False,
+    }
+    try:
+        from anp_foundation.config import get_global_config
+        config = get_global_config()
+    except RuntimeError:
+        return settings
+    group_msg_path = getattr(config.anp_sdk, "group_msg_path", None)
+    if group_msg_path:
+        from anp_foundation.config import UnifiedConfig
+        settings["path"] = UnifiedConfig.resolve_path(group_msg_path) / "group_logs"
+    settings.update({
+        "enabled": getattr(config.anp_sdk, "group_log_enabled", True) and settings["path"] is not None,
+        "segment_bytes": getattr(config.anp_sdk, "group_log_segment_bytes", DEFAULT_SEGMENT_BYTES),
+        "retention_seconds": getattr(config.anp_sdk, "group_log_retention_seconds", DEFAULT_RETENTION_SECONDS),
+        "retention_bytes": getattr(config.anp_sdk, "group_log_retention_bytes", DEFAULT_RETENTION_BYTES),
+        "fsync": getattr(config.anp_sdk, "group_log_fsync", False),
+    })
+    return settings
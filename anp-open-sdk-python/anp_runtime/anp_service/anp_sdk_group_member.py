@@ -1,28 +1,85 @@
 # Agent 端 SDK 用于简化 agent 与群组的交互
 import asyncio
-import json
 import logging
 import time  # 添加缺失的导入
-from typing import Dict, Any, Callable, List
+from typing import Dict, Any, Callable, List, Optional
 
 import aiohttp
 
+from anp_foundation.utils import json_codec
+from anp_runtime.anp_service.anp_sdk_group_fanout import ListenerDisconnected
 from anp_runtime.anp_service.anp_sdk_group_runner import Message, MessageType
+from anp_runtime.anp_service.anp_sdk_group_socket import GroupSocketTransport
 
 logger = logging.getLogger(__name__)
 
+
+def _message_type(value: str) -> MessageType:
+    """解析消息类型：服务端群组运行器使用枚举名（如 "TEXT"），本地运行器使用枚举值"""
+    if value in MessageType.__members__:
+        return MessageType[value]
+    return MessageType(value)
+
+
+def _message_from_dict(data: Dict[str, Any]) -> Message:
+    return Message(
+        type=_message_type(data["type"]),
+        content=data["content"],
+        sender_id=data["sender_id"],
+        group_id=data["group_id"],
+        timestamp=data["timestamp"],
+        metadata=data.get("metadata", {})
+    )
+
+
 class GroupMemberSDK:
-    """Agent 端的群组 SDK"""
+    """Agent 端的群组 SDK
+
+    transport="http" 时每个操作一次 HTTP 请求、监听走 SSE；
+    transport="websocket" 时同一 did 下所有群组的操作和监听复用一条 WebSocket 连接，
+    auth_headers 只在连接升级时发送一次，binary_frames 为 True 时使用二进制帧
+    """
 
     def __init__(self, agent_id: str, port: int, base_url: str = "http://localhost",
-                 use_local_optimization: bool = True):
+                 use_local_optimization: bool = True, transport: str = "http",
+                 auth_headers: Optional[Dict[str, str]] = None, binary_frames: bool = False):
+        if transport not in ("http", "websocket"):
+            raise ValueError(f"不支持的群组传输方式: {transport}")
         self.agent_id = agent_id
         self.port = port
         self.base_url = base_url
         self.use_local_optimization = use_local_optimization
+        self.transport = transport
+        self.auth_headers = auth_headers or {}
+        self.binary_frames = binary_frames
         self._listeners: Dict[str, asyncio.Task] = {}
         self._callbacks: Dict[str, Callable] = {}
+        self._sockets: Dict[str, GroupSocketTransport] = {}
+        self._socket_groups: Dict[str, str] = {}  # group_id -> 订阅所用连接的 did
         self._local_sdk = None
+        self.reconnect_delay = 1.0  # SSE/WebSocket 断开后重连前的等待秒数
+
+    def _group_url(self, did: Optional[str], path: str) -> str:
+        """服务端群组路由 /agent/api/{did}/group/{path} 的完整地址"""
+        return f"{self.base_url}:{self.port}/agent/api/{did or 'default'}/group/{path}"
+
+    async def _get_socket(self, did: str = None) -> GroupSocketTransport:
+        """获取 did 对应的 WebSocket 连接，不存在时建立"""
+        did = did or 'default'
+        socket = self._sockets.get(did)
+        if socket is None:
+            ws_base = self.base_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+            socket = GroupSocketTransport(
+                f"{ws_base}:{self.port}/agent/api/{did}/group/ws",
+                self.agent_id,
+                headers=self.auth_headers,
+                binary=self.binary_frames,
+                reconnect_delay=self.reconnect_delay
+            )
+            self._sockets[did] = socket
+        if not socket.connected:
+            await socket.connect()
+        return socket
 
     def set_local_sdk(self, sdk):
         """设置本地 SDK 实例（用于本地优化）"""
@@ -47,8 +104,14 @@ class GroupMemberSDK:
                     runner.anp_users[self.agent_id] = agent
                 return allowed
 
+        if self.transport == "websocket":
+            socket = await self._get_socket(did)
+            result = await socket.request("join", group_id, name=name or self.agent_id,
+                                          metadata=metadata or {})
+            return result.get("status") == "success"
+
         # HTTP 请求路径
-        url = f"{self.base_url}:{self.port}/agent/group/{did or 'default'}/{group_id}/join"
+        url = self._group_url(did, f"{group_id}/join")
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 url,
@@ -66,8 +129,13 @@ class GroupMemberSDK:
             if runner:
                 return await runner.remove_member(self.agent_id)
 
+        if self.transport == "websocket":
+            socket = await self._get_socket(did)
+            result = await socket.request("leave", group_id)
+            return result.get("status") == "success"
+
         # HTTP 请求路径
-        url = f"{self.base_url}:{self.port}/agent/group/{did or 'default'}/{group_id}/leave"
+        url = self._group_url(did, f"{group_id}/leave")
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 url,
@@ -96,8 +164,14 @@ class GroupMemberSDK:
                 await runner.on_message(message)
                 return True
 
+        if self.transport == "websocket":
+            socket = await self._get_socket(did)
+            result = await socket.request("message", group_id, content=content,
+                                          metadata=metadata or {})
+            return result.get("status") == "success"
+
         # HTTP 请求路径
-        url = f"{self.base_url}:{self.port}/agent/group/{did or 'default'}/{group_id}/message"
+        url = self._group_url(did, f"{group_id}/message")
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 url,
@@ -108,26 +182,34 @@ class GroupMemberSDK:
                 return result.get("status") == "success"
 
     async def listen_group(self, group_id: str, callback: Callable[[Message], None],
-                          did: str = None, message_types: List[MessageType] = None):
-        """监听群组消息"""
+                          did: str = None, message_types: List[MessageType] = None,
+                          from_offset: Optional[int] = None):
+        """监听群组消息
+
+        from_offset 为群组消息日志中的偏移量，指定时先补发该偏移量及之后的历史消息再接收新消息
+        """
+        last_event_id = from_offset - 1 if from_offset is not None else None
         if self.use_local_optimization and self._local_sdk:
             # 本地优化路径
             runner = self._local_sdk.get_group_runner(group_id)
             if runner:
-                queue = asyncio.Queue()
-                runner.register_listener(self.agent_id, queue)
+                queue = runner.register_listener(self.agent_id)
+                replay = []
+                if last_event_id is not None and hasattr(runner, "replay_since"):
+                    replay = runner.replay_since(last_event_id)
 
                 async def local_listener():
+                    for event in replay:
+                        message = _message_from_dict(event.message)
+                        if message_types is None or message.type in message_types:
+                            await callback(message)
                     while True:
-                        message_dict = await queue.get()
-                        message = Message(
-                            type=MessageType(message_dict["type"]),
-                            content=message_dict["content"],
-                            sender_id=message_dict["sender_id"],
-                            group_id=message_dict["group_id"],
-                            timestamp=message_dict["timestamp"],
-                            metadata=message_dict.get("metadata", {})
-                        )
+                        try:
+                            message_dict = await queue.get()
+                        except ListenerDisconnected:
+                            logger.warning(f"Listener for group {group_id} disconnected: {queue.close_reason}")
+                            return
+                        message = _message_from_dict(message_dict)
                         if message_types is None or message.type in message_types:
                             await callback(message)
 
@@ -135,28 +217,48 @@ class GroupMemberSDK:
                 self._listeners[group_id] = task
                 return
 
-        # HTTP SSE 路径
-        url = f"{self.base_url}:{self.port}/agent/group/{did or 'default'}/{group_id}/connect"
+        if self.transport == "websocket":
+            async def on_event(data):
+                message = _message_from_dict(data)
+                if message_types is None or message.type in message_types:
+                    await callback(message)
+
+            socket = await self._get_socket(did)
+            result = await socket.subscribe(group_id, on_event, last_event_id=last_event_id)
+            if result.get("status") == "success":
+                self._socket_groups[group_id] = did or 'default'
+            else:
+                logger.warning(f"Group {group_id} subscribe failed: {result.get('message')}")
+            return
+
+        # HTTP SSE 路径：记录最后收到的事件 ID，连接断开后带 Last-Event-ID 重连续传
+        url = self._group_url(did, f"{group_id}/connect")
 
         async def sse_listener():
+            nonlocal last_event_id
             async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    url,
-                    params={"req_did": self.agent_id}
-                ) as resp:
-                    async for line in resp.content:
-                        if line.startswith(b'data: '):
-                            data = json.loads(line[6:].decode())
-                            message = Message(
-                                type=MessageType(data["type"]),
-                                content=data["content"],
-                                sender_id=data["sender_id"],
-                                group_id=data["group_id"],
-                                timestamp=data["timestamp"],
-                                metadata=data.get("metadata", {})
-                            )
-                            if message_types is None or message.type in message_types:
-                                await callback(message)
+                while True:
+                    headers = {"Last-Event-ID": str(last_event_id)} if last_event_id is not None else {}
+                    try:
+                        async with session.get(
+                            url,
+                            params={"req_did": self.agent_id},
+                            headers=headers
+                        ) as resp:
+                            if resp.status != 200 or not resp.content_type.startswith("text/event-stream"):
+                                logger.warning(f"Group {group_id} connect failed: HTTP {resp.status}")
+                                return
+                            async for line in resp.content:
+                                if line.startswith(b'id: '):
+                                    last_event_id = line[4:].strip().decode()
+                                elif line.startswith(b'data: '):
+                                    data = json_codec.loads(line[6:])
+                                    message = _message_from_dict(data)
+                                    if message_types is None or message.type in message_types:
+                                        await callback(message)
+                    except aiohttp.ClientError as e:
+                        logger.warning(f"Group {group_id} stream interrupted: {e}")
+                    await asyncio.sleep(self.reconnect_delay)
 
         task = asyncio.create_task(sse_listener())
         self._listeners[group_id] = task
@@ -169,6 +271,10 @@ class GroupMemberSDK:
             if isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError):
                 logger.warning(f"Listener shutdown error: {result}")
         self._listeners.clear()
+        for socket in self._sockets.values():
+            await socket.close()
+        self._sockets.clear()
+        self._socket_groups.clear()
 
 
     async def stop_listening(self, group_id: str):
@@ -183,6 +289,10 @@ class GroupMemberSDK:
             except Exception as e:
                 logger.warning(f"Listener for group {group_id} raised error during shutdown: {e}")
 
+        socket_did = self._socket_groups.pop(group_id, None)
+        if socket_did is not None and socket_did in self._sockets:
+            await self._sockets[socket_did].unsubscribe(group_id)
+
         if self.use_local_optimization and self._local_sdk:
             runner = self._local_sdk.get_group_runner(group_id)
             if runner:
@@ -196,12 +306,125 @@ class GroupMemberSDK:
             if runner:
                 return [agent.to_dict() for agent in runner.get_members()]
 
+        if self.transport == "websocket":
+            socket = await self._get_socket(did)
+            result = await socket.request("members", group_id)
+            return result.get("members", [])
+
         # HTTP 请求路径
-        url = f"{self.base_url}:{self.port}/agent/group/{did or 'default'}/{group_id}/members"
+        url = self._group_url(did, f"{group_id}/members")
         async with aiohttp.ClientSession() as session:
             async with session.get(
                 url,
                 params={"req_did": self.agent_id}
             ) as resp:
                 result = await resp.json()
-                return result.get("members", [])
\ No newline at end of file
+                return result.get("members", [])
+
+    async def get_history(self, group_id: str, offset: int = 0, limit: int = 100,
+                          did: str = None) -> Dict[str, Any]:
+        """从群组消息日志分页读取历史消息
+
+        Returns:
+            Dict[str, Any]: messages（含 offset/timestamp/message）、first_offset、next_offset、end_offset，
+            下一页从 next_offset 开始读取
+        """
+        if self.use_local_optimization and self._local_sdk:
+            # 本地优化路径
+            runner = self._local_sdk.get_group_runner(group_id)
+            if runner and hasattr(runner, "read_history"):
+                return {"status": "success", **runner.read_history(offset, limit)}
+
+        if self.transport == "websocket":
+            socket = await self._get_socket(did)
+            return await socket.request("history", group_id, offset=offset, limit=limit)
+
+        # HTTP 请求路径
+        url = self._group_url(did, f"{group_id}/history")
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                url,
+                params={"req_did": self.agent_id, "offset": offset, "limit": limit}
+            ) as resp:
+                return await resp.json()
+
+    async def _batch(self, ops: List[Dict[str, Any]], did: str = None) -> List[Dict[str, Any]]:
+        """一次请求提交多个群组操作，返回与 ops 一一对应的结果"""
+        if self.transport == "websocket":
+            socket = await self._get_socket(did)
+            result = await socket.request("batch", None, ops=ops)
+        else:
+            url = self._group_url(did, "batch")
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    url,
+                    json={"ops": ops},
+                    params={"req_did": self.agent_id}
+                ) as resp:
+                    result = await resp.json()
+        if result.get("status") != "success":
+            error = {"status": "error", "message": result.get("message")}
+            return [error] * len(ops)
+        return result.get("results", [])
+
+    async def join_groups(self, group_ids: List[str], did: str = None, name: str = None,
+                          metadata: Dict[str, Any] = None) -> Dict[str, bool]:
+        """批量加入群组，返回 {group_id: 是否成功}"""
+        if self.use_local_optimization and self._local_sdk:
+            return {group_id: await self.join_group(group_id, did, name, metadata) for group_id in group_ids}
+        ops = [{"op": "join", "group_id": group_id, "name": name or self.agent_id, "metadata": metadata or {}}
+               for group_id in group_ids]
+        results = await self._batch(ops, did)
+        return {group_id: result.get("status") == "success" for group_id, result in zip(group_ids, results)}
+
+    async def leave_groups(self, group_ids: List[str], did: str = None) -> Dict[str, bool]:
+        """批量离开群组，返回 {group_id: 是否成功}"""
+        if self.use_local_optimization and self._local_sdk:
+            return {group_id: await self.leave_group(group_id, did) for group_id in group_ids}
+        results = await self._batch([{"op": "leave", "group_id": group_id} for group_id in group_ids], did)
+        return {group_id: result.get("status") == "success" for group_id, result in zip(group_ids, results)}
+
+    async def send_messages(self, messages: List[Dict[str, Any]], did: str = None) -> List[bool]:
+        """批量发送消息
+
+        Args:
+            messages: 每项为 {"group_id": ..., "content": ..., "metadata": {...}}，同一群组的消息按列表顺序送达
+        """
+        if self.use_local_optimization and self._local_sdk:
+            return [await self.send_message(m["group_id"], m["content"], did, metadata=m.get("metadata"))
+                    for m in messages]
+        ops = [{"op": "message", "group_id": m["group_id"], "content": m["content"],
+                "metadata": m.get("metadata") or {}} for m in messages]
+        results = await self._batch(ops, did)
+        return [result.get("status") == "success" for result in results]
+
+    async def get_member_changes(self, group_id: str, since_version: int = 0,
+                                 did: str = None) -> Dict[str, Any]:
+        """获取自 since_version 以来的成员增量
+
+        Returns:
+            Dict[str, Any]: version（当前版本）、full（为 True 时 joined 是完整成员列表）、
+            joined（新加入或更新的成员）、left（离开的成员ID）
+        """
+        if self.use_local_optimization and self._local_sdk:
+            # 本地优化路径
+            runner = self._local_sdk.get_group_runner(group_id)
+            if runner:
+                if hasattr(runner, "members_since"):
+                    return runner.members_since(since_version)
+                return {"version": None, "full": True, "left": [],
+                        "joined": [agent.to_dict() for agent in runner.get_members()]}
+
+        if self.transport == "websocket":
+            socket = await self._get_socket(did)
+            return await socket.request("members", group_id, action="diff", since_version=since_version)
+
+        # HTTP 请求路径
+        url = self._group_url(did, f"{group_id}/members")
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                url,
+                json={"action": "diff", "since_version": since_version},
+                params={"req_did": self.agent_id}
+            ) as resp:
+                return await resp.json()
@@ -14,6 +14,13 @@ from enum import Enum
 from typing import Dict, Any, Optional, List
 
 from anp_foundation.utils.log_base import logging as logger
+from anp_runtime.anp_service.anp_sdk_group_fanout import (
+    ListenerQueue,
+    fan_out,
+    listener_queue_settings,
+    offer,
+    replace_listener
+)
 
 
 class MessageType(Enum):
@@ -65,6 +72,10 @@ class Agent:
 class GroupRunner(ABC):
     """GroupRunner 基类 - 开发者继承此类实现自己的群组逻辑"""
 
+    # 监听队列长度与溢出策略（drop_oldest/disconnect/coalesce），None 表示使用全局配置
+    listener_queue_size: Optional[int] = None
+    listener_overflow: Optional[str] = None
+
     def __init__(self, group_id: str):
         self.group_id = group_id
         self.agents: Dict[str, Agent] = {}
@@ -105,25 +116,18 @@ class GroupRunner(ABC):
         pass
 
     async def broadcast(self, message: Message, exclude: List[str] = None):
-        """广播消息给所有监听的 agent"""
-        exclude = exclude or []
-        message_dict = message.to_dict()
-
-        for agent_id, queue in self.listeners.items():
-            if agent_id not in exclude:
-                try:
-                    await queue.put(message_dict)
-                except Exception as e:
-                    logger.error(f"Failed to send message to {agent_id}: {e}")
+        """广播消息给所有监听的 agent
 
+        消息只转换一次，以 put_nowait 扇出到各监听队列，慢消费者按溢出策略处理
+        """
+        for agent_id in fan_out(self.listeners, message.to_dict(), exclude):
+            self.unregister_listener(agent_id)
 
     async def send_to_agent(self, agent_id: str, message: Message):
         """发送消息给特定 agent"""
-        if agent_id in self.listeners:
-            try:
-                await self.listeners[agent_id].put(message.to_dict())
-            except Exception as e:
-                logger.error(f"Failed to send message to {agent_id}: {e}")
+        queue = self.listeners.get(agent_id)
+        if queue is not None and not offer(queue, message.to_dict()):
+            self.unregister_listener(agent_id)
 
     async def remove_member(self, agent_id: str) -> bool:
         """移除成员"""
@@ -150,18 +154,34 @@ class GroupRunner(ABC):
         return agent_id in self.agents
 
 
-    def register_listener(self, agent_id: str, queue: asyncio.Queue):
-        """注册消息监听器"""
-        self.listeners[agent_id] = queue
+    def create_listener_queue(self) -> ListenerQueue:
+        """按运行器/全局配置创建有界监听队列"""
+        settings = listener_queue_settings()
+        return ListenerQueue(
+            maxsize=self.listener_queue_size or settings["maxsize"],
+            overflow=self.listener_overflow or settings["overflow"]
+        )
+
+    def register_listener(self, agent_id: str, queue: Optional[asyncio.Queue] = None) -> asyncio.Queue:
+        """注册消息监听器，未传入队列时创建有界监听队列；同一 agent 的旧监听被断开"""
+        if queue is None:
+            queue = self.create_listener_queue()
+        replace_listener(self.listeners, agent_id, queue)
         logger.debug(f"Registered listener for {agent_id} in group {self.group_id}")
+        return queue
 
-    def unregister_listener(self, agent_id: str):
-        """注销消息监听器"""
-        if agent_id in self.listeners:
+    def unregister_listener(self, agent_id: str, queue: Optional[asyncio.Queue] = None):
+        """注销消息监听器（传入 queue 时仅当仍是该队列才注销）"""
+        if agent_id in self.listeners and (queue is None or self.listeners[agent_id] is queue):
             del self.listeners[agent_id]
             logger.debug(f"Unregistered listener for {agent_id} in group {self.group_id}")
 
-
+    def get_listener_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各监听者的积压指标"""
+        return {
+            agent_id: queue.stats() if isinstance(queue, ListenerQueue) else {"depth": queue.qsize()}
+            for agent_id, queue in self.listeners.items()
+        }
 
     async def start(self):
         """启动 GroupRunner"""
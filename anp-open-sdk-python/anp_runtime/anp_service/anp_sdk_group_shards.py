@@ -0,0 +1,287 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""群组运行器分片执行
+
+群组按 group_id 的稳定哈希分配到固定数量的分片，每个分片一个收件箱和一个串行处理的工作协程，
+同一群组的 join/leave/message 等操作按提交顺序执行，一个慢群组只阻塞自己所在的分片。
+- task 模式（默认）：分片工作协程运行在服务端事件循环上，只隔离 await 期间的等待，
+  运行器中的同步计算仍会阻塞整个服务端
+- thread 模式：每个分片一个独立线程和事件循环，CPU 密集或同步阻塞的运行器不会阻塞服务端事件循环；
+  运行器在分片线程中调用 broadcast_message 时会切回服务端事件循环扇出。启用前须确认运行器满足：
+  - join/leave 等回调在分片线程中修改 agents/listeners，而服务端事件循环上的成员检查、连接订阅与
+    统计会不加锁地读取这些状态，运行器须自行保证这些读写线程安全
+  - 运行器持有的 asyncio 对象（Event、Queue、Lock、客户端会话等）须在分片的事件循环中创建和使用，
+    不能与服务端事件循环共享
+place() 可以把热点群组固定到指定分片或独占分片。
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+import logging
+logger = logging.getLogger(__name__)
+
+TASK_MODE = "task"
+THREAD_MODE = "thread"
+SHARD_MODES = (TASK_MODE, THREAD_MODE)
+
+DEFAULT_SHARD_COUNT = 4
+
+# 当前正在执行的分片，以及提交请求的服务端事件循环（thread 模式下用于切回扇出）
+current_shard: contextvars.ContextVar[Optional['GroupShard']] = contextvars.ContextVar(
+    "current_shard", default=None)
+dispatch_loop: contextvars.ContextVar[Optional[asyncio.AbstractEventLoop]] = contextvars.ContextVar(
+    "dispatch_loop", default=None)
+
+ResultFuture = Union[asyncio.Future, concurrent.futures.Future]
+
+
+class GroupShard:
+    """一个分片：收件箱 + 串行工作协程 + 负载指标"""
+
+    def __init__(self, name: str, mode: str = TASK_MODE):
+        self.name = name
+        self.mode = mode
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inbox: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+        self.groups: set = set()
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_wait = 0.0
+        self.max_run = 0.0
+        self.last_group: Optional[str] = None
+
+    def _ensure_started(self, home_loop: asyncio.AbstractEventLoop):
+        if self.mode == THREAD_MODE:
+            if self._thread is None or not self._thread.is_alive():
+                self._ready.clear()
+                self._thread = threading.Thread(target=self._run_thread, name=f"group-shard-{self.name}",
+                                                daemon=True)
+                self._thread.start()
+                self._ready.wait()
+            return
+        # task 模式：事件循环变化（例如测试中每个用例一个循环）时在当前循环重建
+        if self.loop is not home_loop or self._worker is None or self._worker.done():
+            self.loop = home_loop
+            self._inbox = asyncio.Queue()
+            self._worker = home_loop.create_task(self._work())
+
+    def _run_thread(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._inbox = asyncio.Queue()
+        self._worker = self.loop.create_task(self._work())
+        self._ready.set()
+        try:
+            self.loop.run_until_complete(self._worker)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.close()
+
+    async def submit(self, group_id: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """提交一个操作并等待结果；分片内按提交顺序串行执行"""
+        if current_shard.get() is self:
+            # 运行器在本分片内再次提交（例如 on_message 中调用群组接口），直接执行以免自锁
+            return await factory()
+        home_loop = asyncio.get_running_loop()
+        server_loop = dispatch_loop.get()
+        if server_loop is not None and server_loop is not home_loop:
+            # 从 thread 模式分片线程中提交到其他分片：回到服务端事件循环提交
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.submit(group_id, factory), server_loop))
+
+        self._ensure_started(home_loop)
+        self.submitted += 1
+        if self.mode == THREAD_MODE:
+            future: ResultFuture = concurrent.futures.Future()
+            self.loop.call_soon_threadsafe(self._inbox.put_nowait,
+                                           (group_id, factory, future, time.monotonic(), home_loop))
+            return await asyncio.wrap_future(future)
+        future = home_loop.create_future()
+        self._inbox.put_nowait((group_id, factory, future, time.monotonic(), None))
+        return await future
+
+    async def _work(self):
+        current_shard.set(self)
+        inbox = self._inbox
+        try:
+            while True:
+                group_id, factory, future, enqueued_at, home_loop = await inbox.get()
+                if future.cancelled():
+                    continue
+                started = time.monotonic()
+                self.max_wait = max(self.max_wait, started - enqueued_at)
+                self.last_group = group_id
+                token = dispatch_loop.set(home_loop)
+                try:
+                    result = await factory()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    _set_exception(future, e)
+                else:
+                    _set_result(future, result)
+                finally:
+                    dispatch_loop.reset(token)
+                    elapsed = time.monotonic() - started
+                    self.processed += 1
+                    self.busy_seconds += elapsed
+                    self.max_run = max(self.max_run, elapsed)
+        finally:
+            # 分片停止时取消尚未处理的请求，避免提交方一直等待
+            while not inbox.empty():
+                inbox.get_nowait()[2].cancel()
+
+    @property
+    def depth(self) -> int:
+        return self._inbox.qsize() if self._inbox is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shard": self.name,
+            "mode": self.mode,
+            "groups": len(self.groups),
+            "depth": self.depth,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 6),
+            "max_wait_seconds": round(self.max_wait, 6),
+            "max_run_seconds": round(self.max_run, 6),
+            "last_group": self.last_group,
+        }
+
+    def stop(self):
+        """停止工作协程/线程，未处理的请求被取消"""
+        if self._worker is None:
+            return
+        if self.mode == THREAD_MODE and self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._worker.cancel)
+            if self._thread is not None and self._thread is not threading.current_thread():
+                self._thread.join(timeout=5)
+        elif self.loop is not None and not self.loop.is_closed():
+            self._worker.cancel()
+        self._worker = None
+
+
+def _set_result(future: ResultFuture, result: Any):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: ResultFuture, exc: BaseException):
+    if not future.done():
+        future.set_exception(exc)
+
+
+class GroupShardPool:
+    """群组分片池：哈希分片 + 固定放置"""
+
+    def __init__(self, shard_count: int = DEFAULT_SHARD_COUNT, mode: str = TASK_MODE):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"不支持的分片模式: {mode}，可用: {SHARD_MODES}")
+        self.mode = mode
+        self.shards: List[GroupShard] = [GroupShard(str(i), mode) for i in range(max(1, shard_count))]
+        self._dedicated: Dict[str, GroupShard] = {}
+        self._placements: Dict[str, GroupShard] = {}
+
+    def shard_for(self, group_id: str) -> GroupShard:
+        """群组所在的分片：固定放置优先，否则按稳定哈希"""
+        shard = self._placements.get(group_id)
+        if shard is None:
+            shard = self.shards[zlib.crc32(group_id.encode("utf-8")) % len(self.shards)]
+        shard.groups.add(group_id)
+        return shard
+
+    def place(self, group_id: str, shard: Optional[int] = None, dedicated: bool = False) -> str:
+        """把群组固定到指定分片，或 dedicated=True 时放到独占分片；返回分片名
+
+        调整放置前已提交的请求仍在原分片执行完毕
+        """
+        self._release(group_id)
+        if dedicated:
+            target = GroupShard(f"dedicated:{group_id}", self.mode)
+            self._dedicated[group_id] = target
+        elif shard is not None:
+            if not 0 <= shard < len(self.shards):
+                raise ValueError(f"分片编号超出范围: {shard}（共 {len(self.shards)} 个分片）")
+            target = self.shards[shard]
+        else:
+            raise ValueError("必须指定 shard 或 dedicated=True")
+        self._placements[group_id] = target
+        target.groups.add(group_id)
+        logger.debug(f"群组 {group_id} 固定到分片 {target.name}")
+        return target.name
+
+    def unplace(self, group_id: str):
+        """取消固定放置，恢复按哈希分片"""
+        self._release(group_id)
+
+    def _release(self, group_id: str):
+        shard = self._placements.pop(group_id, None)
+        if shard is not None:
+            shard.groups.discard(group_id)
+        dedicated = self._dedicated.pop(group_id, None)
+        if dedicated is not None:
+            dedicated.stop()
+
+    def forget(self, group_id: str):
+        """群组注销时移除其放置与分片归属"""
+        self._release(group_id)
+        for shard in self.shards:
+            shard.groups.discard(group_id)
+
+    def placement(self, group_id: str) -> Dict[str, Any]:
+        shard = self.shard_for(group_id)
+        return {"shard": shard.name, "pinned": group_id in self._placements}
+
+    async def submit(self, group_id: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        return await self.shard_for(group_id).submit(group_id, factory)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [shard.stats() for shard in self.shards + list(self._dedicated.values())]
+
+    def shutdown(self):
+        for shard in self.shards + list(self._dedicated.values()):
+            shard.stop()
+
+
+def shard_pool_settings() -> Dict[str, Any]:
+    """从全局配置读取分片设置，未设置全局配置时使用默认值"""
+    settings = {"shard_count": DEFAULT_SHARD_COUNT, "mode": TASK_MODE}
+    try:
+        from anp_foundation.config import get_global_config
+        config = get_global_config()
+    except RuntimeError:
+        return settings
+    settings.update({
+        "shard_count": getattr(config.anp_sdk, "group_shard_count", DEFAULT_SHARD_COUNT),
+        "mode": getattr(config.anp_sdk, "group_shard_mode", TASK_MODE),
+    })
+    return settings
@@ -0,0 +1,216 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""群组 WebSocket 客户端传输
+
+一条 WebSocket 连接（/agent/api/{did}/group/ws）承载多个群组的请求与事件：
+- request() 发送带编号的请求帧，按编号匹配服务端的 result 帧
+- subscribe() 按群组登记回调，服务端 event 帧按 group_id 分发
+- 记录每个群组最后收到的序号，断线重连后带 last_event_id 重新订阅续传
+"""
+
+import asyncio
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiohttp
+
+from anp_foundation.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+EventCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class GroupSocketError(Exception):
+    """群组 WebSocket 连接或请求失败"""
+
+
+class GroupSocketTransport:
+    """群组 WebSocket 客户端，一个 did 共用一条连接"""
+
+    def __init__(self, url: str, req_did: str, headers: Optional[Dict[str, str]] = None,
+                 binary: bool = False, reconnect_delay: float = 1.0, request_timeout: float = 30.0):
+        self.url = url
+        self.req_did = req_did
+        self.headers = headers or {}
+        self.binary = binary
+        self.reconnect_delay = reconnect_delay
+        self.request_timeout = request_timeout
+        self.welcome: Optional[Dict[str, Any]] = None
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._closing = False
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._callbacks: Dict[str, EventCallback] = {}
+        self._last_seq: Dict[str, int] = {}
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    async def connect(self):
+        """建立连接并等待服务端 welcome 帧（升级时完成认证）"""
+        async with self._connect_lock:
+            if self.connected:
+                return
+            self._closing = False
+            if self._session is None or self._session.closed:
+                self._session = aiohttp.ClientSession()
+            params = {"req_did": self.req_did}
+            if self.binary:
+                params["encoding"] = "binary"
+            try:
+                ws = await self._session.ws_connect(self.url, params=params, headers=self.headers)
+            except aiohttp.ClientError as e:
+                raise GroupSocketError(f"群组WebSocket连接失败: {e}") from e
+
+            welcome = await ws.receive()
+            frame = self._decode(welcome)
+            if not frame or frame.get("op") != "welcome":
+                await ws.close()
+                raise GroupSocketError(f"群组WebSocket认证失败: close_code={ws.close_code}")
+            self.welcome = frame
+            self._ws = ws
+            self._reader = asyncio.create_task(self._read_loop(ws))
+
+    async def request(self, op: str, group_id: str, **payload) -> Dict[str, Any]:
+        """发送一个请求并等待对应的 result"""
+        if not self.connected:
+            await self.connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send({"op": op, "id": request_id, "group_id": group_id, **payload})
+            return await asyncio.wait_for(future, self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def subscribe(self, group_id: str, callback: EventCallback,
+                        last_event_id: Optional[int] = None) -> Dict[str, Any]:
+        """订阅群组事件，重复订阅时从上次收到的序号之后续传，也可指定 last_event_id 从日志偏移量续传"""
+        self._callbacks[group_id] = callback
+        if last_event_id is not None:
+            self._last_seq[group_id] = last_event_id
+        payload = {}
+        if group_id in self._last_seq:
+            payload["last_event_id"] = self._last_seq[group_id]
+        result = await self.request("subscribe", group_id, **payload)
+        if result.get("status") != "success":
+            self._callbacks.pop(group_id, None)
+        return result
+
+    async def unsubscribe(self, group_id: str) -> Dict[str, Any]:
+        """取消订阅群组事件"""
+        self._callbacks.pop(group_id, None)
+        self._last_seq.pop(group_id, None)
+        if not self.connected:
+            return {"status": "success", "message": "Not connected"}
+        return await self.request("unsubscribe", group_id)
+
+    async def close(self):
+        """关闭连接，不再重连"""
+        self._closing = True
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._fail_pending(GroupSocketError("群组WebSocket连接已关闭"))
+
+    async def _send(self, obj: Dict[str, Any]):
+        data = json_codec.dumps_bytes(obj)
+        if self.binary:
+            await self._ws.send_bytes(data)
+        else:
+            await self._ws.send_str(data.decode("utf-8"))
+
+    @staticmethod
+    def _decode(msg: aiohttp.WSMessage) -> Optional[Dict[str, Any]]:
+        if msg.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+            return None
+        try:
+            frame = json_codec.loads(msg.data)
+        except json_codec.JSONDecodeError:
+            logger.warning("收到无法解析的群组WebSocket帧")
+            return None
+        return frame if isinstance(frame, dict) else None
+
+    async def _read_loop(self, ws: aiohttp.ClientWebSocketResponse):
+        try:
+            async for msg in ws:
+                frame = self._decode(msg)
+                if frame is not None:
+                    await self._dispatch(frame)
+        except Exception as e:
+            logger.warning(f"群组WebSocket读取中断: {e!r}")
+        finally:
+            self._ws = None
+            self._fail_pending(GroupSocketError("群组WebSocket连接已断开"))
+        if not self._closing and self._callbacks:
+            asyncio.create_task(self._reconnect())
+
+    async def _dispatch(self, frame: Dict[str, Any]):
+        op = frame.get("op")
+        if op == "event":
+            group_id = frame.get("group_id")
+            seq = frame.get("seq")
+            if seq is not None:
+                self._last_seq[group_id] = seq
+            callback = self._callbacks.get(group_id)
+            if callback is not None:
+                try:
+                    await callback(frame.get("message"))
+                except Exception as e:
+                    logger.error(f"群组 {group_id} 事件回调出错: {e}")
+        elif op in ("result", "error"):
+            future = self._pending.get(frame.get("id"))
+            if future is not None and not future.done():
+                if op == "result":
+                    future.set_result(frame.get("result") or {})
+                else:
+                    future.set_result({"status": "error", "message": frame.get("message")})
+        elif op == "unsubscribed":
+            group_id = frame.get("group_id")
+            self._callbacks.pop(group_id, None)
+            logger.warning(f"群组 {group_id} 订阅被服务端取消: {frame.get('reason')}")
+
+    async def _reconnect(self):
+        """断线后重连并恢复所有订阅"""
+        while not self._closing and self._callbacks:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await self.connect()
+                for group_id, callback in list(self._callbacks.items()):
+                    await self.subscribe(group_id, callback)
+                logger.info(f"群组WebSocket已重连，恢复订阅 {len(self._callbacks)} 个群组")
+                return
+            except (GroupSocketError, asyncio.TimeoutError) as e:
+                logger.warning(f"群组WebSocket重连失败: {e}")
+
+    def _fail_pending(self, exc: Exception):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
@@ -12,14 +12,37 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import asyncio
+import itertools
 import logging
-from typing import Dict, Any, Callable, List, Optional
-from datetime import datetime, time
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, Callable, Iterable, List, Optional
+from datetime import datetime
+from urllib.parse import quote
 
 from starlette.responses import StreamingResponse
 
+from anp_foundation.utils import json_codec
+from anp_runtime.anp_service.anp_sdk_group_fanout import (
+    HEARTBEAT_FRAME,
+    GroupEvent,
+    ListenerDisconnected,
+    ListenerQueue,
+    ReplayBuffer,
+    fan_out,
+    listener_queue_settings,
+    parse_last_event_id,
+    replace_listener
+)
+from anp_runtime.anp_service.anp_sdk_group_log import GroupMessageLog, group_log_settings
+from anp_runtime.anp_service.anp_sdk_group_shards import GroupShardPool, dispatch_loop, shard_pool_settings
+
 logger = logging.getLogger(__name__)
 
+# 单次批量群组请求最多包含的操作数
+MAX_GROUP_BATCH = 500
+
 
 class GroupAgent:
     """群组成员Agent信息"""
@@ -41,6 +64,61 @@ class GroupAgent:
         }
 
 
+class MemberRegistry(dict):
+    """群组成员表：每次增删成员时递增版本号，并保留最近的变更用于增量同步"""
+
+    def __init__(self, history_size: int = 1024):
+        super().__init__()
+        self.version = 0
+        self._changes: deque = deque(maxlen=max(1, history_size))  # (version, agent_id, joined)
+
+    def _record(self, agent_id: str, joined: bool):
+        self.version += 1
+        self._changes.append((self.version, agent_id, joined))
+
+    def __setitem__(self, agent_id, agent):
+        super().__setitem__(agent_id, agent)
+        self._record(agent_id, True)
+
+    def __delitem__(self, agent_id):
+        super().__delitem__(agent_id)
+        self._record(agent_id, False)
+
+    def pop(self, agent_id, *default):
+        present = agent_id in self
+        value = super().pop(agent_id, *default)
+        if present:
+            self._record(agent_id, False)
+        return value
+
+    def clear(self):
+        for agent_id in list(self):
+            del self[agent_id]
+
+    def changes_since(self, since_version: int) -> Dict[str, Any]:
+        """返回 since_version 之后的成员变更；变更已超出保留范围时返回完整成员列表"""
+        oldest = self._changes[0][0] if self._changes else self.version + 1
+        if since_version > self.version or since_version < oldest - 1:
+            return {
+                "version": self.version,
+                "full": True,
+                "joined": [agent.to_dict() for agent in self.values()],
+                "left": []
+            }
+        latest: Dict[str, bool] = {}
+        for version, agent_id, joined in reversed(self._changes):
+            if version <= since_version:
+                break
+            latest.setdefault(agent_id, joined)
+        return {
+            "version": self.version,
+            "full": False,
+            "joined": [self[agent_id].to_dict() for agent_id, joined in latest.items()
+                       if joined and agent_id in self],
+            "left": [agent_id for agent_id, joined in latest.items() if not joined]
+        }
+
+
 class Message:
     """群组消息"""
 
@@ -67,11 +145,62 @@ class Message:
 class GroupRunner:
     """群组运行器基类"""
 
+    # 监听队列长度与溢出策略（drop_oldest/disconnect/coalesce）、重放缓冲长度、SSE 心跳间隔，
+    # None 表示使用全局配置
+    listener_queue_size: Optional[int] = None
+    listener_overflow: Optional[str] = None
+    replay_buffer_size: Optional[int] = None
+    heartbeat_interval: Optional[float] = None
+    # 持久化消息日志：是否启用与根目录，None 表示使用全局配置（group_log_enabled / group_msg_path）
+    message_log_enabled: Optional[bool] = None
+    message_log_path: Optional[str] = None
+
+    # 单次历史查询最多返回的消息数
+    MAX_HISTORY_PAGE = 1000
+    # 成员变更保留条数，客户端版本落后更多时返回完整成员列表
+    membership_history_size = 1024
+
     def __init__(self, group_id: str):
         self.group_id = group_id
-        self.agents: Dict[str, GroupAgent] = {}
+        self.agents: Dict[str, GroupAgent] = MemberRegistry(self.membership_history_size)
         self.listeners: Dict[str, asyncio.Queue] = {}
         self.created_at = datetime.now()
+        replay_size = self.replay_buffer_size
+        if replay_size is None:
+            replay_size = listener_queue_settings()["replay_size"]
+        self.replay_buffer = ReplayBuffer(replay_size, group_id)
+        self._message_log: Optional[GroupMessageLog] = None
+        self._message_log_checked = False
+
+    @property
+    def message_log(self) -> Optional[GroupMessageLog]:
+        """群组的持久化消息日志，首次使用时打开并把事件序号与日志偏移量对齐；未启用时为 None"""
+        if not self._message_log_checked:
+            self._message_log_checked = True
+            settings = group_log_settings()
+            root = self.message_log_path or settings["path"]
+            enabled = self.message_log_enabled
+            if enabled is None:
+                enabled = self.message_log_path is not None or settings["enabled"]
+            if enabled and root:
+                try:
+                    self._message_log = GroupMessageLog(
+                        Path(root) / quote(self.group_id, safe=""),
+                        segment_bytes=settings["segment_bytes"],
+                        retention_seconds=settings["retention_seconds"],
+                        retention_bytes=settings["retention_bytes"],
+                        fsync=settings["fsync"]
+                    )
+                    self.replay_buffer.advance_to(self._message_log.next_offset)
+                except OSError as e:
+                    logger.error(f"❌ 打开群组 {self.group_id} 消息日志失败，仅保留内存消息: {e}")
+        return self._message_log
+
+    def close_message_log(self):
+        """关闭持久化消息日志"""
+        if self._message_log is not None:
+            self._message_log.close()
+            self._message_log = None
 
     async def on_agent_join(self, agent: GroupAgent) -> bool:
         """Agent加入群组时的处理，返回是否允许加入"""
@@ -93,6 +222,15 @@ class GroupRunner:
         """获取所有成员"""
         return list(self.agents.values())
 
+    @property
+    def membership_version(self) -> int:
+        """成员版本号，每次加入或离开递增"""
+        return self.agents.version
+
+    def members_since(self, since_version: int) -> Dict[str, Any]:
+        """自 since_version 以来的成员增量（joined/left），客户端据此更新本地成员表"""
+        return self.agents.changes_since(since_version)
+
     async def remove_member(self, agent_id: str) -> bool:
         """移除成员"""
         if agent_id in self.agents:
@@ -102,22 +240,97 @@ class GroupRunner:
             return True
         return False
 
-    def register_listener(self, agent_id: str, queue: asyncio.Queue):
-        """注册事件监听器"""
-        self.listeners[agent_id] = queue
+    def create_listener_queue(self) -> ListenerQueue:
+        """按运行器/全局配置创建有界监听队列"""
+        settings = listener_queue_settings()
+        return ListenerQueue(
+            maxsize=self.listener_queue_size or settings["maxsize"],
+            overflow=self.listener_overflow or settings["overflow"]
+        )
+
+    def register_listener(self, agent_id: str, queue: Optional[asyncio.Queue] = None) -> asyncio.Queue:
+        """注册事件监听器，未传入队列时创建有界监听队列
 
-    def unregister_listener(self, agent_id: str):
-        """注销事件监听器"""
-        if agent_id in self.listeners:
+        同一 agent 只保留一个监听：经另一传输或新连接再次注册时，旧监听被断开
+        """
+        if queue is None:
+            queue = self.create_listener_queue()
+        replace_listener(self.listeners, agent_id, queue)
+        return queue
+
+    def unregister_listener(self, agent_id: str, queue: Optional[asyncio.Queue] = None):
+        """注销事件监听器（传入 queue 时仅当仍是该队列才注销，避免误删重连后的新监听）"""
+        if agent_id in self.listeners and (queue is None or self.listeners[agent_id] is queue):
             del self.listeners[agent_id]
 
-    async def broadcast_message(self, message: Dict[str, Any]):
-        """广播消息给所有监听器"""
-        for queue in self.listeners.values():
+    async def broadcast_message(self, message: Dict[str, Any]) -> GroupEvent:
+        """广播消息给所有监听器
+
+        消息只编码一次为 SSE 帧，同一个 GroupEvent 以 put_nowait 扇出给所有监听者，
+        慢消费者按溢出策略处理；事件同时进入重放缓冲区供断线续传。
+        启用持久化日志时先追加到日志，以日志分配的偏移量作为事件序号（文件写入由日志的后台线程完成，
+        不阻塞事件循环）；日志写入失败时停用日志、仅保留内存消息，避免之后的序号与日志偏移量错位。
+        在 thread 模式分片线程中调用时切回服务端事件循环扇出
+        """
+        server_loop = dispatch_loop.get()
+        if server_loop is not None and server_loop is not asyncio.get_running_loop():
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.broadcast_message(message), server_loop))
+        log = self.message_log
+        data = None
+        if log is not None:
+            data = json_codec.dumps_bytes(message)
             try:
-                await queue.put(message)
-            except Exception as e:
-                logger.error(f"广播消息失败: {e}")
+                self.replay_buffer.advance_to(log.append(data))
+            except OSError as e:
+                logger.error(f"❌ 群组 {self.group_id} 消息写入日志失败，停用日志，仅保留内存消息: {e}")
+                self.close_message_log()
+        event = self.replay_buffer.publish(message, data)
+        for agent_id in fan_out(self.listeners, event):
+            self.unregister_listener(agent_id)
+        return event
+
+    def replay_since(self, last_seq: int) -> Iterable[GroupEvent]:
+        """序号大于 last_seq 的事件：重放缓冲区之前的部分从持久化日志按页读取"""
+        buffered = self.replay_buffer.since(last_seq)
+        first_buffered = buffered[0].seq if buffered else self.replay_buffer.last_seq + 1
+        log = self.message_log
+        if log is None or last_seq + 1 >= first_buffered:
+            return buffered
+        older = (GroupEvent.from_encoded(record.offset, record.data, self.group_id)
+                 for record in log.iter_range(last_seq + 1, first_buffered))
+        return itertools.chain(older, buffered)
+
+    def read_history(self, offset: int, limit: int = 100) -> Dict[str, Any]:
+        """从 offset 起分页读取历史消息，返回消息与下一页的偏移量"""
+        limit = max(1, min(limit, self.MAX_HISTORY_PAGE))
+        log = self.message_log
+        if log is not None:
+            messages = [
+                {"offset": record.offset, "timestamp": record.timestamp, "message": json_codec.loads(record.data)}
+                for record in log.read(offset, limit)
+            ]
+            first_offset = log.first_offset
+        else:
+            messages = [
+                {"offset": event.seq, "timestamp": event.message.get("timestamp"), "message": event.message}
+                for event in self.replay_buffer.since(offset - 1)[:limit]
+            ]
+            first_offset = self.replay_buffer.first_seq
+        next_offset = messages[-1]["offset"] + 1 if messages else max(offset, first_offset)
+        return {
+            "messages": messages,
+            "first_offset": first_offset,
+            "next_offset": next_offset,
+            "end_offset": self.replay_buffer.last_seq + 1
+        }
+
+    def get_listener_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各监听者的积压指标"""
+        return {
+            agent_id: queue.stats() if isinstance(queue, ListenerQueue) else {"depth": queue.qsize()}
+            for agent_id, queue in self.listeners.items()
+        }
 
 
 class GlobalGroupManager:
@@ -127,12 +340,37 @@ class GlobalGroupManager:
     _groups: Dict[str, GroupRunner] = {}  # {group_id: GroupRunner}
     _group_patterns: Dict[str, type] = {}  # {url_pattern: GroupRunner类}
     _group_stats: Dict[str, Any] = {}  # 群组统计信息
+    _shard_pool: Optional[GroupShardPool] = None  # 运行器分片池，首次使用时按配置创建
+
+    @classmethod
+    def get_shard_pool(cls) -> GroupShardPool:
+        """获取运行器分片池"""
+        if cls._shard_pool is None:
+            settings = shard_pool_settings()
+            cls._shard_pool = GroupShardPool(settings["shard_count"], settings["mode"])
+        return cls._shard_pool
+
+    @classmethod
+    def place_group(cls, group_id: str, shard: Optional[int] = None, dedicated: bool = False) -> str:
+        """把热点群组固定到指定分片或独占分片，返回分片名"""
+        return cls.get_shard_pool().place(group_id, shard=shard, dedicated=dedicated)
+
+    @classmethod
+    def unplace_group(cls, group_id: str):
+        """取消群组的固定放置"""
+        cls.get_shard_pool().unplace(group_id)
+
+    @classmethod
+    def get_shard_stats(cls) -> List[Dict[str, Any]]:
+        """各分片的负载指标"""
+        return cls.get_shard_pool().stats()
 
     @classmethod
     def register_runner(cls, group_id: str, runner_class: type, url_pattern: Optional[str] = None):
         """注册群组运行器"""
         if group_id in cls._groups:
             logger.warning(f"群组 {group_id} 已存在，将被覆盖")
+            cls._groups[group_id].close_message_log()
 
         # 创建运行器实例
         runner = runner_class(group_id)
@@ -156,7 +394,9 @@ class GlobalGroupManager:
     def unregister_runner(cls, group_id: str):
         """注销群组运行器"""
         if group_id in cls._groups:
-            del cls._groups[group_id]
+            cls._groups.pop(group_id).close_message_log()
+            if cls._shard_pool is not None:
+                cls._shard_pool.forget(group_id)
             if group_id in cls._group_stats:
                 del cls._group_stats[group_id]
             logger.debug(f"🗑️ 群组运行器已注销: {group_id}")
@@ -173,10 +413,24 @@ class GlobalGroupManager:
 
     @classmethod
     def get_group_stats(cls, group_id: str = None) -> Dict[str, Any]:
-        """获取群组统计信息"""
+        """获取群组统计信息（含各监听者积压指标）"""
         if group_id:
-            return cls._group_stats.get(group_id, {})
-        return cls._group_stats.copy()
+            return cls._stats_with_listeners(group_id)
+        return {gid: cls._stats_with_listeners(gid) for gid in cls._group_stats}
+
+    @classmethod
+    def _stats_with_listeners(cls, group_id: str) -> Dict[str, Any]:
+        stats = dict(cls._group_stats.get(group_id, {}))
+        runner = cls._groups.get(group_id)
+        if stats and runner is not None:
+            stats["member_count"] = len(runner.agents)
+            stats["listeners"] = runner.get_listener_stats()
+            if runner._message_log is not None:
+                stats["message_log"] = runner._message_log.stats()
+            pool = cls.get_shard_pool()
+            shard = pool.shard_for(group_id)
+            stats["shard"] = {**shard.stats(), **pool.placement(group_id)}
+        return stats
 
     @classmethod
     def update_group_activity(cls, group_id: str, activity_type: str = "message"):
@@ -189,9 +443,14 @@ class GlobalGroupManager:
     @classmethod
     def clear_groups(cls):
         """清除所有群组（主要用于测试）"""
+        for runner in cls._groups.values():
+            runner.close_message_log()
         cls._groups.clear()
         cls._group_patterns.clear()
         cls._group_stats.clear()
+        if cls._shard_pool is not None:
+            cls._shard_pool.shutdown()
+            cls._shard_pool = None
         logger.debug("清除所有群组")
 
 class MessageHandler:
@@ -222,8 +481,8 @@ class GlobalMessageManager:
     _handler_conflicts: List[Dict[str, Any]] = []  # 冲突记录
 
     @classmethod
-    def route_group_request(cls, did: str, group_id: str, request_type: str,
-                            request_data: Dict[str, Any], request) -> Any:
+    async def route_group_request(cls, did: str, group_id: str, request_type: str,
+                                  request_data: Dict[str, Any], request) -> Any:
         """路由群组请求"""
         # 获取群组运行器
         runner = GlobalGroupManager.get_runner(group_id)
@@ -233,20 +492,72 @@ class GlobalMessageManager:
         # 更新活动统计
         GlobalGroupManager.update_group_activity(group_id, request_type)
 
+        # join/leave/message/members 会调用运行器回调，提交到群组所在分片按序执行
+        handler = cls._runner_handler(request_type)
+        if handler is not None:
+            return await GlobalGroupManager.get_shard_pool().submit(
+                group_id, lambda: handler(runner, request_data))
+
         # 根据请求类型处理
-        if request_type == "join":
-            return cls._handle_group_join(runner, request_data)
-        elif request_type == "leave":
-            return cls._handle_group_leave(runner, request_data)
-        elif request_type == "message":
-            return cls._handle_group_message(runner, request_data)
-        elif request_type == "connect":
+        if request_type == "connect":
             return cls._handle_group_connect(runner, request_data)
-        elif request_type == "members":
-            return cls._handle_group_members(runner, request_data)
+        elif request_type == "history":
+            return cls._handle_group_history(runner, request_data)
         else:
             return {"status": "error", "message": f"未知的群组请求类型: {request_type}"}
 
+    @classmethod
+    def _runner_handler(cls, request_type: str) -> Optional[Callable]:
+        """需要在群组分片内执行的请求类型对应的处理函数"""
+        return {
+            "join": cls._handle_group_join,
+            "leave": cls._handle_group_leave,
+            "message": cls._handle_group_message,
+            "members": cls._handle_group_members,
+        }.get(request_type)
+
+    @classmethod
+    async def route_group_batch(cls, did: str, ops: List[Dict[str, Any]], req_did: str) -> List[Any]:
+        """批量路由群组请求
+
+        ops 中每项为 {"op": "join" | "leave" | "message" | "members", "group_id": ..., ...参数}，
+        同一群组的操作合并为一次分片提交并按原顺序执行，不同群组的操作并发执行；
+        返回与 ops 一一对应的结果列表
+        """
+        if len(ops) > MAX_GROUP_BATCH:
+            raise ValueError(f"批量请求最多 {MAX_GROUP_BATCH} 项，实际 {len(ops)} 项")
+        results: List[Any] = [None] * len(ops)
+        by_group: Dict[str, List[int]] = {}
+        for index, op in enumerate(ops):
+            if not isinstance(op, dict) or cls._runner_handler(op.get("op")) is None or not op.get("group_id"):
+                results[index] = {"status": "error", "message": f"不支持的批量操作: {op}"}
+                continue
+            by_group.setdefault(op["group_id"], []).append(index)
+
+        async def run_group(group_id: str, indexes: List[int]):
+            runner = GlobalGroupManager.get_runner(group_id)
+            if not runner:
+                for index in indexes:
+                    results[index] = {"status": "error", "message": f"群组不存在: {group_id}"}
+                return
+
+            async def job():
+                for index in indexes:
+                    op = ops[index]
+                    request_data = {k: v for k, v in op.items() if k != "op"}
+                    request_data["req_did"] = req_did
+                    GlobalGroupManager.update_group_activity(group_id, op["op"])
+                    try:
+                        results[index] = await cls._runner_handler(op["op"])(runner, request_data)
+                    except Exception as e:
+                        logger.error(f"❌ 批量群组请求失败 {op['op']}/{group_id}: {e}")
+                        results[index] = {"status": "error", "message": str(e)}
+
+            await GlobalGroupManager.get_shard_pool().submit(group_id, job)
+
+        await asyncio.gather(*(run_group(group_id, indexes) for group_id, indexes in by_group.items()))
+        return results
+
     @classmethod
     async def _handle_group_join(cls, runner: GroupRunner, request_data: Dict[str, Any]):
         """处理加入群组请求"""
@@ -300,25 +611,57 @@ class GlobalMessageManager:
 
     @classmethod
     def _handle_group_connect(cls, runner: GroupRunner, request_data: Dict[str, Any]):
-        """处理群组连接请求（SSE）"""
+        """处理群组连接请求（SSE）
+
+        request_data 中带 last_event_id（来自 Last-Event-ID 头）时，先补发之后的事件
+        （重放缓冲区之前的部分来自持久化日志）；
+        空闲超过心跳间隔时发送 keep-alive 注释帧
+        """
         req_did = request_data.get("req_did")
         if not runner.is_member(req_did):
             return {"status": "error", "message": "Not a member of this group"}
 
+        heartbeat_interval = runner.heartbeat_interval or listener_queue_settings()["heartbeat_interval"]
+        # 注册监听与读取重放缓冲之间没有 await，补发的事件与后续队列中的事件不会重复或遗漏
+        queue = runner.register_listener(req_did)
+        replay = []
+        if request_data.get("last_event_id") is not None:
+            replay = runner.replay_since(parse_last_event_id(request_data["last_event_id"]))
+
         async def event_generator():
-            queue = asyncio.Queue()
-            runner.register_listener(req_did, queue)
             try:
+                for event in replay:
+                    yield event.frame
                 while True:
-                    message = await queue.get()
-                    import json
-                    yield f"data: {json.dumps(message)}\n\n"
-            except asyncio.CancelledError:
-                runner.unregister_listener(req_did)
-                raise
+                    try:
+                        event = await asyncio.wait_for(queue.get(), heartbeat_interval)
+                    except asyncio.TimeoutError:
+                        yield HEARTBEAT_FRAME
+                        continue
+                    if isinstance(event, GroupEvent):
+                        yield event.frame
+                    else:
+                        yield b"data: " + json_codec.dumps_bytes(event) + b"\n\n"
+            except ListenerDisconnected:
+                logger.warning(f"群组 {runner.group_id} 监听者 {req_did} 断开SSE连接: {queue.close_reason}")
+            finally:
+                runner.unregister_listener(req_did, queue)
 
         return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+    @classmethod
+    def _handle_group_history(cls, runner: GroupRunner, request_data: Dict[str, Any]):
+        """分页读取群组历史消息（offset 起，最多 limit 条）"""
+        req_did = request_data.get("req_did")
+        if not runner.is_member(req_did):
+            return {"status": "error", "message": "Not a member of this group"}
+        try:
+            offset = int(request_data.get("offset") or 0)
+            limit = int(request_data.get("limit") or 100)
+        except (TypeError, ValueError):
+            return {"status": "error", "message": "offset and limit must be integers"}
+        return {"status": "success", **runner.read_history(offset, limit)}
+
     @classmethod
     async def _handle_group_members(cls, runner: GroupRunner, request_data: Dict[str, Any]):
         """处理群组成员管理"""
@@ -326,7 +669,13 @@ class GlobalMessageManager:
 
         if action == "list":
             members = [agent.to_dict() for agent in runner.get_members()]
-            return {"status": "success", "members": members}
+            return {"status": "success", "members": members, "version": runner.membership_version}
+        elif action == "diff":
+            try:
+                since_version = int(request_data.get("since_version") or 0)
+            except (TypeError, ValueError):
+                return {"status": "error", "message": "since_version must be an integer"}
+            return {"status": "success", **runner.members_since(since_version)}
         elif action == "add":
             agent_id = request_data.get("agent_id")
             group_agent = GroupAgent(
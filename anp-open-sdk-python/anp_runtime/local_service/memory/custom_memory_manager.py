@@ -198,22 +198,21 @@ class CustomMemoryManager:
             raise RuntimeError(f"保存自定义记忆失败: {memory.id}")
         
         # 更新缓存和索引
-        with self._lock:
-            self._custom_memory_cache[memory.id] = memory
-            
-            # 更新模板索引
-            if template.name not in self._template_index:
-                self._template_index[template.name] = []
-            self._template_index[template.name].append(memory.id)
-            
-            # 更新模式索引
-            if template.schema.name not in self._schema_index:
-                self._schema_index[template.schema.name] = []
-            self._schema_index[template.schema.name].append(memory.id)
+        self._index_custom_memories(template, [memory])
         
         logger.debug(f"创建自定义记忆: {memory.title} ({memory.id})")
         return memory
     
+    def _index_custom_memories(self, template: CustomMemoryTemplate, memories: List[MemoryEntry]):
+        """把新建的自定义记忆加入缓存、模板索引和模式索引"""
+        with self._lock:
+            template_ids = self._template_index.setdefault(template.name, [])
+            schema_ids = self._schema_index.setdefault(template.schema.name, [])
+            for memory in memories:
+                self._custom_memory_cache[memory.id] = memory
+                template_ids.append(memory.id)
+                schema_ids.append(memory.id)
+    
     async def get_custom_memory(self, memory_id: str) -> Optional[MemoryEntry]:
         """获取自定义记忆"""
         
@@ -399,7 +398,12 @@ class CustomMemoryManager:
         source_agent_name: str,
         **kwargs
     ) -> List[MemoryEntry]:
-        """批量创建自定义记忆"""
+        """批量创建自定义记忆，校验通过的条目通过一次批量写入保存"""
+        
+        template = await self.get_template(template_id)
+        if not template:
+            logger.error(f"批量创建自定义记忆失败: 模板不存在: {template_id}")
+            return []
         
         memories = []
         
@@ -411,19 +415,27 @@ class CustomMemoryManager:
                 elif not title:
                     title = f"Batch_{i+1}"
                 
-                memory = await self.create_custom_memory(
-                    template_id=template_id,
+                memories.append(template.create_memory(
                     content=content,
                     source_agent_did=source_agent_did,
                     source_agent_name=source_agent_name,
                     title=title,
                     **{k: v for k, v in kwargs.items() if k != 'title'}
-                )
-                memories.append(memory)
+                ))
                 
             except Exception as e:
                 logger.error(f"批量创建自定义记忆失败 (索引 {i}): {e}")
         
+        if not memories:
+            return []
+        
+        saved = await self.base_manager.storage.save_memories(memories)
+        if saved != len(memories):
+            logger.error(f"批量保存自定义记忆失败: 保存了 {saved}/{len(memories)} 条")
+            return []
+        
+        self._index_custom_memories(template, memories)
+        
         logger.debug(f"批量创建了 {len(memories)} 条自定义记忆")
         return memories
     
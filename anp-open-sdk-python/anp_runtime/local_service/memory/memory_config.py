@@ -24,14 +24,50 @@ class StorageConfig:
     # 内存缓存大小 (记忆条目数量)
     cache_size: int = 1000
     
+    # 记忆缓存的内存预算 (估算字节数)，0 表示只按条目数量限制
+    cache_max_bytes: int = 32 * 1024 * 1024
+    
+    # 会话缓存大小 (会话数量)
+    session_cache_size: int = 256
+    
     # 是否启用持久化
     enable_persistence: bool = True
     
     # 批量写入大小
     batch_write_size: int = 100
     
+    # 是否启用后写缓冲 (记忆写入先进入缓冲，按批量大小或时间间隔合并写入)
+    enable_write_behind: bool = True
+    
+    # 后写缓冲刷新间隔 (秒)
+    write_flush_interval: float = 0.1
+    
     # 数据压缩
     enable_compression: bool = False
+    
+    # SQLite 日志模式 (WAL 下读写互不阻塞)
+    journal_mode: str = "WAL"
+    
+    # SQLite 同步级别 (WAL 下 NORMAL 只在检查点时 fsync)
+    synchronous: str = "NORMAL"
+    
+    # SQLite 每个连接的页缓存大小 (KiB)
+    sqlite_cache_kb: int = 8192
+    
+    # SQLite 内存映射大小 (字节)，0 表示关闭
+    mmap_size: int = 64 * 1024 * 1024
+    
+    # 只读连接池大小，0 表示与线程池大小一致
+    read_pool_size: int = 0
+    
+    # 每个连接缓存的已编译语句数量
+    statement_cache_size: int = 128
+    
+    # 数据库忙等待超时 (毫秒)
+    busy_timeout_ms: int = 5000
+    
+    # 是否在进程内维护记忆候选倒排索引 (推荐与相似记忆搜索的候选检索，启动时从数据库建立)
+    enable_candidate_index: bool = True
 
 
 @dataclass
@@ -105,6 +141,9 @@ class PerformanceConfig:
     # 搜索缓存大小
     search_cache_size: int = 100
     
+    # 搜索/推荐缓存有效期 (秒)：缓存按写入代数失效，有效期只限制时间相关评分的陈旧程度
+    search_cache_ttl: int = 3600
+    
     # 操作超时时间 (秒)
     operation_timeout: int = 30
 
@@ -210,9 +249,21 @@ class MemoryConfig:
             storage_type=storage_data.get('storage_type', 'sqlite'),
             database_path=storage_data.get('database_path', './data/memory.db'),
             cache_size=storage_data.get('cache_size', 1000),
+            cache_max_bytes=storage_data.get('cache_max_bytes', 32 * 1024 * 1024),
+            session_cache_size=storage_data.get('session_cache_size', 256),
             enable_persistence=storage_data.get('enable_persistence', True),
             batch_write_size=storage_data.get('batch_write_size', 100),
-            enable_compression=storage_data.get('enable_compression', False)
+            enable_write_behind=storage_data.get('enable_write_behind', True),
+            write_flush_interval=storage_data.get('write_flush_interval', 0.1),
+            enable_compression=storage_data.get('enable_compression', False),
+            journal_mode=storage_data.get('journal_mode', 'WAL'),
+            synchronous=storage_data.get('synchronous', 'NORMAL'),
+            sqlite_cache_kb=storage_data.get('sqlite_cache_kb', 8192),
+            mmap_size=storage_data.get('mmap_size', 64 * 1024 * 1024),
+            read_pool_size=storage_data.get('read_pool_size', 0),
+            statement_cache_size=storage_data.get('statement_cache_size', 128),
+            busy_timeout_ms=storage_data.get('busy_timeout_ms', 5000),
+            enable_candidate_index=storage_data.get('enable_candidate_index', True)
         )
         
         recommendation_data = data.get('recommendation', {})
@@ -245,6 +296,7 @@ class MemoryConfig:
             search_index_type=performance_data.get('search_index_type', 'simple'),
             enable_search_cache=performance_data.get('enable_search_cache', True),
             search_cache_size=performance_data.get('search_cache_size', 100),
+            search_cache_ttl=performance_data.get('search_cache_ttl', 3600),
             operation_timeout=performance_data.get('operation_timeout', 30)
         )
         
@@ -290,9 +342,21 @@ class MemoryConfig:
                 'storage_type': self.storage.storage_type,
                 'database_path': self.storage.database_path,
                 'cache_size': self.storage.cache_size,
+                'cache_max_bytes': self.storage.cache_max_bytes,
+                'session_cache_size': self.storage.session_cache_size,
                 'enable_persistence': self.storage.enable_persistence,
                 'batch_write_size': self.storage.batch_write_size,
-                'enable_compression': self.storage.enable_compression
+                'enable_write_behind': self.storage.enable_write_behind,
+                'write_flush_interval': self.storage.write_flush_interval,
+                'enable_compression': self.storage.enable_compression,
+                'journal_mode': self.storage.journal_mode,
+                'synchronous': self.storage.synchronous,
+                'sqlite_cache_kb': self.storage.sqlite_cache_kb,
+                'mmap_size': self.storage.mmap_size,
+                'read_pool_size': self.storage.read_pool_size,
+                'statement_cache_size': self.storage.statement_cache_size,
+                'busy_timeout_ms': self.storage.busy_timeout_ms,
+                'enable_candidate_index': self.storage.enable_candidate_index
             },
             'recommendation': {
                 'algorithm': self.recommendation.algorithm,
@@ -319,6 +383,7 @@ class MemoryConfig:
                 'search_index_type': self.performance.search_index_type,
                 'enable_search_cache': self.performance.enable_search_cache,
                 'search_cache_size': self.performance.search_cache_size,
+                'search_cache_ttl': self.performance.search_cache_ttl,
                 'operation_timeout': self.performance.operation_timeout
             },
             'collection': {
@@ -413,6 +478,27 @@ class MemoryConfig:
         if self.storage.cache_size <= 0:
             errors.append("缓存大小必须大于0")
         
+        if self.storage.cache_max_bytes < 0:
+            errors.append("缓存内存预算不能为负数")
+        
+        if self.storage.session_cache_size <= 0:
+            errors.append("会话缓存大小必须大于0")
+        
+        if self.storage.journal_mode.upper() not in ['WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF']:
+            errors.append(f"不支持的SQLite日志模式: {self.storage.journal_mode}")
+        
+        if self.storage.synchronous.upper() not in ['OFF', 'NORMAL', 'FULL', 'EXTRA']:
+            errors.append(f"不支持的SQLite同步级别: {self.storage.synchronous}")
+        
+        if self.storage.batch_write_size <= 0:
+            errors.append("批量写入大小必须大于0")
+        
+        if self.storage.write_flush_interval <= 0:
+            errors.append("后写缓冲刷新间隔必须大于0")
+        
+        if self.storage.read_pool_size < 0:
+            errors.append("只读连接池大小不能为负数")
+        
         # 验证推荐配置
         if self.recommendation.algorithm not in ['keyword', 'similarity', 'hybrid']:
             errors.append(f"不支持的推荐算法: {self.recommendation.algorithm}")
@@ -442,6 +528,9 @@ class MemoryConfig:
         if self.performance.thread_pool_size <= 0:
             errors.append("线程池大小必须大于0")
         
+        if self.performance.search_cache_ttl <= 0:
+            errors.append("搜索缓存有效期必须大于0")
+        
         # 验证收集配置
         if self.collection.collection_mode not in ['auto', 'manual', 'selective']:
             errors.append(f"不支持的收集模式: {self.collection.collection_mode}")
@@ -0,0 +1,254 @@
+"""
+记忆候选倒排索引
+
+进程内的关键词/标签、Agent、会话与记忆类型倒排表，随存储写入增量维护。
+推荐与相似记忆搜索通过倒排表的并集/交集取候选，有查询词时使用 WAND 提前终止取前 N 个，
+候选检索的代价取决于相关倒排表的长度，而不是记忆总量
+"""
+
+import heapq
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .memory_models import MemoryEntry, MemoryType
+
+# 倒排表键：(字段, 值)，('*', '') 包含全部记忆
+_ALL_KEY = ('*', '')
+# 字段权重为 0 时查询词仍参与召回，只是几乎不影响排序
+_MIN_TERM_WEIGHT = 1e-6
+# 得分保留的小数位：按不同顺序累加的相同得分视为并列，由写入顺序决定先后
+_SCORE_DIGITS = 9
+
+
+class _IndexedMemory(NamedTuple):
+    """索引中的记忆：过滤与评分所需的字段"""
+    memory_id: str
+    memory_type: str
+    agents: Tuple[str, ...]
+    session_id: Optional[str]
+    keys: Tuple[Tuple[str, str], ...]
+
+
+class MemoryCandidateIndex:
+    """记忆候选倒排索引（线程安全）
+    
+    - 每条记忆写入时分配递增的序号，倒排表是按序号升序的列表，新写入只需追加；序号越大越新
+    - 删除或更新时旧序号只从文档表移除，倒排表中的失效序号在遍历时跳过，累计过多时整体压缩
+    - 查询词（关键词/标签）的得分为命中词的权重之和；Agent、会话、记忆类型为过滤条件
+    """
+    
+    def __init__(self):
+        self._postings: Dict[Tuple[str, str], List[int]] = {}
+        self._docs: Dict[int, _IndexedMemory] = {}
+        self._ordinals: Dict[str, int] = {}
+        self._next_ordinal = 0
+        self._stale_entries = 0
+        self._live_entries = 0
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._docs)
+    
+    def __contains__(self, memory_id: str) -> bool:
+        return memory_id in self._ordinals
+    
+    @staticmethod
+    def _index_keys(memory_type: str, agents: Iterable[str], session_id: Optional[str],
+                    tags: Iterable[str], keywords: Iterable[str]) -> Tuple[Tuple[str, str], ...]:
+        keys = {_ALL_KEY, ('type', memory_type)}
+        keys.update(('agent', agent) for agent in agents)
+        if session_id:
+            keys.add(('session', session_id))
+        keys.update(('tag', tag) for tag in tags)
+        keys.update(('keyword', keyword) for keyword in keywords)
+        return tuple(keys)
+    
+    def add(self, memory: MemoryEntry):
+        """写入或更新一条记忆"""
+        metadata = memory.metadata
+        self.add_fields(memory.id, memory.memory_type.value, metadata.source_agent_did,
+                        metadata.target_agent_did, metadata.session_id, metadata.tags, metadata.keywords)
+    
+    def add_fields(self, memory_id: str, memory_type: str, source_agent_did: str,
+                   target_agent_did: Optional[str], session_id: Optional[str],
+                   tags: Iterable[str], keywords: Iterable[str]):
+        """按字段写入一条记忆，供存储从数据库行直接建立索引"""
+        agents = tuple(agent for agent in (source_agent_did, target_agent_did) if agent)
+        keys = self._index_keys(memory_type, agents, session_id, tags, keywords)
+        with self._lock:
+            self._discard(memory_id)
+            ordinal = self._next_ordinal
+            self._next_ordinal += 1
+            self._ordinals[memory_id] = ordinal
+            self._docs[ordinal] = _IndexedMemory(memory_id, memory_type, agents, session_id, keys)
+            for key in keys:
+                postings = self._postings.get(key)
+                if postings is None:
+                    self._postings[key] = [ordinal]
+                else:
+                    postings.append(ordinal)
+            self._live_entries += len(keys)
+            # 更新同样会留下旧序号，只有更新没有删除的负载也需要压缩
+            self._maybe_compact()
+    
+    def remove(self, memory_ids: Iterable[str]):
+        with self._lock:
+            for memory_id in memory_ids:
+                self._discard(memory_id)
+            self._maybe_compact()
+    
+    def _discard(self, memory_id: str):
+        ordinal = self._ordinals.pop(memory_id, None)
+        if ordinal is not None:
+            removed = len(self._docs.pop(ordinal).keys)
+            self._live_entries -= removed
+            self._stale_entries += removed
+    
+    def _maybe_compact(self):
+        """失效序号多于有效序号时压缩（调用方持有锁）"""
+        if self._stale_entries > max(self._live_entries, 1024):
+            self._compact()
+    
+    def _compact(self):
+        """从倒排表中移除失效序号（调用方持有锁）"""
+        docs = self._docs
+        compacted = {}
+        for key, postings in self._postings.items():
+            live = [ordinal for ordinal in postings if ordinal in docs]
+            if live:
+                compacted[key] = live
+        self._postings = compacted
+        self._stale_entries = 0
+    
+    def top_candidates(
+        self,
+        keywords: Optional[Sequence[str]] = None,
+        tags: Optional[Sequence[str]] = None,
+        agent_did: Optional[str] = None,
+        session_id: Optional[str] = None,
+        memory_types: Optional[Sequence[MemoryType]] = None,
+        limit: int = 100,
+        keyword_weight: float = 1.0,
+        tag_weight: float = 1.0,
+        exclude: Optional[Iterable[str]] = None
+    ) -> List[str]:
+        """返回得分最高的至多 limit 个记忆ID，得分相同时新的在前
+        
+        记忆须满足 Agent（来源或目标）、会话与记忆类型（任一）过滤条件；有关键词或标签时只返回至少命中一个的记忆，
+        每个查询词的权重为字段权重除以该字段查询词数量；没有查询词时按写入顺序返回最新的记忆
+        """
+        if limit <= 0:
+            return []
+        excluded = set(exclude or ())
+        type_values = {getattr(memory_type, 'value', memory_type) for memory_type in memory_types or ()}
+        
+        def accept(doc: _IndexedMemory) -> bool:
+            return ((agent_did is None or agent_did in doc.agents)
+                    and (session_id is None or doc.session_id == session_id)
+                    and (not type_values or doc.memory_type in type_values)
+                    and doc.memory_id not in excluded)
+        
+        term_weights: Dict[Tuple[str, str], float] = {}
+        for field, values, weight in (('keyword', keywords, keyword_weight), ('tag', tags, tag_weight)):
+            values = set(values or ())
+            for value in values:
+                term_weights[(field, value)] = max(weight, _MIN_TERM_WEIGHT) / len(values)
+        
+        with self._lock:
+            filter_keys = [('session', session_id)] if session_id else []
+            if agent_did:
+                filter_keys.append(('agent', agent_did))
+            if type_values:
+                # 多个类型为并集，只有一个类型时才能作为单个倒排表遍历
+                filter_keys.append(('type', next(iter(type_values))) if len(type_values) == 1 else _ALL_KEY)
+            filter_postings = min((self._postings.get(key, []) for key in filter_keys), key=len, default=None)
+            
+            if not term_weights:
+                return self._newest(filter_postings if filter_postings is not None else
+                                    self._postings.get(_ALL_KEY, []), limit, accept)
+            
+            term_lists = [(self._postings[key], weight) for key, weight in term_weights.items() if key in self._postings]
+            if filter_postings is not None and len(filter_postings) <= sum(len(p) for p, _ in term_lists):
+                # 过滤条件比查询词更有选择性：直接对过滤结果逐个评分
+                ranked = self._score_filtered(filter_postings, term_weights, limit, accept)
+            else:
+                ranked = self._wand(term_lists, limit, accept)
+            return [self._docs[ordinal].memory_id for _, ordinal in ranked]
+    
+    def _newest(self, postings: List[int], limit: int, accept: Callable[[_IndexedMemory], bool]) -> List[str]:
+        """从倒排表末尾（最新）开始取满足过滤条件的记忆"""
+        results = []
+        for ordinal in reversed(postings):
+            doc = self._docs.get(ordinal)
+            if doc is not None and accept(doc):
+                results.append(doc.memory_id)
+                if len(results) >= limit:
+                    break
+        return results
+    
+    def _score_filtered(self, postings: List[int], term_weights: Dict[Tuple[str, str], float], limit: int,
+                        accept: Callable[[_IndexedMemory], bool]) -> List[Tuple[float, int]]:
+        heap: List[Tuple[float, int]] = []
+        for ordinal in postings:
+            doc = self._docs.get(ordinal)
+            if doc is None or not accept(doc):
+                continue
+            score = round(sum(term_weights.get(key, 0.0) for key in doc.keys), _SCORE_DIGITS)
+            if score > 0:
+                self._offer(heap, limit, score, ordinal)
+        return sorted(heap, reverse=True)
+    
+    def _wand(self, term_lists: List[Tuple[List[int], float]], limit: int,
+              accept: Callable[[_IndexedMemory], bool]) -> List[Tuple[float, int]]:
+        """WAND：按当前序号排列各查询词的游标，累计权重上界达到第 N 名得分的位置为枢轴；
+        枢轴之前的游标直接跳到枢轴序号（二分查找），只有可能进入前 N 名的记忆才会被完整评分，
+        所有剩余查询词的权重之和都达不到第 N 名得分时提前结束"""
+        cursors = [[postings, 0, weight] for postings, weight in term_lists if postings]
+        heap: List[Tuple[float, int]] = []
+        while cursors:
+            cursors.sort(key=lambda cursor: cursor[0][cursor[1]])
+            threshold = heap[0][0] if len(heap) >= limit else 0.0
+            upper_bound = 0.0
+            pivot = -1
+            for i, cursor in enumerate(cursors):
+                upper_bound += cursor[2]
+                # 遍历按序号升序，得分与第 N 名相同的记忆更新，也能进入前 N 名
+                if upper_bound + 10 ** -_SCORE_DIGITS >= threshold:
+                    pivot = i
+                    break
+            if pivot < 0:
+                break
+            
+            pivot_ordinal = cursors[pivot][0][cursors[pivot][1]]
+            if cursors[0][0][cursors[0][1]] == pivot_ordinal:
+                score = 0.0
+                for cursor in cursors:
+                    if cursor[0][cursor[1]] != pivot_ordinal:
+                        break
+                    score += cursor[2]
+                    cursor[1] += 1
+                doc = self._docs.get(pivot_ordinal)
+                if doc is not None and accept(doc):
+                    self._offer(heap, limit, round(score, _SCORE_DIGITS), pivot_ordinal)
+            else:
+                for cursor in cursors[:pivot]:
+                    cursor[1] = bisect_left(cursor[0], pivot_ordinal, cursor[1])
+            cursors = [cursor for cursor in cursors if cursor[1] < len(cursor[0])]
+        return sorted(heap, reverse=True)
+    
+    @staticmethod
+    def _offer(heap: List[Tuple[float, int]], limit: int, score: float, ordinal: int):
+        if len(heap) < limit:
+            heapq.heappush(heap, (score, ordinal))
+        elif (score, ordinal) > heap[0]:
+            heapq.heapreplace(heap, (score, ordinal))
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'memories': len(self._docs),
+                'posting_lists': len(self._postings),
+                'live_entries': self._live_entries,
+                'stale_entries': self._stale_entries
+            }
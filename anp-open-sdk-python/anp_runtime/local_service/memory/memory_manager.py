@@ -5,14 +5,17 @@
 """
 
 import asyncio
+import hashlib
 import threading
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Set, Callable, Union, Tuple
+from typing import Dict, List, NamedTuple, Optional, Any, Set, Callable, Union, Tuple
 import logging
 
 from .memory_models import MemoryEntry, ContextSession, MemoryType, MethodCallMemory
-from .memory_storage import MemoryStorageInterface, create_storage
+from .memory_storage import MemoryStorageInterface, WriteGenerations, create_storage
+from .memory_index import MemoryCandidateIndex
 from .context_session import ContextSessionManager, get_session_manager
 from .memory_config import MemoryConfig, get_memory_config
 
@@ -133,101 +136,21 @@ class MemoryLifecycleManager:
             return 0
     
     async def _cleanup_lru(self, count: int) -> int:
-        """LRU清理策略"""
-        # 简化实现：清理最久未访问的记忆
-        memories = await self.storage.search_memories(limit=count * 2)
-        
-        # 按最后访问时间排序
-        memories.sort(key=lambda m: m.metadata.last_accessed or m.created_at)
-        
-        cleaned = 0
-        for memory in memories[:count]:
-            if await self.storage.delete_memory(memory.id):
-                cleaned += 1
-        
-        return cleaned
+        """LRU清理策略：清理最久未访问的记忆"""
+        return await self.storage.cleanup_memories('lru', count)
     
     async def _cleanup_lfu(self, count: int) -> int:
-        """LFU清理策略"""
-        # 简化实现：清理访问次数最少的记忆
-        memories = await self.storage.search_memories(limit=count * 2)
-        
-        # 按访问次数排序
-        memories.sort(key=lambda m: m.metadata.access_count)
-        
-        cleaned = 0
-        for memory in memories[:count]:
-            if await self.storage.delete_memory(memory.id):
-                cleaned += 1
-        
-        return cleaned
+        """LFU清理策略：清理访问次数最少的记忆"""
+        return await self.storage.cleanup_memories('lfu', count)
     
     async def _cleanup_time_based(self, count: int) -> int:
-        """基于时间的清理策略"""
-        # 清理超过保留期的记忆
+        """基于时间的清理策略：清理超过保留期的记忆，从最旧的开始"""
         cutoff_date = datetime.now() - timedelta(days=self.config.cleanup.retention_days)
-        
-        memories = await self.storage.search_memories(limit=count * 2)
-        
-        cleaned = 0
-        for memory in memories:
-            if memory.created_at < cutoff_date:
-                if await self.storage.delete_memory(memory.id):
-                    cleaned += 1
-                    if cleaned >= count:
-                        break
-        
-        return cleaned
+        return await self.storage.cleanup_memories('time_based', count, retention_cutoff=cutoff_date)
     
     async def _cleanup_smart(self, count: int) -> int:
-        """智能清理策略"""
-        # 综合考虑访问频次、时间、重要性等因素
-        memories = await self.storage.search_memories(limit=count * 2)
-        
-        # 计算清理优先级（越低越容易被清理）
-        scored_memories = []
-        now = datetime.now()
-        
-        for memory in memories:
-            score = 0.0
-            
-            # 访问频次分数 (0-1)
-            access_score = min(memory.metadata.access_count / 10.0, 1.0)
-            score += access_score * 0.3
-            
-            # 时间分数 (越新分数越高, 0-1)
-            age_days = (now - memory.created_at).days
-            time_score = max(0, 1 - age_days / 365.0)  # 1年内的记忆有较高分数
-            score += time_score * 0.3
-            
-            # 相关度分数
-            score += memory.metadata.relevance_score * 0.2
-            
-            # 类型重要性分数
-            type_importance = {
-                MemoryType.ERROR: 0.1,        # 错误记忆重要性较低
-                MemoryType.METHOD_CALL: 0.5,  # 方法调用记忆中等重要
-                MemoryType.USER_PREFERENCE: 0.8,  # 用户偏好重要性较高
-                MemoryType.CONTEXT: 0.7,      # 上下文记忆重要性较高
-                MemoryType.PATTERN: 0.9       # 模式记忆重要性很高
-            }
-            score += type_importance.get(memory.memory_type, 0.5) * 0.2
-            
-            scored_memories.append((memory, score))
-        
-        # 按分数排序，分数低的优先清理
-        scored_memories.sort(key=lambda x: x[1])
-        
-        cleaned = 0
-        for memory, score in scored_memories[:count]:
-            # 如果分数太高，不清理
-            if score > 0.7:
-                continue
-                
-            if await self.storage.delete_memory(memory.id):
-                cleaned += 1
-        
-        return cleaned
+        """智能清理策略：综合访问频次、时间、相关度与类型重要性评分，清理评分低的记忆"""
+        return await self.storage.cleanup_memories('smart', count)
     
     async def close(self):
         """关闭生命周期管理器"""
@@ -239,6 +162,70 @@ class MemoryLifecycleManager:
                 pass
 
 
+# 存储不提供写入代数时，缓存结果无法感知写入，只保留较短时间
+_UNVERSIONED_CACHE_TTL = timedelta(minutes=5)
+
+
+class _CachedResult(NamedTuple):
+    """结果缓存条目：结果、缓存时间、依赖的作用域及其在查询执行前的写入代数（None 表示无代数）"""
+    results: Any
+    cached_at: datetime
+    scopes: Tuple
+    versions: Optional[Tuple[int, ...]]
+
+
+class VersionedResultCache(OrderedDict):
+    """按写入代数失效的 LRU 结果缓存（调用方持有锁）
+    
+    - 键为查询参数 repr 的 blake2b 摘要，不受进程级 hash 随机化影响，也不会因 hash 碰撞串用结果
+    - 条目依赖的作用域有写入（代数变化）时失效；代数不变时结果仍然正确，有效期可以较长
+    - OrderedDict 按访问顺序排列，命中移到队尾，超出容量从队首淘汰，均为 O(1)
+    """
+    
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+    
+    @staticmethod
+    def dependencies(
+        storage: Any,
+        memory_types: Optional[List[MemoryType]] = None,
+        agent_did: Optional[str] = None,
+        session_id: Optional[str] = None
+    ) -> Optional[Tuple[Tuple, Tuple[int, ...]]]:
+        """在执行查询之前调用，返回 (依赖作用域, 当前代数)；存储不提供写入代数时返回 None"""
+        generations = getattr(storage, 'generations', None)
+        if not isinstance(generations, WriteGenerations):
+            return None
+        scopes = WriteGenerations.query_scopes(memory_types, agent_did, session_id)
+        return scopes, generations.snapshot(scopes)
+    
+    def lookup(self, key: str, storage: Any, now: datetime, ttl: timedelta) -> Optional[Any]:
+        entry = self.get(key)
+        if entry is None:
+            return None
+        if isinstance(entry, _CachedResult):
+            if entry.versions is None:
+                valid = now - entry.cached_at < min(ttl, _UNVERSIONED_CACHE_TTL)
+            else:
+                generations = getattr(storage, 'generations', None)
+                valid = (now - entry.cached_at < ttl and isinstance(generations, WriteGenerations)
+                         and generations.snapshot(entry.scopes) == entry.versions)
+            if valid:
+                self.move_to_end(key)
+                return entry.results
+        del self[key]
+        return None
+    
+    def store(self, key: str, results: Any, now: datetime, max_size: int,
+              dependencies: Optional[Tuple[Tuple, Tuple[int, ...]]] = None):
+        scopes, versions = dependencies if dependencies is not None else ((), None)
+        self[key] = _CachedResult(results, now, scopes, versions)
+        self.move_to_end(key)
+        while len(self) > max(1, max_size):
+            self.popitem(last=False)
+
+
 class MemorySearchEngine:
     """记忆搜索引擎"""
     
@@ -246,8 +233,8 @@ class MemorySearchEngine:
         self.storage = storage
         self.config = config
         
-        # 搜索缓存
-        self._search_cache: Dict[str, Tuple[List[MemoryEntry], datetime]] = {}
+        # 搜索缓存：按写入代数失效
+        self._search_cache = VersionedResultCache()
         self._cache_lock = threading.RLock()
     
     async def search(
@@ -261,21 +248,28 @@ class MemorySearchEngine:
         time_range: Optional[Tuple[datetime, datetime]] = None,
         limit: int = 100,
         offset: int = 0,
-        use_cache: bool = True
+        use_cache: bool = True,
+        tag_mode: str = "all"
     ) -> List[MemoryEntry]:
-        """智能搜索记忆条目"""
+        """智能搜索记忆条目，tag_mode 为 "any" 时 tags/keywords 命中任意一个即可"""
         
         # 生成缓存键
         cache_key = self._generate_cache_key(
             query, memory_type, agent_did, session_id, tags, keywords, 
-            time_range, limit, offset
+            time_range, limit, offset, tag_mode
         )
         
-        # 检查缓存
-        if use_cache and self.config.performance.enable_search_cache:
+        # 检查缓存；未命中时先等待后写缓冲提交，再在查询之前记录依赖作用域的写入代数
+        use_cache = use_cache and self.config.performance.enable_search_cache
+        dependencies = None
+        if use_cache:
             cached_result = self._get_cached_result(cache_key)
-            if cached_result:
+            if cached_result is not None:
                 return cached_result
+            if isinstance(getattr(self.storage, 'generations', None), WriteGenerations):
+                await self.storage.wait_for_writes()
+            dependencies = VersionedResultCache.dependencies(
+                self.storage, [memory_type] if memory_type else None, agent_did, session_id)
         
         # 执行搜索
         results = await self.storage.search_memories(
@@ -286,7 +280,8 @@ class MemorySearchEngine:
             tags=tags,
             keywords=keywords,
             limit=limit,
-            offset=offset
+            offset=offset,
+            tag_mode=tag_mode
         )
         
         # 应用时间范围过滤
@@ -298,38 +293,27 @@ class MemorySearchEngine:
             ]
         
         # 缓存结果
-        if use_cache and self.config.performance.enable_search_cache:
-            self._cache_result(cache_key, results)
+        if use_cache:
+            self._cache_result(cache_key, results, dependencies)
         
         return results
     
     def _generate_cache_key(self, *args) -> str:
         """生成缓存键"""
-        return str(hash(str(args)))
+        return VersionedResultCache.make_key(*args)
     
     def _get_cached_result(self, cache_key: str) -> Optional[List[MemoryEntry]]:
-        """获取缓存结果"""
+        """获取缓存结果：依赖的作用域没有写入且未超过有效期时命中"""
+        ttl = timedelta(seconds=self.config.performance.search_cache_ttl)
         with self._cache_lock:
-            if cache_key in self._search_cache:
-                results, cached_time = self._search_cache[cache_key]
-                # 检查缓存是否过期（5分钟）
-                if datetime.now() - cached_time < timedelta(minutes=5):
-                    return results
-                else:
-                    del self._search_cache[cache_key]
-        return None
+            return self._search_cache.lookup(cache_key, self.storage, datetime.now(), ttl)
     
-    def _cache_result(self, cache_key: str, results: List[MemoryEntry]):
-        """缓存搜索结果"""
+    def _cache_result(self, cache_key: str, results: List[MemoryEntry],
+                      dependencies: Optional[Tuple[Tuple, Tuple[int, ...]]] = None):
+        """缓存搜索结果，超出容量时淘汰最久未使用的条目"""
         with self._cache_lock:
-            # 限制缓存大小
-            if len(self._search_cache) >= self.config.performance.search_cache_size:
-                # 移除最旧的缓存
-                oldest_key = min(self._search_cache.keys(), 
-                               key=lambda k: self._search_cache[k][1])
-                del self._search_cache[oldest_key]
-            
-            self._search_cache[cache_key] = (results, datetime.now())
+            self._search_cache.store(
+                cache_key, results, datetime.now(), self.config.performance.search_cache_size, dependencies)
     
     async def search_similar_memories(
         self, 
@@ -341,22 +325,41 @@ class MemorySearchEngine:
         
         # 基于标签和关键词搜索相似记忆
         similar_memories = []
-        
-        # 搜索具有相同标签的记忆
-        if reference_memory.metadata.tags:
-            tag_results = await self.search(
-                tags=reference_memory.metadata.tags,
-                limit=limit * 2
-            )
-            similar_memories.extend(tag_results)
-        
-        # 搜索具有相同关键词的记忆
-        if reference_memory.metadata.keywords:
-            keyword_results = await self.search(
-                keywords=reference_memory.metadata.keywords,
-                limit=limit * 2
-            )
-            similar_memories.extend(keyword_results)
+        tags = reference_memory.metadata.tags
+        keywords = reference_memory.metadata.keywords
+        index = getattr(self.storage, 'candidate_index', None)
+        
+        if isinstance(index, MemoryCandidateIndex):
+            # 一次倒排索引查询按标签/关键词重合度取候选（权重与相似度计算一致），再批量读取
+            if tags or keywords:
+                await self.storage.wait_for_writes()
+                candidate_ids = index.top_candidates(
+                    keywords=keywords,
+                    tags=tags,
+                    limit=limit * 4,
+                    keyword_weight=0.3,
+                    tag_weight=0.3,
+                    exclude=[reference_memory.id]
+                )
+                similar_memories = await self.storage.get_memories(candidate_ids)
+        else:
+            # 搜索具有相同标签的记忆
+            if tags:
+                tag_results = await self.search(
+                    tags=tags,
+                    limit=limit * 2,
+                    tag_mode="any"
+                )
+                similar_memories.extend(tag_results)
+            
+            # 搜索具有相同关键词的记忆
+            if keywords:
+                keyword_results = await self.search(
+                    keywords=keywords,
+                    limit=limit * 2,
+                    tag_mode="any"
+                )
+                similar_memories.extend(keyword_results)
         
         # 去重并计算相似度
         unique_memories = {}
@@ -464,6 +467,36 @@ class MemoryManager:
         expiry_time: Optional[datetime] = None
     ) -> MemoryEntry:
         """创建记忆条目"""
+        memory = self._build_memory(
+            memory_type, title, content, source_agent_did, source_agent_name,
+            target_agent_did, target_agent_name, session_id, tags, keywords, expiry_time
+        )
+        
+        # 保存到存储
+        success = await self.storage.save_memory(memory)
+        if not success:
+            raise RuntimeError(f"创建记忆失败: {memory.id}")
+        
+        await self._on_memory_created(memory)
+        
+        logger.debug(f"创建记忆: {memory.title} ({memory.id})")
+        return memory
+    
+    def _build_memory(
+        self,
+        memory_type: MemoryType,
+        title: str,
+        content: Dict[str, Any],
+        source_agent_did: str,
+        source_agent_name: str,
+        target_agent_did: Optional[str] = None,
+        target_agent_name: Optional[str] = None,
+        session_id: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        keywords: Optional[List[str]] = None,
+        expiry_time: Optional[datetime] = None
+    ) -> MemoryEntry:
+        """构造记忆条目（不保存）"""
         
         from .memory_models import MemoryMetadata
         
@@ -478,21 +511,18 @@ class MemoryManager:
             expiry_time=expiry_time
         )
         
-        memory = MemoryEntry(
+        return MemoryEntry(
             memory_type=memory_type,
             title=title,
             content=content,
             metadata=metadata
         )
-        
-        # 保存到存储
-        success = await self.storage.save_memory(memory)
-        if not success:
-            raise RuntimeError(f"创建记忆失败: {memory.id}")
-        
+    
+    async def _on_memory_created(self, memory: MemoryEntry):
+        """记忆保存后关联会话、更新统计并通知监听器"""
         # 如果有会话ID，关联到会话
-        if session_id:
-            await self.session_manager.add_memory_to_session(session_id, memory.id)
+        if memory.metadata.session_id:
+            await self.session_manager.add_memory_to_session(memory.metadata.session_id, memory.id)
         
         # 更新统计
         with self._stats_lock:
@@ -500,9 +530,6 @@ class MemoryManager:
         
         # 通知监听器
         self.lifecycle_manager._notify_listeners(MemoryEventType.MEMORY_CREATED, memory)
-        
-        logger.debug(f"创建记忆: {memory.title} ({memory.id})")
-        return memory
     
     async def get_memory(self, memory_id: str) -> Optional[MemoryEntry]:
         """获取记忆条目"""
@@ -575,31 +602,68 @@ class MemoryManager:
         """搜索相似记忆"""
         return await self.search_engine.search_similar_memories(reference_memory, **kwargs)
     
+    async def get_tag_counts(self, **kwargs) -> Dict[str, int]:
+        """统计标签（field="keywords" 时为关键词）分布，参数同 storage.get_tag_counts"""
+        return await self.storage.get_tag_counts(**kwargs)
+    
     # ============ 批量操作 ============
     
     async def create_memories_batch(self, memory_specs: List[Dict[str, Any]]) -> List[MemoryEntry]:
-        """批量创建记忆条目"""
+        """批量创建记忆条目，所有条目通过一次批量写入保存"""
         memories = []
         
         for spec in memory_specs:
             try:
-                memory = await self.create_memory(**spec)
-                memories.append(memory)
+                memories.append(self._build_memory(**spec))
             except Exception as e:
                 logger.error(f"批量创建记忆失败: {e}")
         
+        if not memories:
+            return []
+        
+        saved = await self.storage.save_memories(memories)
+        if saved != len(memories):
+            logger.error(f"批量创建记忆失败: 保存了 {saved}/{len(memories)} 条")
+            return []
+        
+        for memory in memories:
+            await self._on_memory_created(memory)
+        
+        logger.debug(f"批量创建记忆: {len(memories)} 条")
         return memories
     
     async def delete_memories_batch(self, memory_ids: List[str]) -> int:
-        """批量删除记忆条目"""
-        deleted_count = 0
+        """批量删除记忆条目：一次批量读取（不计入访问统计）与一次批量删除，只为实际删除的记忆发送事件"""
+        memory_ids = list(dict.fromkeys(memory_ids))
+        try:
+            memories = await self.storage.get_memories(memory_ids)
+        except Exception as e:
+            logger.error(f"批量删除记忆失败: {e}")
+            return 0
         
-        for memory_id in memory_ids:
-            try:
-                if await self.delete_memory(memory_id):
-                    deleted_count += 1
-            except Exception as e:
-                logger.error(f"批量删除记忆失败: {e}")
+        if not memories:
+            return 0
+        
+        deleted_count = await self.storage.delete_memories([memory.id for memory in memories])
+        if deleted_count == 0:
+            return 0
+        
+        if deleted_count < len(memories):
+            # 部分记忆未被删除（例如已被并发删除或删除失败）：仍能读到的记忆不发送删除事件
+            remaining = {memory.id for memory in await self.storage.get_memories([m.id for m in memories])}
+            memories = [memory for memory in memories if memory.id not in remaining]
+        
+        for memory in memories:
+            # 从所有相关会话中移除
+            if memory.metadata.session_id:
+                await self.session_manager.remove_memory_from_session(
+                    memory.metadata.session_id, memory.id
+                )
+            self.lifecycle_manager._notify_listeners(MemoryEventType.MEMORY_DELETED, memory)
+        
+        # 更新统计
+        with self._stats_lock:
+            self._stats['memories_deleted'] += deleted_count
         
         return deleted_count
     
@@ -711,11 +775,21 @@ class MemoryManager:
             'strategy_cleaned': 0
         }
     
+    async def flush(self):
+        """将存储中缓冲的写入落盘"""
+        await self.storage.flush()
+    
     async def close(self):
         """关闭记忆管理器"""
         await self.lifecycle_manager.close()
         await self.session_manager.close()
         
+        # 先写入后写缓冲中的记忆，再关闭存储
+        try:
+            await self.storage.flush()
+        except Exception as e:
+            logger.error(f"关闭前写入缓冲记忆失败: {e}")
+        
         # 检查存储是否有close方法（如SQLiteMemoryStorage）
         if hasattr(self.storage, 'close') and callable(getattr(self.storage, 'close')):
             close_method = getattr(self.storage, 'close')
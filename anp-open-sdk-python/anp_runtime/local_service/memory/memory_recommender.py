@@ -11,8 +11,14 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Set, Tuple, Callable
 import logging
 
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖，缺失时逐条计算评分
+    np = None
+
 from .memory_models import MemoryEntry, MemoryType
-from .memory_manager import MemoryManager, get_memory_manager
+from .memory_manager import MemoryManager, VersionedResultCache, get_memory_manager
+from .memory_index import MemoryCandidateIndex
 from .memory_config import MemoryConfig, get_memory_config
 from .context_session import ContextSessionManager, get_session_manager
 
@@ -50,6 +56,75 @@ class RecommendationContext:
         self.boost_recent_memories = True
 
 
+class CandidateFeatures:
+    """候选记忆的列式特征（需要 NumPy）
+    
+    对每个候选记忆只遍历一次，把评分用到的属性提取为 NumPy 数组，评分函数在整列上做向量运算：
+    - 关键词/标签：去重后的数量与命中查询的数量，Jaccard = 命中 / (数量 + 查询数 - 命中)
+    - 创建距今天数（按同一个当前时间计算）、访问次数、相关度
+    - 与当前 Agent、会话、方法名的匹配情况
+    """
+    
+    def __init__(self, memories: List[MemoryEntry], context: RecommendationContext, now: datetime):
+        self.memories = memories
+        query_keywords = set(context.query_keywords)
+        query_tags = set(context.query_tags)
+        agent_did = context.current_agent_did
+        session_id = context.current_session_id
+        method_name = context.current_method_name
+        
+        columns = []
+        for memory in memories:
+            metadata = memory.metadata
+            keywords = set(metadata.keywords)
+            tags = set(metadata.tags)
+            columns.append((
+                len(keywords), len(keywords & query_keywords) if query_keywords else 0,
+                len(tags), len(tags & query_tags) if query_tags else 0,
+                (now - memory.created_at).days,
+                metadata.access_count,
+                metadata.relevance_score,
+                1.0 if agent_did and metadata.source_agent_did == agent_did
+                else 0.7 if agent_did and metadata.target_agent_did == agent_did else 0.0,
+                1.0 if session_id and metadata.session_id == session_id else 0.0,
+                _method_similarity(memory, method_name) if method_name else 0.0
+            ))
+        
+        table = np.array(columns, dtype=np.float64).reshape(len(memories), 10)
+        (self.keyword_count, self.keyword_hits, self.tag_count, self.tag_hits, self.age_days,
+         self.access_count, self.relevance, self.agent_affinity, self.session_match,
+         self.method_similarity) = table.T
+        self.query_keyword_count = len(query_keywords)
+        self.query_tag_count = len(query_tags)
+    
+    def __len__(self) -> int:
+        return len(self.memories)
+
+
+def _jaccard(hits: 'np.ndarray', counts: 'np.ndarray', query_count: int) -> 'np.ndarray':
+    """由命中数与集合大小计算 Jaccard 相似度，记忆或查询为空时为 0"""
+    if not query_count:
+        return np.zeros_like(hits)
+    return np.where(counts > 0, hits / (counts + query_count - hits), 0.0)
+
+
+def _method_similarity(memory: MemoryEntry, method_name: Optional[str]) -> float:
+    """方法名完全相同为 1.0，互相包含为 0.7，仅对方法调用记忆计算"""
+    if not method_name or memory.memory_type != MemoryType.METHOD_CALL:
+        return 0.0
+    
+    memory_method_name = memory.content.get('method_name', '')
+    if not memory_method_name:
+        return 0.0
+    
+    if memory_method_name == method_name:
+        return 1.0
+    elif method_name in memory_method_name or memory_method_name in method_name:
+        return 0.7
+    else:
+        return 0.0
+
+
 class ScoringFunction:
     """评分函数基类"""
     
@@ -63,6 +138,17 @@ class ScoringFunction:
     ) -> float:
         """计算记忆条目的评分"""
         raise NotImplementedError
+    
+    def calculate_scores(
+        self,
+        features: CandidateFeatures,
+        context: RecommendationContext
+    ) -> 'np.ndarray':
+        """批量计算候选记忆的评分，默认逐条调用 calculate_score，内置评分函数以向量运算实现"""
+        return np.fromiter(
+            (self.calculate_score(memory, context) for memory in features.memories),
+            dtype=np.float64, count=len(features)
+        )
 
 
 class KeywordScoringFunction(ScoringFunction):
@@ -88,6 +174,9 @@ class KeywordScoringFunction(ScoringFunction):
         union = len(memory_keywords | query_keywords)
         
         return intersection / union if union > 0 else 0.0
+    
+    def calculate_scores(self, features: CandidateFeatures, context: RecommendationContext) -> 'np.ndarray':
+        return _jaccard(features.keyword_hits, features.keyword_count, features.query_keyword_count)
 
 
 class TagScoringFunction(ScoringFunction):
@@ -112,6 +201,9 @@ class TagScoringFunction(ScoringFunction):
         union = len(memory_tags | query_tags)
         
         return intersection / union if union > 0 else 0.0
+    
+    def calculate_scores(self, features: CandidateFeatures, context: RecommendationContext) -> 'np.ndarray':
+        return _jaccard(features.tag_hits, features.tag_count, features.query_tag_count)
 
 
 class TimeScoringFunction(ScoringFunction):
@@ -134,6 +226,9 @@ class TimeScoringFunction(ScoringFunction):
         decay_factor = math.exp(-age_days / self.decay_days)
         
         return decay_factor
+    
+    def calculate_scores(self, features: CandidateFeatures, context: RecommendationContext) -> 'np.ndarray':
+        return np.exp(-features.age_days / self.decay_days)
 
 
 class AccessFrequencyScoringFunction(ScoringFunction):
@@ -151,6 +246,10 @@ class AccessFrequencyScoringFunction(ScoringFunction):
         
         # 使用对数归一化
         return math.log(access_count + 1) / math.log(100)  # 假设最大访问次数为100
+    
+    def calculate_scores(self, features: CandidateFeatures, context: RecommendationContext) -> 'np.ndarray':
+        access_count = np.maximum(features.access_count, 0.0)
+        return np.where(access_count > 0, np.log(access_count + 1) / math.log(100), 0.0)
 
 
 class AgentAffinityScoringFunction(ScoringFunction):
@@ -171,6 +270,9 @@ class AgentAffinityScoringFunction(ScoringFunction):
             return 0.7
         else:
             return 0.0
+    
+    def calculate_scores(self, features: CandidateFeatures, context: RecommendationContext) -> 'np.ndarray':
+        return features.agent_affinity
 
 
 class SessionAffinityScoringFunction(ScoringFunction):
@@ -186,6 +288,9 @@ class SessionAffinityScoringFunction(ScoringFunction):
         
         # 相同会话的记忆得分更高
         return 1.0 if memory.metadata.session_id == context.current_session_id else 0.0
+    
+    def calculate_scores(self, features: CandidateFeatures, context: RecommendationContext) -> 'np.ndarray':
+        return features.session_match
 
 
 class MethodSimilarityScoringFunction(ScoringFunction):
@@ -196,20 +301,11 @@ class MethodSimilarityScoringFunction(ScoringFunction):
         memory: MemoryEntry, 
         context: RecommendationContext
     ) -> float:
-        if not context.current_method_name or memory.memory_type != MemoryType.METHOD_CALL:
-            return 0.0
-        
-        memory_method_name = memory.content.get('method_name', '')
-        if not memory_method_name:
-            return 0.0
-        
         # 简单的字符串相似度
-        if memory_method_name == context.current_method_name:
-            return 1.0
-        elif context.current_method_name in memory_method_name or memory_method_name in context.current_method_name:
-            return 0.7
-        else:
-            return 0.0
+        return _method_similarity(memory, context.current_method_name)
+    
+    def calculate_scores(self, features: CandidateFeatures, context: RecommendationContext) -> 'np.ndarray':
+        return features.method_similarity
 
 
 class RecommendationAlgorithm:
@@ -268,10 +364,29 @@ class HybridRecommendationAlgorithm(RecommendationAlgorithm):
     ) -> List[Tuple[MemoryEntry, float]]:
         """生成混合推荐"""
         
-        # 构建搜索参数
+        # 构建搜索参数：候选记忆命中任意一个关键词/标签即可，相关度由评分函数计算
         limit = context.max_recommendations * 3  # 获取更多候选以便筛选
-        
-        if context.memory_types:
+        storage = getattr(memory_manager, 'storage', None)
+        index = getattr(storage, 'candidate_index', None)
+        
+        if isinstance(index, MemoryCandidateIndex):
+            # 倒排索引一次取出所有类型的候选：命中的关键词/标签越多越靠前，Agent、会话与类型作为过滤条件
+            await storage.wait_for_writes()
+            memory_types = context.memory_types
+            if not context.include_error_memories:
+                memory_types = [t for t in (memory_types or MemoryType) if t != MemoryType.ERROR]
+            candidate_ids = index.top_candidates(
+                keywords=context.query_keywords,
+                tags=context.query_tags,
+                agent_did=context.current_agent_did,
+                session_id=context.current_session_id,
+                memory_types=memory_types,
+                limit=limit * max(len(context.memory_types or ()), 1),
+                keyword_weight=self.config.recommendation.keyword_weight,
+                tag_weight=self.config.recommendation.tag_weight
+            )
+            candidate_memories = await storage.get_memories(candidate_ids)
+        elif context.memory_types:
             # 如果指定了多个类型，需要分别搜索后合并
             all_memories = []
             for memory_type in context.memory_types:
@@ -282,7 +397,8 @@ class HybridRecommendationAlgorithm(RecommendationAlgorithm):
                     session_id=context.current_session_id,
                     memory_type=memory_type,
                     limit=limit,
-                    offset=0
+                    offset=0,
+                    tag_mode="any"
                 )
                 all_memories.extend(memories)
             
@@ -296,7 +412,8 @@ class HybridRecommendationAlgorithm(RecommendationAlgorithm):
                 agent_did=context.current_agent_did,
                 session_id=context.current_session_id,
                 limit=limit,
-                offset=0
+                offset=0,
+                tag_mode="any"
             )
         
         # 应用时间范围过滤
@@ -314,6 +431,9 @@ class HybridRecommendationAlgorithm(RecommendationAlgorithm):
                 if m.memory_type != MemoryType.ERROR
             ]
         
+        if np is not None and candidate_memories:
+            return self._score_vectorized(candidate_memories, context)
+        
         # 计算推荐分数
         scored_memories = []
         for memory in candidate_memories:
@@ -333,6 +453,34 @@ class HybridRecommendationAlgorithm(RecommendationAlgorithm):
         # 排序并返回前N个
         scored_memories.sort(key=lambda x: x[1], reverse=True)
         return scored_memories[:context.max_recommendations]
+    
+    def _score_vectorized(
+        self,
+        candidate_memories: List[MemoryEntry],
+        context: RecommendationContext
+    ) -> List[Tuple[MemoryEntry, float]]:
+        """列式评分：各评分函数在整列特征上计算，按阈值过滤后用 argpartition 取前 N 个
+        
+        排序结果与逐条评分一致：分数降序，分数相同时保持候选顺序
+        """
+        features = CandidateFeatures(candidate_memories, context, datetime.now())
+        total_scores = np.zeros(len(features))
+        for scoring_function in self.scoring_functions:
+            total_scores += scoring_function.calculate_scores(features, context) * scoring_function.weight
+        
+        # 相关度分数加权，应用相似度阈值
+        total_scores *= features.relevance
+        selected = np.flatnonzero(total_scores >= context.similarity_threshold)
+        
+        limit = context.max_recommendations
+        if limit <= 0 or not len(selected):
+            return []
+        if len(selected) > limit:
+            # 第 N 大的分数，保留不低于它的候选（含并列），再做稳定排序
+            kth_score = np.partition(total_scores[selected], len(selected) - limit)[len(selected) - limit]
+            selected = selected[total_scores[selected] >= kth_score]
+        ordered = selected[np.lexsort((selected, -total_scores[selected]))][:limit]
+        return [(candidate_memories[i], float(total_scores[i])) for i in ordered]
 
 
 class KeywordRecommendationAlgorithm(RecommendationAlgorithm):
@@ -352,7 +500,8 @@ class KeywordRecommendationAlgorithm(RecommendationAlgorithm):
         memories = await memory_manager.search_memories(
             keywords=context.query_keywords,
             limit=context.max_recommendations * 2,
-            offset=0
+            offset=0,
+            tag_mode="any"
         )
         
         # 计算关键词匹配分数
@@ -389,8 +538,8 @@ class MemoryRecommender:
             'similarity': HybridRecommendationAlgorithm(self.config)  # 使用混合算法作为相似度算法
         }
         
-        # 推荐缓存
-        self._recommendation_cache: Dict[str, Tuple[List[Tuple[MemoryEntry, float]], datetime]] = {}
+        # 推荐缓存：按写入代数失效
+        self._recommendation_cache = VersionedResultCache()
         self._cache_lock = threading.RLock()
         
         # 统计信息
@@ -413,13 +562,19 @@ class MemoryRecommender:
         # 生成缓存键
         cache_key = self._generate_cache_key(context, algorithm)
         
-        # 检查缓存
-        if use_cache and self.config.performance.enable_search_cache:
+        # 检查缓存；未命中时在生成推荐之前记录依赖作用域的写入代数
+        use_cache = use_cache and self.config.performance.enable_search_cache
+        dependencies = None
+        if use_cache:
             cached_result = self._get_cached_recommendation(cache_key)
-            if cached_result:
+            if cached_result is not None:
                 with self._stats_lock:
                     self._stats['cache_hits'] += 1
                 return cached_result
+            dependencies = VersionedResultCache.dependencies(
+                getattr(self.memory_manager, 'storage', None), context.memory_types,
+                context.current_agent_did, context.current_session_id
+            )
         
         # 检查算法是否存在
         if algorithm not in self.algorithms:
@@ -431,8 +586,8 @@ class MemoryRecommender:
         )
         
         # 缓存结果
-        if use_cache and self.config.performance.enable_search_cache:
-            self._cache_recommendation(cache_key, recommendations)
+        if use_cache:
+            self._cache_recommendation(cache_key, recommendations, dependencies)
             with self._stats_lock:
                 self._stats['cache_misses'] += 1
         
@@ -529,38 +684,30 @@ class MemoryRecommender:
             'max_recommendations': context.max_recommendations,
             'similarity_threshold': context.similarity_threshold
         }
-        return str(hash(str(sorted(key_data.items()))))
+        return VersionedResultCache.make_key(sorted(key_data.items()))
     
     def _get_cached_recommendation(
         self, 
         cache_key: str
     ) -> Optional[List[Tuple[MemoryEntry, float]]]:
-        """获取缓存的推荐结果"""
+        """获取缓存的推荐结果：依赖的作用域没有写入且未超过有效期时命中"""
+        ttl = timedelta(seconds=self.config.performance.search_cache_ttl)
         with self._cache_lock:
-            if cache_key in self._recommendation_cache:
-                recommendations, cached_time = self._recommendation_cache[cache_key]
-                # 检查缓存是否过期（10分钟）
-                if datetime.now() - cached_time < timedelta(minutes=10):
-                    return recommendations
-                else:
-                    del self._recommendation_cache[cache_key]
-        return None
+            return self._recommendation_cache.lookup(
+                cache_key, getattr(self.memory_manager, 'storage', None), datetime.now(), ttl)
     
     def _cache_recommendation(
         self, 
         cache_key: str, 
-        recommendations: List[Tuple[MemoryEntry, float]]
+        recommendations: List[Tuple[MemoryEntry, float]],
+        dependencies: Optional[Tuple[Tuple, Tuple[int, ...]]] = None
     ):
-        """缓存推荐结果"""
+        """缓存推荐结果，超出容量时淘汰最久未使用的条目"""
         with self._cache_lock:
-            # 限制缓存大小
-            if len(self._recommendation_cache) >= self.config.performance.search_cache_size:
-                # 移除最旧的缓存
-                oldest_key = min(self._recommendation_cache.keys(), 
-                               key=lambda k: self._recommendation_cache[k][1])
-                del self._recommendation_cache[oldest_key]
-            
-            self._recommendation_cache[cache_key] = (recommendations, datetime.now())
+            self._recommendation_cache.store(
+                cache_key, recommendations, datetime.now(),
+                self.config.performance.search_cache_size, dependencies
+            )
     
     def get_recommendation_statistics(self) -> Dict[str, Any]:
         """获取推荐统计信息"""
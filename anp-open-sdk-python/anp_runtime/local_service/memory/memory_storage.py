@@ -5,19 +5,27 @@
 支持SQLite、内存和文件存储
 """
 
+import asyncio
+import queue
+import re
 import sqlite3
-import json
+import sys
 import threading
 import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union, Tuple
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Any, Set, Union, Tuple
 from concurrent.futures import ThreadPoolExecutor
 import logging
 
+from anp_foundation.utils import json_codec
+
 from .memory_models import MemoryEntry, ContextSession, MemoryType
-from .memory_config import MemoryConfig, get_memory_config
+from .memory_config import MemoryConfig, StorageConfig, get_memory_config
+from .memory_index import MemoryCandidateIndex
 
 logger = logging.getLogger(__name__)
 
@@ -55,9 +63,13 @@ class MemoryStorageInterface(ABC):
         tags: Optional[List[str]] = None,
         keywords: Optional[List[str]] = None,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        tag_mode: str = "all"
     ) -> List[MemoryEntry]:
-        """搜索记忆条目"""
+        """搜索记忆条目
+        
+        tag_mode 为 "all" 时记忆须包含 tags/keywords 中的全部值，为 "any" 时包含任意一个即可
+        """
         pass
     
     @abstractmethod
@@ -94,6 +106,907 @@ class MemoryStorageInterface(ABC):
     async def get_storage_stats(self) -> Dict[str, Any]:
         """获取存储统计信息"""
         pass
+    
+    async def save_memories(self, memories: List[MemoryEntry]) -> int:
+        """批量保存记忆条目，返回成功保存的数量（默认逐条保存）"""
+        saved = 0
+        for memory in memories:
+            if await self.save_memory(memory):
+                saved += 1
+        return saved
+    
+    async def delete_memories(self, memory_ids: List[str]) -> int:
+        """批量删除记忆条目，返回实际删除的数量（默认逐条删除）"""
+        deleted = 0
+        for memory_id in memory_ids:
+            if await self.delete_memory(memory_id):
+                deleted += 1
+        return deleted
+    
+    async def flush(self):
+        """将缓冲中尚未落盘的写入持久化（默认无缓冲）"""
+        pass
+    
+    async def cleanup_memories(self, strategy: str, count: int,
+                               retention_cutoff: Optional[datetime] = None) -> int:
+        """按清理策略删除至多 count 条记忆，返回删除数量
+        
+        - lru: 最久未访问的记忆（没有访问记录时按创建时间）
+        - lfu: 访问次数最少的记忆
+        - time_based: 创建时间早于 retention_cutoff 的记忆，从最旧的开始
+        - smart: 综合评分不高于阈值的记忆，从评分最低的开始
+        
+        默认在 search_memories 返回的全部记忆上排序后调用 delete_memories
+        """
+        _check_cleanup_strategy(strategy)
+        if count <= 0:
+            return 0
+        memories = await self.search_memories(limit=2 ** 31 - 1)
+        victims = _select_cleanup_victims(memories, strategy, count, retention_cutoff, datetime.now())
+        return await self.delete_memories([memory.id for memory in victims])
+    
+    @property
+    def generations(self) -> Optional['WriteGenerations']:
+        """记忆写入代数，上层结果缓存据此判断条目是否仍然有效；未提供时上层只能依赖 TTL"""
+        return getattr(self, '_generations', None)
+    
+    @property
+    def candidate_index(self) -> Optional[MemoryCandidateIndex]:
+        """记忆候选倒排索引，随写入增量维护；未提供时推荐与相似记忆搜索回退到 search_memories"""
+        return getattr(self, '_candidate_index', None)
+    
+    async def wait_for_writes(self):
+        """等待已保存的写入提交、对读取与候选索引可见（默认写入立即可见）"""
+        pass
+    
+    async def get_memories(self, memory_ids: List[str]) -> List[MemoryEntry]:
+        """按 id 批量读取记忆，保持传入顺序并跳过不存在的 id；不计入访问统计
+        
+        默认逐条调用 get_memory（会计入访问统计），子类应覆盖
+        """
+        memories = []
+        for memory_id in memory_ids:
+            memory = await self.get_memory(memory_id)
+            if memory is not None:
+                memories.append(memory)
+        return memories
+    
+    async def get_tag_counts(
+        self,
+        field: str = "tags",
+        query: str = "",
+        memory_type: Optional[MemoryType] = None,
+        agent_did: Optional[str] = None,
+        session_id: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        keywords: Optional[List[str]] = None,
+        tag_mode: str = "all",
+        limit: Optional[int] = None
+    ) -> Dict[str, int]:
+        """统计符合条件的记忆中每个标签（field="keywords" 时为关键词）的数量，按数量降序
+        
+        默认基于 search_memories 的结果统计
+        """
+        _check_term_field(field)
+        memories = await self.search_memories(
+            query, memory_type, agent_did, session_id, tags, keywords,
+            limit=2 ** 31 - 1, tag_mode=tag_mode
+        )
+        counts: Dict[str, int] = {}
+        for memory in memories:
+            for term in set(getattr(memory.metadata, field)):
+                counts[term] = counts.get(term, 0) + 1
+        return _sorted_counts(counts, limit)
+
+
+_TAG_MODES = ('all', 'any')
+# 标签/关键词倒排表：字段 -> (表名, 列名)
+_TERM_TABLES = {'tags': ('memory_tags', 'tag'), 'keywords': ('memory_keywords', 'keyword')}
+
+
+def _check_tag_mode(tag_mode: str):
+    if tag_mode not in _TAG_MODES:
+        raise ValueError(f"不支持的标签匹配模式: {tag_mode}，可选: {', '.join(_TAG_MODES)}")
+
+
+def _check_term_field(field: str):
+    if field not in _TERM_TABLES:
+        raise ValueError(f"不支持的统计字段: {field}，可选: {', '.join(_TERM_TABLES)}")
+
+
+def _sorted_counts(counts: Dict[str, int], limit: Optional[int]) -> Dict[str, int]:
+    items = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return dict(items[:limit] if limit else items)
+
+
+_CLEANUP_STRATEGIES = ('lru', 'lfu', 'time_based', 'smart')
+# 智能清理：综合评分高于该值的记忆不清理
+_SMART_CLEANUP_MAX_SCORE = 0.7
+# 智能清理中各记忆类型的重要性，未列出的类型为 0.5
+_CLEANUP_TYPE_IMPORTANCE = {
+    MemoryType.ERROR: 0.1,
+    MemoryType.METHOD_CALL: 0.5,
+    MemoryType.USER_PREFERENCE: 0.8,
+    MemoryType.CONTEXT: 0.7,
+    MemoryType.PATTERN: 0.9,
+}
+
+
+def _check_cleanup_strategy(strategy: str):
+    if strategy not in _CLEANUP_STRATEGIES:
+        raise ValueError(f"不支持的清理策略: {strategy}，可选: {', '.join(_CLEANUP_STRATEGIES)}")
+
+
+def _smart_cleanup_score(memory: MemoryEntry, now: datetime) -> float:
+    """智能清理评分，越低越先清理：访问频次 0.3、新近程度 0.3（一年内线性衰减）、相关度 0.2、类型重要性 0.2
+    
+    与 _SMART_SCORE_SQL 按相同顺序计算，两种存储的结果一致
+    """
+    score = min(memory.metadata.access_count / 10.0, 1.0) * 0.3
+    score += max(0, 1 - (now - memory.created_at).days / 365.0) * 0.3
+    score += memory.metadata.relevance_score * 0.2
+    score += _CLEANUP_TYPE_IMPORTANCE.get(memory.memory_type, 0.5) * 0.2
+    return score
+
+
+def _select_cleanup_victims(memories: List[MemoryEntry], strategy: str, count: int,
+                            retention_cutoff: Optional[datetime], now: datetime) -> List[MemoryEntry]:
+    """按清理策略选出至多 count 条待删除的记忆，排序与 SQLite 实现的 _CLEANUP_SELECT_SQL 一致"""
+    if strategy == 'lru':
+        ranked = sorted(memories, key=lambda m: (m.metadata.last_accessed or m.created_at, m.id))
+    elif strategy == 'lfu':
+        ranked = sorted(memories, key=lambda m: (m.metadata.access_count, m.created_at, m.id))
+    elif strategy == 'time_based':
+        ranked = sorted(
+            (m for m in memories if retention_cutoff is None or m.created_at < retention_cutoff),
+            key=lambda m: (m.created_at, m.id)
+        )
+    else:
+        scored = [(_smart_cleanup_score(m, now), m) for m in memories]
+        ranked = [
+            m for score, m in sorted(scored, key=lambda item: (item[0], item[1].created_at, item[1].id))
+            if score <= _SMART_CLEANUP_MAX_SCORE
+        ]
+    return ranked[:count]
+
+
+# 固定的 SQL 文本：sqlite3 按连接以 SQL 文本为键缓存已编译语句，长期连接上重复执行无需重新解析
+# 使用 UPSERT 而不是 INSERT OR REPLACE：保持 rowid 不变，全文索引由 UPDATE 触发器同步。
+# 访问统计只增不减：整行写入携带的可能是较旧实例的计数，取较大值
+_INSERT_MEMORY_SQL = '''
+    INSERT INTO memory_entries (
+        id, memory_type, title, content,
+        source_agent_did, source_agent_name,
+        target_agent_did, target_agent_name,
+        session_id, tags, keywords,
+        relevance_score, access_count,
+        created_at, updated_at,
+        last_accessed, expiry_time,
+        fts_title, fts_body
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        memory_type = excluded.memory_type,
+        title = excluded.title,
+        content = excluded.content,
+        source_agent_did = excluded.source_agent_did,
+        source_agent_name = excluded.source_agent_name,
+        target_agent_did = excluded.target_agent_did,
+        target_agent_name = excluded.target_agent_name,
+        session_id = excluded.session_id,
+        tags = excluded.tags,
+        keywords = excluded.keywords,
+        relevance_score = excluded.relevance_score,
+        access_count = MAX(access_count, excluded.access_count),
+        created_at = excluded.created_at,
+        updated_at = excluded.updated_at,
+        last_accessed = COALESCE(MAX(last_accessed, excluded.last_accessed), last_accessed, excluded.last_accessed),
+        expiry_time = excluded.expiry_time,
+        fts_title = excluded.fts_title,
+        fts_body = excluded.fts_body
+'''
+# 读取记忆时列出所需的列，不读取只供全文索引使用的分词列
+_MEMORY_COLUMNS = (
+    'id, memory_type, title, content, source_agent_did, source_agent_name, target_agent_did, target_agent_name, '
+    'session_id, tags, keywords, relevance_score, access_count, created_at, updated_at, last_accessed, expiry_time'
+)
+_SELECT_MEMORY_SQL = f'SELECT {_MEMORY_COLUMNS} FROM memory_entries WHERE id = ?'
+_UPDATE_ACCESS_SQL = '''
+    UPDATE memory_entries
+    SET access_count = MAX(access_count, ?1), last_accessed = COALESCE(MAX(last_accessed, ?2), last_accessed, ?2)
+    WHERE id = ?3
+'''
+_DELETE_MEMORY_SQL = 'DELETE FROM memory_entries WHERE id = ?'
+_INSERT_SESSION_SQL = '''
+    INSERT OR REPLACE INTO context_sessions (
+        id, name, description, participants,
+        memory_entries, context_data,
+        created_at, updated_at, is_active
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SELECT_SESSION_SQL = 'SELECT * FROM context_sessions WHERE id = ?'
+_DELETE_SESSION_SQL = 'DELETE FROM context_sessions WHERE id = ?'
+_DELETE_EXPIRED_SQL = 'DELETE FROM memory_entries WHERE expiry_time IS NOT NULL AND expiry_time < ?'
+# 删除前读取被删记忆的作用域，用于推进写入代数
+_SCOPE_COLUMNS = 'memory_type, source_agent_did, target_agent_did, session_id'
+_SELECT_SCOPE_SQL = f'SELECT {_SCOPE_COLUMNS} FROM memory_entries WHERE id = ?'
+_SELECT_EXPIRED_SQL = f'''
+    SELECT id, {_SCOPE_COLUMNS}
+    FROM memory_entries WHERE expiry_time IS NOT NULL AND expiry_time < ?
+'''
+# 启动时建立候选倒排索引，按写入顺序加载，使索引中的先后与数据库一致
+_SELECT_CANDIDATE_FIELDS_SQL = f'''
+    SELECT id, {_SCOPE_COLUMNS}, tags, keywords
+    FROM memory_entries ORDER BY updated_at, rowid
+'''
+# 批量读取记忆时每条语句的 id 数量，低于 SQLite 的变量数上限
+_GET_MEMORIES_CHUNK = 500
+
+# 策略清理：每种策略一条按索引排序、带 LIMIT 的选择语句，{columns} 为选出的列。
+# 先选出待删记忆的 id 与作用域，再以同一子查询执行一条 DELETE；两者在同一个写事务内，id 作为最后的排序键保证结果一致。
+# 智能清理的评分与 _smart_cleanup_score 按相同顺序计算
+_SMART_SCORE_SQL = (
+    'MIN(access_count / 10.0, 1.0) * 0.3'
+    ' + MAX(0, 1 - CAST(julianday(:now) - julianday(created_at) AS INTEGER) / 365.0) * 0.3'
+    ' + relevance_score * 0.2'
+    ' + (CASE memory_type '
+    + ' '.join(f"WHEN '{memory_type.value}' THEN {importance}"
+               for memory_type, importance in _CLEANUP_TYPE_IMPORTANCE.items())
+    + ' ELSE 0.5 END) * 0.2'
+)
+_CLEANUP_SELECT_SQL = {
+    'lru': 'SELECT {columns} FROM memory_entries ORDER BY COALESCE(last_accessed, created_at), id LIMIT :limit',
+    'lfu': 'SELECT {columns} FROM memory_entries ORDER BY access_count, created_at, id LIMIT :limit',
+    'time_based': (
+        'SELECT {columns} FROM memory_entries WHERE created_at < :cutoff ORDER BY created_at, id LIMIT :limit'
+    ),
+    'smart': (
+        'SELECT {columns} FROM ('
+        f'SELECT id, created_at, {_SCOPE_COLUMNS}, {_SMART_SCORE_SQL} AS cleanup_score FROM memory_entries'
+        ') WHERE cleanup_score <= :max_score ORDER BY cleanup_score, created_at, id LIMIT :limit'
+    ),
+}
+
+# 全文索引：FTS5 unicode61 分词器不切分连续的中日韩文字，写入索引前在每个 CJK 字符两侧插入零宽空格，
+# 使每个字符成为一个词元；查询时 CJK 串转换为相邻词元的短语查询，等价于子串匹配。
+# 分词文本在 Python 中计算，随记忆一起写入 memory_entries 的 fts_title/fts_body 列。
+# memory_fts 是以 memory_entries 为内容表的外部内容表，只保存倒排索引（snippet 从这两列读取文本）；
+# 触发器只引用普通列，不依赖应用注册的 SQL 函数，其他工具（sqlite3 命令行、维护脚本）也能照常增删改记忆。
+# 外部内容表删除旧词元时须提供与写入时相同的文本，删除与更新触发器以旧行的分词列执行 'delete' 命令
+_FTS_SEPARATOR = '\u200b'
+_CJK_CHAR_RE = re.compile('([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+_FTS_TOKEN_RE = re.compile('[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]|[^\\W_]+')
+_FTS_TRIGGERS = ('memory_fts_insert', 'memory_fts_delete', 'memory_fts_update')
+_FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5(
+        fts_title, fts_body, content = 'memory_entries', content_rowid = 'rowid',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+'''
+_FTS_TRIGGER_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS memory_fts_insert AFTER INSERT ON memory_entries BEGIN
+        INSERT INTO memory_fts(rowid, fts_title, fts_body) VALUES (new.rowid, new.fts_title, new.fts_body);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS memory_fts_delete AFTER DELETE ON memory_entries BEGIN
+        INSERT INTO memory_fts(memory_fts, rowid, fts_title, fts_body)
+        VALUES ('delete', old.rowid, old.fts_title, old.fts_body);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS memory_fts_update AFTER UPDATE OF fts_title, fts_body ON memory_entries
+    WHEN old.fts_title IS NOT new.fts_title OR old.fts_body IS NOT new.fts_body
+    BEGIN
+        INSERT INTO memory_fts(memory_fts, rowid, fts_title, fts_body)
+        VALUES ('delete', old.rowid, old.fts_title, old.fts_body);
+        INSERT INTO memory_fts(rowid, fts_title, fts_body) VALUES (new.rowid, new.fts_title, new.fts_body);
+    END
+    ''',
+]
+# 旧版数据库回填分词列时每批处理的行数
+_FTS_BACKFILL_CHUNK = 1000
+# 标题命中的权重高于正文
+_FTS_RANK = 'bm25(memory_fts, 4.0, 1.0)'
+
+
+def _term_schema_sql(column: str) -> List[str]:
+    """标签/关键词倒排表及同步触发器：以 (值, memory_id) 为主键，按值查找走主键索引"""
+    table, term = _TERM_TABLES[column]
+    insert = (
+        f"INSERT OR IGNORE INTO {table}({term}, memory_id) "
+        f"SELECT value, new.id FROM json_each(new.{column}) WHERE type = 'text';"
+    )
+    return [
+        f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            {term} TEXT NOT NULL,
+            memory_id TEXT NOT NULL,
+            PRIMARY KEY ({term}, memory_id)
+        ) WITHOUT ROWID
+        ''',
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_memory ON {table}(memory_id, {term})',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON memory_entries BEGIN
+            {insert}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON memory_entries BEGIN
+            DELETE FROM {table} WHERE memory_id = old.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {column} ON memory_entries
+        WHEN old.{column} IS NOT new.{column}
+        BEGIN
+            DELETE FROM {table} WHERE memory_id = old.id;
+            {insert}
+        END
+        ''',
+    ]
+
+
+def _fts_text(text: Optional[str]) -> str:
+    """把文本转换为写入全文索引的形式"""
+    if not text:
+        return ''
+    return _CJK_CHAR_RE.sub(_FTS_SEPARATOR + r'\1' + _FTS_SEPARATOR, text)
+
+
+def _flatten_json(value: Any, parts: List[str]):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            parts.append(str(key))
+            _flatten_json(item, parts)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _flatten_json(item, parts)
+    elif value is not None and not isinstance(value, bool):
+        parts.append(str(value))
+
+
+def _fts_document(content: Any, keywords: Any) -> str:
+    """展开内容（键和值）与关键词，生成正文索引文本"""
+    parts: List[str] = []
+    _flatten_json(content, parts)
+    _flatten_json(keywords, parts)
+    return _fts_text(' '.join(parts))
+
+
+def _fts_columns(title: Optional[str], content: Optional[str], keywords: Optional[str]) -> Tuple[str, str]:
+    """由数据库中的 JSON 列计算分词列，用于回填旧版数据库"""
+    values = []
+    for raw in (content, keywords):
+        try:
+            values.append(json_codec.loads(raw) if raw else None)
+        except ValueError:
+            values.append(raw)
+    return _fts_text(title), _fts_document(*values)
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """把用户查询转换为 FTS5 MATCH 表达式
+    
+    每个以空白分隔的片段转换为一个短语（片段内的词元必须相邻），片段之间为 AND；
+    片段以字母数字结尾时按前缀匹配。查询中没有可索引的词元时返回 None
+    """
+    phrases = []
+    for chunk in query.split():
+        tokens = _FTS_TOKEN_RE.findall(chunk)
+        if not tokens:
+            continue
+        phrase = '"' + ' '.join(tokens) + '"'
+        if not _CJK_CHAR_RE.fullmatch(tokens[-1]):
+            phrase += ' *'
+        phrases.append(phrase)
+    return ' AND '.join(phrases) if phrases else None
+
+
+
+class SQLiteConnectionPool:
+    """SQLite 连接管理：一个专用写连接 + 只读连接池
+    
+    - 所有写事务经由同一个写连接串行执行（SQLite 同一时刻只允许一个写者）
+    - WAL 模式下读写互不阻塞，只读连接按需创建、用完归还，线程池中的查询可以并行
+    - 连接长期保持，配合固定的 SQL 文本复用已编译语句
+    - ":memory:" 数据库无法跨连接共享，读操作退化为在写连接上串行执行
+    """
+    
+    def __init__(self, db_path: Union[str, Path], storage_config: StorageConfig, read_pool_size: int):
+        self.db_path = str(db_path)
+        self.storage_config = storage_config
+        self.read_pool_size = max(1, read_pool_size)
+        self._in_memory = self.db_path == ':memory:'
+        self._write_lock = threading.RLock()
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._closed = False
+        self._writer = self._connect(readonly=False)
+    
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        storage = self.storage_config
+        if readonly:
+            conn = sqlite3.connect(
+                Path(self.db_path).resolve().as_uri() + '?mode=ro',
+                uri=True,
+                check_same_thread=False,
+                cached_statements=storage.statement_cache_size
+            )
+        else:
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                cached_statements=storage.statement_cache_size
+            )
+        conn.row_factory = sqlite3.Row  # 允许按列名访问
+        conn.execute(f'PRAGMA busy_timeout = {int(storage.busy_timeout_ms)}')
+        # 负数表示以 KiB 为单位
+        conn.execute(f'PRAGMA cache_size = -{int(storage.sqlite_cache_kb)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        if not self._in_memory:
+            conn.execute(f'PRAGMA mmap_size = {int(storage.mmap_size)}')
+        if not readonly:
+            if not self._in_memory:
+                mode = conn.execute(f'PRAGMA journal_mode = {storage.journal_mode}').fetchone()[0]
+                if mode.upper() != storage.journal_mode.upper():
+                    logger.warning(f"SQLite日志模式设置为 {storage.journal_mode} 失败，当前为 {mode}: {self.db_path}")
+            conn.execute(f'PRAGMA synchronous = {storage.synchronous}')
+        return conn
+    
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """获取写连接，正常退出时提交，异常时回滚"""
+        with self._write_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("连接池已关闭")
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+    
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """获取只读连接，用完自动归还连接池"""
+        if self._in_memory:
+            with self._write_lock:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("连接池已关闭")
+                yield self._writer
+            return
+        
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            # 结束隐式读事务，避免长期持有 WAL 快照阻止检查点
+            if conn.in_transaction:
+                conn.rollback()
+            self._release_reader(conn)
+    
+    def _acquire_reader(self) -> sqlite3.Connection:
+        if self._closed:
+            raise sqlite3.ProgrammingError("连接池已关闭")
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._reader_lock:
+            if self._reader_count < self.read_pool_size:
+                self._reader_count += 1
+                try:
+                    return self._connect(readonly=True)
+                except Exception:
+                    self._reader_count -= 1
+                    raise
+        return self._readers.get(timeout=self.storage_config.busy_timeout_ms / 1000)
+    
+    def _release_reader(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+        else:
+            self._readers.put(conn)
+    
+    def close(self):
+        """关闭全部连接；仍被借出的只读连接在归还时关闭"""
+        with self._write_lock:
+            if self._closed:
+                return
+            self._closed = True
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            # 最后一个连接关闭时 SQLite 会执行检查点并清理 -wal/-shm 文件
+            self._writer.close()
+
+
+class WriteBehindBuffer:
+    """记忆写入的后写缓冲
+    
+    - put() 只把记忆放入待写字典，同一 id 的多次写入合并为最后一次
+    - 后台线程在待写数量达到 batch_size 或经过 flush_interval 时刷新，
+      每批在一个事务中 executemany 写入
+    - 正在写入的批次在完成前仍可通过 get() 读到，保证读己之写
+    - 批量写入失败时逐条重试，只丢弃无法写入的记录，丢弃的记录交给 on_dropped
+    - 每批提交之后以实际写入的记录调用 on_written（在执行刷新的线程中），写入此时已对读取可见
+    """
+    
+    def __init__(self, write_batch: Callable[[List[MemoryEntry]], None], batch_size: int = 100,
+                 flush_interval: float = 0.1, on_flush: Optional[Callable[[], Any]] = None,
+                 on_written: Optional[Callable[[List[MemoryEntry]], Any]] = None,
+                 on_dropped: Optional[Callable[[List[MemoryEntry]], Any]] = None):
+        self._write_batch = write_batch
+        # 每轮刷新记忆之后调用，用于顺带落盘其他批量数据（例如访问统计）
+        self._on_flush = on_flush
+        self._on_written = on_written
+        self._on_dropped = on_dropped
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, MemoryEntry] = {}
+        self._inflight: Dict[str, MemoryEntry] = {}
+        self._lock = threading.Lock()
+        # 串行化刷新，保证同一 id 的旧版本不会晚于新版本写入
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.flushed_batches = 0
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+        self._thread.start()
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+    
+    def put(self, memory: MemoryEntry):
+        """放入一条待写记忆"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("后写缓冲已关闭")
+            self._pending[memory.id] = memory
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+    
+    def get(self, memory_id: str) -> Optional[MemoryEntry]:
+        """获取尚未落盘的记忆"""
+        with self._lock:
+            memory = self._pending.get(memory_id)
+            if memory is None:
+                memory = self._inflight.get(memory_id)
+            return memory
+    
+    def flush(self) -> int:
+        """同步写入全部待写记忆，返回写入的数量"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight = self._pending
+                self._pending = {}
+                batch = list(self._inflight.values())
+            try:
+                for start in range(0, len(batch), self.batch_size):
+                    self._write_chunk(batch[start:start + self.batch_size])
+            finally:
+                with self._lock:
+                    self._inflight = {}
+            return len(batch)
+    
+    def _write_chunk(self, chunk: List[MemoryEntry]):
+        written = chunk
+        dropped = []
+        try:
+            self._write_batch(chunk)
+            self.flushed_batches += 1
+            self.flushed_rows += len(chunk)
+        except Exception as e:
+            logger.warning(f"批量写入 {len(chunk)} 条记忆失败，改为逐条写入: {e}")
+            written = []
+            for memory in chunk:
+                try:
+                    self._write_batch([memory])
+                    self.flushed_rows += 1
+                    written.append(memory)
+                except Exception as e:
+                    self.dropped_rows += 1
+                    dropped.append(memory)
+                    logger.error(f"写入记忆失败，已丢弃: {memory.id}: {e}")
+        if dropped and self._on_dropped is not None:
+            try:
+                self._on_dropped(dropped)
+            except Exception as e:
+                logger.error(f"后写缓冲丢弃回调失败: {e}")
+        if written and self._on_written is not None:
+            try:
+                self._on_written(written)
+            except Exception as e:
+                logger.error(f"后写缓冲提交回调失败: {e}")
+    
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if self._on_flush is not None:
+                    self._on_flush()
+            except Exception as e:
+                logger.error(f"后写缓冲刷新失败: {e}")
+    
+    def close(self):
+        """停止后台线程并写入剩余记忆"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        if self._on_flush is not None:
+            self._on_flush()
+
+
+class AccessTracker:
+    """记忆访问统计的内存累加表
+    
+    读取记忆只更新这里的 (access_count, last_accessed)，同一记忆多次访问只保留最新值，
+    之后批量执行 UPDATE 落盘，读请求路径上不产生写入。记录的是绝对值而不是增量：
+    整行写入时也会带上实例上的计数，按绝对值取较大者才不会重复累加
+    """
+    
+    def __init__(self):
+        self._pending: Dict[str, Tuple[int, datetime]] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+    
+    def record(self, memory: MemoryEntry):
+        metadata = memory.metadata
+        with self._lock:
+            pending = self._pending.get(memory.id)
+            if pending is None or metadata.access_count >= pending[0]:
+                self._pending[memory.id] = (metadata.access_count, metadata.last_accessed)
+    
+    def apply(self, memory: MemoryEntry):
+        """把尚未落盘的访问统计合并到从数据库读出的记忆上"""
+        pending = self._pending.get(memory.id)
+        if pending is not None and pending[0] > memory.metadata.access_count:
+            memory.metadata.access_count, memory.metadata.last_accessed = pending
+    
+    def discard(self, memory_ids: List[str]):
+        with self._lock:
+            for memory_id in memory_ids:
+                self._pending.pop(memory_id, None)
+    
+    def drain(self) -> List[Tuple[int, Optional[str], str]]:
+        """取出全部待写统计，返回 _UPDATE_ACCESS_SQL 的参数列表"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return [
+            (count, last_accessed.isoformat() if last_accessed else None, memory_id)
+            for memory_id, (count, last_accessed) in pending.items()
+        ]
+
+
+# 缓存条目估算大小时，MemoryEntry/ContextSession 对象本身（含元数据、时间戳、id）的固定开销
+_RECORD_OVERHEAD_BYTES = 1024
+
+
+def _approx_size(value: Any) -> int:
+    """估算 JSON 风格数据占用的内存字节数"""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_approx_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _memory_size(memory: MemoryEntry) -> int:
+    metadata = memory.metadata
+    return (_RECORD_OVERHEAD_BYTES + _approx_size(memory.title) + _approx_size(memory.content)
+            + _approx_size(metadata.tags) + _approx_size(metadata.keywords))
+
+
+def _session_size(session: ContextSession) -> int:
+    return (_RECORD_OVERHEAD_BYTES + _approx_size(session.name) + _approx_size(session.description)
+            + _approx_size(session.participants) + _approx_size(session.memory_entries)
+            + _approx_size(session.context_data))
+
+
+class _CacheEntry(NamedTuple):
+    """缓存槽位：不可变的 (值, 估算字节数) 记录，比每条目一个普通对象更省内存"""
+    value: Any
+    size: int
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存
+    
+    - OrderedDict 按访问顺序保存条目，get/put/pop 均为 O(1)，命中时移到队尾，淘汰从队首开始
+    - 同时按条目数量与估算字节数限制容量，max_bytes 为 0 时只限制数量（不估算大小）
+    - 单个条目超过 max_bytes 时不缓存
+    - 记录命中、未命中与淘汰次数
+    """
+    
+    def __init__(self, max_entries: int, max_bytes: int = 0, sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self._sizeof = sizeof or _approx_size
+        self._entries: 'OrderedDict[str, _CacheEntry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+    
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+    
+    def peek(self, key: str) -> Optional[Any]:
+        """读取条目但不调整顺序、不计入命中统计"""
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+    
+    def put(self, key: str, value: Any):
+        size = self._sizeof(value) if self.max_bytes else 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            if self.max_bytes and size > self.max_bytes:
+                return
+            self._entries[key] = _CacheEntry(value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+    
+    def pop(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._bytes -= entry.size
+            return entry.value
+    
+    def discard_value(self, key: str, value: Any) -> bool:
+        """仅当条目仍是给定对象时移除，返回是否移除"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.value is not value:
+                return False
+            self._bytes -= self._entries.pop(key).size
+            return True
+    
+    def discard_if(self, predicate: Callable[[Any], bool]) -> int:
+        """移除满足条件的条目（遍历全部条目），返回移除的数量"""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if predicate(entry.value)]
+            for key in keys:
+                self._bytes -= self._entries.pop(key).size
+            return len(keys)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# 写入代数的全局作用域，任何记忆写入都会推进
+_ALL_SCOPE = ('*', '')
+
+
+class WriteGenerations:
+    """记忆写入代数
+    
+    每次写入把受影响作用域（全局、记忆类型、来源/目标智能体、会话）的代数设为一个新的递增序号。
+    上层缓存在执行查询之前记录其依赖作用域的代数，之后代数不变即说明相关记忆没有写入，结果仍然有效，
+    因此可以使用较长的 TTL。代数须在写入对后续读取可见之后再推进；后写缓冲的写入在放入缓冲时
+与提交之后各推进一次，缓存不会在两者之间继续命中旧结果。
+    
+    记忆的类型、智能体与会话在创建后视为不变：更新时只推进新实例的作用域（以及存储持有的旧实例的作用域）
+    """
+    
+    def __init__(self):
+        self._sequence = 0
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def current(self) -> int:
+        return self._sequence
+    
+    @staticmethod
+    def scopes(memory_type: str, source_agent_did: str, target_agent_did: Optional[str],
+               session_id: Optional[str]) -> List[Tuple[str, str]]:
+        """写入一条记忆时受影响的作用域"""
+        scopes = [_ALL_SCOPE, ('type', memory_type), ('agent', source_agent_did)]
+        if target_agent_did:
+            scopes.append(('agent', target_agent_did))
+        if session_id:
+            scopes.append(('session', session_id))
+        return scopes
+    
+    @classmethod
+    def memory_scopes(cls, memory: MemoryEntry) -> List[Tuple[str, str]]:
+        metadata = memory.metadata
+        return cls.scopes(memory.memory_type.value, metadata.source_agent_did,
+                          metadata.target_agent_did, metadata.session_id)
+    
+    @staticmethod
+    def query_scopes(
+        memory_types: Optional[List[MemoryType]] = None,
+        agent_did: Optional[str] = None,
+        session_id: Optional[str] = None
+    ) -> Tuple[Tuple[str, str], ...]:
+        """查询结果依赖的作用域
+        
+        结果中的记忆都属于过滤条件对应的作用域，只要其中一个作用域没有写入，结果就不会变化，
+        因此只依赖最窄的一个：会话优先，其次智能体，再次各记忆类型，没有过滤条件时依赖全局
+        """
+        if session_id:
+            return (('session', session_id),)
+        if agent_did:
+            return (('agent', agent_did),)
+        if memory_types:
+            return tuple(('type', getattr(memory_type, 'value', memory_type)) for memory_type in memory_types)
+        return (_ALL_SCOPE,)
+    
+    def bump(self, scopes: List[Tuple[str, str]]):
+        with self._lock:
+            self._sequence += 1
+            for scope in scopes:
+                self._versions[scope] = self._sequence
+    
+    def bump_memories(self, memories: List[MemoryEntry]):
+        scopes = set()
+        for memory in memories:
+            scopes.update(self.memory_scopes(memory))
+        if scopes:
+            self.bump(list(scopes))
+    
+    def snapshot(self, scopes: Tuple[Tuple[str, str], ...]) -> Tuple[int, ...]:
+        """作用域当前的代数，用于与缓存条目记录的代数比较"""
+        return tuple(self._versions.get(scope, 0) for scope in scopes)
 
 
 class SQLiteMemoryStorage(MemoryStorageInterface):
@@ -104,99 +1017,264 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
         self.db_path = Path(self.config.storage.database_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # 线程锁
-        self._lock = threading.RLock()
-        
         # 线程池
         self._executor = ThreadPoolExecutor(
             max_workers=self.config.performance.thread_pool_size
         )
         
+        # 连接池：专用写连接 + 只读连接池（默认与线程池大小一致）
+        read_pool_size = self.config.storage.read_pool_size or self.config.performance.thread_pool_size
+        self._pool = SQLiteConnectionPool(
+            self.config.storage.database_path, self.config.storage, read_pool_size
+        )
+        
+        # 是否可用 FTS5 全文索引（SQLite 未编译 FTS5 时回退到 LIKE 扫描）
+        self._fts_enabled = False
+        # 是否可用标签/关键词倒排表（SQLite 缺少 JSON1 时回退到 LIKE 匹配）
+        self._term_index_enabled = False
+        
         # 内存缓存
-        self._memory_cache: Dict[str, MemoryEntry] = {}
-        self._session_cache: Dict[str, ContextSession] = {}
-        self._cache_lock = threading.RLock()
+        self._memory_cache = LRUCache(
+            self.config.storage.cache_size, self.config.storage.cache_max_bytes, sizeof=_memory_size)
+        self._session_cache = LRUCache(self.config.storage.session_cache_size, sizeof=_session_size)
+        
+        # 写入代数：供搜索/推荐缓存判断结果是否仍然有效；后写缓冲的写入在批次提交后才推进
+        self._generations = WriteGenerations()
+        # 后写缓冲中被新实例替换、尚待提交后推进作用域的旧实例
+        self._replaced: Dict[str, MemoryEntry] = {}
+        self._replaced_lock = threading.Lock()
         
         # 初始化数据库
         self._init_database()
+        
+        # 候选倒排索引：启动时从数据库建立，之后与写入代数在同一处增量维护
+        self._candidate_index: Optional[MemoryCandidateIndex] = None
+        if self.config.storage.enable_candidate_index:
+            self._candidate_index = self._load_candidate_index()
+        
+        # 访问统计：读取记忆时只更新内存中的计数，随后写缓冲刷新或攒满一批时批量 UPDATE
+        self._access_tracker = AccessTracker()
+        
+        # 后写缓冲：记忆写入按 batch_write_size / write_flush_interval 合并为批量事务
+        self._write_buffer: Optional[WriteBehindBuffer] = None
+        if self.config.storage.enable_write_behind:
+            self._write_buffer = WriteBehindBuffer(
+                self._write_memories,
+                batch_size=self.config.storage.batch_write_size,
+                flush_interval=self.config.storage.write_flush_interval,
+                on_flush=self._flush_access,
+                on_written=self._on_buffer_written,
+                on_dropped=self._on_buffer_dropped
+            )
     
     def _init_database(self):
         """初始化数据库表结构"""
-        with self._lock:
-            conn = sqlite3.connect(str(self.db_path))
-            try:
-                cursor = conn.cursor()
-                
-                # 创建记忆条目表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS memory_entries (
-                        id TEXT PRIMARY KEY,
-                        memory_type TEXT NOT NULL,
-                        title TEXT NOT NULL,
-                        content TEXT NOT NULL,
-                        source_agent_did TEXT NOT NULL,
-                        source_agent_name TEXT NOT NULL,
-                        target_agent_did TEXT,
-                        target_agent_name TEXT,
-                        session_id TEXT,
-                        tags TEXT,
-                        keywords TEXT,
-                        relevance_score REAL DEFAULT 1.0,
-                        access_count INTEGER DEFAULT 0,
-                        created_at TEXT NOT NULL,
-                        updated_at TEXT NOT NULL,
-                        last_accessed TEXT,
-                        expiry_time TEXT
-                    )
-                ''')
-                
-                # 创建上下文会话表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS context_sessions (
-                        id TEXT PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        description TEXT,
-                        participants TEXT,
-                        memory_entries TEXT,
-                        context_data TEXT,
-                        created_at TEXT NOT NULL,
-                        updated_at TEXT NOT NULL,
-                        is_active INTEGER DEFAULT 1
-                    )
-                ''')
-                
-                # 创建索引
-                cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_memory_type 
-                    ON memory_entries(memory_type)
-                ''')
-                
-                cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_source_agent 
-                    ON memory_entries(source_agent_did)
-                ''')
-                
-                cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_session_id 
-                    ON memory_entries(session_id)
-                ''')
-                
-                cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_created_at 
-                    ON memory_entries(created_at)
-                ''')
-                
-                conn.commit()
-                logger.debug(f"数据库初始化完成: {self.db_path}")
-                
-            finally:
-                conn.close()
+        with self._pool.writer() as conn:
+            cursor = conn.cursor()
+            
+            # 创建记忆条目表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS memory_entries (
+                    id TEXT PRIMARY KEY,
+                    memory_type TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    source_agent_did TEXT NOT NULL,
+                    source_agent_name TEXT NOT NULL,
+                    target_agent_did TEXT,
+                    target_agent_name TEXT,
+                    session_id TEXT,
+                    tags TEXT,
+                    keywords TEXT,
+                    relevance_score REAL DEFAULT 1.0,
+                    access_count INTEGER DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    last_accessed TEXT,
+                    expiry_time TEXT,
+                    fts_title TEXT,
+                    fts_body TEXT
+                )
+            ''')
+            
+            # 旧版数据库补充全文索引使用的分词列
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(memory_entries)')}
+            for column in ('fts_title', 'fts_body'):
+                if column not in columns:
+                    cursor.execute(f'ALTER TABLE memory_entries ADD COLUMN {column} TEXT')
+            
+            # 创建上下文会话表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS context_sessions (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    description TEXT,
+                    participants TEXT,
+                    memory_entries TEXT,
+                    context_data TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    is_active INTEGER DEFAULT 1
+                )
+            ''')
+            
+            # 创建索引
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_memory_type 
+                ON memory_entries(memory_type)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_source_agent 
+                ON memory_entries(source_agent_did)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_session_id 
+                ON memory_entries(session_id)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_created_at 
+                ON memory_entries(created_at)
+            ''')
+            
+            # 清理策略与过期清理使用的索引：LRU 按表达式排序，需要同一表达式上的索引
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_last_accessed 
+                ON memory_entries(COALESCE(last_accessed, created_at))
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_access_count 
+                ON memory_entries(access_count)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_expiry_time 
+                ON memory_entries(expiry_time)
+            ''')
+            
+        self._fts_enabled = self._init_fulltext_index()
+        self._term_index_enabled = self._init_term_index()
+        logger.debug(f"数据库初始化完成: {self.db_path}")
     
-    def _get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        conn = sqlite3.connect(str(self.db_path))
-        conn.row_factory = sqlite3.Row  # 允许按列名访问
-        return conn
+    def _init_fulltext_index(self) -> bool:
+        """创建 FTS5 全文索引与同步触发器，已有数据库首次启用时回填分词列并重建索引；
+        旧版全文表（自带文本副本，或触发器依赖应用注册的 SQL 函数）删除后重建"""
+        try:
+            with self._pool.writer() as conn:
+                existing = conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'memory_fts'"
+                ).fetchone()
+                if existing is not None and 'fts_title' not in existing[0]:
+                    for trigger in _FTS_TRIGGERS:
+                        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+                    conn.execute('DROP TABLE memory_fts')
+                    existing = None
+                conn.execute('DROP VIEW IF EXISTS memory_fts_source')
+                conn.execute(_FTS_TABLE_SQL)
+                if existing is None:
+                    self._backfill_fts_columns(conn)
+                for sql in _FTS_TRIGGER_SQL:
+                    conn.execute(sql)
+                if existing is None:
+                    conn.execute("INSERT INTO memory_fts(memory_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite 不支持 FTS5，记忆文本搜索回退到 LIKE 扫描: {e}")
+            return False
+    
+    @staticmethod
+    def _backfill_fts_columns(conn: sqlite3.Connection):
+        """按 rowid 分批计算并写入已有记忆的分词列"""
+        last_rowid = -1
+        while True:
+            rows = conn.execute(
+                'SELECT rowid, title, content, keywords FROM memory_entries WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                (last_rowid, _FTS_BACKFILL_CHUNK)
+            ).fetchall()
+            if not rows:
+                return
+            conn.executemany(
+                'UPDATE memory_entries SET fts_title = ?, fts_body = ? WHERE rowid = ?',
+                [(*_fts_columns(title, content, keywords), rowid) for rowid, title, content, keywords in rows]
+            )
+            last_rowid = rows[-1][0]
+    
+    def _init_term_index(self) -> bool:
+        """创建标签/关键词倒排表与同步触发器，已有数据库首次启用时从 JSON 列回填"""
+        try:
+            with self._pool.writer() as conn:
+                conn.execute("SELECT value FROM json_each('[]')")
+                for column, (table, term) in _TERM_TABLES.items():
+                    exists = conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                    ).fetchone() is not None
+                    for sql in _term_schema_sql(column):
+                        conn.execute(sql)
+                    if not exists:
+                        conn.execute(f'''
+                            INSERT OR IGNORE INTO {table}({term}, memory_id)
+                            SELECT j.value, m.id FROM memory_entries m, json_each(m.{column}) j
+                            WHERE j.type = 'text'
+                        ''')
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite 不支持 JSON1，标签/关键词过滤回退到 LIKE 匹配: {e}")
+            return False
+    
+    def _load_candidate_index(self) -> MemoryCandidateIndex:
+        """从数据库已有的记忆建立候选倒排索引"""
+        index = MemoryCandidateIndex()
+        started = time.perf_counter()
+        with self._pool.reader() as conn:
+            for memory_id, memory_type, source, target, session_id, tags, keywords in \
+                    conn.execute(_SELECT_CANDIDATE_FIELDS_SQL):
+                index.add_fields(memory_id, memory_type, source, target, session_id,
+                                 json_codec.loads(tags) if tags else (),
+                                 json_codec.loads(keywords) if keywords else ())
+        logger.debug(f"候选倒排索引建立完成: {len(index)} 条记忆，耗时 {time.perf_counter() - started:.3f}s")
+        return index
+    
+    def _write_memories(self, memories: List[MemoryEntry]):
+        """在一个事务中写入一批记忆"""
+        rows = [self._memory_to_row(memory) for memory in memories]
+        with self._pool.writer() as conn:
+            conn.executemany(_INSERT_MEMORY_SQL, rows)
+    
+    def _flush_pending(self):
+        """读数据库之前先写入缓冲中的记忆，保证查询能看到之前的写入
+        
+        不按 len(self._write_buffer) 判断：后台线程正在写入的批次不计入待写数量，
+        flush() 会先等待该批次提交，再写入其余待写记忆
+        """
+        if self._write_buffer is not None:
+            self._write_buffer.flush()
+    
+    def _flush_access(self):
+        """批量写入访问统计"""
+        rows = self._access_tracker.drain()
+        if not rows:
+            return
+        try:
+            with self._pool.writer() as conn:
+                conn.executemany(_UPDATE_ACCESS_SQL, rows)
+        except Exception as e:
+            logger.error(f"写入记忆访问统计失败，丢弃 {len(rows)} 条: {e}")
+    
+    async def _run(self, func: Callable[[], Any]) -> Any:
+        """在线程池中执行阻塞的数据库操作（未启用异步时直接执行）"""
+        if self.config.performance.enable_async_operations:
+            loop = None
+            try:
+                loop = asyncio.get_event_loop()
+            except RuntimeError:
+                pass
+            
+            if loop:
+                return await loop.run_in_executor(self._executor, func)
+        return func()
     
     def _memory_to_row(self, memory: MemoryEntry) -> Tuple:
         """将MemoryEntry转换为数据库行"""
@@ -205,20 +1283,22 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
             memory.id,
             memory.memory_type.value,
             memory.title,
-            json.dumps(memory.content, ensure_ascii=False),
+            json_codec.dumps(memory.content),
             metadata.source_agent_did,
             metadata.source_agent_name,
             metadata.target_agent_did,
             metadata.target_agent_name,
             metadata.session_id,
-            json.dumps(metadata.tags, ensure_ascii=False),
-            json.dumps(metadata.keywords, ensure_ascii=False),
+            json_codec.dumps(metadata.tags),
+            json_codec.dumps(metadata.keywords),
             metadata.relevance_score,
             metadata.access_count,
             memory.created_at.isoformat(),
             memory.updated_at.isoformat(),
             metadata.last_accessed.isoformat() if metadata.last_accessed else None,
-            metadata.expiry_time.isoformat() if metadata.expiry_time else None
+            metadata.expiry_time.isoformat() if metadata.expiry_time else None,
+            _fts_text(memory.title),
+            _fts_document(memory.content, metadata.keywords)
         )
     
     def _row_to_memory(self, row: sqlite3.Row) -> MemoryEntry:
@@ -231,23 +1311,25 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
             target_agent_did=row['target_agent_did'],
             target_agent_name=row['target_agent_name'],
             session_id=row['session_id'],
-            tags=json.loads(row['tags']) if row['tags'] else [],
-            keywords=json.loads(row['keywords']) if row['keywords'] else [],
+            tags=json_codec.loads(row['tags']) if row['tags'] else [],
+            keywords=json_codec.loads(row['keywords']) if row['keywords'] else [],
             relevance_score=row['relevance_score'],
             access_count=row['access_count'],
             last_accessed=datetime.fromisoformat(row['last_accessed']) if row['last_accessed'] else None,
             expiry_time=datetime.fromisoformat(row['expiry_time']) if row['expiry_time'] else None
         )
         
-        return MemoryEntry(
+        memory = MemoryEntry(
             id=row['id'],
             memory_type=MemoryType(row['memory_type']),
             title=row['title'],
-            content=json.loads(row['content']),
+            content=json_codec.loads(row['content']),
             metadata=metadata,
             created_at=datetime.fromisoformat(row['created_at']),
             updated_at=datetime.fromisoformat(row['updated_at'])
         )
+        self._access_tracker.apply(memory)
+        return memory
     
     def _session_to_row(self, session: ContextSession) -> Tuple:
         """将ContextSession转换为数据库行"""
@@ -255,9 +1337,9 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
             session.id,
             session.name,
             session.description,
-            json.dumps(session.participants, ensure_ascii=False),
-            json.dumps(session.memory_entries, ensure_ascii=False),
-            json.dumps(session.context_data, ensure_ascii=False),
+            json_codec.dumps(session.participants),
+            json_codec.dumps(session.memory_entries),
+            json_codec.dumps(session.context_data),
             session.created_at.isoformat(),
             session.updated_at.isoformat(),
             1 if session.is_active else 0
@@ -269,9 +1351,9 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
             id=row['id'],
             name=row['name'],
             description=row['description'] or '',
-            participants=json.loads(row['participants']) if row['participants'] else [],
-            memory_entries=json.loads(row['memory_entries']) if row['memory_entries'] else [],
-            context_data=json.loads(row['context_data']) if row['context_data'] else {},
+            participants=json_codec.loads(row['participants']) if row['participants'] else [],
+            memory_entries=json_codec.loads(row['memory_entries']) if row['memory_entries'] else [],
+            context_data=json_codec.loads(row['context_data']) if row['context_data'] else {},
             created_at=datetime.fromisoformat(row['created_at']),
             updated_at=datetime.fromisoformat(row['updated_at']),
             is_active=bool(row['is_active'])
@@ -279,56 +1361,76 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
     
     def _update_cache(self, memory: MemoryEntry):
         """更新内存缓存"""
-        with self._cache_lock:
-            if len(self._memory_cache) >= self.config.storage.cache_size:
-                # 简单的LRU清理：移除最早的条目
-                oldest_key = min(self._memory_cache.keys())
-                del self._memory_cache[oldest_key]
-            self._memory_cache[memory.id] = memory
+        self._memory_cache.put(memory.id, memory)
     
     def _update_session_cache(self, session: ContextSession):
         """更新会话缓存"""
-        with self._cache_lock:
-            self._session_cache[session.id] = session
+        self._session_cache.put(session.id, session)
+    
+    def _replaced_instances(self, memories: List[MemoryEntry]) -> List[MemoryEntry]:
+        """缓存中与新实例不是同一对象的旧实例，它们的作用域也要推进（在更新缓存之前调用）"""
+        replaced = []
+        for memory in memories:
+            previous = self._memory_cache.peek(memory.id)
+            if previous is not None and previous is not memory:
+                replaced.append(previous)
+        return replaced
+    
+    def _track_saved(self, memories: List[MemoryEntry], replaced: List[MemoryEntry]):
+        """写入提交之后推进写入代数并更新候选索引"""
+        self._generations.bump_memories(list(memories) + replaced)
+        if self._candidate_index is not None:
+            for memory in memories:
+                self._candidate_index.add(memory)
+    
+    def _buffer_memories(self, memories: List[MemoryEntry]):
+        """放入后写缓冲；被替换的旧实例先记下，批次提交后与新实例一起推进作用域
+        
+        放入缓冲后立即推进一次作用域，使之前缓存的结果失效；提交之后再推进一次，
+        丢弃两次推进之间可能缓存的、尚未包含这批记忆的结果
+        """
+        replaced = self._replaced_instances(memories)
+        with self._replaced_lock:
+            for previous in replaced:
+                self._replaced.setdefault(previous.id, previous)
+        for memory in memories:
+            self._write_buffer.put(memory)
+        self._generations.bump_memories(list(memories) + replaced)
+    
+    def _on_buffer_written(self, memories: List[MemoryEntry]):
+        """后写缓冲的一批记忆提交之后调用（在刷新线程中）：写入此时才对读取可见，才能推进写入代数"""
+        with self._replaced_lock:
+            replaced = [self._replaced.pop(m.id) for m in memories if m.id in self._replaced]
+        self._track_saved(memories, replaced)
+    
+    def _on_buffer_dropped(self, memories: List[MemoryEntry]):
+        """后写缓冲丢弃无法写入的记忆之后调用（在刷新线程中）
+        
+        缓存中仍是被丢弃的实例时移出缓存，之后的读取回到数据库中已提交的版本；
+        候选索引只在提交后加入记忆，不含被丢弃的实例，无需处理。推进作用域使包含它们的缓存结果失效
+        """
+        with self._replaced_lock:
+            replaced = [self._replaced.pop(m.id) for m in memories if m.id in self._replaced]
+        for memory in memories:
+            self._memory_cache.discard_value(memory.id, memory)
+        self._generations.bump_memories(list(memories) + replaced)
     
     async def save_memory(self, memory: MemoryEntry) -> bool:
         """保存记忆条目"""
         try:
-            def _save():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO memory_entries (
-                                id, memory_type, title, content,
-                                source_agent_did, source_agent_name,
-                                target_agent_did, target_agent_name,
-                                session_id, tags, keywords,
-                                relevance_score, access_count,
-                                created_at, updated_at,
-                                last_accessed, expiry_time
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', self._memory_to_row(memory))
-                        conn.commit()
-                        return True
-                    finally:
-                        conn.close()
-            
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
-                
-                if loop:
-                    result = await loop.run_in_executor(self._executor, _save)
-                else:
-                    result = _save()
+            if self._write_buffer is not None:
+                self._buffer_memories([memory])
+                result = True
             else:
-                result = _save()
+                replaced = self._replaced_instances([memory])
+                
+                def _save():
+                    self._write_memories([memory])
+                    return True
+                
+                result = await self._run(_save)
+                if result:
+                    self._track_saved([memory], replaced)
             
             if result:
                 self._update_cache(memory)
@@ -341,49 +1443,31 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
             return False
     
     async def get_memory(self, memory_id: str) -> Optional[MemoryEntry]:
-        """获取记忆条目"""
-        # 先检查缓存
-        with self._cache_lock:
-            if memory_id in self._memory_cache:
-                memory = self._memory_cache[memory_id]
-                memory.update_access()
-                return memory
-        
+        """获取记忆条目，访问统计只记入内存，不重写整行"""
         try:
-            def _get():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute(
-                            'SELECT * FROM memory_entries WHERE id = ?',
-                            (memory_id,)
-                        )
-                        row = cursor.fetchone()
-                        return self._row_to_memory(row) if row else None
-                    finally:
-                        conn.close()
+            # 先检查缓存与后写缓冲
+            memory = self._memory_cache.get(memory_id)
+            if memory is None and self._write_buffer is not None:
+                memory = self._write_buffer.get(memory_id)
+                if memory is not None:
+                    self._update_cache(memory)
             
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
+            if memory is None:
+                def _get():
+                    with self._pool.reader() as conn:
+                        row = conn.execute(_SELECT_MEMORY_SQL, (memory_id,)).fetchone()
+                        return self._row_to_memory(row) if row else None
                 
-                if loop:
-                    memory = await loop.run_in_executor(self._executor, _get)
-                else:
-                    memory = _get()
-            else:
-                memory = _get()
-            
-            if memory:
-                memory.update_access()
+                memory = await self._run(_get)
+                if memory is None:
+                    return None
                 self._update_cache(memory)
-                # 更新数据库中的访问信息
-                await self.update_memory(memory)
+            
+            memory.update_access()
+            self._access_tracker.record(memory)
+            # 没有后写缓冲的后台刷新时，攒满一批再写入
+            if self._write_buffer is None and len(self._access_tracker) >= self.config.storage.batch_write_size:
+                await self._run(self._flush_access)
             
             return memory
             
@@ -396,39 +1480,50 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
         memory.updated_at = datetime.now()
         return await self.save_memory(memory)
     
+    async def wait_for_writes(self):
+        """等待后写缓冲中的记忆提交：候选索引与写入代数在提交之后才更新"""
+        if self._write_buffer is not None:
+            await self._run(self._flush_pending)
+    
+    async def get_memories(self, memory_ids: List[str]) -> List[MemoryEntry]:
+        """按 id 批量读取记忆：先查缓存，其余每 500 个 id 一条查询；不计入访问统计"""
+        try:
+            found: Dict[str, MemoryEntry] = {}
+            missing = []
+            for memory_id in memory_ids:
+                memory = self._memory_cache.peek(memory_id)
+                if memory is None:
+                    missing.append(memory_id)
+                else:
+                    found[memory_id] = memory
+            
+            if missing:
+                def _get():
+                    self._flush_pending()
+                    rows = []
+                    with self._pool.reader() as conn:
+                        for start in range(0, len(missing), _GET_MEMORIES_CHUNK):
+                            chunk = missing[start:start + _GET_MEMORIES_CHUNK]
+                            placeholders = ', '.join('?' * len(chunk))
+                            rows.extend(conn.execute(
+                                f'SELECT {_MEMORY_COLUMNS} FROM memory_entries WHERE id IN ({placeholders})', chunk).fetchall())
+                    return [self._row_to_memory(row) for row in rows]
+                
+                for memory in await self._run(_get):
+                    found[memory.id] = memory
+            
+            return [found[memory_id] for memory_id in memory_ids if memory_id in found]
+            
+        except Exception as e:
+            logger.error(f"批量获取记忆条目失败: {e}")
+            return []
+    
     async def delete_memory(self, memory_id: str) -> bool:
         """删除记忆条目"""
         try:
-            def _delete():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute('DELETE FROM memory_entries WHERE id = ?', (memory_id,))
-                        conn.commit()
-                        return cursor.rowcount > 0
-                    finally:
-                        conn.close()
-            
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
-                
-                if loop:
-                    result = await loop.run_in_executor(self._executor, _delete)
-                else:
-                    result = _delete()
-            else:
-                result = _delete()
+            result = await self._run(lambda: self._delete_memories([memory_id])) > 0
             
             if result:
-                # 从缓存中删除
-                with self._cache_lock:
-                    self._memory_cache.pop(memory_id, None)
                 logger.debug(f"删除记忆条目成功: {memory_id}")
             
             return result
@@ -437,6 +1532,175 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
             logger.error(f"删除记忆条目失败: {e}")
             return False
     
+    def _delete_memories(self, memory_ids: List[str]) -> int:
+        # 先写入缓冲中的记忆，使删除计数包含尚未落盘的记忆，也避免旧版本在删除之后被写回
+        self._flush_pending()
+        self._access_tracker.discard(memory_ids)
+        deleted = 0
+        scopes = set()
+        batch_size = self.config.storage.batch_write_size
+        for start in range(0, len(memory_ids), batch_size):
+            chunk = memory_ids[start:start + batch_size]
+            with self._pool.writer() as conn:
+                for memory_id in chunk:
+                    row = conn.execute(_SELECT_SCOPE_SQL, (memory_id,)).fetchone()
+                    if row is not None:
+                        scopes.update(WriteGenerations.scopes(*row))
+                deleted += conn.executemany(_DELETE_MEMORY_SQL, [(memory_id,) for memory_id in chunk]).rowcount
+        self._forget_memories(memory_ids, scopes)
+        return deleted
+    
+    def _forget_memories(self, memory_ids: List[str], scopes: Set[Tuple[str, str]]):
+        """记忆删除后移出缓存与候选索引，并推进写入代数"""
+        if scopes:
+            self._generations.bump(list(scopes))
+        if self._candidate_index is not None:
+            self._candidate_index.remove(memory_ids)
+        for memory_id in memory_ids:
+            self._memory_cache.pop(memory_id)
+    
+    async def save_memories(self, memories: List[MemoryEntry]) -> int:
+        """批量保存记忆条目，每 batch_write_size 条一个事务，返回时已落盘"""
+        if not memories:
+            return 0
+        try:
+            if self._write_buffer is not None:
+                self._buffer_memories(memories)
+                await self._run(self._write_buffer.flush)
+            else:
+                replaced = self._replaced_instances(memories)
+                batch_size = self.config.storage.batch_write_size
+                
+                def _save():
+                    for start in range(0, len(memories), batch_size):
+                        self._write_memories(memories[start:start + batch_size])
+                
+                await self._run(_save)
+                self._track_saved(memories, replaced)
+            
+            for memory in memories:
+                self._update_cache(memory)
+            logger.debug(f"批量保存记忆条目成功: {len(memories)} 条")
+            return len(memories)
+            
+        except Exception as e:
+            logger.error(f"批量保存记忆条目失败: {e}")
+            return 0
+    
+    async def delete_memories(self, memory_ids: List[str]) -> int:
+        """批量删除记忆条目，返回实际删除的数量"""
+        if not memory_ids:
+            return 0
+        try:
+            deleted = await self._run(lambda: self._delete_memories(list(memory_ids)))
+            logger.debug(f"批量删除记忆条目: 请求 {len(memory_ids)} 条，删除 {deleted} 条")
+            return deleted
+            
+        except Exception as e:
+            logger.error(f"批量删除记忆条目失败: {e}")
+            return 0
+    
+    async def flush(self):
+        """将后写缓冲中的记忆与访问统计写入数据库"""
+        def _flush():
+            self._flush_pending()
+            self._flush_access()
+        
+        await self._run(_flush)
+    
+    def _build_search(
+        self,
+        query: str,
+        memory_type: Optional[MemoryType],
+        agent_did: Optional[str],
+        session_id: Optional[str],
+        tags: Optional[List[str]],
+        keywords: Optional[List[str]],
+        tag_mode: str = "all"
+    ) -> Tuple[Optional[str], List[str], List[Any]]:
+        """构建搜索条件，返回 (全文匹配表达式, memory_entries 上的条件, 条件参数)"""
+        # 构建查询条件
+        conditions = []
+        params: List[Any] = []
+        match = _fts_query(query) if query and self._fts_enabled else None
+        
+        if query and not match:
+            conditions.append('(m.title LIKE ? OR m.content LIKE ?)')
+            query_pattern = f'%{query}%'
+            params.extend([query_pattern, query_pattern])
+        
+        if memory_type:
+            conditions.append('m.memory_type = ?')
+            params.append(memory_type.value)
+        
+        if agent_did:
+            conditions.append('(m.source_agent_did = ? OR m.target_agent_did = ?)')
+            params.extend([agent_did, agent_did])
+        
+        if session_id:
+            conditions.append('m.session_id = ?')
+            params.append(session_id)
+        
+        for column, values in (('tags', tags), ('keywords', keywords)):
+            if not values:
+                continue
+            values = list(dict.fromkeys(values))
+            if self._term_index_enabled:
+                # ALL 为各值记忆集合的交集，ANY 为 IN 列表，均走倒排表主键索引
+                table, term = _TERM_TABLES[column]
+                if tag_mode == 'any':
+                    placeholders = ','.join('?' * len(values))
+                    conditions.append(f'm.id IN (SELECT memory_id FROM {table} WHERE {term} IN ({placeholders}))')
+                else:
+                    lookup = f'SELECT memory_id FROM {table} WHERE {term} = ?'
+                    conditions.append(f"m.id IN ({' INTERSECT '.join([lookup] * len(values))})")
+                params.extend(values)
+            else:
+                joiner = ' OR ' if tag_mode == 'any' else ' AND '
+                conditions.append('(' + joiner.join([f'm.{column} LIKE ?'] * len(values)) + ')')
+                params.extend(f'%"{value}"%' for value in values)
+        
+        return match, conditions, params
+    
+    def _search_rows(self, conn: sqlite3.Connection, query: str, filters: Tuple, limit: int, offset: int,
+                     snippet_tokens: int = 0) -> List[sqlite3.Row]:
+        """执行搜索；有全文匹配时按 BM25 排序，snippet_tokens > 0 时返回 (行, 片段) 列表"""
+        match, conditions, params = self._build_search(query, *filters)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        
+        if not match:
+            sql = f'SELECT {_MEMORY_COLUMNS} FROM memory_entries m{where} ORDER BY m.updated_at DESC LIMIT ? OFFSET ?'
+            return conn.execute(sql, params + [limit, offset]).fetchall()
+        
+        if conditions:
+            sql = (
+                f'SELECT {_MEMORY_COLUMNS}, {_FTS_RANK} AS fts_score FROM memory_entries m '
+                f'JOIN memory_fts ON memory_fts.rowid = m.rowid{where} AND memory_fts MATCH ? '
+                f'ORDER BY fts_score, m.updated_at DESC LIMIT ? OFFSET ?'
+            )
+            rows = conn.execute(sql, params + [match, limit, offset]).fetchall()
+        else:
+            # 只有全文条件时先在索引内取前 N 个 rowid，避免为所有命中行读取记忆内容
+            sql = (
+                f'SELECT {_MEMORY_COLUMNS}, f.fts_score FROM ('
+                f'SELECT rowid, {_FTS_RANK} AS fts_score FROM memory_fts WHERE memory_fts MATCH ? '
+                f'ORDER BY fts_score, rowid DESC LIMIT ? OFFSET ?'
+                f') f JOIN memory_entries m ON m.rowid = f.rowid ORDER BY f.fts_score, m.updated_at DESC'
+            )
+            rows = conn.execute(sql, [match, limit, offset]).fetchall()
+        
+        if snippet_tokens <= 0 or not rows:
+            return rows
+        
+        # 只为返回的记录生成片段
+        snippets = dict(conn.execute(
+            f"SELECT m.id, snippet(memory_fts, -1, '[', ']', '…', {int(snippet_tokens)}) "
+            f"FROM memory_entries m JOIN memory_fts ON memory_fts.rowid = m.rowid "
+            f"WHERE memory_fts MATCH ? AND m.id IN ({','.join('?' * len(rows))})",
+            [match] + [row['id'] for row in rows]
+        ).fetchall())
+        return [(row, snippets.get(row['id'], '')) for row in rows]
+    
     async def search_memories(
         self,
         query: str = "",
@@ -446,82 +1710,116 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
         tags: Optional[List[str]] = None,
         keywords: Optional[List[str]] = None,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        tag_mode: str = "all"
     ) -> List[MemoryEntry]:
-        """搜索记忆条目"""
+        """搜索记忆条目，文本查询走全文索引并按 BM25 相关度排序"""
+        _check_tag_mode(tag_mode)
         try:
             def _search():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        
-                        # 构建查询条件
-                        conditions = []
-                        params = []
-                        
-                        if query:
-                            conditions.append('(title LIKE ? OR content LIKE ?)')
-                            query_pattern = f'%{query}%'
-                            params.extend([query_pattern, query_pattern])
-                        
-                        if memory_type:
-                            conditions.append('memory_type = ?')
-                            params.append(memory_type.value)
-                        
-                        if agent_did:
-                            conditions.append('(source_agent_did = ? OR target_agent_did = ?)')
-                            params.extend([agent_did, agent_did])
-                        
-                        if session_id:
-                            conditions.append('session_id = ?')
-                            params.append(session_id)
-                        
-                        if tags:
-                            for tag in tags:
-                                conditions.append('tags LIKE ?')
-                                params.append(f'%"{tag}"%')
-                        
-                        if keywords:
-                            for keyword in keywords:
-                                conditions.append('keywords LIKE ?')
-                                params.append(f'%"{keyword}"%')
-                        
-                        # 构建完整查询
-                        sql = 'SELECT * FROM memory_entries'
-                        if conditions:
-                            sql += ' WHERE ' + ' AND '.join(conditions)
-                        sql += ' ORDER BY updated_at DESC LIMIT ? OFFSET ?'
-                        params.extend([limit, offset])
-                        
-                        cursor.execute(sql, params)
-                        rows = cursor.fetchall()
-                        return [self._row_to_memory(row) for row in rows]
-                    
-                    finally:
-                        conn.close()
+                self._flush_pending()
+                filters = (memory_type, agent_did, session_id, tags, keywords, tag_mode)
+                with self._pool.reader() as conn:
+                    rows = self._search_rows(conn, query, filters, limit, offset)
+                return [self._row_to_memory(row) for row in rows]
             
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
-                
-                if loop:
-                    memories = await loop.run_in_executor(self._executor, _search)
-                else:
-                    memories = _search()
-            else:
-                memories = _search()
-            
-            return memories
+            return await self._run(_search)
             
         except Exception as e:
             logger.error(f"搜索记忆条目失败: {e}")
             return []
     
+    async def search_with_snippets(
+        self,
+        query: str,
+        memory_type: Optional[MemoryType] = None,
+        agent_did: Optional[str] = None,
+        session_id: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        keywords: Optional[List[str]] = None,
+        limit: int = 10,
+        offset: int = 0,
+        snippet_tokens: int = 16,
+        tag_mode: str = "all"
+    ) -> List[Dict[str, Any]]:
+        """全文搜索并返回命中片段
+        
+        Returns:
+            List[Dict[str, Any]]: [{'memory': MemoryEntry, 'score': BM25 分数（越小越相关）,
+            'snippet': 以 [ ] 标出命中词的片段}]
+        """
+        if not self._fts_enabled or not _fts_query(query):
+            memories = await self.search_memories(
+                query, memory_type, agent_did, session_id, tags, keywords, limit, offset, tag_mode)
+            return [{'memory': m, 'score': 0.0, 'snippet': m.title} for m in memories]
+        
+        _check_tag_mode(tag_mode)
+        try:
+            def _search():
+                self._flush_pending()
+                filters = (memory_type, agent_did, session_id, tags, keywords, tag_mode)
+                with self._pool.reader() as conn:
+                    rows = self._search_rows(conn, query, filters, limit, offset, snippet_tokens=max(1, snippet_tokens))
+                return [{
+                    'memory': self._row_to_memory(row),
+                    'score': row['fts_score'],
+                    'snippet': snippet.replace(_FTS_SEPARATOR, '')
+                } for row, snippet in rows]
+            
+            return await self._run(_search)
+            
+        except Exception as e:
+            logger.error(f"全文搜索记忆条目失败: {e}")
+            return []
+    
+    async def get_tag_counts(
+        self,
+        field: str = "tags",
+        query: str = "",
+        memory_type: Optional[MemoryType] = None,
+        agent_did: Optional[str] = None,
+        session_id: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        keywords: Optional[List[str]] = None,
+        tag_mode: str = "all",
+        limit: Optional[int] = None
+    ) -> Dict[str, int]:
+        """统计符合条件的记忆中每个标签（或关键词）的数量，在倒排表上分组计数"""
+        _check_term_field(field)
+        _check_tag_mode(tag_mode)
+        if not self._term_index_enabled:
+            return await super().get_tag_counts(
+                field, query, memory_type, agent_did, session_id, tags, keywords, tag_mode, limit)
+        
+        try:
+            def _count():
+                self._flush_pending()
+                table, term = _TERM_TABLES[field]
+                match, conditions, params = self._build_search(
+                    query, memory_type, agent_did, session_id, tags, keywords, tag_mode)
+                sql = f'SELECT t.{term}, COUNT(*) AS n FROM {table} t'
+                if match:
+                    conditions.append('memory_fts MATCH ?')
+                    params.append(match)
+                if conditions:
+                    sql += ' JOIN memory_entries m ON m.id = t.memory_id'
+                if match:
+                    sql += ' JOIN memory_fts ON memory_fts.rowid = m.rowid'
+                if conditions:
+                    sql += ' WHERE ' + ' AND '.join(conditions)
+                sql += f' GROUP BY t.{term} ORDER BY n DESC, t.{term}'
+                if limit:
+                    sql += ' LIMIT ?'
+                    params.append(limit)
+                with self._pool.reader() as conn:
+                    return dict(conn.execute(sql, params).fetchall())
+            
+            return await self._run(_count)
+            
+        except Exception as e:
+            logger.error(f"统计记忆标签失败: {e}")
+            return {}
+    
     async def get_memories_by_session(self, session_id: str) -> List[MemoryEntry]:
         """根据会话ID获取记忆条目"""
         return await self.search_memories(query="", session_id=session_id)
@@ -530,36 +1828,11 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
         """保存上下文会话"""
         try:
             def _save():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO context_sessions (
-                                id, name, description, participants,
-                                memory_entries, context_data,
-                                created_at, updated_at, is_active
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', self._session_to_row(session))
-                        conn.commit()
-                        return True
-                    finally:
-                        conn.close()
-            
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
-                
-                if loop:
-                    result = await loop.run_in_executor(self._executor, _save)
-                else:
-                    result = _save()
-            else:
-                result = _save()
+                with self._pool.writer() as conn:
+                    conn.execute(_INSERT_SESSION_SQL, self._session_to_row(session))
+                    return True
+            
+            result = await self._run(_save)
             
             if result:
                 self._update_session_cache(session)
@@ -574,39 +1847,17 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
     async def get_session(self, session_id: str) -> Optional[ContextSession]:
         """获取上下文会话"""
         # 先检查缓存
-        with self._cache_lock:
-            if session_id in self._session_cache:
-                return self._session_cache[session_id]
+        session = self._session_cache.get(session_id)
+        if session is not None:
+            return session
         
         try:
             def _get():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute(
-                            'SELECT * FROM context_sessions WHERE id = ?',
-                            (session_id,)
-                        )
-                        row = cursor.fetchone()
-                        return self._row_to_session(row) if row else None
-                    finally:
-                        conn.close()
-            
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
-                
-                if loop:
-                    session = await loop.run_in_executor(self._executor, _get)
-                else:
-                    session = _get()
-            else:
-                session = _get()
+                with self._pool.reader() as conn:
+                    row = conn.execute(_SELECT_SESSION_SQL, (session_id,)).fetchone()
+                    return self._row_to_session(row) if row else None
+            
+            session = await self._run(_get)
             
             if session:
                 self._update_session_cache(session)
@@ -626,35 +1877,14 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
         """删除上下文会话"""
         try:
             def _delete():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute('DELETE FROM context_sessions WHERE id = ?', (session_id,))
-                        conn.commit()
-                        return cursor.rowcount > 0
-                    finally:
-                        conn.close()
-            
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
-                
-                if loop:
-                    result = await loop.run_in_executor(self._executor, _delete)
-                else:
-                    result = _delete()
-            else:
-                result = _delete()
+                with self._pool.writer() as conn:
+                    return conn.execute(_DELETE_SESSION_SQL, (session_id,)).rowcount > 0
+            
+            result = await self._run(_delete)
             
             if result:
                 # 从缓存中删除
-                with self._cache_lock:
-                    self._session_cache.pop(session_id, None)
+                self._session_cache.pop(session_id)
                 logger.debug(f"删除会话成功: {session_id}")
             
             return result
@@ -667,45 +1897,28 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
         """清理过期记忆，返回清理数量"""
         try:
             def _cleanup():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        now = datetime.now().isoformat()
-                        cursor.execute(
-                            'DELETE FROM memory_entries WHERE expiry_time IS NOT NULL AND expiry_time < ?',
-                            (now,)
-                        )
-                        conn.commit()
-                        return cursor.rowcount
-                    finally:
-                        conn.close()
-            
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
-                
-                if loop:
-                    count = await loop.run_in_executor(self._executor, _cleanup)
-                else:
-                    count = _cleanup()
-            else:
-                count = _cleanup()
+                self._flush_pending()
+                with self._pool.writer() as conn:
+                    now = datetime.now().isoformat()
+                    expired = conn.execute(_SELECT_EXPIRED_SQL, (now,)).fetchall()
+                    count = conn.execute(_DELETE_EXPIRED_SQL, (now,)).rowcount
+                scopes = set()
+                for row in expired:
+                    scopes.update(WriteGenerations.scopes(*row[1:]))
+                memory_ids = [row[0] for row in expired]
+                self._access_tracker.discard(memory_ids)
+                if self._candidate_index is not None:
+                    self._candidate_index.remove(memory_ids)
+                if scopes:
+                    self._generations.bump(list(scopes))
+                return count
+            
+            count = await self._run(_cleanup)
             
             if count > 0:
                 logger.info(f"清理了 {count} 个过期记忆条目")
                 # 清理缓存中的过期条目
-                with self._cache_lock:
-                    expired_keys = [
-                        k for k, v in self._memory_cache.items() 
-                        if v.is_expired()
-                    ]
-                    for key in expired_keys:
-                        del self._memory_cache[key]
+                self._memory_cache.discard_if(lambda memory: memory.is_expired())
             
             return count
             
@@ -713,72 +1926,108 @@ class SQLiteMemoryStorage(MemoryStorageInterface):
             logger.error(f"清理过期记忆失败: {e}")
             return 0
     
+    async def cleanup_memories(self, strategy: str, count: int,
+                               retention_cutoff: Optional[datetime] = None) -> int:
+        """按清理策略删除至多 count 条记忆：一条按索引排序的选择语句与一条集合 DELETE，在同一个写事务内完成"""
+        _check_cleanup_strategy(strategy)
+        if count <= 0:
+            return 0
+        try:
+            def _cleanup():
+                # LRU/LFU 依赖访问统计，先把缓冲中的记忆与访问统计写入数据库
+                self._flush_pending()
+                self._flush_access()
+                select_sql = _CLEANUP_SELECT_SQL[strategy]
+                params = {
+                    'limit': count,
+                    'now': datetime.now().isoformat(),
+                    'cutoff': (retention_cutoff or datetime.max).isoformat(),
+                    'max_score': _SMART_CLEANUP_MAX_SCORE
+                }
+                with self._pool.writer() as conn:
+                    victims = conn.execute(select_sql.format(columns=f'id, {_SCOPE_COLUMNS}'), params).fetchall()
+                    if not victims:
+                        return 0
+                    deleted = conn.execute(
+                        f"DELETE FROM memory_entries WHERE id IN ({select_sql.format(columns='id')})", params
+                    ).rowcount
+                memory_ids = [row[0] for row in victims]
+                self._access_tracker.discard(memory_ids)
+                scopes = set()
+                for row in victims:
+                    scopes.update(WriteGenerations.scopes(*row[1:]))
+                self._forget_memories(memory_ids, scopes)
+                return deleted
+            
+            deleted = await self._run(_cleanup)
+            if deleted > 0:
+                logger.info(f"按 {strategy} 策略清理了 {deleted} 个记忆条目")
+            return deleted
+            
+        except Exception as e:
+            logger.error(f"按 {strategy} 策略清理记忆失败: {e}")
+            return 0
+    
     async def get_storage_stats(self) -> Dict[str, Any]:
         """获取存储统计信息"""
         try:
             def _get_stats():
-                with self._lock:
-                    conn = self._get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        
-                        # 记忆条目统计
-                        cursor.execute('SELECT COUNT(*) FROM memory_entries')
-                        total_memories = cursor.fetchone()[0]
-                        
-                        cursor.execute('SELECT memory_type, COUNT(*) FROM memory_entries GROUP BY memory_type')
-                        memory_types = dict(cursor.fetchall())
-                        
-                        # 会话统计
-                        cursor.execute('SELECT COUNT(*) FROM context_sessions')
-                        total_sessions = cursor.fetchone()[0]
-                        
-                        cursor.execute('SELECT COUNT(*) FROM context_sessions WHERE is_active = 1')
-                        active_sessions = cursor.fetchone()[0]
-                        
-                        # 数据库文件大小
-                        db_size = self.db_path.stat().st_size if self.db_path.exists() else 0
-                        
-                        return {
-                            'storage_type': 'sqlite',
-                            'database_path': str(self.db_path),
-                            'database_size_bytes': db_size,
-                            'total_memories': total_memories,
-                            'memory_types': memory_types,
-                            'total_sessions': total_sessions,
-                            'active_sessions': active_sessions,
-                            'cache_size': len(self._memory_cache),
-                            'session_cache_size': len(self._session_cache)
-                        }
-                        
-                    finally:
-                        conn.close()
-            
-            if self.config.performance.enable_async_operations:
-                loop = None
-                try:
-                    import asyncio
-                    loop = asyncio.get_event_loop()
-                except:
-                    pass
+                self._flush_pending()
+                with self._pool.reader() as conn:
+                    cursor = conn.cursor()
+                    
+                    # 记忆条目统计
+                    cursor.execute('SELECT COUNT(*) FROM memory_entries')
+                    total_memories = cursor.fetchone()[0]
+                    
+                    cursor.execute('SELECT memory_type, COUNT(*) FROM memory_entries GROUP BY memory_type')
+                    memory_types = {row[0]: row[1] for row in cursor.fetchall()}
+                    
+                    # 会话统计
+                    cursor.execute('SELECT COUNT(*) FROM context_sessions')
+                    total_sessions = cursor.fetchone()[0]
+                    
+                    cursor.execute('SELECT COUNT(*) FROM context_sessions WHERE is_active = 1')
+                    active_sessions = cursor.fetchone()[0]
                 
-                if loop:
-                    stats = await loop.run_in_executor(self._executor, _get_stats)
-                else:
-                    stats = _get_stats()
-            else:
-                stats = _get_stats()
+                # 数据库文件大小
+                db_size = self.db_path.stat().st_size if self.db_path.exists() else 0
+                
+                return {
+                    'storage_type': 'sqlite',
+                    'database_path': str(self.db_path),
+                    'database_size_bytes': db_size,
+                    'total_memories': total_memories,
+                    'memory_types': memory_types,
+                    'total_sessions': total_sessions,
+                    'active_sessions': active_sessions,
+                    'cache_size': len(self._memory_cache),
+                    'session_cache_size': len(self._session_cache),
+                    'memory_cache': self._memory_cache.stats(),
+                    'session_cache': self._session_cache.stats(),
+                    'pending_writes': len(self._write_buffer) if self._write_buffer is not None else 0,
+                    'dropped_writes': self._write_buffer.dropped_rows if self._write_buffer is not None else 0,
+                    'pending_access_updates': len(self._access_tracker),
+                    'write_generation': self._generations.current,
+                    'candidate_index': self._candidate_index.stats() if self._candidate_index is not None else None
+                }
             
-            return stats
+            return await self._run(_get_stats)
             
         except Exception as e:
             logger.error(f"获取存储统计失败: {e}")
             return {}
     
     def close(self):
-        """关闭存储"""
+        """关闭存储，先写入后写缓冲中的记忆与访问统计"""
+        if getattr(self, '_write_buffer', None) is not None:
+            self._write_buffer.close()
         if hasattr(self, '_executor'):
             self._executor.shutdown(wait=True)
+        if hasattr(self, '_pool'):
+            if hasattr(self, '_access_tracker'):
+                self._flush_access()
+            self._pool.close()
 
 
 class InMemoryStorage(MemoryStorageInterface):
@@ -788,10 +2037,102 @@ class InMemoryStorage(MemoryStorageInterface):
         self._memories: Dict[str, MemoryEntry] = {}
         self._sessions: Dict[str, ContextSession] = {}
         self._lock = threading.RLock()
+        # 标签/关键词倒排索引：字段 -> 值 -> 记忆ID集合，按保存时的标签建立
+        self._term_index: Dict[str, Dict[str, Set[str]]] = {field: {} for field in _TERM_TABLES}
+        self._indexed_terms: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        self._generations = WriteGenerations()
+        self._candidate_index = MemoryCandidateIndex()
+    
+    def _index_memory(self, memory: MemoryEntry):
+        """保存记忆并更新倒排索引（调用方持有锁）"""
+        previous = self._memories.get(memory.id)
+        self._generations.bump_memories([memory] if previous is None else [memory, previous])
+        self._unindex_memory(memory.id)
+        terms = {field: tuple(set(getattr(memory.metadata, field))) for field in _TERM_TABLES}
+        for field, values in terms.items():
+            index = self._term_index[field]
+            for value in values:
+                index.setdefault(value, set()).add(memory.id)
+        self._indexed_terms[memory.id] = terms
+        self._memories[memory.id] = memory
+        self._candidate_index.add(memory)
+    
+    def _unindex_memory(self, memory_id: str):
+        terms = self._indexed_terms.pop(memory_id, None)
+        if not terms:
+            return
+        for field, values in terms.items():
+            index = self._term_index[field]
+            for value in values:
+                memory_ids = index.get(value)
+                if memory_ids is not None:
+                    memory_ids.discard(memory_id)
+                    if not memory_ids:
+                        del index[value]
+    
+    def _remove_memory(self, memory_id: str) -> bool:
+        self._unindex_memory(memory_id)
+        memory = self._memories.pop(memory_id, None)
+        if memory is None:
+            return False
+        self._generations.bump_memories([memory])
+        self._candidate_index.remove([memory_id])
+        return True
+    
+    def _match_terms(self, field: str, values: List[str], tag_mode: str) -> Set[str]:
+        """在倒排索引上求 ALL（交集，从最小集合开始）或 ANY（并集）"""
+        index = self._term_index[field]
+        id_sets = sorted((index.get(value, set()) for value in set(values)), key=len)
+        if tag_mode == 'any':
+            return set().union(*id_sets)
+        result = set(id_sets[0])
+        for memory_ids in id_sets[1:]:
+            if not result:
+                break
+            result &= memory_ids
+        return result
+    
+    def _filter_memories(
+        self,
+        query: str,
+        memory_type: Optional[MemoryType],
+        agent_did: Optional[str],
+        session_id: Optional[str],
+        tags: Optional[List[str]],
+        keywords: Optional[List[str]],
+        tag_mode: str
+    ) -> List[MemoryEntry]:
+        """返回符合条件的记忆（调用方持有锁）"""
+        candidates: Optional[Set[str]] = None
+        for field, values in (('tags', tags), ('keywords', keywords)):
+            if values:
+                memory_ids = self._match_terms(field, values, tag_mode)
+                candidates = memory_ids if candidates is None else candidates & memory_ids
+        memories = self._memories.values() if candidates is None else [self._memories[i] for i in candidates]
+        
+        results = []
+        for memory in memories:
+            # 简单的过滤逻辑
+            if memory_type and memory.memory_type != memory_type:
+                continue
+            
+            if agent_did and (memory.metadata.source_agent_did != agent_did and
+                             memory.metadata.target_agent_did != agent_did):
+                continue
+            
+            if session_id and memory.metadata.session_id != session_id:
+                continue
+            
+            if query and (query.lower() not in memory.title.lower() and
+                         query.lower() not in str(memory.content).lower()):
+                continue
+            
+            results.append(memory)
+        return results
     
     async def save_memory(self, memory: MemoryEntry) -> bool:
         with self._lock:
-            self._memories[memory.id] = memory
+            self._index_memory(memory)
         return True
     
     async def get_memory(self, memory_id: str) -> Optional[MemoryEntry]:
@@ -804,9 +2145,23 @@ class InMemoryStorage(MemoryStorageInterface):
     async def update_memory(self, memory: MemoryEntry) -> bool:
         return await self.save_memory(memory)
     
+    async def get_memories(self, memory_ids: List[str]) -> List[MemoryEntry]:
+        with self._lock:
+            return [self._memories[memory_id] for memory_id in memory_ids if memory_id in self._memories]
+    
     async def delete_memory(self, memory_id: str) -> bool:
         with self._lock:
-            return self._memories.pop(memory_id, None) is not None
+            return self._remove_memory(memory_id)
+    
+    async def save_memories(self, memories: List[MemoryEntry]) -> int:
+        with self._lock:
+            for memory in memories:
+                self._index_memory(memory)
+        return len(memories)
+    
+    async def delete_memories(self, memory_ids: List[str]) -> int:
+        with self._lock:
+            return sum(1 for memory_id in memory_ids if self._remove_memory(memory_id))
     
     async def search_memories(
         self,
@@ -817,38 +2172,42 @@ class InMemoryStorage(MemoryStorageInterface):
         tags: Optional[List[str]] = None,
         keywords: Optional[List[str]] = None,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        tag_mode: str = "all"
     ) -> List[MemoryEntry]:
+        _check_tag_mode(tag_mode)
         with self._lock:
-            results = []
-            for memory in self._memories.values():
-                # 简单的过滤逻辑
-                if memory_type and memory.memory_type != memory_type:
-                    continue
-                
-                if agent_did and (memory.metadata.source_agent_did != agent_did and
-                                 memory.metadata.target_agent_did != agent_did):
-                    continue
-                
-                if session_id and memory.metadata.session_id != session_id:
-                    continue
-                
-                if query and (query.lower() not in memory.title.lower() and
-                             query.lower() not in str(memory.content).lower()):
-                    continue
-                
-                if tags and not any(tag in memory.metadata.tags for tag in tags):
-                    continue
-                
-                if keywords and not any(kw in memory.metadata.keywords for kw in keywords):
-                    continue
-                
-                results.append(memory)
+            results = self._filter_memories(query, memory_type, agent_did, session_id, tags, keywords, tag_mode)
             
             # 排序并分页
             results.sort(key=lambda x: x.updated_at, reverse=True)
             return results[offset:offset + limit]
     
+    async def get_tag_counts(
+        self,
+        field: str = "tags",
+        query: str = "",
+        memory_type: Optional[MemoryType] = None,
+        agent_did: Optional[str] = None,
+        session_id: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        keywords: Optional[List[str]] = None,
+        tag_mode: str = "all",
+        limit: Optional[int] = None
+    ) -> Dict[str, int]:
+        _check_term_field(field)
+        _check_tag_mode(tag_mode)
+        with self._lock:
+            if not (query or memory_type or agent_did or session_id or tags or keywords):
+                counts = {value: len(memory_ids) for value, memory_ids in self._term_index[field].items()}
+            else:
+                counts = {}
+                for memory in self._filter_memories(
+                        query, memory_type, agent_did, session_id, tags, keywords, tag_mode):
+                    for value in self._indexed_terms[memory.id][field]:
+                        counts[value] = counts.get(value, 0) + 1
+        return _sorted_counts(counts, limit)
+    
     async def get_memories_by_session(self, session_id: str) -> List[MemoryEntry]:
         with self._lock:
             return [m for m in self._memories.values() if m.metadata.session_id == session_id]
@@ -876,9 +2235,19 @@ class InMemoryStorage(MemoryStorageInterface):
                 if memory.is_expired()
             ]
             for memory_id in expired_ids:
-                del self._memories[memory_id]
+                self._remove_memory(memory_id)
             return len(expired_ids)
     
+    async def cleanup_memories(self, strategy: str, count: int,
+                               retention_cutoff: Optional[datetime] = None) -> int:
+        _check_cleanup_strategy(strategy)
+        if count <= 0:
+            return 0
+        with self._lock:
+            victims = _select_cleanup_victims(
+                list(self._memories.values()), strategy, count, retention_cutoff, datetime.now())
+            return sum(1 for memory in victims if self._remove_memory(memory.id))
+    
     async def get_storage_stats(self) -> Dict[str, Any]:
         with self._lock:
             memory_types = {}
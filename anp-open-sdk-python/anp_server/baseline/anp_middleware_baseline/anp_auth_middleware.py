@@ -1,11 +1,14 @@
-import json
-from typing import Callable
+from typing import Callable, Optional, Tuple
 
 from fastapi import HTTPException
 from starlette.requests import Request
 from starlette.responses import Response, JSONResponse
+from starlette.websockets import WebSocket
 
 from anp_foundation.auth.auth_verifier import _authenticate_request
+from anp_foundation.did.did_tool import extract_did_from_auth_header
+from anp_foundation.utils import json_codec
+from anp_foundation.utils.tracing import span
 
 import logging
 
@@ -26,6 +29,15 @@ async def _check_permissions(request: Request, auth_info: dict) :
 
 
 async def auth_middleware(request: Request, call_next: Callable, auth_method: str = "wba" ) -> Response:
+    # 请求根 span：沿用调用方 traceparent 中的 trace_id，响应头返回 X-Trace-Id
+    with span("http.request", traceparent=request.headers.get("traceparent"), path=request.url.path) as root:
+        response = await _auth_middleware(request, call_next, auth_method)
+        if root.trace_id:
+            response.headers["X-Trace-Id"] = root.trace_id
+        return response
+
+
+async def _auth_middleware(request: Request, call_next: Callable, auth_method: str = "wba" ) -> Response:
     try:
         logger.debug(f"auth_middleware -- get: {request.url}")
 
@@ -33,7 +45,8 @@ async def auth_middleware(request: Request, call_next: Callable, auth_method: st
         if is_exempt(request.url.path):
             return await call_next(request)
         # Only authenticate if not exempt
-        auth_passed,msg,response_auth = await _authenticate_request(request)
+        with span("auth"):
+            auth_passed,msg,response_auth = await _authenticate_request(request)
 
         headers = dict(request.headers)
         request.state.headers = headers
@@ -48,7 +61,7 @@ async def auth_middleware(request: Request, call_next: Callable, auth_method: st
                         content={"error": "Permission denied", "message": error_message}
                     )
                 response = await call_next(request)
-                response.headers['authorization'] = json.dumps(response_auth) if response_auth else ""
+                response.headers['authorization'] = json_codec.dumps(response_auth, ascii_only=True) if response_auth else ""
 
                 # 可以在这里添加权限相关的响应头
                 if len(additional_headers)>0:
@@ -92,3 +105,42 @@ async def auth_middleware(request: Request, call_next: Callable, auth_method: st
 
 
 
+
+
+async def authenticate_websocket(websocket: WebSocket) -> Tuple[bool, Optional[str], dict]:
+    """
+    WebSocket 升级时的认证，http 中间件不会处理 websocket 请求
+
+    复用与 HTTP 请求相同的 DIDWba/Bearer 认证流程，只在升级时认证一次。
+    不查豁免路径列表：连接上的所有消息都以认证得到的 DID 身份发送，
+    默认豁免的 /agent/api/* 覆盖了群组 WebSocket 路由，豁免会让任何客户端冒充任意 DID
+
+    Returns:
+        Tuple[bool, Optional[str], dict]: (是否通过, 调用方DID, 认证响应或错误信息)
+    """
+    try:
+        # 以升级请求的 scope 构造 HTTP Request，供认证流程读取头、参数和URL
+        request = Request({**websocket.scope, "type": "http", "method": "GET"})
+        auth_passed, msg, response_auth = await _authenticate_request(request)
+        if auth_passed is not True:
+            return False, None, {"detail": f"{msg}:{response_auth}"}
+
+        permission_result, error_message, _ = await _check_permissions(request, response_auth)
+        if not permission_result:
+            return False, None, {"detail": error_message}
+
+        req_did = response_auth.get("req_did") if isinstance(response_auth, dict) else None
+        if not req_did:
+            auth_header = websocket.headers.get("Authorization", "")
+            if auth_header.startswith("Bearer "):
+                req_did = websocket.headers.get("req_did")
+            else:
+                req_did, _ = extract_did_from_auth_header(auth_header)
+        return True, req_did, response_auth
+
+    except HTTPException as exc:
+        logger.debug(f"WebSocket authentication error: {exc.detail}")
+        return False, None, {"detail": exc.detail}
+    except Exception as e:
+        logger.error(f"Unexpected error in websocket auth: {e}")
+        return False, None, {"detail": "Internal anp_servicepoint error"}
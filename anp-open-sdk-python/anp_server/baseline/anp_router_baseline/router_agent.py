@@ -16,14 +16,18 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-from fastapi import Request, APIRouter
+from fastapi import Request, APIRouter, WebSocket, WebSocketDisconnect
+
+from anp_servicepoint.core_service_handler.group_socket_handler import GroupSocketSession
 
 # 导入或定义核心处理函数
 from anp_servicepoint.core_service_handler.agent_service_handler import (
     process_group_request,
+    process_group_batch_request,
     process_agent_api_request,
     process_agent_message,
-    get_all_groups
+    get_all_groups,
+    get_transformer_metrics
 )
 
 
@@ -83,12 +87,13 @@ async def handle_group_message(did: str, group_id: str, request: Request):
 
 @router.get("/api/{did}/group/{group_id}/connect")
 async def handle_group_connect(did: str, group_id: str, request: Request):
-    """处理群组连接请求（SSE）"""
+    """处理群组连接请求（SSE），支持 Last-Event-ID 头或 last_event_id 参数断线续传"""
     req_did = request.query_params.get("req_did", "demo_caller")
 
     request_data = {
         "req_did": req_did,
-        "group_id": group_id
+        "group_id": group_id,
+        "last_event_id": request.headers.get("last-event-id", request.query_params.get("last_event_id"))
     }
 
     # 调用核心处理函数
@@ -116,6 +121,73 @@ async def handle_group_members(did: str, group_id: str, request: Request):
     return await process_group_request(did, group_id, "members", request_data, request)
 
 
+@router.post("/api/{did}/group/batch")
+async def handle_group_batch(did: str, request: Request):
+    """批量群组请求：body 为 {"ops": [{"op": "join|leave|message|members", "group_id": ..., ...}]}"""
+    data = await request.json()
+    req_did = request.query_params.get("req_did", "demo_caller")
+
+    request_data = {
+        "ops": data.get("ops") if isinstance(data, dict) else None,
+        "req_did": req_did
+    }
+
+    # 调用核心处理函数
+    return await process_group_batch_request(did, request_data, request)
+
+
+@router.get("/api/{did}/group/{group_id}/history")
+async def handle_group_history(did: str, group_id: str, request: Request):
+    """分页读取群组历史消息（?offset=起始偏移量&limit=条数）"""
+    req_did = request.query_params.get("req_did", "demo_caller")
+
+    request_data = {
+        "req_did": req_did,
+        "group_id": group_id,
+        "offset": request.query_params.get("offset"),
+        "limit": request.query_params.get("limit")
+    }
+
+    # 调用核心处理函数
+    return await process_group_request(did, group_id, "history", request_data, request)
+
+
+@router.websocket("/api/{did}/group/ws")
+async def handle_group_websocket(did: str, websocket: WebSocket):
+    """群组 WebSocket 连接：升级时认证一次，一条连接上收发多个群组的消息
+
+    ?encoding=binary 时服务端以二进制帧发送
+    """
+    # http 认证中间件不处理 websocket，这里在升级时认证
+    from anp_server.baseline.anp_middleware_baseline.anp_auth_middleware import authenticate_websocket
+    auth_passed, req_did, auth_info = await authenticate_websocket(websocket)
+    # 先完成握手再关闭，客户端才能收到 4401 关闭码和原因
+    await websocket.accept()
+    if not auth_passed or not req_did:
+        await websocket.close(code=4401, reason=str(auth_info.get("detail", "Unauthorized"))[:120])
+        return
+
+    session = GroupSocketSession(
+        did, req_did,
+        send=lambda data: websocket.send_bytes(data) if isinstance(data, bytes) else websocket.send_text(data),
+        binary=websocket.query_params.get("encoding") == "binary"
+    )
+    try:
+        await session.send_json({"op": "welcome", "req_did": req_did})
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if data is None:
+                data = message.get("text", "")
+            await session.handle_frame(data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+
+
 @router.get("/api/groups")
 async def list_all_groups(request: Request):
     """列出所有群组"""
@@ -123,6 +195,12 @@ async def list_all_groups(request: Request):
     return get_all_groups()
 
 
+@router.get("/api/transformer/metrics")
+async def transformer_metrics(request: Request):
+    """查看transformer_server转发延迟与熔断器状态"""
+    return get_transformer_metrics()
+
+
 @router.api_route("/api/{did}/{subpath:path}", methods=["GET", "POST"])
 async def handle_agent_api(did: str, subpath: str, request: Request):
     """处理Agent API调用 - 根据配置决定本地处理或转发"""
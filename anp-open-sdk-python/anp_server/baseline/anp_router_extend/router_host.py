@@ -1,6 +1,6 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
-from fastapi import HTTPException, APIRouter
+from fastapi import HTTPException, APIRouter, Query
 from starlette.requests import Request
 
 from pydantic import BaseModel
@@ -16,6 +16,7 @@ from anp_servicepoint.extend_service_handler.host_service_handler import (
     check_hosted_did_status,
     check_hosted_did_result,
     acknowledge_hosted_did_result,
+    acknowledge_hosted_did_results,
     list_hosted_dids
 )
 
@@ -35,6 +36,10 @@ class HostedDIDRequestResponse(BaseModel):
     message: Optional[str] = None
     estimated_processing_time: Optional[int] = None
 
+class HostedDIDAcknowledgeRequest(BaseModel):
+    """批量确认托管DID结果请求"""
+    result_ids: List[str]
+
 router = APIRouter(tags=["did_host"])
 
 @router.get("/wba/hostuser/{user_id}/did.json", summary="Get Hosted DID document")
@@ -105,19 +110,35 @@ async def check_hosted_did_status_endpoint(request: Request, request_id: str):
 
 
 @router.get("/wba/hosted-did/check/{requester_did_id}")
-async def check_hosted_did_result_endpoint(request: Request, requester_did_id: str):
+async def check_hosted_did_result_endpoint(request: Request, requester_did_id: str,
+                                          wait: float = Query(0, allow_inf_nan=False)):
     """
     第二步：检查托管DID处理结果
 
     客户端使用自己的DID ID来检查是否有新的托管DID结果
-    支持轮询调用
+    支持轮询调用；传入 wait 秒数时为长轮询，没有结果时挂起直到结果发布或超时
     """
     # 获取域名管理器
     domain_manager = get_domain_manager()
     host, port = domain_manager.get_host_port_from_request(request)
 
     # 调用核心处理函数
-    success, result = await check_hosted_did_result(requester_did_id, host, port)
+    success, result = await check_hosted_did_result(requester_did_id, host, port, wait)
+
+    if not success:
+        raise HTTPException(status_code=500, detail=result.get("error", "Unknown error"))
+
+    return result
+
+@router.post("/wba/hosted-did/acknowledge")
+async def acknowledge_hosted_did_results_endpoint(request: Request, ack_request: HostedDIDAcknowledgeRequest):
+    """批量确认已收到托管DID结果"""
+    # 获取域名管理器
+    domain_manager = get_domain_manager()
+    host, port = domain_manager.get_host_port_from_request(request)
+
+    # 调用核心处理函数
+    success, result = await acknowledge_hosted_did_results(ack_request.result_ids, host, port)
 
     if not success:
         raise HTTPException(status_code=500, detail=result.get("error", "Unknown error"))
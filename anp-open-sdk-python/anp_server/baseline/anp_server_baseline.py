@@ -15,18 +15,33 @@
 # 在模块顶部获取 logger，这是标准做法
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse
 
 from anp_foundation.config import get_global_config
+from anp_foundation.utils.json_codec import FastJSONResponse
+from anp_foundation.utils.tracing import get_tracer
 from anp_server.baseline.anp_middleware_baseline.anp_auth_middleware import auth_middleware
 from anp_server.baseline.anp_router_baseline import router_did
 from anp_server.baseline.anp_router_baseline import router_publisher, router_agent
 from anp_server.baseline.anp_router_extend import router_auth, router_host
+from anp_servicepoint.core_service_handler.transformer_proxy import close_transformer_proxy
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """服务端生命周期：关闭时释放转发 transformer_server 的连接池"""
+    yield
+    try:
+        await close_transformer_proxy()
+    except Exception as e:
+        logger.warning(f"关闭 transformer_server 转发客户端失败: {e}")
+
 class ANP_Server:
     """ANP SDK主类，支持多种运行模式"""
     
@@ -64,7 +79,9 @@ class ANP_Server:
                 version="0.1.0",
                 reload=False,
                 docs_url="/docs",
-                redoc_url="/redoc"
+                redoc_url="/redoc",
+                default_response_class=FastJSONResponse,
+                lifespan=_lifespan
                     )
         else:
             self.app = FastAPI(
@@ -73,7 +90,9 @@ class ANP_Server:
                 version="0.1.0",
                 reload=True,
                 docs_url=None,
-                redoc_url=None
+                redoc_url=None,
+                default_response_class=FastJSONResponse,
+                lifespan=_lifespan
                     )
         # fastapi 关键配置
         @self.app.middleware("http")
@@ -102,6 +121,12 @@ class ANP_Server:
                 "documentation": "/docs"
             }
 
+        @self.app.get("/metrics", tags=["status"], include_in_schema=False)
+        async def metrics():
+            """请求链路各阶段耗时分位数（Prometheus 文本格式）"""
+            return PlainTextResponse(get_tracer().render_prometheus(),
+                                     media_type="text/plain; version=0.0.4; charset=utf-8")
+
     def start_server(self):
         if self.server_running:
             self.logger.warning("服务器已经在运行")
@@ -3,7 +3,6 @@
 Agent 核心处理函数 - 与 Web 框架无关的业务逻辑
 """
 import logging
-import aiohttp
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
@@ -11,6 +10,7 @@ logger = logging.getLogger(__name__)
 # 导入必要的依赖
 from anp_foundation.config import get_global_config
 from anp_runtime.global_router_agent_message import GlobalMessageManager, GlobalGroupManager
+from anp_servicepoint.core_service_handler.transformer_proxy import get_transformer_proxy
 
 
 async def process_group_request(did: str, group_id: str, action: str, request_data: Dict[str, Any],
@@ -21,7 +21,7 @@ async def process_group_request(did: str, group_id: str, action: str, request_da
     Args:
         did: 目标DID
         group_id: 群组ID
-        action: 操作类型 (join/leave/message/connect/members)
+        action: 操作类型 (join/leave/message/connect/members/history)
         request_data: 请求数据
         original_request: 原始请求对象(可选)
 
@@ -31,45 +31,34 @@ async def process_group_request(did: str, group_id: str, action: str, request_da
     # 获取配置
     config = get_global_config()
     use_transformer_server = getattr(config.anp_sdk, "use_transformer_server", False)
-    transformer_server_url = getattr(config.anp_sdk, "transformer_server_url", "http://localhost:9528")
 
     # 根据配置决定处理方式
     if use_transformer_server:
-        # 转发到transformer_server
-        try:
-            logger.debug(f"🔄 转发群组{action}请求到transformer_server: {did}/{group_id}")
-
-            # 构建请求参数
-            params = {}
-            if original_request and hasattr(original_request, "query_params"):
-                params = dict(original_request.query_params)
-            elif "req_did" in request_data:
-                params = {"req_did": request_data["req_did"]}
-
-            # 发送请求
-            async with aiohttp.ClientSession() as session:
-                target_url = f"{transformer_server_url}/agent/group/{did}/{group_id}/{action}"
-
-                # 移除请求数据中的元数据
-                payload = {k: v for k, v in request_data.items()
-                           if k not in ["req_did", "group_id"]}
-
-                async with session.post(
-                        target_url,
-                        json=payload,
-                        params=params
-                ) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ Framework server返回错误: {response.status} - {error_text}")
-                        if not getattr(config.anp_sdk, "fallback_to_local", True):
-                            return {"status": "error", "message": f"Framework server错误: {response.status}"}
-        except Exception as e:
-            logger.error(f"❌ 转发到Framework server失败: {e}")
-            if not getattr(config.anp_sdk, "fallback_to_local", True):
-                return {"status": "error", "message": f"Framework server连接失败: {str(e)}"}
+        # 转发到transformer_server，熔断期间直接走本地处理
+        logger.debug(f"🔄 转发群组{action}请求到transformer_server: {did}/{group_id}")
+
+        # 构建请求参数
+        params = {}
+        if original_request and hasattr(original_request, "query_params"):
+            params = dict(original_request.query_params)
+        elif "req_did" in request_data:
+            params = {"req_did": request_data["req_did"]}
+
+        proxy = get_transformer_proxy()
+        target_path = f"/agent/group/{did}/{group_id}/{action}"
+        if action == "connect":
+            # SSE 连接以流式透传方式转发
+            ok, result = await proxy.forward_stream("stream", target_path, params)
+        else:
+            # 移除请求数据中的元数据
+            payload = {k: v for k, v in request_data.items()
+                       if k not in ["req_did", "group_id"]}
+            ok, result = await proxy.forward("group", target_path, payload, params)
+        if ok:
+            return result
+        if not getattr(config.anp_sdk, "fallback_to_local", True):
+            return {"status": "error", "message": result}
+        logger.debug("⚠️ 回退到本地处理")
 
     # 本地处理
     try:
@@ -82,6 +71,48 @@ async def process_group_request(did: str, group_id: str, action: str, request_da
         return {"status": "error", "message": f"处理群组{action}失败: {str(e)}"}
 
 
+async def process_group_batch_request(did: str, request_data: Dict[str, Any],
+                                      original_request: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    处理批量群组请求：一次调用加入/离开多个群组、发送多条消息或查询多个群组的成员
+
+    Args:
+        did: 目标DID
+        request_data: 请求数据，包含 ops 列表和 req_did
+        original_request: 原始请求对象(可选)
+
+    Returns:
+        Dict[str, Any]: 处理结果，results 与 ops 一一对应
+    """
+    config = get_global_config()
+    use_transformer_server = getattr(config.anp_sdk, "use_transformer_server", False)
+    ops = request_data.get("ops")
+    if not isinstance(ops, list):
+        return {"status": "error", "message": "ops must be a list"}
+
+    if use_transformer_server:
+        logger.debug(f"🔄 转发批量群组请求到transformer_server: {did} ({len(ops)}项)")
+        params = {}
+        if original_request and hasattr(original_request, "query_params"):
+            params = dict(original_request.query_params)
+        elif "req_did" in request_data:
+            params = {"req_did": request_data["req_did"]}
+        proxy = get_transformer_proxy()
+        ok, result = await proxy.forward("group", f"/agent/group/{did}/batch", {"ops": ops}, params)
+        if ok:
+            return result
+        if not getattr(config.anp_sdk, "fallback_to_local", True):
+            return {"status": "error", "message": result}
+        logger.debug("⚠️ 回退到本地处理")
+
+    try:
+        results = await GlobalMessageManager.route_group_batch(did, ops, request_data.get("req_did"))
+        return {"status": "success", "results": results}
+    except Exception as e:
+        logger.error(f"❌ 本地处理批量群组请求失败: {e}")
+        return {"status": "error", "message": f"处理批量群组请求失败: {str(e)}"}
+
+
 async def process_agent_api_request(did: str, subpath: str, request_data: Dict[str, Any],
                                     original_request: Optional[Any] = None) -> Dict[str, Any]:
     """
@@ -99,7 +130,6 @@ async def process_agent_api_request(did: str, subpath: str, request_data: Dict[s
     # 获取配置
     config = get_global_config()
     use_transformer_server = getattr(config.anp_sdk, "use_transformer_server", False)
-    transformer_server_url = getattr(config.anp_sdk, "transformer_server_url", "http://localhost:9528")
 
     # 构造请求数据
     processed_data = {
@@ -117,46 +147,32 @@ async def process_agent_api_request(did: str, subpath: str, request_data: Dict[s
 
     # 根据配置决定处理方式
     if use_transformer_server:
-        # 转发到transformer_server
-        try:
-            logger.debug(f"🔄 转发请求到transformer_server: {did}/{subpath}")
-
-            # 构建请求参数
-            params = {}
-            if original_request and hasattr(original_request, "query_params"):
-                params = dict(original_request.query_params)
-            elif "req_did" in processed_data:
-                params = {"req_did": processed_data["req_did"]}
-
-            # 发送请求
-            async with aiohttp.ClientSession() as session:
-                target_url = f"{transformer_server_url}/agent/api/{did}/{subpath}"
-
-                # 移除请求数据中的元数据
-                payload = {k: v for k, v in request_data.items()
-                           if k not in ["type", "path", "req_did"]}
-
-                async with session.post(
-                        target_url,
-                        json=payload,
-                        params=params
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ transformer server返回错误: {response.status} - {error_text}")
-                        # 失败时回退到本地处理
-                        if not getattr(config.anp_sdk, "fallback_to_local", True):
-                            return {"status": "error", "message": f"transformer server错误: {response.status}",
-                                    "details": error_text}
-        except Exception as e:
-            logger.error(f"❌ transformer server失败: {e}")
-            # 失败时回退到本地处理
-            if not getattr(config.anp_sdk, "fallback_to_local", True):
-                return {"status": "error", "message": f"transformer server连接失败: {str(e)}"}
-            logger.debug("⚠️ 回退到本地处理")
+        # 转发到transformer_server，熔断期间直接走本地处理
+        logger.debug(f"🔄 转发请求到transformer_server: {did}/{subpath}")
+
+        # 构建请求参数
+        params = {}
+        if original_request and hasattr(original_request, "query_params"):
+            params = dict(original_request.query_params)
+        elif "req_did" in processed_data:
+            params = {"req_did": processed_data["req_did"]}
+
+        # 移除请求数据中的元数据
+        payload = {k: v for k, v in request_data.items()
+                   if k not in ["type", "path", "req_did"]}
+
+        ok, result = await get_transformer_proxy().forward(
+            "api", f"/agent/api/{did}/{subpath}", payload, params
+        )
+        if ok:
+            return result
+        # 失败时回退到本地处理
+        if not getattr(config.anp_sdk, "fallback_to_local", True):
+            error = {"status": "error", "message": str(result)}
+            if getattr(result, "details", None) is not None:
+                error["details"] = result.details
+            return error
+        logger.debug("⚠️ 回退到本地处理")
 
     # 本地处理（或回退处理）
     try:
@@ -199,7 +215,6 @@ async def process_agent_message(did: str, request_data: Dict[str, Any],
     # 获取配置
     config = get_global_config()
     use_transformer_server = getattr(config.anp_sdk, "use_transformer_server", False)
-    transformer_server_url = getattr(config.anp_sdk, "transformer_server_url", "http://localhost:9528")
 
     # 构造请求数据
     processed_data = {
@@ -216,46 +231,29 @@ async def process_agent_message(did: str, request_data: Dict[str, Any],
 
     # 根据配置决定处理方式
     if use_transformer_server:
-        # 转发到transformer_server
-        try:
-            logger.debug(f"🔄 转发消息到transformer_server: {did}")
-
-            # 构建请求参数
-            params = {}
-            if original_request and hasattr(original_request, "query_params"):
-                params = dict(original_request.query_params)
-            elif "req_did" in processed_data:
-                params = {"req_did": processed_data["req_did"]}
-
-            # 发送请求
-            async with aiohttp.ClientSession() as session:
-                target_url = f"{transformer_server_url}/agent/message/{did}/post"
-
-                # 移除请求数据中的元数据
-                payload = {k: v for k, v in request_data.items()
-                           if k not in ["type", "req_did"]}
-
-                async with session.post(
-                        target_url,
-                        json=payload,
-                        params=params
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ transformer server返回错误: {response.status} - {error_text}")
-                        # 失败时回退到本地处理
-                        if not getattr(config.anp_sdk, "fallback_to_local", True):
-                            return {"anp_result": {"status": "error",
-                                                   "message": f"transformer server错误: {response.status}"}}
-        except Exception as e:
-            logger.error(f"❌ transformer server失败: {e}")
-            # 失败时回退到本地处理
-            if not getattr(config.anp_sdk, "fallback_to_local", True):
-                return {"anp_result": {"status": "error", "message": f"transformer server连接失败: {str(e)}"}}
-            logger.debug("⚠️ 回退到本地处理")
+        # 转发到transformer_server，熔断期间直接走本地处理
+        logger.debug(f"🔄 转发消息到transformer_server: {did}")
+
+        # 构建请求参数
+        params = {}
+        if original_request and hasattr(original_request, "query_params"):
+            params = dict(original_request.query_params)
+        elif "req_did" in processed_data:
+            params = {"req_did": processed_data["req_did"]}
+
+        # 移除请求数据中的元数据
+        payload = {k: v for k, v in request_data.items()
+                   if k not in ["type", "req_did"]}
+
+        ok, result = await get_transformer_proxy().forward(
+            "message", f"/agent/message/{did}/post", payload, params
+        )
+        if ok:
+            return result
+        # 失败时回退到本地处理
+        if not getattr(config.anp_sdk, "fallback_to_local", True):
+            return {"anp_result": {"status": "error", "message": result}}
+        logger.debug("⚠️ 回退到本地处理")
 
     # 本地处理（或回退处理）
     try:
@@ -298,4 +296,19 @@ def get_all_groups() -> Dict[str, Any]:
         }
     except Exception as e:
         logger.error(f"❌ 列出群组失败: {e}")
-        return {"status": "error", "message": f"列出群组失败: {str(e)}"}
\ No newline at end of file
+        return {"status": "error", "message": f"列出群组失败: {str(e)}"}
+
+
+def get_transformer_metrics() -> Dict[str, Any]:
+    """
+    获取transformer_server转发指标
+
+    Returns:
+        Dict[str, Any]: 各路由转发延迟与熔断器状态
+    """
+    config = get_global_config()
+    return {
+        "status": "success",
+        "enabled": getattr(config.anp_sdk, "use_transformer_server", False),
+        "metrics": get_transformer_proxy().get_metrics()
+    }
\ No newline at end of file
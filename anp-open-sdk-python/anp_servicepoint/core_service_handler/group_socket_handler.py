@@ -0,0 +1,178 @@
+# group_socket_handler.py
+"""
+群组 WebSocket 会话 - 与 Web 框架无关的多路复用协议处理
+
+一条连接在升级时认证一次，之后可同时操作和订阅多个群组。
+客户端帧（文本或二进制，内容均为 JSON）:
+    {"op": "join" | "leave" | "message" | "members" | "history" | "subscribe" | "unsubscribe",
+     "group_id": "...", "id": <可选的请求编号>, ...其他参数}
+    subscribe 可带 last_event_id，从群组重放缓冲区（更早的部分从持久化日志）续传；
+    history 带 offset/limit 分页读取历史消息
+    {"op": "batch", "id": ..., "ops": [{"op": ..., "group_id": ..., ...}, ...]} 一帧提交多个群组操作
+服务端帧:
+    {"op": "result", "id": ..., "group_id": ..., "result": {...}}
+    {"op": "event", "group_id": ..., "seq": ..., "message": {...}}
+    {"op": "error", "id": ..., "message": "..."}
+二进制模式下服务端所有帧都以二进制发送，事件帧复用 GroupEvent 上缓存的编码结果。
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from anp_foundation.utils import json_codec
+from anp_runtime.anp_service.anp_sdk_group_fanout import (
+    GroupEvent,
+    ListenerDisconnected,
+    parse_last_event_id
+)
+from anp_runtime.global_router_agent_message import GlobalGroupManager, GlobalMessageManager
+
+logger = logging.getLogger(__name__)
+
+Frame = Union[str, bytes]
+
+# 直接交给 GlobalMessageManager 处理的操作
+ROUTED_OPS = ("join", "leave", "message", "members", "history")
+
+
+class GroupSocketSession:
+    """单条 WebSocket 连接上的群组会话"""
+
+    def __init__(self, did: str, req_did: str, send: Callable[[Frame], Awaitable[None]],
+                 binary: bool = False):
+        self.did = did
+        self.req_did = req_did
+        self.binary = binary
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self._subscriptions: Dict[str, asyncio.Task] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+
+    async def send_frame(self, payload: bytes):
+        """按连接模式发送一帧，多个订阅协程共用连接时串行发送"""
+        async with self._send_lock:
+            if self.binary:
+                await self._send(payload)
+            else:
+                await self._send(payload.decode("utf-8"))
+
+    async def send_json(self, obj: Dict[str, Any]):
+        await self.send_frame(json_codec.dumps_bytes(obj))
+
+    async def handle_frame(self, data: Frame):
+        """处理客户端发来的一帧"""
+        try:
+            frame = json_codec.loads(data)
+        except json_codec.JSONDecodeError:
+            await self.send_json({"op": "error", "message": "Invalid JSON frame"})
+            return
+        if not isinstance(frame, dict):
+            await self.send_json({"op": "error", "message": "Frame must be a JSON object"})
+            return
+
+        op = frame.get("op")
+        request_id = frame.get("id")
+        if op == "batch":
+            await self._handle_batch(request_id, frame.get("ops"))
+            return
+        group_id = frame.get("group_id")
+        if not group_id:
+            await self.send_json({"op": "error", "id": request_id, "message": "Missing group_id"})
+            return
+
+        try:
+            if op in ROUTED_OPS:
+                request_data = {k: v for k, v in frame.items() if k not in ("op", "id")}
+                request_data["req_did"] = self.req_did
+                result = await GlobalMessageManager.route_group_request(
+                    self.did, group_id, op, request_data, None
+                )
+            elif op == "subscribe":
+                result = self.subscribe(group_id, frame.get("last_event_id"))
+            elif op == "unsubscribe":
+                result = await self.unsubscribe(group_id)
+            else:
+                await self.send_json({"op": "error", "id": request_id, "message": f"Unknown op: {op}"})
+                return
+        except Exception as e:
+            logger.error(f"❌ 群组WebSocket请求处理失败 {op}/{group_id}: {e}")
+            result = {"status": "error", "message": str(e)}
+
+        await self.send_json({"op": "result", "id": request_id, "group_id": group_id, "result": result})
+
+    async def _handle_batch(self, request_id: Any, ops: Any):
+        if not isinstance(ops, list):
+            await self.send_json({"op": "error", "id": request_id, "message": "ops must be a list"})
+            return
+        try:
+            results = await GlobalMessageManager.route_group_batch(self.did, ops, self.req_did)
+            result = {"status": "success", "results": results}
+        except Exception as e:
+            logger.error(f"❌ 群组WebSocket批量请求处理失败: {e}")
+            result = {"status": "error", "message": str(e)}
+        await self.send_json({"op": "result", "id": request_id, "result": result})
+
+    def subscribe(self, group_id: str, last_event_id: Optional[Any] = None) -> Dict[str, Any]:
+        """订阅群组事件，可从 last_event_id 之后续传"""
+        runner = GlobalGroupManager.get_runner(group_id)
+        if not runner:
+            return {"status": "error", "message": f"群组不存在: {group_id}"}
+        if not runner.is_member(self.req_did):
+            return {"status": "error", "message": "Not a member of this group"}
+        if group_id in self._subscriptions:
+            return {"status": "success", "message": "Already subscribed",
+                    "last_seq": runner.replay_buffer.last_seq}
+
+        # 与 SSE 相同：注册监听与读取重放缓冲之间没有 await
+        queue = runner.register_listener(self.req_did)
+        replay = []
+        if last_event_id is not None:
+            replay = runner.replay_since(parse_last_event_id(last_event_id))
+        self._queues[group_id] = queue
+        self._subscriptions[group_id] = asyncio.create_task(self._pump(runner, queue, replay))
+        return {"status": "success", "message": "Subscribed", "last_seq": runner.replay_buffer.last_seq}
+
+    async def _pump(self, runner, queue: asyncio.Queue, replay):
+        group_id = runner.group_id
+        try:
+            for event in replay:
+                await self.send_frame(event.ws_frame)
+            while True:
+                event = await queue.get()
+                if isinstance(event, GroupEvent):
+                    await self.send_frame(event.ws_frame)
+                else:
+                    await self.send_json({"op": "event", "group_id": group_id, "message": event})
+        except ListenerDisconnected:
+            logger.warning(f"群组 {group_id} 监听者 {self.req_did} 取消WebSocket订阅: {queue.close_reason}")
+            self._subscriptions.pop(group_id, None)
+            self._queues.pop(group_id, None)
+            try:
+                await self.send_json({"op": "unsubscribed", "group_id": group_id,
+                                      "reason": queue.close_reason})
+            except Exception:
+                pass
+        except Exception as e:
+            logger.debug(f"群组 {group_id} WebSocket推送结束: {e!r}")
+        finally:
+            runner.unregister_listener(self.req_did, queue)
+
+    async def unsubscribe(self, group_id: str) -> Dict[str, Any]:
+        """取消订阅"""
+        task = self._subscriptions.pop(group_id, None)
+        self._queues.pop(group_id, None)
+        if task is None:
+            return {"status": "error", "message": "Not subscribed"}
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return {"status": "success", "message": "Unsubscribed"}
+
+    async def close(self):
+        """连接关闭时注销所有订阅"""
+        tasks = list(self._subscriptions.values())
+        self._subscriptions.clear()
+        self._queues.clear()
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
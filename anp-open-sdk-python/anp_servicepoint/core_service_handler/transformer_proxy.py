@@ -0,0 +1,315 @@
+# transformer_proxy.py
+"""
+transformer_server 转发客户端 - 连接池复用、按路由超时、熔断与转发指标
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+from starlette.responses import StreamingResponse
+
+from anp_foundation.config import get_global_config
+from anp_foundation.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# 默认的按路由超时（秒），可通过 anp_sdk.transformer_timeouts 覆盖
+DEFAULT_ROUTE_TIMEOUTS = {
+    "group": 10.0,
+    "api": 30.0,
+    "message": 30.0,
+    "stream": 5.0,  # 流式转发只限制连接建立时间
+}
+
+
+class ForwardError(str):
+    """转发失败的错误描述；transformer_server 返回了错误响应时 details 为响应正文"""
+
+    def __new__(cls, message: str, details: Optional[str] = None):
+        error = super().__new__(cls, message)
+        error.details = details
+        return error
+
+
+class CircuitBreaker:
+    """简单的三态熔断器: closed -> open -> half_open -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.open_count = 0
+        self.short_circuited = 0
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        """判断当前是否允许转发"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            else:
+                self.short_circuited += 1
+                return False
+        # half_open: 只放行一个探测请求
+        if self._probe_in_flight:
+            self.short_circuited += 1
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("✅ transformer_server 已恢复，熔断器关闭")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def abandon_probe(self):
+        """请求被取消（客户端断开、上层超时）时调用：不计为失败，只释放探测名额，下一个请求重新探测"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.open_count += 1
+                logger.warning(f"⚠️ transformer_server 不可用，熔断器打开 {self.recovery_timeout}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "open_count": self.open_count,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class RouteMetrics:
+    """单个路由的转发延迟统计"""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, duration_ms: float, ok: bool):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self._recent.append(duration_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self._recent)
+
+        def pct(p: float) -> float:
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(len(recent) * p))], 3)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+        }
+
+
+class TransformerProxy:
+    """transformer_server 转发客户端
+
+    - 复用单个 keep-alive 连接池，而不是每个请求新建 ClientSession
+    - 每类路由独立超时
+    - 熔断器打开期间直接走本地处理，不再等待转发超时
+    """
+
+    def __init__(self, base_url: str, route_timeouts: Optional[Dict[str, float]] = None,
+                 failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 pool_size: int = 100, keepalive_timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.route_timeouts = {**DEFAULT_ROUTE_TIMEOUTS, **(route_timeouts or {})}
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self.metrics: Dict[str, RouteMetrics] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取绑定当前事件循环的共享会话"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    def _timeout(self, route: str, streaming: bool = False) -> aiohttp.ClientTimeout:
+        seconds = self.route_timeouts.get(route, DEFAULT_ROUTE_TIMEOUTS["api"])
+        if streaming:
+            return aiohttp.ClientTimeout(total=None, sock_connect=seconds)
+        return aiohttp.ClientTimeout(total=seconds)
+
+    def _observe(self, route: str, started: float, ok: bool):
+        self.metrics.setdefault(route, RouteMetrics()).observe((time.perf_counter() - started) * 1000, ok)
+
+    def is_available(self) -> bool:
+        """熔断器是否允许转发"""
+        return self.breaker.allow_request()
+
+    async def forward(self, route: str, path: str, payload: Dict[str, Any],
+                      params: Optional[Dict[str, str]] = None) -> Tuple[bool, Any]:
+        """转发一个 JSON 请求
+
+        Returns:
+            Tuple[bool, Any]: (是否成功, 成功时为响应内容，失败时为错误描述 ForwardError)
+        """
+        if not self.is_available():
+            return False, "transformer server熔断中"
+
+        started = time.perf_counter()
+        try:
+            session = self._get_session()
+            async with session.post(
+                f"{self.base_url}{path}",
+                data=json_codec.dumps_bytes(payload),
+                params=params,
+                headers={"Content-Type": "application/json"},
+                timeout=self._timeout(route),
+            ) as response:
+                if response.status == 200:
+                    result = await response.json(loads=json_codec.loads, content_type=None)
+                    self.breaker.record_success()
+                    self._observe(route, started, True)
+                    return True, result
+                error_text = await response.text()
+                # 5xx 视为转发目标不健康，4xx 是请求本身的问题
+                if response.status >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                self._observe(route, started, False)
+                logger.error(f"❌ transformer server返回错误: {response.status} - {error_text}")
+                return False, ForwardError(f"transformer server错误: {response.status}", error_text)
+        except asyncio.CancelledError:
+            # CancelledError 不是 Exception 的子类，半开状态的探测被取消时必须释放名额，否则熔断器永远拒绝
+            self.breaker.abandon_probe()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            self._observe(route, started, False)
+            logger.error(f"❌ transformer server失败: {e!r}")
+            return False, f"transformer server连接失败: {e!r}"
+
+    async def forward_stream(self, route: str, path: str,
+                             params: Optional[Dict[str, str]] = None) -> Tuple[bool, Any]:
+        """以流式透传方式转发 GET 请求（如群组 SSE 连接）"""
+        if not self.is_available():
+            return False, "transformer server熔断中"
+
+        started = time.perf_counter()
+        try:
+            session = self._get_session()
+            response = await session.get(
+                f"{self.base_url}{path}",
+                params=params,
+                timeout=self._timeout(route, streaming=True),
+            )
+        except asyncio.CancelledError:
+            self.breaker.abandon_probe()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            self._observe(route, started, False)
+            logger.error(f"❌ transformer server流式连接失败: {e!r}")
+            return False, f"transformer server连接失败: {e!r}"
+
+        if response.status != 200:
+            response.release()
+            if response.status >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            self._observe(route, started, False)
+            return False, f"transformer server错误: {response.status}"
+
+        self.breaker.record_success()
+        self._observe(route, started, True)
+
+        async def passthrough():
+            try:
+                async for chunk in response.content.iter_any():
+                    yield chunk
+            finally:
+                response.release()
+
+        media_type = response.headers.get("Content-Type", "text/event-stream")
+        return True, StreamingResponse(passthrough(), media_type=media_type)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """转发延迟与熔断器状态"""
+        return {
+            "base_url": self.base_url,
+            "breaker": self.breaker.to_dict(),
+            "routes": {route: m.to_dict() for route, m in self.metrics.items()},
+        }
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+
+_transformer_proxy: Optional[TransformerProxy] = None
+
+
+def get_transformer_proxy() -> TransformerProxy:
+    """获取按全局配置创建的转发客户端单例"""
+    global _transformer_proxy
+    config = get_global_config()
+    base_url = getattr(config.anp_sdk, "transformer_server_url", "http://localhost:9528")
+    if _transformer_proxy is None or _transformer_proxy.base_url != base_url.rstrip("/"):
+        route_timeouts = getattr(config.anp_sdk, "transformer_timeouts", None)
+        if route_timeouts is not None and not isinstance(route_timeouts, dict):
+            route_timeouts = dict(getattr(route_timeouts, "_data", {}))
+        _transformer_proxy = TransformerProxy(
+            base_url,
+            route_timeouts=route_timeouts,
+            failure_threshold=getattr(config.anp_sdk, "transformer_failure_threshold", 5),
+            recovery_timeout=getattr(config.anp_sdk, "transformer_recovery_timeout", 30.0),
+        )
+    return _transformer_proxy
+
+
+async def close_transformer_proxy():
+    """关闭转发客户端单例的连接池（服务端关闭时调用，未创建过时什么也不做）"""
+    global _transformer_proxy
+    proxy, _transformer_proxy = _transformer_proxy, None
+    if proxy is not None:
+        await proxy.close()
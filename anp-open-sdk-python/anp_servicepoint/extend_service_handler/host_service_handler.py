@@ -4,14 +4,18 @@
 """
 import json
 import logging
+import math
 import time
 import uuid
-from typing import Dict, Any, Optional, Tuple, Union
+from typing import Dict, Any, List, Optional, Tuple, Union
 
 from anp_foundation.domain import get_domain_manager
 
 logger = logging.getLogger(__name__)
 
+# 长轮询检查结果时服务端最多挂起的秒数
+MAX_RESULT_WAIT_SECONDS = 60.0
+
 
 class BaseHostedDIDRequest:
     """托管DID申请请求"""
@@ -170,7 +174,8 @@ async def check_hosted_did_status(request_id: str, host: str, port: int) -> Tupl
         return False, {"error": str(e)}
 
 
-async def check_hosted_did_result(requester_did_id: str, host: str, port: int) -> Tuple[bool, Dict[str, Any]]:
+async def check_hosted_did_result(requester_did_id: str, host: str, port: int,
+                                  wait: float = 0) -> Tuple[bool, Dict[str, Any]]:
     """
     检查托管DID处理结果
 
@@ -178,17 +183,22 @@ async def check_hosted_did_result(requester_did_id: str, host: str, port: int) -
         requester_did_id: 申请者DID
         host: 主机名
         port: 端口号
+        wait: 长轮询等待秒数，没有结果时最多挂起这么久（上限 MAX_RESULT_WAIT_SECONDS），0 表示立即返回；
+            NaN 或无穷大视为无效参数
 
     Returns:
         Tuple[bool, Dict[str, Any]]: (成功标志, 结果信息)
     """
+    if not math.isfinite(wait):
+        return False, {"error": f"wait 必须是有限的秒数: {wait}"}
     try:
         # 获取域名管理器
         domain_manager = get_domain_manager()
 
         from anp_servicepoint.extend_service_implementation.did_host.hosted_did_result_manager import HostedDIDResultManager
         result_manager = HostedDIDResultManager.create_for_domain(host, port)
-        results = await result_manager.get_results_for_requester(requester_did_id)
+        wait = min(max(wait, 0), MAX_RESULT_WAIT_SECONDS)
+        results = await result_manager.wait_for_results(requester_did_id, wait)
 
         return True, {
             "success": True,
@@ -234,6 +244,35 @@ async def acknowledge_hosted_did_result(result_id: str, host: str, port: int) ->
         return False, {"error": str(e)}
 
 
+async def acknowledge_hosted_did_results(result_ids: List[str], host: str, port: int) -> Tuple[bool, Dict[str, Any]]:
+    """
+    批量确认已收到托管DID结果
+
+    Args:
+        result_ids: 结果ID列表
+        host: 主机名
+        port: 端口号
+
+    Returns:
+        Tuple[bool, Dict[str, Any]]: (成功标志, 响应信息)
+    """
+    try:
+        from anp_servicepoint.extend_service_implementation.did_host.hosted_did_result_manager import HostedDIDResultManager
+        result_manager = HostedDIDResultManager.create_for_domain(host, port)
+        acknowledged = await result_manager.acknowledge_results(result_ids)
+
+        return True, {
+            "success": True,
+            "acknowledged": acknowledged,
+            "requested": len(result_ids),
+            "message": "结果确认成功"
+        }
+
+    except Exception as e:
+        logger.error(f"批量确认托管DID结果失败: {e}")
+        return False, {"error": str(e)}
+
+
 async def list_hosted_dids(host: str, port: int) -> Tuple[bool, Dict[str, Any]]:
     """
     列出当前域名下的所有托管DID
@@ -1,6 +1,6 @@
 import asyncio
 from datetime import datetime, timezone
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from .hosted_did_queue_manager import HostedDIDQueueManager, RequestStatus
 from .hosted_did_result_manager import HostedDIDResultManager
@@ -10,105 +10,145 @@ logger = logging.getLogger(__name__)
 
 
 class HostedDIDProcessor:
-    """托管DID后台处理器"""
+    """托管DID后台处理器
+
+    由队列管理器在 add_request 时推送 request_id，多个 worker 协程并发处理；
+    启动时会恢复日志中尚未完成的申请。
+    """
     
-    def __init__(self, host: str, port: int):
+    def __init__(self, host: str, port: int, worker_count: int = 4):
         self.host = host
         self.port = port
+        self.worker_count = max(1, worker_count)
         self.queue_manager = HostedDIDQueueManager.create_for_domain(host, port)
         self.result_manager = HostedDIDResultManager.create_for_domain(host, port)
         self.did_manager = DIDHostManager.create_for_domain(host, port)
         self.running = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
     
     @classmethod
-    def create_for_domain(cls, host: str, port: int) -> 'HostedDIDProcessor':
+    def create_for_domain(cls, host: str, port: int, worker_count: int = 4) -> 'HostedDIDProcessor':
         """为指定域名创建处理器"""
-        return cls(host, port)
+        return cls(host, port, worker_count)
     
     async def start_processing(self):
-        """启动后台处理"""
+        """启动后台处理，直到 stop_processing 被调用"""
         self.running = True
-        logger.info(f"托管DID处理器启动: {self.host}:{self.port}")
-        
-        while self.running:
-            try:
-                await self.process_pending_requests()
-                await asyncio.sleep(10)  # 每10秒检查一次
-            except Exception as e:
-                logger.error(f"处理循环出错: {e}")
-                await asyncio.sleep(30)  # 出错后等待30秒
+        self._queue = self.queue_manager.subscribe()
+        logger.info(f"托管DID处理器启动: {self.host}:{self.port} (workers={self.worker_count})")
+
+        # 恢复上次未处理完的申请
+        await self.queue_manager.requeue_interrupted()
+        for request_data in await self.queue_manager.get_pending_requests():
+            self._queue.put_nowait(request_data["request_id"])
+
+        self._workers = [
+            asyncio.create_task(self._worker_loop(i)) for i in range(self.worker_count)
+        ]
+        try:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        finally:
+            self.queue_manager.unsubscribe(self._queue)
+            self._queue = None
+            self._workers = []
+            self.running = False
     
     def stop_processing(self):
         """停止后台处理"""
         self.running = False
+        for task in self._workers:
+            task.cancel()
         logger.info(f"托管DID处理器停止: {self.host}:{self.port}")
+
+    async def _worker_loop(self, worker_id: int):
+        while self.running:
+            request_id = await self._queue.get()
+            try:
+                await self.process_request(request_id)
+            except Exception as e:
+                logger.error(f"worker{worker_id} 处理申请出错 {request_id}: {e}")
     
     async def process_pending_requests(self):
-        """处理待处理的申请"""
+        """处理当前所有待处理的申请（不依赖后台 worker，可手动调用）"""
         try:
             pending_requests = await self.queue_manager.get_pending_requests()
-            
             for request_data in pending_requests:
-                try:
-                    request_id = request_data["request_id"]
-                    
-                    # 移动到处理中状态
-                    await self.queue_manager.move_request_status(
-                        request_id, RequestStatus.PENDING, RequestStatus.PROCESSING,
-                        "开始处理申请"
-                    )
-                    
-                    # 执行业务逻辑
-                    success, result_data, error_msg = await self.perform_business_logic(request_data)
-                    
-                    if success:
-                        # 处理成功，移动到完成状态
-                        await self.queue_manager.move_request_status(
-                            request_id, RequestStatus.PROCESSING, RequestStatus.COMPLETED,
-                            "处理完成"
-                        )
-                        
-                        # 发布结果
-                        await self.result_manager.publish_result(
-                            request_id=request_id,
-                            requester_did=request_data["requester_did"],
-                            hosted_did_document=result_data,
-                            success=True
-                        )
-                        
-                        logger.info(f"申请处理成功: {request_id}")
-                    else:
-                        # 处理失败，移动到失败状态
-                        await self.queue_manager.move_request_status(
-                            request_id, RequestStatus.PROCESSING, RequestStatus.FAILED,
-                            f"处理失败: {error_msg}"
-                        )
-                        
-                        # 发布错误结果
-                        await self.result_manager.publish_result(
-                            request_id=request_id,
-                            requester_did=request_data["requester_did"],
-                            hosted_did_document={},
-                            success=False,
-                            error_message=error_msg
-                        )
-                        
-                        logger.error(f"申请处理失败: {request_id} - {error_msg}")
-                        
-                except Exception as e:
-                    logger.error(f"处理申请时出错 {request_data.get('request_id', 'unknown')}: {e}")
-                    
-                    # 尝试移动到失败状态
-                    try:
-                        await self.queue_manager.move_request_status(
-                            request_data["request_id"], RequestStatus.PROCESSING, RequestStatus.FAILED,
-                            f"处理异常: {str(e)}"
-                        )
-                    except:
-                        pass
-                        
+                await self.process_request(request_data["request_id"])
         except Exception as e:
             logger.error(f"处理待处理申请失败: {e}")
+
+    async def process_request(self, request_id: str) -> bool:
+        """处理单个申请
+
+        Returns:
+            bool: 是否由本次调用处理（申请已被其他 worker 认领时返回 False）
+        """
+        # 移动到处理中状态；条件更新保证同一申请只会被认领一次
+        if not await self.queue_manager.move_request_status(
+            request_id, RequestStatus.PENDING, RequestStatus.PROCESSING,
+            "开始处理申请"
+        ):
+            return False
+
+        try:
+            request_data = await self.queue_manager.get_request(request_id)
+            # 执行业务逻辑
+            success, result_data, error_msg = await self.perform_business_logic(request_data)
+            
+            if success:
+                # 处理成功，移动到完成状态
+                await self.queue_manager.move_request_status(
+                    request_id, RequestStatus.PROCESSING, RequestStatus.COMPLETED,
+                    "处理完成"
+                )
+                
+                # 发布结果
+                await self.result_manager.publish_result(
+                    request_id=request_id,
+                    requester_did=request_data["requester_did"],
+                    hosted_did_document=result_data,
+                    success=True
+                )
+                
+                logger.info(f"申请处理成功: {request_id}")
+            else:
+                # 处理失败，移动到失败状态
+                await self.queue_manager.move_request_status(
+                    request_id, RequestStatus.PROCESSING, RequestStatus.FAILED,
+                    f"处理失败: {error_msg}"
+                )
+                
+                # 发布错误结果
+                await self.result_manager.publish_result(
+                    request_id=request_id,
+                    requester_did=request_data["requester_did"],
+                    hosted_did_document={},
+                    success=False,
+                    error_message=error_msg
+                )
+                
+                logger.error(f"申请处理失败: {request_id} - {error_msg}")
+                
+        except asyncio.CancelledError:
+            # 处理器停止时放回待处理：本进程认领的申请不会被 requeue_interrupted 重新排队
+            await self.queue_manager.move_request_status(
+                request_id, RequestStatus.PROCESSING, RequestStatus.PENDING,
+                "处理取消，重新排队"
+            )
+            raise
+        except Exception as e:
+            logger.error(f"处理申请时出错 {request_id}: {e}")
+            
+            # 尝试移动到失败状态
+            try:
+                await self.queue_manager.move_request_status(
+                    request_id, RequestStatus.PROCESSING, RequestStatus.FAILED,
+                    f"处理异常: {str(e)}"
+                )
+            except:
+                pass
+        return True
     
     async def perform_business_logic(self, request_data: Dict[str, Any]):
         """
@@ -220,17 +260,13 @@ class HostedDIDProcessor:
     async def get_processing_statistics(self) -> Dict[str, Any]:
         """获取处理统计信息"""
         try:
-            queue_stats = {
-                "pending": len(list((self.queue_manager.queue_dir / "pending").glob("*.json"))),
-                "processing": len(list((self.queue_manager.queue_dir / "processing").glob("*.json"))),
-                "completed": len(list((self.queue_manager.queue_dir / "completed").glob("*.json"))),
-                "failed": len(list((self.queue_manager.queue_dir / "failed").glob("*.json")))
-            }
+            queue_stats = self.queue_manager.get_status_counts()
             
             result_stats = await self.result_manager.get_result_statistics()
             
             return {
                 "processor_status": "running" if self.running else "stopped",
+                "worker_count": self.worker_count,
                 "host": self.host,
                 "port": self.port,
                 "queue_statistics": queue_stats,
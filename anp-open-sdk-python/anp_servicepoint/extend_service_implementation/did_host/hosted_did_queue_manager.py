@@ -1,9 +1,16 @@
+import asyncio
 import json
+import os
+import socket
+import sqlite3
+import threading
 import time
+from bisect import bisect_left, insort
 from enum import Enum
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
 from anp_foundation.domain import get_domain_manager
+from anp_foundation.utils import json_codec
 
 import logging
 logger = logging.getLogger(__name__)
@@ -17,29 +24,178 @@ class RequestStatus(Enum):
 
 
 class HostedDIDQueueManager:
-    """托管DID申请队列管理器"""
-    
+    """托管DID申请队列管理器
+
+    申请记录保存在 queue_dir 下的 SQLite 日志（WAL 模式）中，状态流转为单条 UPDATE；
+    add_request 会通知所有订阅了该域名的处理器，无需轮询目录。
+    日志读写在线程池中执行，不阻塞事件循环；待处理申请的序号在内存中按序保存，排队位置为一次二分查找。
+    认领申请时记录认领进程（主机名:pid），重新排队时不会夺走仍在运行的进程正在处理的申请。
+    """
+
+    JOURNAL_FILE = "queue.db"
+    # 无法确认认领进程是否存活（其他主机或旧版记录）时，处理超过该时长的申请视为中断
+    STALE_PROCESSING_SECONDS = 3600
+
+    # 按 (host, port) 共享的实例与订阅者，保证 HTTP 处理函数与后台处理器看到同一份队列
+    _instances: Dict[Tuple[str, int], 'HostedDIDQueueManager'] = {}
+    _subscribers: Dict[Tuple[str, int], List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+    _instances_lock = threading.Lock()
+
     def __init__(self, host: str, port: int):
         self.host = host
         self.port = port
         self.domain_manager = get_domain_manager()
-        
+
         # 获取队列存储路径
         paths = self.domain_manager.get_all_data_paths(host, port)
         self.queue_dir = paths['base_path'] / "hosted_did_queue"
         self.queue_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 子目录
-        (self.queue_dir / "pending").mkdir(exist_ok=True)
-        (self.queue_dir / "processing").mkdir(exist_ok=True)
-        (self.queue_dir / "completed").mkdir(exist_ok=True)
-        (self.queue_dir / "failed").mkdir(exist_ok=True)
-    
+
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.queue_dir / self.JOURNAL_FILE), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_journal()
+        self._migrate_legacy_files()
+
+        # 内存中的状态计数与按序排列的待处理序号，统计为 O(1)，排队位置为 O(log n)
+        self._status_counts: Dict[str, int] = {status.value: 0 for status in RequestStatus}
+        for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM hosted_did_requests GROUP BY status"):
+            self._status_counts[row["status"]] = row["n"]
+        self._pending_seqs: List[int] = [row["seq"] for row in self._conn.execute(
+            "SELECT seq FROM hosted_did_requests WHERE status = ? ORDER BY seq", (RequestStatus.PENDING.value,)
+        )]
+
+    def _init_journal(self):
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS hosted_did_requests (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT NOT NULL UNIQUE,
+                    requester_did TEXT,
+                    status TEXT NOT NULL,
+                    submit_time REAL,
+                    process_time REAL,
+                    complete_time REAL,
+                    message TEXT DEFAULT '',
+                    payload TEXT NOT NULL,
+                    owner TEXT
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_hosted_did_requests_status ON hosted_did_requests(status, seq)"
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(hosted_did_requests)")}
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE hosted_did_requests ADD COLUMN owner TEXT")
+
+    def _migrate_legacy_files(self):
+        """把旧版按状态分目录保存的 JSON 申请导入日志"""
+        imported = 0
+        for status in RequestStatus:
+            status_dir = self.queue_dir / status.value
+            if not status_dir.is_dir():
+                continue
+            for request_file in sorted(status_dir.glob("*.json"), key=lambda p: p.stat().st_mtime):
+                try:
+                    with open(request_file, 'r', encoding='utf-8') as f:
+                        request_data = json.load(f)
+                    with self._lock, self._conn:
+                        self._conn.execute(
+                            "INSERT OR IGNORE INTO hosted_did_requests "
+                            "(request_id, requester_did, status, submit_time, process_time, complete_time, message, payload) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (request_data["request_id"], request_data.get("requester_did"), status.value,
+                             request_data.get("submit_time"), request_data.get("process_time"),
+                             request_data.get("complete_time"), request_data.get("message", ""),
+                             json_codec.dumps(request_data))
+                        )
+                    request_file.unlink()
+                    imported += 1
+                except Exception as e:
+                    logger.warning(f"导入旧版申请文件失败 {request_file}: {e}")
+            try:
+                status_dir.rmdir()
+            except OSError:
+                pass
+        if imported:
+            logger.info(f"已将{imported}个旧版申请文件导入队列日志: {self.queue_dir}")
+
     @classmethod
     def create_for_domain(cls, host: str, port: int) -> 'HostedDIDQueueManager':
-        """为指定域名创建队列管理器"""
-        return cls(host, port)
-    
+        """获取指定域名的队列管理器（同一域名共享一个实例）"""
+        key = (host, int(port))
+        with cls._instances_lock:
+            manager = cls._instances.get(key)
+            if manager is None:
+                manager = cls(host, port)
+                cls._instances[key] = manager
+            return manager
+
+    def subscribe(self) -> asyncio.Queue:
+        """订阅新申请通知，返回绑定当前事件循环的队列，元素为 request_id"""
+        queue = asyncio.Queue()
+        key = (self.host, int(self.port))
+        with self._instances_lock:
+            self._subscribers.setdefault(key, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """取消订阅"""
+        key = (self.host, int(self.port))
+        with self._instances_lock:
+            self._subscribers[key] = [s for s in self._subscribers.get(key, []) if s[1] is not queue]
+
+    def _notify(self, request_id: str):
+        key = (self.host, int(self.port))
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        for loop, queue in list(self._subscribers.get(key, [])):
+            if loop is current_loop:
+                queue.put_nowait(request_id)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, request_id)
+
+    def _set_count(self, status: str, delta: int):
+        self._status_counts[status] = self._status_counts.get(status, 0) + delta
+
+    def _add_pending(self, seq: int):
+        """登记待处理序号；新申请的序号最大，直接追加（调用方持有锁）"""
+        if not self._pending_seqs or seq > self._pending_seqs[-1]:
+            self._pending_seqs.append(seq)
+        else:
+            insort(self._pending_seqs, seq)
+
+    def _remove_pending(self, seq: int):
+        """移除待处理序号（调用方持有锁）"""
+        index = bisect_left(self._pending_seqs, seq)
+        if index < len(self._pending_seqs) and self._pending_seqs[index] == seq:
+            del self._pending_seqs[index]
+
+    @staticmethod
+    async def _run(func: Callable[..., Any], *args) -> Any:
+        """在线程池中执行阻塞的日志读写"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _owner_alive(self, owner: Optional[str], process_time: Optional[float], now: float) -> bool:
+        """认领申请的进程是否仍在运行：本机进程按 pid 检查，无法检查时按处理时长判断"""
+        if owner == self.owner:
+            return True
+        host, _, pid = (owner or "").rpartition(":")
+        if host == socket.gethostname() and pid.isdigit() and os.name == "posix":
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+            return True
+        return process_time is not None and now - process_time < self.STALE_PROCESSING_SECONDS
+
     async def add_request(self, request_id: str, hosted_request) -> bool:
         """添加申请到队列"""
         try:
@@ -53,99 +209,189 @@ class HostedDIDQueueManager:
                 "host": self.host,
                 "port": self.port
             }
-            
-            # 保存到pending目录
-            request_file = self.queue_dir / "pending" / f"{request_id}.json"
-            with open(request_file, 'w', encoding='utf-8') as f:
-                json.dump(request_data, f, ensure_ascii=False, indent=2)
-            
+
+            def _insert():
+                with self._lock, self._conn:
+                    cursor = self._conn.execute(
+                        "INSERT INTO hosted_did_requests (request_id, requester_did, status, submit_time, payload) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (request_id, request_data["requester_did"], RequestStatus.PENDING.value,
+                         request_data["submit_time"], json_codec.dumps(request_data))
+                    )
+                    self._set_count(RequestStatus.PENDING.value, 1)
+                    self._add_pending(cursor.lastrowid)
+
+            await self._run(_insert)
+            self._notify(request_id)
             logger.info(f"申请已添加到队列: {request_id}")
             return True
-            
+
         except Exception as e:
             logger.error(f"添加申请到队列失败: {e}")
             return False
-    
+
+    def _fetch(self, request_id: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM hosted_did_requests WHERE request_id = ?", (request_id,)
+            ).fetchone()
+
+    def _row_to_request(self, row: sqlite3.Row) -> Dict[str, Any]:
+        request_data = json_codec.loads(row["payload"])
+        request_data.update({
+            "status": row["status"],
+            "process_time": row["process_time"],
+            "complete_time": row["complete_time"],
+            "message": row["message"] or "",
+        })
+        return request_data
+
     async def get_request_status(self, request_id: str) -> Optional[Dict[str, Any]]:
         """获取申请状态"""
         try:
-            # 在各个状态目录中查找
-            for status in RequestStatus:
-                request_file = self.queue_dir / status.value / f"{request_id}.json"
-                if request_file.exists():
-                    with open(request_file, 'r', encoding='utf-8') as f:
-                        request_data = json.load(f)
-                    
-                    return {
-                        "request_id": request_id,
-                        "status": status.value,
-                        "submit_time": request_data.get("submit_time"),
-                        "process_time": request_data.get("process_time"),
-                        "complete_time": request_data.get("complete_time"),
-                        "message": request_data.get("message", ""),
-                        "requester_did": request_data.get("requester_did")
-                    }
-            
-            return None
-            
+            row = await self._run(self._fetch, request_id)
+            if row is None:
+                return None
+
+            status = {
+                "request_id": request_id,
+                "status": row["status"],
+                "submit_time": row["submit_time"],
+                "process_time": row["process_time"],
+                "complete_time": row["complete_time"],
+                "message": row["message"] or "",
+                "requester_did": row["requester_did"]
+            }
+            if row["status"] == RequestStatus.PENDING.value:
+                status["queue_position"] = self.get_queue_position_for_seq(row["seq"])
+            return status
+
         except Exception as e:
             logger.error(f"获取申请状态失败: {e}")
             return None
-    
+
+    def get_queue_position_for_seq(self, seq: int) -> int:
+        """根据入队序号计算排队位置（从1开始）：排在前面的待处理申请数加一
+
+        在内存中按序保存的待处理序号上二分查找，处理器不按入队顺序认领或申请被放回队列时仍然准确
+        """
+        with self._lock:
+            return bisect_left(self._pending_seqs, seq) + 1
+
+    async def get_queue_position(self, request_id: str) -> Optional[int]:
+        """获取待处理申请的排队位置，非待处理状态返回 None"""
+        row = await self._run(self._fetch, request_id)
+        if row is None or row["status"] != RequestStatus.PENDING.value:
+            return None
+        return self.get_queue_position_for_seq(row["seq"])
+
+    async def get_request(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """获取完整的申请数据"""
+        row = await self._run(self._fetch, request_id)
+        return self._row_to_request(row) if row is not None else None
+
     async def get_pending_requests(self) -> List[Dict[str, Any]]:
-        """获取待处理的申请"""
+        """获取待处理的申请（按入队顺序）"""
         try:
-            pending_requests = []
-            pending_dir = self.queue_dir / "pending"
-            
-            for request_file in pending_dir.glob("*.json"):
-                try:
-                    with open(request_file, 'r', encoding='utf-8') as f:
-                        request_data = json.load(f)
-                    pending_requests.append(request_data)
-                except Exception as e:
-                    logger.warning(f"读取申请文件失败 {request_file}: {e}")
-            
-            # 按提交时间排序
-            return sorted(pending_requests, key=lambda x: x.get("submit_time", 0))
-            
+            def _select():
+                with self._lock:
+                    return self._conn.execute(
+                        "SELECT * FROM hosted_did_requests WHERE status = ? ORDER BY seq",
+                        (RequestStatus.PENDING.value,)
+                    ).fetchall()
+
+            rows = await self._run(_select)
+            return [self._row_to_request(row) for row in rows]
+
         except Exception as e:
             logger.error(f"获取待处理申请失败: {e}")
             return []
-    
-    async def move_request_status(self, request_id: str, from_status: RequestStatus, 
+
+    def get_status_counts(self) -> Dict[str, int]:
+        """各状态的申请数量"""
+        return dict(self._status_counts)
+
+    async def requeue_interrupted(self) -> int:
+        """把认领进程已退出的处理中申请放回待处理；仍在运行的进程（包括本进程）认领的申请保持不变"""
+        def _requeue() -> int:
+            now = time.time()
+            with self._lock, self._conn:
+                rows = self._conn.execute(
+                    "SELECT seq, owner, process_time FROM hosted_did_requests WHERE status = ?",
+                    (RequestStatus.PROCESSING.value,)
+                ).fetchall()
+                seqs = [row["seq"] for row in rows if not self._owner_alive(row["owner"], row["process_time"], now)]
+                self._conn.executemany(
+                    "UPDATE hosted_did_requests SET status = ?, message = ?, owner = NULL "
+                    "WHERE seq = ? AND status = ?",
+                    [(RequestStatus.PENDING.value, "处理中断，重新排队", seq, RequestStatus.PROCESSING.value)
+                     for seq in seqs]
+                )
+                if seqs:
+                    self._set_count(RequestStatus.PROCESSING.value, -len(seqs))
+                    self._set_count(RequestStatus.PENDING.value, len(seqs))
+                    for seq in seqs:
+                        self._add_pending(seq)
+            return len(seqs)
+
+        moved = await self._run(_requeue)
+        if moved:
+            logger.info(f"重新排队{moved}个中断的申请")
+        return moved
+
+    async def move_request_status(self, request_id: str, from_status: RequestStatus,
                                  to_status: RequestStatus, message: str = "") -> bool:
-        """移动申请状态"""
+        """移动申请状态（仅当当前状态为 from_status 时生效，可用于多个处理协程间的抢占）
+
+        移到处理中时记录认领进程，离开处理中时清除
+        """
         try:
-            from_file = self.queue_dir / from_status.value / f"{request_id}.json"
-            to_file = self.queue_dir / to_status.value / f"{request_id}.json"
-            
-            if not from_file.exists():
-                logger.warning(f"申请文件不存在: {from_file}")
-                return False
-            
-            # 读取并更新数据
-            with open(from_file, 'r', encoding='utf-8') as f:
-                request_data = json.load(f)
-            
-            request_data["status"] = to_status.value
-            request_data["message"] = message
-            
+            now = time.time()
+            time_column = ""
             if to_status == RequestStatus.PROCESSING:
-                request_data["process_time"] = time.time()
+                time_column = ", process_time = :now"
             elif to_status in [RequestStatus.COMPLETED, RequestStatus.FAILED]:
-                request_data["complete_time"] = time.time()
-            
-            # 保存到新位置
-            with open(to_file, 'w', encoding='utf-8') as f:
-                json.dump(request_data, f, ensure_ascii=False, indent=2)
-            
-            # 删除原文件
-            from_file.unlink()
-            
+                time_column = ", complete_time = :now"
+
+            def _update() -> bool:
+                with self._lock, self._conn:
+                    row = self._conn.execute(
+                        "SELECT seq FROM hosted_did_requests WHERE request_id = ? AND status = ?",
+                        (request_id, from_status.value)
+                    ).fetchone()
+                    if row is None:
+                        return False
+                    self._conn.execute(
+                        f"UPDATE hosted_did_requests SET status = :to_status, message = :message, "
+                        f"owner = :owner{time_column} WHERE seq = :seq",
+                        {"to_status": to_status.value, "message": message, "now": now,
+                         "owner": self.owner if to_status == RequestStatus.PROCESSING else None,
+                         "seq": row["seq"]}
+                    )
+                    self._set_count(from_status.value, -1)
+                    self._set_count(to_status.value, 1)
+                    if from_status == RequestStatus.PENDING:
+                        self._remove_pending(row["seq"])
+                    if to_status == RequestStatus.PENDING:
+                        self._add_pending(row["seq"])
+                return True
+
+            if not await self._run(_update):
+                logger.warning(f"申请不存在或状态不是{from_status.value}: {request_id}")
+                return False
+
             logger.info(f"申请状态已更新: {request_id} {from_status.value} -> {to_status.value}")
             return True
-            
+
         except Exception as e:
             logger.error(f"移动申请状态失败: {e}")
             return False
+
+    def close(self):
+        """关闭队列日志"""
+        with self._lock:
+            self._conn.close()
+        key = (self.host, int(self.port))
+        with self._instances_lock:
+            if self._instances.get(key) is self:
+                del self._instances[key]
@@ -1,46 +1,151 @@
+import asyncio
 import json
+import sqlite3
+import threading
 import time
 import uuid
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterable, Tuple
 
 from anp_foundation.domain import get_domain_manager
+from anp_foundation.utils import json_codec
 
 import logging
 logger = logging.getLogger(__name__)
 
+PENDING = "pending"            # 待客户端获取
+ACKNOWLEDGED = "acknowledged"  # 已确认收到
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
 class HostedDIDResultManager:
-    """托管DID结果管理器"""
-    
+    """托管DID结果管理器
+
+    结果保存在 results_dir 下的 SQLite 库中，按 (申请者, 状态, 创建时间) 和
+    (状态, 确认时间) 建索引；各状态数量在内存中维护，统计为 O(1)。
+    wait_for_results 支持长轮询：publish_result 发布结果时立即唤醒等待该申请者的请求。
+    """
+
+    RESULTS_FILE = "results.db"
+
+    # 按 (host, port) 共享实例，HTTP 处理函数与后台处理器使用同一连接与计数
+    _instances: Dict[Tuple[str, int], 'HostedDIDResultManager'] = {}
+    _instances_lock = threading.Lock()
+
     def __init__(self, host: str, port: int):
         self.host = host
         self.port = port
         self.domain_manager = get_domain_manager()
-        
+
         # 获取结果存储路径
         paths = self.domain_manager.get_all_data_paths(host, port)
         self.results_dir = paths['base_path'] / "hosted_did_results"
         self.results_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 子目录
-        (self.results_dir / "pending").mkdir(exist_ok=True)      # 待客户端获取
-        (self.results_dir / "acknowledged").mkdir(exist_ok=True) # 已确认收到
-    
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.results_dir / self.RESULTS_FILE), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_store()
+
+        self._status_counts: Dict[str, int] = {PENDING: 0, ACKNOWLEDGED: 0}
+        for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM hosted_did_results GROUP BY status"):
+            self._status_counts[row["status"]] = row["n"]
+        self._migrate_legacy_files()
+
+        # requester_id -> [(事件循环, Future)]，publish_result 可能在其他线程的事件循环中调用
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._waiters_lock = threading.Lock()
+
+    def _init_store(self):
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS hosted_did_results (
+                    result_id TEXT PRIMARY KEY,
+                    request_id TEXT,
+                    requester_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_time REAL NOT NULL,
+                    acknowledged_time REAL,
+                    payload TEXT NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_hosted_did_results_requester "
+                "ON hosted_did_results(requester_id, status, created_time)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_hosted_did_results_ack "
+                "ON hosted_did_results(status, acknowledged_time)"
+            )
+
+    def _migrate_legacy_files(self):
+        """把旧版 pending/acknowledged 目录中的 JSON 结果导入结果库"""
+        imported = 0
+        for status in (PENDING, ACKNOWLEDGED):
+            status_dir = self.results_dir / status
+            if not status_dir.is_dir():
+                continue
+            for result_file in status_dir.glob("*.json"):
+                try:
+                    with open(result_file, 'r', encoding='utf-8') as f:
+                        result_data = json.load(f)
+                    self._insert(result_data, status)
+                    result_file.unlink()
+                    imported += 1
+                except Exception as e:
+                    logger.warning(f"导入旧版结果文件失败 {result_file}: {e}")
+            try:
+                status_dir.rmdir()
+            except OSError:
+                pass
+        if imported:
+            logger.info(f"已将{imported}个旧版结果文件导入结果库: {self.results_dir}")
+
+    def _insert(self, result_data: Dict[str, Any], status: str = PENDING):
+        """写入一条结果并更新状态计数；result_id 已存在时替换旧结果，旧结果的状态从计数中扣除"""
+        with self._lock, self._conn:
+            replaced = self._conn.execute(
+                "SELECT status FROM hosted_did_results WHERE result_id = ?", (result_data["result_id"],)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hosted_did_results "
+                "(result_id, request_id, requester_id, status, created_time, acknowledged_time, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (result_data["result_id"], result_data.get("request_id"), result_data.get("requester_id", ""),
+                 status, result_data.get("created_time", time.time()), result_data.get("acknowledged_time"),
+                 json_codec.dumps(result_data))
+            )
+            if replaced is not None:
+                self._status_counts[replaced["status"]] -= 1
+            self._status_counts[status] = self._status_counts.get(status, 0) + 1
+
     @classmethod
     def create_for_domain(cls, host: str, port: int) -> 'HostedDIDResultManager':
-        """为指定域名创建结果管理器"""
-        return cls(host, port)
-    
-    async def publish_result(self, request_id: str, requester_did: str, 
-                           hosted_did_document: Dict[str, Any], success: bool = True, 
+        """获取指定域名的结果管理器（同一域名共享一个实例）"""
+        key = (host, int(port))
+        with cls._instances_lock:
+            manager = cls._instances.get(key)
+            if manager is None:
+                manager = cls(host, port)
+                cls._instances[key] = manager
+            return manager
+
+    async def publish_result(self, request_id: str, requester_did: str,
+                           hosted_did_document: Dict[str, Any], success: bool = True,
                            error_message: str = "") -> bool:
         """发布处理结果"""
         try:
             # 从requester_did中提取用户ID
             did_parts = requester_did.split(':')
             requester_id = did_parts[-1] if did_parts else str(uuid.uuid4())
-            
+
             result_id = f"{requester_id}_{int(time.time())}_{request_id[:8]}"
-            
+
             result_data = {
                 "result_id": result_id,
                 "request_id": request_id,
@@ -51,131 +156,150 @@ class HostedDIDResultManager:
                 "host": self.host,
                 "port": self.port
             }
-            
+
             if success:
                 result_data["hosted_did_document"] = hosted_did_document
             else:
                 result_data["error_message"] = error_message
-            
-            # 保存到pending目录
-            result_file = self.results_dir / "pending" / f"{result_id}.json"
-            with open(result_file, 'w', encoding='utf-8') as f:
-                json.dump(result_data, f, ensure_ascii=False, indent=2)
-            
+
+            self._insert(result_data)
+            self._wake_waiters(requester_id)
+
             logger.info(f"处理结果已发布: {result_id} for {requester_did}")
             return True
-            
+
         except Exception as e:
             logger.error(f"发布处理结果失败: {e}")
             return False
-    
+
     async def get_results_for_requester(self, requester_did_id: str) -> List[Dict[str, Any]]:
-        """获取指定申请者的处理结果"""
+        """获取指定申请者的待确认结果（按创建时间倒序）"""
         try:
-            results = []
-            pending_dir = self.results_dir / "pending"
-            
-            for result_file in pending_dir.glob("*.json"):
-                try:
-                    with open(result_file, 'r', encoding='utf-8') as f:
-                        result_data = json.load(f)
-                    
-                    # 检查是否匹配申请者ID
-                    if result_data.get("requester_id") == requester_did_id:
-                        results.append(result_data)
-                        
-                except Exception as e:
-                    logger.warning(f"读取结果文件失败 {result_file}: {e}")
-            
-            # 按创建时间排序
-            return sorted(results, key=lambda x: x.get("created_time", 0), reverse=True)
-            
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT payload FROM hosted_did_results "
+                    "WHERE requester_id = ? AND status = ? ORDER BY created_time DESC",
+                    (requester_did_id, PENDING)
+                ).fetchall()
+            return [json_codec.loads(row["payload"]) for row in rows]
+
         except Exception as e:
             logger.error(f"获取申请者结果失败: {e}")
             return []
-    
+
+    async def wait_for_results(self, requester_did_id: str, timeout: float) -> List[Dict[str, Any]]:
+        """长轮询：等待指定申请者的结果，已有结果时立即返回，超时返回空列表"""
+        if timeout <= 0:
+            return await self.get_results_for_requester(requester_did_id)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # 先登记再查询，避免查询与登记之间发布的结果被漏掉
+        with self._waiters_lock:
+            self._waiters.setdefault(requester_did_id, []).append((loop, future))
+        try:
+            results = await self.get_results_for_requester(requester_did_id)
+            if results:
+                return results
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                return []
+            return await self.get_results_for_requester(requester_did_id)
+        finally:
+            with self._waiters_lock:
+                waiters = self._waiters.get(requester_did_id)
+                if waiters is not None:
+                    waiters[:] = [w for w in waiters if w[1] is not future]
+                    if not waiters:
+                        del self._waiters[requester_did_id]
+
+    def _wake_waiters(self, requester_did_id: str):
+        with self._waiters_lock:
+            waiters = self._waiters.pop(requester_did_id, [])
+        if not waiters:
+            return
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        for loop, future in waiters:
+            if loop is current_loop:
+                _resolve(future)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve, future)
+
     async def acknowledge_result(self, result_id: str) -> bool:
         """确认结果已收到"""
+        acknowledged = await self.acknowledge_results([result_id])
+        if not acknowledged:
+            logger.warning(f"结果不存在或已确认: {result_id}")
+            return False
+        return True
+
+    async def acknowledge_results(self, result_ids: Iterable[str]) -> int:
+        """批量确认结果已收到
+
+        Returns:
+            int: 实际确认的结果数量（不存在或已确认的结果会被忽略）
+        """
         try:
-            pending_file = self.results_dir / "pending" / f"{result_id}.json"
-            acknowledged_file = self.results_dir / "acknowledged" / f"{result_id}.json"
-            
-            if not pending_file.exists():
-                logger.warning(f"结果文件不存在: {pending_file}")
-                return False
-            
-            # 读取结果数据
-            with open(pending_file, 'r', encoding='utf-8') as f:
-                result_data = json.load(f)
-            
-            # 添加确认时间
-            result_data["acknowledged_time"] = time.time()
-            
-            # 移动到已确认目录
-            with open(acknowledged_file, 'w', encoding='utf-8') as f:
-                json.dump(result_data, f, ensure_ascii=False, indent=2)
-            
-            # 删除原文件
-            pending_file.unlink()
-            
-            logger.info(f"结果已确认: {result_id}")
-            return True
-            
+            result_ids = list(dict.fromkeys(result_ids))
+            if not result_ids:
+                return 0
+            now = time.time()
+            with self._lock, self._conn:
+                cursor = self._conn.executemany(
+                    "UPDATE hosted_did_results SET status = ?, acknowledged_time = ? "
+                    "WHERE result_id = ? AND status = ?",
+                    [(ACKNOWLEDGED, now, result_id, PENDING) for result_id in result_ids]
+                )
+                acknowledged = cursor.rowcount
+                self._status_counts[PENDING] -= acknowledged
+                self._status_counts[ACKNOWLEDGED] += acknowledged
+
+            logger.info(f"结果已确认: {acknowledged}/{len(result_ids)}")
+            return acknowledged
+
         except Exception as e:
             logger.error(f"确认结果失败: {e}")
-            return False
-    
+            return 0
+
     async def cleanup_old_results(self, max_age_days: int = 7) -> int:
-        """清理过期结果"""
+        """清理过期结果（按确认时间索引批量删除已确认的结果）"""
         try:
-            cleanup_count = 0
-            current_time = time.time()
-            max_age_seconds = max_age_days * 24 * 3600
-            
-            # 清理已确认的结果
-            acknowledged_dir = self.results_dir / "acknowledged"
-            for result_file in acknowledged_dir.glob("*.json"):
-                try:
-                    with open(result_file, 'r', encoding='utf-8') as f:
-                        result_data = json.load(f)
-                    
-                    acknowledged_time = result_data.get("acknowledged_time", 0)
-                    if current_time - acknowledged_time > max_age_seconds:
-                        result_file.unlink()
-                        cleanup_count += 1
-                        logger.debug(f"清理过期结果: {result_file.name}")
-                        
-                except Exception as e:
-                    logger.warning(f"清理结果文件失败 {result_file}: {e}")
-            
+            cutoff = time.time() - max_age_days * 24 * 3600
+            with self._lock, self._conn:
+                cursor = self._conn.execute(
+                    "DELETE FROM hosted_did_results WHERE status = ? AND acknowledged_time < ?",
+                    (ACKNOWLEDGED, cutoff)
+                )
+                cleanup_count = cursor.rowcount
+                self._status_counts[ACKNOWLEDGED] -= cleanup_count
+
             logger.info(f"清理了 {cleanup_count} 个过期结果")
             return cleanup_count
-            
+
         except Exception as e:
             logger.error(f"清理过期结果失败: {e}")
             return 0
-    
+
     async def get_result_statistics(self) -> Dict[str, Any]:
         """获取结果统计信息"""
-        try:
-            stats = {
-                "pending_count": 0,
-                "acknowledged_count": 0,
-                "total_count": 0
-            }
-            
-            # 统计待处理结果
-            pending_dir = self.results_dir / "pending"
-            stats["pending_count"] = len(list(pending_dir.glob("*.json")))
-            
-            # 统计已确认结果
-            acknowledged_dir = self.results_dir / "acknowledged"
-            stats["acknowledged_count"] = len(list(acknowledged_dir.glob("*.json")))
-            
-            stats["total_count"] = stats["pending_count"] + stats["acknowledged_count"]
-            
-            return stats
-            
-        except Exception as e:
-            logger.error(f"获取结果统计失败: {e}")
-            return {"error": str(e)}
+        with self._lock:
+            pending_count = self._status_counts[PENDING]
+            acknowledged_count = self._status_counts[ACKNOWLEDGED]
+        return {
+            "pending_count": pending_count,
+            "acknowledged_count": acknowledged_count,
+            "total_count": pending_count + acknowledged_count
+        }
+
+    def close(self):
+        """关闭结果库"""
+        with self._lock:
+            self._conn.close()
+        key = (self.host, int(self.port))
+        with self._instances_lock:
+            if self._instances.get(key) is self:
+                del self._instances[key]
@@ -0,0 +1,104 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""群组 SSE 扇出基准测试
+
+模拟一个 N 成员的群组，对比两种广播方式从发布到所有监听者拿到 SSE 帧的耗时：
+- per_listener: 旧实现，每个监听者 await queue.put(dict)，消费时各自 json 编码
+- encode_once: 发布时编码一次 GroupEvent，put_nowait 扇出共享帧
+
+用法:
+    python benchmarks/bench_group_fanout.py [--members 1000] [--messages 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anp_foundation.utils import json_codec
+from anp_runtime.global_router_agent_message import GroupRunner
+
+
+def make_message(seq: int) -> dict:
+    return {
+        "type": "TEXT",
+        "content": f"第{seq}条群组消息: " + "x" * 200,
+        "sender_id": "did:wba:localhost%3A9527:wba:user:27c0b1d11180f973",
+        "group_id": "bench",
+        "timestamp": time.time(),
+        "metadata": {"seq": seq, "tags": ["bench", "群聊"]},
+    }
+
+
+async def bench_per_listener(members: int, messages: int) -> dict:
+    queues = [asyncio.Queue() for _ in range(members)]
+    started = time.perf_counter()
+    frames = 0
+    for seq in range(messages):
+        message = make_message(seq)
+        for queue in queues:
+            await queue.put(message)
+        for queue in queues:
+            item = queue.get_nowait()
+            frames += len(b"data: " + json.dumps(item).encode("utf-8") + b"\n\n")
+    elapsed = time.perf_counter() - started
+    return _report(elapsed, members, messages, frames)
+
+
+async def bench_encode_once(members: int, messages: int) -> dict:
+    runner = GroupRunner("bench")
+    runner.listener_queue_size = messages + 1
+    queues = [runner.register_listener(f"agent-{i}") for i in range(members)]
+    started = time.perf_counter()
+    frames = 0
+    for seq in range(messages):
+        await runner.broadcast_message(make_message(seq))
+        for queue in queues:
+            frames += len(queue.get_nowait().frame)
+    elapsed = time.perf_counter() - started
+    return _report(elapsed, members, messages, frames)
+
+
+def _report(elapsed: float, members: int, messages: int, frame_bytes: int) -> dict:
+    return {
+        "total_ms": round(elapsed * 1000, 3),
+        "per_broadcast_us": round(elapsed / messages * 1e6, 3),
+        "deliveries_per_s": round(members * messages / elapsed),
+        "frame_bytes": frame_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Group SSE fan-out benchmark")
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    report = {
+        "members": args.members,
+        "messages": args.messages,
+        "json_codec": json_codec.get_json_codec().name,
+        "per_listener": asyncio.run(bench_per_listener(args.members, args.messages)),
+        "encode_once": asyncio.run(bench_encode_once(args.members, args.messages)),
+    }
+    print(json_codec.dumps_bytes(report).decode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
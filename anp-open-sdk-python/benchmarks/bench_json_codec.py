@@ -0,0 +1,126 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""JSON 编解码后端基准测试
+
+对 DID 文档、双向认证响应头、记忆条目三类典型负载，
+分别测量每个可用后端的编码/解码耗时，结果以 JSON 输出。
+
+用法:
+    python benchmarks/bench_json_codec.py [--iterations 20000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anp_foundation.utils import json_codec
+
+DID = "did:wba:localhost%3A9527:wba:user:27c0b1d11180f973"
+
+DID_DOCUMENT = {
+    "@context": [
+        "https://www.w3.org/ns/did/v1",
+        "https://w3id.org/security/suites/jws-2020/v1",
+        "https://w3id.org/security/suites/secp256k1-2019/v1"
+    ],
+    "id": DID,
+    "verificationMethod": [
+        {
+            "id": f"{DID}#key-1",
+            "type": "EcdsaSecp256k1VerificationKey2019",
+            "controller": DID,
+            "publicKeyJwk": {
+                "kty": "EC",
+                "crv": "secp256k1",
+                "x": "hvHQgwoRQgGP0Rx8UkBfknf89Nt3d8eTKiUBwsJfaJA",
+                "y": "nFkpjb0xEYy5yuVBCzBjxoS4awpJc9MgtGc1a4CiCv0",
+                "kid": "kwlEv0zCpYSQm5VRUe7UtUdgzCgbrFOwMIrVAAQyLRQ"
+            }
+        }
+    ],
+    "authentication": [f"{DID}#key-1"],
+    "service": [
+        {
+            "id": f"{DID}#ad",
+            "type": "AgentDescription",
+            "serviceEndpoint": "http://localhost:9527/wba/user/27c0b1d11180f973/ad.json"
+        }
+    ]
+}
+
+AUTH_HEADER = {
+    "access_token": "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCJ9." + "a" * 220 + "." + "b" * 342,
+    "token_type": "bearer",
+    "req_did": DID,
+    "resp_did": "did:wba:localhost%3A9527:wba:user:5fea49e183c6c211",
+    "resp_did_auth_header": {
+        "Authorization": (
+            f'DIDWba did="{DID}", nonce="a1b2c3d4e5f60718", timestamp="2024-06-01T12:00:00Z", '
+            'resp_did="did:wba:localhost%3A9527:wba:user:5fea49e183c6c211", '
+            'verification_method="key-1", signature="' + "s" * 86 + '"'
+        )
+    }
+}
+
+MEMORY_ENTRY = {
+    "method": "calculate_sum",
+    "args": [12, 30],
+    "kwargs": {"precision": 2, "描述": "计算两个数字之和"},
+    "result": {"status": "success", "value": 42, "说明": "调用成功"},
+    "execution_time_ms": 1.37,
+    "tags": ["calculator", "math", "本地方法"],
+    "keywords": ["sum", "add", "加法"]
+}
+
+PAYLOADS = {
+    "did_document": DID_DOCUMENT,
+    "auth_header": AUTH_HEADER,
+    "memory_entry": MEMORY_ENTRY,
+}
+
+
+def bench_codec(name: str, iterations: int) -> dict:
+    json_codec.set_json_codec(name)
+    results = {}
+    for payload_name, payload in PAYLOADS.items():
+        encoded = json_codec.dumps_bytes(payload)
+        encode_s = timeit.timeit(lambda: json_codec.dumps_bytes(payload), number=iterations)
+        decode_s = timeit.timeit(lambda: json_codec.loads(encoded), number=iterations)
+        results[payload_name] = {
+            "size_bytes": len(encoded),
+            "encode_us": round(encode_s / iterations * 1e6, 3),
+            "decode_us": round(decode_s / iterations * 1e6, 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON codec benchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    report = {
+        "iterations": args.iterations,
+        "codecs": {name: bench_codec(name, args.iterations) for name in json_codec.available_codecs()},
+    }
+    json_codec.set_json_codec()
+    print(json_codec.dumps_bytes(report).decode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""记忆全文搜索延迟基准测试
+
+在临时数据库中逐级写入合成的中英文混合记忆（默认 1万、10万、100万 条），每一级对比：
+- fts: search_memories 走 FTS5 全文索引，按 BM25 排序
+- like: 旧实现的 title LIKE '%q%' OR content LIKE '%q%' 全表扫描
+
+每个查询重复执行若干次，输出中位数与 p95 延迟（毫秒）。每一级同时输出数据库大小与其中全文索引
+（memory_fts 的影子表，外部内容表只保存倒排索引）占用的字节数。100万 条的写入需要数分钟。
+
+用法:
+    python benchmarks/bench_memory_search.py [--rows 10000,100000,1000000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anp_foundation.utils import json_codec
+from anp_runtime.local_service.memory.memory_config import MemoryConfig, StorageConfig
+from anp_runtime.local_service.memory.memory_models import MemoryEntry, MemoryMetadata, MemoryType
+from anp_runtime.local_service.memory.memory_storage import SQLiteMemoryStorage
+
+CJK_WORDS = [
+    "天气", "会议", "记忆", "检索", "性能", "优化", "智能体", "用户", "偏好", "订单",
+    "支付", "物流", "北京", "上海", "计划", "报告", "错误", "超时", "重试", "缓存",
+]
+RARE_WORDS = ["量子纠缠", "蝴蝶效应", "黑天鹅"]
+EN_WORDS = [
+    "agent", "memory", "search", "latency", "request", "response", "token", "session",
+    "payload", "router", "handler", "batch", "index", "query", "result", "error",
+]
+QUERIES = {
+    "cjk_common": "记忆",
+    "cjk_phrase": "性能优化",
+    "cjk_rare": "量子纠缠",
+    "en_prefix": "laten",
+    "mixed": "会议 agent",
+}
+BATCH = 5000
+
+
+def make_memory(rng: random.Random, i: int) -> MemoryEntry:
+    words = rng.choices(CJK_WORDS, k=6) + rng.choices(EN_WORDS, k=4)
+    if i % 997 == 0:
+        words.append(rng.choice(RARE_WORDS))
+    rng.shuffle(words)
+    return MemoryEntry(
+        memory_type=MemoryType.METHOD_CALL,
+        title=" ".join(words[:3]),
+        content={"index": i, "text": "".join(words[3:7]), "detail": " ".join(words[7:])},
+        metadata=MemoryMetadata(
+            source_agent_did=f"did:wba:localhost%3A9527:wba:user:{i % 50:016x}",
+            source_agent_name=f"Agent {i % 50}",
+            keywords=rng.sample(EN_WORDS, 2)
+        )
+    )
+
+
+async def measure(search, repeat: int) -> dict:
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = await search()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "rows": rows,
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
+
+
+def storage_bytes(storage: SQLiteMemoryStorage) -> dict:
+    """数据库大小与全文索引占用的字节数；SQLite 未编译 dbstat 时只输出数据库大小"""
+    with storage._pool.reader() as conn:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        sizes = {"db_bytes": conn.execute("PRAGMA page_count").fetchone()[0] * page_size}
+        try:
+            sizes["fts_bytes"] = conn.execute(
+                "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name LIKE 'memory_fts_%'").fetchone()[0]
+        except sqlite3.OperationalError:
+            pass
+    return sizes
+
+
+async def run(rows_levels, repeat: int, limit: int, seed: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="anp_memory_search_")
+    storage = SQLiteMemoryStorage(MemoryConfig(
+        storage=StorageConfig(database_path=os.path.join(workdir, "memory.db"), batch_write_size=BATCH)))
+    rng = random.Random(seed)
+    report = {}
+    written = 0
+    try:
+        for level in rows_levels:
+            started = time.perf_counter()
+            while written < level:
+                count = min(BATCH, level - written)
+                await storage.save_memories([make_memory(rng, written + i) for i in range(count)])
+                written += count
+            await storage.flush()
+            populate_s = time.perf_counter() - started
+
+            level_report = {"populate_s": round(populate_s, 3), "storage": storage_bytes(storage), "queries": {}}
+            for name, query in QUERIES.items():
+                async def fts():
+                    return len(await storage.search_memories(query=query, limit=limit))
+
+                async def like():
+                    pattern = f"%{query}%"
+                    with storage._pool.reader() as conn:
+                        return len(conn.execute(
+                            "SELECT * FROM memory_entries WHERE title LIKE ? OR content LIKE ? "
+                            "ORDER BY updated_at DESC LIMIT ?", (pattern, pattern, limit)).fetchall())
+
+                # 多词查询在 LIKE 下按整串匹配，结果数不可比，只看耗时
+                level_report["queries"][name] = {
+                    "fts": await measure(fts, repeat),
+                    "like": await measure(like, repeat),
+                }
+            report[str(level)] = level_report
+    finally:
+        storage.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory full-text search latency benchmark")
+    parser.add_argument("--rows", default="10000,100000,1000000", help="逗号分隔的数据量，按从小到大逐级写入")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    levels = sorted(int(r) for r in args.rows.split(",") if r.strip())
+    report = {
+        "limit": args.limit,
+        "repeat": args.repeat,
+        "json_codec": json_codec.get_json_codec().name,
+        "rows": asyncio.run(run(levels, args.repeat, args.limit, args.seed)),
+    }
+    print(json_codec.dumps_bytes(report).decode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""SQLite 记忆存储并发读基准测试
+
+在临时数据库中写入 N 条记忆，然后对不同的 thread_pool_size 并发执行 search_memories，
+对比两种读连接配置的吞吐量：
+- serialized: read_pool_size=1，所有查询排队使用同一个只读连接（相当于旧实现的全局锁）
+- pooled: read_pool_size 与线程池大小一致，WAL 下多个只读连接并行查询
+
+查询使用 LIKE 全表扫描、只返回少量行，耗时主要在 SQLite 内部（执行期间释放 GIL），
+因此吞吐量应随线程池大小增长。
+
+用法:
+    python benchmarks/bench_memory_storage.py [--memories 20000] [--queries 400] [--threads 1,2,4,8]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anp_foundation.utils import json_codec
+from anp_runtime.local_service.memory.memory_config import MemoryConfig, PerformanceConfig, StorageConfig
+from anp_runtime.local_service.memory.memory_models import MemoryEntry, MemoryMetadata, MemoryType
+from anp_runtime.local_service.memory.memory_storage import SQLiteMemoryStorage
+
+
+def make_config(db_path: str, threads: int, read_pool_size: int) -> MemoryConfig:
+    return MemoryConfig(
+        storage=StorageConfig(database_path=db_path, read_pool_size=read_pool_size),
+        performance=PerformanceConfig(thread_pool_size=threads)
+    )
+
+
+async def populate(db_path: str, memories: int):
+    storage = SQLiteMemoryStorage(make_config(db_path, 1, 1))
+    try:
+        await storage.save_memories([MemoryEntry(
+            memory_type=MemoryType.METHOD_CALL if i % 2 else MemoryType.CONTEXT,
+            title=f"记忆 {i}",
+            content={"index": i, "text": f"payload-{i % 997} " + "x" * 200},
+            metadata=MemoryMetadata(
+                source_agent_did=f"did:wba:localhost%3A9527:wba:user:{i % 50:016x}",
+                source_agent_name=f"Agent {i % 50}",
+                tags=[f"tag_{i % 20}", "bench"],
+                keywords=[f"kw_{i % 30}"]
+            )
+        ) for i in range(memories)])
+    finally:
+        storage.close()
+
+
+async def bench_reads(db_path: str, threads: int, read_pool_size: int, queries: int) -> dict:
+    storage = SQLiteMemoryStorage(make_config(db_path, threads, read_pool_size))
+    try:
+        # 预热：建立只读连接并编译语句
+        await asyncio.gather(*(storage.search_memories(query="payload-1 ", limit=5) for _ in range(threads)))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            storage.search_memories(query=f"payload-{i % 997} ", limit=5) for i in range(queries)))
+        elapsed = time.perf_counter() - started
+    finally:
+        storage.close()
+    return {
+        "queries": queries,
+        "rows": sum(len(r) for r in results),
+        "elapsed_s": round(elapsed, 3),
+        "queries_per_s": round(queries / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite memory storage concurrent read benchmark")
+    parser.add_argument("--memories", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--threads", default="1,2,4,8", help="逗号分隔的 thread_pool_size 列表")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="anp_memory_bench_")
+    db_path = os.path.join(workdir, "memory.db")
+    try:
+        started = time.perf_counter()
+        asyncio.run(populate(db_path, args.memories))
+        populate_s = time.perf_counter() - started
+
+        runs = {}
+        for threads in (int(t) for t in args.threads.split(",") if t.strip()):
+            runs[str(threads)] = {
+                "serialized": asyncio.run(bench_reads(db_path, threads, 1, args.queries)),
+                "pooled": asyncio.run(bench_reads(db_path, threads, threads, args.queries)),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "memories": args.memories,
+        "populate_s": round(populate_s, 3),
+        "cpu_count": os.cpu_count(),
+        "json_codec": json_codec.get_json_codec().name,
+        "thread_pool_size": runs,
+    }
+    print(json_codec.dumps_bytes(report).decode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""推荐候选检索延迟基准测试
+
+在临时 SQLite 数据库中逐级写入合成记忆（默认 1万、10万 条），每一级对比：
+- index: 候选倒排索引一次查询取候选（WAND 取前 N 个），再按 id 批量读取
+- search: 旧实现按记忆类型分别调用 search_memories（相似记忆搜索为标签、关键词两次搜索）
+
+测量 HybridRecommendationAlgorithm.recommend 与 MemorySearchEngine.search_similar_memories 的端到端耗时，
+搜索结果缓存关闭。
+
+用法:
+    python benchmarks/bench_recommendation_candidates.py [--rows 10000,100000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anp_foundation.utils import json_codec
+from anp_runtime.local_service.memory.context_session import ContextSessionManager
+from anp_runtime.local_service.memory.memory_config import (
+    CleanupConfig, MemoryConfig, PerformanceConfig, StorageConfig, set_memory_config
+)
+from anp_runtime.local_service.memory.memory_manager import MemoryManager
+from anp_runtime.local_service.memory.memory_models import MemoryEntry, MemoryMetadata, MemoryType
+from anp_runtime.local_service.memory.memory_recommender import HybridRecommendationAlgorithm, RecommendationContext
+from anp_runtime.local_service.memory.memory_storage import SQLiteMemoryStorage
+
+WORDS = [f"term{i}" for i in range(200)]
+TYPES = [MemoryType.METHOD_CALL, MemoryType.CONTEXT, MemoryType.PATTERN]
+BATCH = 5000
+
+
+def make_memory(rng: random.Random, i: int) -> MemoryEntry:
+    # 词频近似 Zipf 分布：少数常见词出现在大量记忆中
+    keywords = list({WORDS[min(int(rng.paretovariate(1.0)) - 1, len(WORDS) - 1)] for _ in range(4)})
+    return MemoryEntry(
+        memory_type=rng.choice(TYPES),
+        title=f"memory {i}",
+        content={"method_name": "search"},
+        metadata=MemoryMetadata(
+            source_agent_did=f"did:wba:localhost%3A9527:wba:user:{i % 50:016x}",
+            source_agent_name=f"Agent {i % 50}",
+            keywords=keywords,
+            tags=rng.sample(WORDS[:40], 2)
+        )
+    )
+
+
+async def measure(call, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
+
+
+async def run(rows_levels, repeat: int, seed: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="anp_memory_candidates_")
+    config = MemoryConfig(
+        storage=StorageConfig(database_path=os.path.join(workdir, "memory.db"), batch_write_size=BATCH),
+        cleanup=CleanupConfig(enable_auto_cleanup=False),
+        performance=PerformanceConfig(enable_search_cache=False)
+    )
+    # 会话管理器读取全局记忆配置；先设置全局配置，避免在当前目录生成默认配置文件和数据库
+    set_memory_config(config)
+    storage = SQLiteMemoryStorage(config)
+    manager = MemoryManager(storage=storage, session_manager=ContextSessionManager(storage), config=config)
+    index = storage.candidate_index
+    algorithm = HybridRecommendationAlgorithm(config)
+    rng = random.Random(seed)
+    context = RecommendationContext(
+        query_keywords=["term0", "term3", "term17"],
+        query_tags=["term5"],
+        current_agent_did="did:wba:localhost%3A9527:wba:user:0000000000000007",
+        memory_types=TYPES
+    )
+    report = {}
+    written = 0
+    try:
+        for level in rows_levels:
+            while written < level:
+                count = min(BATCH, level - written)
+                await storage.save_memories([make_memory(rng, written + i) for i in range(count)])
+                written += count
+            reference = make_memory(rng, level)
+
+            level_report = {}
+            for mode in ("index", "search"):
+                storage._candidate_index = index if mode == "index" else None
+                level_report[mode] = {
+                    "recommend": await measure(lambda: algorithm.recommend(manager, context), repeat),
+                    "similar": await measure(lambda: manager.search_similar_memories(reference), repeat),
+                }
+            storage._candidate_index = index
+            report[str(level)] = level_report
+    finally:
+        await manager.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendation candidate retrieval latency benchmark")
+    parser.add_argument("--rows", default="10000,100000", help="逗号分隔的数据量，按从小到大逐级写入")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    levels = sorted(int(r) for r in args.rows.split(",") if r.strip())
+    report = {
+        "repeat": args.repeat,
+        "json_codec": json_codec.get_json_codec().name,
+        "rows": asyncio.run(run(levels, args.repeat, args.seed)),
+    }
+    print(json_codec.dumps_bytes(report).decode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
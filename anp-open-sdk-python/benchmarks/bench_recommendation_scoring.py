@@ -0,0 +1,154 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""推荐评分延迟基准测试
+
+对合成的候选记忆（默认 1千、1万、10万 条）执行 HybridRecommendationAlgorithm.recommend，
+候选直接由桩管理器返回，只测量过滤、评分与取前 N 个的耗时，对比：
+- scalar: 逐条调用每个评分函数的 calculate_score，全量排序（NumPy 不可用时的路径）
+- vectorized: 提取列式特征后按列计算评分，argpartition 取前 N 个
+
+两种路径返回的推荐应完全一致，结果中的 same_result 用于核对。
+
+用法:
+    python benchmarks/bench_recommendation_scoring.py [--candidates 1000,10000,100000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anp_foundation.utils import json_codec
+from anp_runtime.local_service.memory import memory_recommender
+from anp_runtime.local_service.memory.memory_config import MemoryConfig
+from anp_runtime.local_service.memory.memory_models import MemoryEntry, MemoryMetadata, MemoryType
+from anp_runtime.local_service.memory.memory_recommender import HybridRecommendationAlgorithm, RecommendationContext
+
+WORDS = [
+    "search", "user", "order", "payment", "profile", "cache", "session", "token",
+    "router", "handler", "batch", "index", "query", "result", "error", "retry",
+]
+METHODS = ["search_users", "search", "process_payment", "get_profile", "refresh_token"]
+
+
+class StubManager:
+    """只返回固定候选列表的记忆管理器"""
+
+    def __init__(self, memories):
+        self.memories = memories
+
+    async def search_memories(self, **kwargs):
+        return self.memories
+
+
+def make_memories(rng: random.Random, count: int):
+    now = datetime.now()
+    return [
+        MemoryEntry(
+            memory_type=rng.choice([MemoryType.METHOD_CALL, MemoryType.CONTEXT, MemoryType.PATTERN]),
+            title=f"memory {i}",
+            content={"method_name": rng.choice(METHODS)},
+            metadata=MemoryMetadata(
+                source_agent_did=f"did:wba:localhost%3A9527:wba:user:{i % 50:016x}",
+                source_agent_name=f"Agent {i % 50}",
+                session_id=f"session-{i % 200}",
+                keywords=rng.sample(WORDS, 3),
+                tags=rng.sample(WORDS, 2),
+                relevance_score=rng.uniform(0.3, 1.0),
+                access_count=rng.randint(0, 100)
+            ),
+            created_at=now - timedelta(days=rng.randint(0, 365))
+        )
+        for i in range(count)
+    ]
+
+
+def make_context() -> RecommendationContext:
+    context = RecommendationContext(
+        query_keywords=["search", "user", "cache"],
+        query_tags=["session"],
+        current_agent_did="did:wba:localhost%3A9527:wba:user:0000000000000007",
+        current_session_id="session-7",
+        current_method_name="search"
+    )
+    context.max_recommendations = 10
+    context.similarity_threshold = 0.1
+    return context
+
+
+async def measure(algorithm, manager, context, repeat: int):
+    timings = []
+    result = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await algorithm.recommend(manager, context)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return result, {
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
+
+
+async def run(levels, repeat: int, seed: int) -> dict:
+    algorithm = HybridRecommendationAlgorithm(MemoryConfig())
+    context = make_context()
+    numpy_module = memory_recommender.np
+    report = {}
+    for count in levels:
+        manager = StubManager(make_memories(random.Random(seed), count))
+        vectorized, vectorized_stats = await measure(algorithm, manager, context, repeat)
+        memory_recommender.np = None
+        try:
+            scalar, scalar_stats = await measure(algorithm, manager, context, repeat)
+        finally:
+            memory_recommender.np = numpy_module
+        report[str(count)] = {
+            "scalar": scalar_stats,
+            "vectorized": vectorized_stats,
+            "speedup": round(scalar_stats["median_ms"] / max(vectorized_stats["median_ms"], 1e-6), 2),
+            "same_result": [m.id for m, _ in scalar] == [m.id for m, _ in vectorized],
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendation scoring latency benchmark")
+    parser.add_argument("--candidates", default="1000,10000,100000", help="逗号分隔的候选数量")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if memory_recommender.np is None:
+        parser.error("需要安装 NumPy 才能对比列式评分")
+
+    levels = [int(c) for c in args.candidates.split(",") if c.strip()]
+    report = {
+        "repeat": args.repeat,
+        "numpy": memory_recommender.np.__version__,
+        "json_codec": json_codec.get_json_codec().name,
+        "candidates": asyncio.run(run(levels, args.repeat, args.seed)),
+    }
+    print(json_codec.dumps_bytes(report).decode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# Copyright 2024 ANP Open SDK Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""ANP 服务端负载基准测试
+
+在临时目录中用 create_did_user 创建 N 个合成用户，其中前 --agents 个注册为提供 /echo API
+和 text 消息处理器的 Agent，其余作为调用方；在本进程内启动 ANP_Server，
+再由 asyncio 客户端按场景发起请求：
+- didwba: 每次都走 DIDWba 双向认证（签名、nonce、DID 文档解析、验签、签发 token）
+- bearer: 复用服务端签发的 token 调用同一 API
+- message: 通过 /message/post 发送 P2P 消息
+- group: 向群组发送消息并扇出到所有成员的监听队列
+- did_doc: 获取 DID 文档（免认证路径）
+
+默认从认证豁免列表中移除 /agent/api/*，使 API、消息与群组请求都经过认证中间件。
+每个场景输出吞吐量与 p50/p90/p99 延迟，同时附带客户端与服务端各追踪阶段的耗时分位数，结果以 JSON 输出，
+便于在版本之间跟踪认证和路由热路径的回归。
+
+用法:
+    python benchmarks/bench_server_load.py [--users 8] [--agents 2] [--requests 200] [--concurrency 8]
+        [--mix didwba=1,bearer=1,message=1,group=1,did_doc=1] [--mode sequential|mixed]
+        [--port 9627] [--output report.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import quote, urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+
+from anp_foundation.config import UnifiedConfig, set_global_config
+from anp_foundation.utils import json_codec
+from anp_foundation.utils.tracing import LatencyHistogram, get_tracer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CONFIG = os.path.join(REPO_ROOT, "unified_config.default.yaml")
+
+SCENARIOS = ("didwba", "bearer", "message", "group", "did_doc")
+GROUP_ID = "bench"
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """解析场景权重，例如 "didwba=2,bearer=1"；未列出的场景不运行"""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"未知场景: {name}，可用: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight) if weight else 1.0
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def build_config(config_file: str, port: int, workdir: str, exempt_api: bool):
+    """基于默认配置生成基准测试配置：临时用户目录、关闭调试日志与转发"""
+    # 以临时目录作为 APP_ROOT：DID 文档服务按 data_user/{host}_{port} 的域名目录查找用户
+    config = UnifiedConfig(config_file=config_file, app_root=workdir)
+    config.anp_sdk.host = "localhost"
+    config.anp_sdk.port = port
+    config.anp_sdk.debug_mode = False
+    config.anp_sdk.use_transformer_server = False
+    config.anp_sdk.group_msg_path = workdir
+    config.anp_sdk.group_log_enabled = False
+    config.did_config.hosts.localhost = port
+    set_global_config(config)
+
+    from anp_foundation.domain import get_domain_manager
+    paths = get_domain_manager().get_all_data_paths("localhost", port)
+    config.anp_sdk.user_did_path = str(paths["user_did_path"])
+    config.anp_sdk.user_hosted_path = str(paths["user_hosted_path"])
+    os.makedirs(config.anp_sdk.user_did_path, exist_ok=True)
+    config.log_settings.log_level = "WARNING"
+    if not exempt_api:
+        config.auth_middleware.exempt_paths = [
+            p for p in config.auth_middleware.exempt_paths if not p.startswith("/agent/")]
+    return config
+
+
+class BenchContext:
+    """合成用户、Agent 与服务端"""
+
+    def __init__(self, port: int, users: int, agents: int):
+        self.port = port
+        self.base_url = f"http://localhost:{port}"
+        self.user_count = users
+        self.agent_count = agents
+        self.agent_dids: List[str] = []
+        self.caller_dids: List[str] = []
+        self.tokens: Dict[tuple, str] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[asyncio.Queue] = []
+        self._drainer: Optional[asyncio.Task] = None
+
+    def create_population(self):
+        from anp_foundation.anp_user_local_data import create_did_user, force_reload_user_data_manager
+        from anp_runtime.agent_decorator import agent_api, agent_message_handler, create_agent
+        from anp_runtime.agent_manager import AgentManager
+
+        force_reload_user_data_manager()
+        AgentManager.clear_all_agents()
+        for i in range(self.user_count):
+            document = create_did_user({"name": f"bench_user_{i}", "host": "localhost", "port": self.port,
+                                        "dir": "wba", "type": "user"})
+            if document is None:
+                raise RuntimeError(f"创建合成用户失败: bench_user_{i}")
+            (self.agent_dids if i < self.agent_count else self.caller_dids).append(document["id"])
+
+        for index, did in enumerate(self.agent_dids):
+            agent = create_agent(did, f"bench_agent_{index}")
+
+            async def echo(request_data, request):
+                return {"echo": request_data.get("params", {})}
+
+            async def on_text(msg_data):
+                return {"reply": msg_data.get("content", "")}
+
+            agent_api(agent, "/echo", auto_wrap=False)(echo)
+            agent_message_handler(agent, "text", auto_wrap=False)(on_text)
+
+    def start_server(self):
+        import uvicorn
+        from anp_server.baseline.anp_server_baseline import ANP_Server
+
+        app = ANP_Server(port=self.port).app
+        self._server = uvicorn.Server(uvicorn.Config(app, host="localhost", port=self.port,
+                                                     log_level="warning", access_log=False))
+        self._thread = threading.Thread(target=self._server.run, name="bench-server", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 15
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError(f"基准测试服务端未能在端口 {self.port} 启动")
+            time.sleep(0.05)
+
+    def stop_server(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+
+    async def prepare(self):
+        """预热：每对调用方/Agent 完成一次 DIDWba 认证以获取 token，调用方加入群组并登记监听者"""
+        from anp_foundation.anp_user import ANPUser
+        from anp_runtime.anp_service.agent_api_call import agent_api_call_post
+        from anp_runtime.global_router_agent_message import GlobalGroupManager, GroupRunner
+
+        self.session = aiohttp.ClientSession()
+        for caller, target in itertools.product(self.caller_dids, self.agent_dids):
+            await agent_api_call_post(caller, target, "/echo", {"warmup": True})
+            token_info = ANPUser.from_did(target).contact_manager.get_token_to_remote(caller)
+            if not token_info:
+                raise RuntimeError(f"预热后未获得 token: {caller} -> {target}")
+            self.tokens[(caller, target)] = token_info["token"]
+
+        GlobalGroupManager.register_runner(GROUP_ID, GroupRunner)
+        runner = GlobalGroupManager.get_runner(GROUP_ID)
+        runner.listener_queue_size = 1 << 16
+        for caller in self.caller_dids:
+            status, _ = await self.bearer_post(caller, self.agent_dids[0], f"/group/{GROUP_ID}/join", {})
+            if status != 200:
+                raise RuntimeError(f"加入群组失败: {caller} status={status}")
+            self._listeners.append(runner.register_listener(caller))
+        self._drainer = asyncio.create_task(self._drain_listeners())
+
+    async def _drain_listeners(self):
+        # 模拟 SSE 消费端取走扇出的事件
+        while True:
+            for queue in self._listeners:
+                while not queue.empty():
+                    queue.get_nowait()
+            await asyncio.sleep(0.01)
+
+    async def close(self):
+        if self._drainer is not None:
+            self._drainer.cancel()
+            await asyncio.gather(self._drainer, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+
+    def pair(self, i: int) -> tuple:
+        return self.caller_dids[i % len(self.caller_dids)], self.agent_dids[i % len(self.agent_dids)]
+
+    async def bearer_post(self, caller: str, target: str, path: str, body: Dict[str, Any]):
+        url = (f"{self.base_url}/agent/api/{quote(target)}{path}?"
+               f"{urlencode({'req_did': caller, 'resp_did': target})}")
+        headers = {"Authorization": f"Bearer {self.tokens[(caller, target)]}",
+                   "req_did": caller, "resp_did": target}
+        async with self.session.post(url, json=body, headers=headers) as response:
+            return response.status, await response.read()
+
+
+async def run_didwba(ctx: BenchContext, i: int) -> bool:
+    from anp_runtime.anp_service.agent_api_call import agent_api_call_post
+    caller, target = ctx.pair(i)
+    result = await agent_api_call_post(caller, target, "/echo", {"i": i})
+    return "error" not in result
+
+
+async def run_bearer(ctx: BenchContext, i: int) -> bool:
+    caller, target = ctx.pair(i)
+    status, _ = await ctx.bearer_post(caller, target, "/echo", {"params": {"i": i}})
+    return status == 200
+
+
+async def run_message(ctx: BenchContext, i: int) -> bool:
+    from anp_runtime.anp_service.agent_message_p2p import agent_msg_post
+    caller, target = ctx.pair(i)
+    result = await agent_msg_post(caller, target, f"bench message {i}")
+    return "error" not in result
+
+
+async def run_group(ctx: BenchContext, i: int) -> bool:
+    caller, _ = ctx.pair(i)
+    status, body = await ctx.bearer_post(caller, ctx.agent_dids[0], f"/group/{GROUP_ID}/message",
+                                         {"content": f"bench group {i}"})
+    return status == 200 and json_codec.loads(body).get("status") == "success"
+
+
+async def run_did_doc(ctx: BenchContext, i: int) -> bool:
+    did = (ctx.agent_dids + ctx.caller_dids)[i % ctx.user_count]
+    async with ctx.session.get(f"{ctx.base_url}/wba/user/{did.rsplit(':', 1)[-1]}/did.json") as response:
+        await response.read()
+        return response.status == 200
+
+
+RUNNERS: Dict[str, Callable[[BenchContext, int], Awaitable[bool]]] = {
+    "didwba": run_didwba,
+    "bearer": run_bearer,
+    "message": run_message,
+    "group": run_group,
+    "did_doc": run_did_doc,
+}
+
+
+class ScenarioStats:
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def report(self) -> Dict[str, Any]:
+        count = self.histogram.count
+        percentiles = self.histogram.percentiles((0.5, 0.9, 0.99))
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "elapsed_s": round(self.elapsed, 3),
+            "throughput_rps": round(count / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": percentiles[0.5] / 1000,
+            "p90_ms": percentiles[0.9] / 1000,
+            "p99_ms": percentiles[0.99] / 1000,
+            "max_ms": self.histogram.max_us / 1000,
+        }
+
+
+async def drive(ctx: BenchContext, plan: List[str], concurrency: int, stats: Dict[str, ScenarioStats]):
+    """concurrency 个并发工作协程依次执行 plan 中的请求"""
+    counter = itertools.count()
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if i >= len(plan):
+                return
+            name = plan[i]
+            started = time.perf_counter()
+            try:
+                ok = await RUNNERS[name](ctx, i)
+            except Exception:
+                ok = False
+            stats[name].histogram.record((time.perf_counter() - started) * 1e6)
+            if not ok:
+                stats[name].errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run_benchmark(ctx: BenchContext, mix: Dict[str, float], requests: int, concurrency: int,
+                        mode: str, seed: int) -> Dict[str, Any]:
+    await ctx.prepare()
+    get_tracer().reset()
+    stats = {name: ScenarioStats() for name in mix}
+    total_weight = sum(mix.values())
+    counts = {name: max(1, round(requests * weight / total_weight)) for name, weight in mix.items()}
+    try:
+        if mode == "mixed":
+            # 各场景请求随机交错，反映真实流量下的相互影响
+            plan = [name for name, count in counts.items() for _ in range(count)]
+            random.Random(seed).shuffle(plan)
+            started = time.perf_counter()
+            await drive(ctx, plan, concurrency, stats)
+            elapsed = time.perf_counter() - started
+            for s in stats.values():
+                s.elapsed = elapsed
+        else:
+            for name, count in counts.items():
+                started = time.perf_counter()
+                await drive(ctx, [name] * count, concurrency, stats)
+                stats[name].elapsed = time.perf_counter() - started
+    finally:
+        await ctx.close()
+    return {name: s.report() for name, s in stats.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANP server load benchmark")
+    parser.add_argument("--users", type=int, default=8, help="合成用户总数（含 Agent）")
+    parser.add_argument("--agents", type=int, default=2, help="其中注册为 Agent 的用户数")
+    parser.add_argument("--requests", type=int, default=200, help="按权重分配到各场景的请求总数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(",".join(SCENARIOS)))
+    parser.add_argument("--mode", choices=("sequential", "mixed"), default="sequential")
+    parser.add_argument("--port", type=int, default=9627)
+    parser.add_argument("--config", default=DEFAULT_CONFIG)
+    parser.add_argument("--exempt-api", action="store_true", help="保留 /agent/api/* 的认证豁免")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="报告写入的文件，默认输出到标准输出")
+    parser.add_argument("--keep-data", action="store_true", help="保留临时用户目录")
+    args = parser.parse_args()
+    if not 0 < args.agents < args.users:
+        parser.error("--agents 必须大于0且小于 --users")
+
+    workdir = tempfile.mkdtemp(prefix="anp_bench_")
+    build_config(args.config, args.port, workdir, args.exempt_api)
+    ctx = BenchContext(args.port, args.users, args.agents)
+    try:
+        ctx.create_population()
+        ctx.start_server()
+        scenarios = asyncio.run(run_benchmark(ctx, args.mix, args.requests, args.concurrency,
+                                              args.mode, args.seed))
+    finally:
+        ctx.stop_server()
+        if not args.keep_data:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "users": args.users,
+        "agents": args.agents,
+        "concurrency": args.concurrency,
+        "mode": args.mode,
+        "mix": args.mix,
+        "python": platform.python_version(),
+        "json_codec": json_codec.get_json_codec().name,
+        "scenarios": scenarios,
+        "stages": get_tracer().stats(),
+    }
+    output = json_codec.dumps_bytes(report).decode("utf-8")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
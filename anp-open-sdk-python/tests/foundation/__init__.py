@@ -0,0 +1,3 @@
+"""
+基础模块测试
+"""
\ No newline at end of file
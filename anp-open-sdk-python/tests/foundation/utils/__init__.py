@@ -0,0 +1,3 @@
+"""
+工具模块测试
+"""
\ No newline at end of file
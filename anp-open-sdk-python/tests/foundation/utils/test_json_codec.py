@@ -0,0 +1,69 @@
+"""
+JSON 编解码层测试
+
+测试后端选择、标准库回退、解码错误类型以及 FastJSONResponse
+"""
+
+import json
+
+import pytest
+
+from anp_foundation.utils import json_codec
+
+
+@pytest.fixture(params=json_codec.available_codecs())
+def codec_name(request):
+    """在每个可用后端上运行测试"""
+    json_codec.set_json_codec(request.param)
+    yield request.param
+    json_codec.set_json_codec()
+
+
+class TestJsonCodec:
+    """测试编解码函数"""
+
+    def test_roundtrip(self, codec_name):
+        """测试编码后解码得到原对象"""
+        data = {"did": "did:wba:localhost%3A9527:wba:user:1", "描述": "中文内容", "n": [1, 2.5, None, True]}
+        assert json_codec.loads(json_codec.dumps(data)) == data
+        assert json_codec.loads(json_codec.dumps_bytes(data)) == data
+
+    def test_output_is_compact_utf8(self, codec_name):
+        """测试输出为紧凑格式且不转义非ASCII字符"""
+        assert json_codec.dumps({"a": "中"}) == '{"a":"中"}'
+
+    def test_ascii_only(self, codec_name):
+        """测试 ascii_only 时输出可直接放入HTTP头"""
+        text = json_codec.dumps({"a": "中"}, ascii_only=True)
+        assert text.isascii()
+        assert json.loads(text) == {"a": "中"}
+
+    def test_decode_error_type(self, codec_name):
+        """测试解码失败统一抛出 json.JSONDecodeError"""
+        with pytest.raises(json.JSONDecodeError):
+            json_codec.loads("{not json")
+
+    def test_fallback_for_unsupported_values(self, codec_name):
+        """测试快速后端不支持的值回退到标准库"""
+        big = 2 ** 70
+        assert json_codec.loads(json_codec.dumps({"big": big})) == {"big": big}
+
+    def test_unserializable_raises_type_error(self, codec_name):
+        """测试无法序列化的对象抛出 TypeError"""
+        with pytest.raises(TypeError):
+            json_codec.dumps({"obj": object()})
+
+    def test_unknown_codec(self):
+        """测试未知后端名称"""
+        with pytest.raises(ValueError):
+            json_codec.set_json_codec("not-a-codec")
+
+
+class TestFastJSONResponse:
+    """测试 FastJSONResponse"""
+
+    def test_render(self, codec_name):
+        response = json_codec.FastJSONResponse(content={"status": "ok", "内容": 1}, status_code=201)
+        assert response.status_code == 201
+        assert response.headers["content-type"] == "application/json"
+        assert json.loads(response.body) == {"status": "ok", "内容": 1}
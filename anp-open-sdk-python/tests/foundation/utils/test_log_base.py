@@ -0,0 +1,80 @@
+"""
+异步日志管道测试
+
+测试 DEBUG 采样、结构化 JSON 输出、队列满时不阻塞、入队时固定消息参数，以及格式化器输出在后台线程完成
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+
+from anp_foundation.utils import tracing
+from anp_foundation.utils.log_base import JsonFormatter, LogQueueListener, NonBlockingQueueHandler, SamplingFilter
+
+
+def _record(name="anp_foundation.auth.auth_verifier", level=logging.DEBUG, msg="m %s", args=("x",)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = []
+
+    def emit(self, record):
+        self.threads.append(threading.current_thread())
+        self.records.append(self.format(record))
+
+
+class TestLogPipeline:
+    """日志管道测试"""
+
+    def test_sampling_by_longest_prefix(self):
+        sampling = SamplingFilter({"anp_foundation": 1.0, "anp_foundation.auth": 0.0})
+        assert not sampling.filter(_record())
+        assert sampling.filter(_record(level=logging.INFO))
+        assert sampling.filter(_record(name="anp_foundation.did"))
+        assert sampling.filter(_record(name="anp_foundation.authx"))
+        assert sampling.rate_for("anp_foundation.auth.x") == 0.0
+
+    def test_json_output_carries_trace_id(self):
+        formatter = JsonFormatter()
+        with tracing.Tracer().span("http.request") as root:
+            line = formatter.format(_record())
+        entry = json.loads(line)
+        assert entry["message"] == "m x" and entry["level"] == "DEBUG"
+        assert entry["trace_id"] == root.trace_id
+
+    def test_queue_formats_in_background_and_drops_when_full(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        capture = _Capture()
+        logger = logging.getLogger("tests.log_pipeline")
+        logger.propagate = False
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        try:
+            payload = ["a"]
+            logger.debug("value %s", payload)
+            logger.debug("value %s", "b")
+            assert handler.dropped == 1
+            # 入队后修改参数不影响已入队的消息
+            payload.append("late")
+            queued = handler.queue.queue[0]
+            assert queued.msg == "value ['a']" and queued.args is None
+
+            listener = LogQueueListener(handler.queue, capture)
+            listener.start()
+            try:
+                while not handler.queue.empty():
+                    time.sleep(0.001)
+                logger.error("boom", exc_info=ValueError("bad"))
+            finally:
+                listener.stop()
+        finally:
+            logger.removeHandler(handler)
+        assert capture.records[0] == "value ['a']"
+        assert capture.records[1].startswith("boom\nValueError: bad")
+        assert all(t is not threading.main_thread() for t in capture.threads)
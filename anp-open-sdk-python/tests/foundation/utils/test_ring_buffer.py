@@ -0,0 +1,56 @@
+"""
+环形缓冲区测试
+
+测试固定容量覆盖、按 key 的二级索引、最近 N 条查询以及溢出文件滚动
+"""
+
+import json
+
+import pytest
+
+from anp_foundation.utils.ring_buffer import RingBuffer, RotatingSpill
+
+
+class TestRingBuffer:
+    """环形缓冲区测试"""
+
+    def test_overwrites_oldest(self):
+        buffer = RingBuffer(3)
+        assert [buffer.append(i) for i in range(5)] == [None, None, None, 0, 1]
+        assert len(buffer) == 3 and buffer.total == 5 and buffer.evicted == 2
+        assert list(buffer) == [2, 3, 4]
+        assert buffer[0] == 2 and buffer[-1] == 4
+        assert buffer.recent(2) == [3, 4] and buffer.recent(10) == [2, 3, 4]
+        with pytest.raises(IndexError):
+            buffer[3]
+        with pytest.raises(ValueError):
+            RingBuffer(0)
+
+    def test_secondary_index_follows_evictions(self):
+        buffer = RingBuffer(4, key_funcs={"did": lambda r: (r[0], r[1])})
+        for record in [("a", "b", 1), ("a", "a", 2), ("c", "b", 3), ("a", "c", 4), ("b", "c", 5)]:
+            buffer.append(record)
+        # ("a", "b", 1) 已被覆盖，同一记录中重复的 key 只索引一次
+        assert [r[2] for r in buffer.recent_by("did", "a", 10)] == [2, 4]
+        assert [r[2] for r in buffer.recent_by("did", "b", 10)] == [3, 5]
+        assert [r[2] for r in buffer.recent_by("did", "c", 2)] == [4, 5]
+        assert buffer.count_by("did", "a") == 2
+        assert buffer.recent_by("did", "missing", 5) == []
+
+        for i in range(4):
+            buffer.append(("z", None, i))
+        assert buffer.keys("did") == ["z"]
+
+    def test_spill_evicted_records_with_rotation(self, tmp_path):
+        spill = RotatingSpill(tmp_path / "records.jsonl", max_bytes=20, backup_count=2)
+        buffer = RingBuffer(2, spill=spill)
+        for i in range(10):
+            buffer.append({"n": i})
+        buffer.flush()
+        spill.close()
+
+        files = sorted(tmp_path.iterdir())
+        assert [f.name for f in files] == ["records.jsonl", "records.jsonl.1", "records.jsonl.2"]
+        spilled = [json.loads(line)["n"] for f in reversed(files) for line in f.read_text().splitlines()]
+        # 最早的记录随滚动被丢弃，保留的记录按写入顺序排列，最后是停机前 flush 的内容
+        assert spilled == sorted(spilled) and spilled[-2:] == [8, 9]
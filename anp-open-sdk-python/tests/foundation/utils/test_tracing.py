@@ -0,0 +1,116 @@
+"""
+请求链路追踪测试
+
+测试直方图分位数精度、span 嵌套与 trace_id 传递、traceparent 解析、
+Prometheus 文本输出，以及 ApiCallRecord 自动填充耗时
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from anp_foundation.utils import tracing
+from anp_foundation.utils.tracing import LatencyHistogram, Tracer, current_span, parse_traceparent
+from anp_runtime.agent_manager import ApiCallRecord
+
+
+@pytest.fixture
+def tracer():
+    """每个用例一个独立的全局 Tracer"""
+    tracer = Tracer()
+    tracing.set_tracer(tracer)
+    yield tracer
+    tracing.set_tracer(None)
+
+
+class TestLatencyHistogram:
+    """直方图测试"""
+
+    def test_percentiles_within_relative_error(self):
+        histogram = LatencyHistogram()
+        values = [random.randint(1, 5_000_000) for _ in range(20000)]
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for q, estimate in histogram.percentiles((0.5, 0.9, 0.99)).items():
+            exact = values[max(0, int(q * len(values) + 0.5) - 1)]
+            assert abs(estimate - exact) / exact < 0.02
+        assert histogram.percentile(1.0) == max(values)
+        assert histogram.count == len(values) and histogram.min_us == min(values)
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 101):
+            histogram.record(value)
+        assert histogram.percentiles((0.5, 0.99)) == {0.5: 50, 0.99: 99}
+        assert LatencyHistogram().percentile(0.5) == 0
+
+
+class TestTracer:
+    """span 与导出测试"""
+
+    @pytest.mark.asyncio
+    async def test_nested_spans_share_trace_id(self, tracer):
+        seen = {}
+
+        async def child(name):
+            with tracing.span(name) as s:
+                await asyncio.sleep(0)
+                seen[name] = s
+
+        with tracing.span("http.request") as root:
+            await asyncio.gather(child("a"), child("b"))
+            assert current_span.get() is root
+        assert current_span.get() is None
+        assert seen["a"].trace_id == seen["b"].trace_id == root.trace_id
+        assert seen["a"].parent_id == root.span_id
+        assert set(tracer.stats()) == {"http.request", "a", "b"}
+
+    def test_traceparent_continues_remote_trace(self, tracer):
+        header = "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+        assert parse_traceparent(header) == ("ab" * 16, "cd" * 8)
+        assert parse_traceparent("00-" + "0" * 32 + "-" + "cd" * 8 + "-01") is None
+        assert parse_traceparent("garbage") is None
+        with tracing.span("http.request", traceparent=header) as root:
+            with tracing.span("auth") as inner:
+                pass
+        assert root.trace_id == inner.trace_id == "ab" * 16
+        assert root.parent_id == "cd" * 8
+        assert inner.traceparent.startswith("00-" + "ab" * 16 + "-" + inner.span_id)
+
+    def test_prometheus_output_and_errors(self, tracer):
+        for ms in (1, 2, 3):
+            tracer.record("auth.verify", ms)
+        with pytest.raises(RuntimeError):
+            with tracing.span('router "x"'):
+                raise RuntimeError("boom")
+        text = tracer.render_prometheus()
+        assert '# TYPE anp_stage_latency_seconds summary' in text
+        assert 'anp_stage_latency_seconds_count{stage="auth.verify"} 3' in text
+        assert 'anp_stage_latency_seconds{stage="auth.verify",quantile="0.5"} 0.002' in text
+        assert 'anp_stage_errors_total{stage="router \\"x\\""} 1' in text
+        assert tracer.stats()["auth.verify"]["p50_ms"] == pytest.approx(2, rel=0.02)
+
+    def test_disabled_tracer_records_nothing(self):
+        tracer = Tracer(enabled=False)
+        with tracer.span("auth") as s:
+            s.set_attribute("k", "v")
+        assert s.traceparent is None
+        assert tracer.stats() == {}
+
+    @pytest.mark.asyncio
+    async def test_traced_decorator_and_api_call_duration(self, tracer):
+        record = ApiCallRecord()
+
+        @tracing.traced("agent.handle_request")
+        async def handler():
+            await asyncio.sleep(0.01)
+            record.record_api_call("a", "b", "/x", "POST", {}, {"status": "success"})
+            return "ok"
+
+        assert await handler() == "ok"
+        assert record.api_calls[0]["duration_ms"] >= 10
+        assert tracer.stats()["agent.handle_request"]["count"] == 1
+        record.record_api_call("a", "b", "/x", "POST", {}, {"status": "success"}, duration_ms=5)
+        assert record.api_calls[1]["duration_ms"] == 5
@@ -0,0 +1 @@
+"""anp_service 测试"""
@@ -0,0 +1,237 @@
+"""
+群组消息扇出测试
+
+测试 ListenerQueue 的三种溢出策略、积压指标，两个 GroupRunner 的非阻塞广播，
+以及一次编码的 SSE 帧、心跳与 Last-Event-ID 续传
+"""
+
+import asyncio
+
+import pytest
+
+from anp_runtime.anp_service.anp_sdk_group_fanout import (
+    COALESCE,
+    DISCONNECT,
+    DROP_OLDEST,
+    HEARTBEAT_FRAME,
+    ListenerDisconnected,
+    ListenerQueue,
+    ReplayBuffer,
+    fan_out
+)
+from anp_runtime.anp_service import anp_sdk_group_runner as sdk_runner
+from anp_runtime.global_router_agent_message import (
+    GlobalGroupManager,
+    GlobalMessageManager,
+    GroupAgent,
+    GroupRunner
+)
+
+
+def _msg(seq: int, sender: str = "a", type: str = "text"):
+    return {"type": type, "sender_id": sender, "content": seq}
+
+
+class TestListenerQueue:
+    """有界监听队列测试"""
+
+    def test_drop_oldest(self):
+        queue = ListenerQueue(maxsize=3, overflow=DROP_OLDEST)
+        for i in range(5):
+            queue.put_nowait(_msg(i))
+        assert [queue.get_nowait()["content"] for _ in range(3)] == [2, 3, 4]
+        stats = queue.stats()
+        assert stats["dropped"] == 2
+        assert stats["enqueued"] == 5
+        assert stats["delivered"] == 3
+        assert stats["max_depth"] == 3
+
+    @pytest.mark.asyncio
+    async def test_disconnect_wakes_consumer(self):
+        queue = ListenerQueue(maxsize=2, overflow=DISCONNECT)
+        queue.put_nowait(_msg(0))
+        queue.put_nowait(_msg(1))
+        with pytest.raises(ListenerDisconnected):
+            queue.put_nowait(_msg(2))
+        assert queue.closed and queue.stats()["dropped"] == 2
+        with pytest.raises(ListenerDisconnected):
+            await asyncio.wait_for(queue.get(), 1)
+
+    def test_coalesce_replaces_same_key(self):
+        queue = ListenerQueue(maxsize=2, overflow=COALESCE)
+        queue.put_nowait(_msg(0, sender="a"))
+        queue.put_nowait(_msg(1, sender="b"))
+        queue.put_nowait(_msg(2, sender="a"))
+        # 没有可合并的消息时退化为丢弃最旧
+        queue.put_nowait(_msg(3, sender="c"))
+        assert [queue.get_nowait()["content"] for _ in range(2)] == [2, 3]
+        assert queue.stats()["coalesced"] == 1
+        assert queue.stats()["dropped"] == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("overflow", [DROP_OLDEST, COALESCE, DISCONNECT])
+    async def test_join_after_overflow(self, overflow):
+        """溢出丢弃、合并或断开之后，消费完剩余消息即可 join"""
+        queue = ListenerQueue(maxsize=2, overflow=overflow)
+        for i in range(4):
+            try:
+                queue.put_nowait(_msg(i, sender="a" if i % 2 else "b"))
+            except ListenerDisconnected:
+                break
+        while not queue.empty():
+            try:
+                queue.get_nowait()
+            except ListenerDisconnected:
+                break
+            queue.task_done()
+        await asyncio.wait_for(queue.join(), 1)
+
+    def test_invalid_policy(self):
+        with pytest.raises(ValueError):
+            ListenerQueue(overflow="block")
+
+    def test_fan_out_reports_disconnected(self):
+        slow = ListenerQueue(maxsize=1, overflow=DISCONNECT)
+        fast = ListenerQueue(maxsize=8)
+        listeners = {"slow": slow, "fast": fast, "me": ListenerQueue()}
+        assert fan_out(listeners, _msg(0), exclude=["me"]) == []
+        assert fan_out(listeners, _msg(1), exclude=["me"]) == ["slow"]
+        assert fast.qsize() == 2
+        assert listeners["me"].qsize() == 0
+
+
+class TestGroupRunnerBroadcast:
+    """GroupRunner 广播测试"""
+
+    def teardown_method(self):
+        GlobalGroupManager.clear_groups()
+
+    @pytest.mark.asyncio
+    async def test_global_runner_never_blocks_on_slow_listener(self):
+        class BoundedRunner(GroupRunner):
+            listener_queue_size = 4
+            listener_overflow = DISCONNECT
+
+        GlobalGroupManager.register_runner("g1", BoundedRunner)
+        runner = GlobalGroupManager.get_runner("g1")
+        slow = runner.register_listener("slow")
+        runner.register_listener("ok", asyncio.Queue())
+
+        for i in range(5):
+            await asyncio.wait_for(runner.broadcast_message(_msg(i)), 0.1)
+
+        assert "slow" not in runner.listeners
+        assert slow.closed
+        assert runner.listeners["ok"].qsize() == 5
+        stats = GlobalGroupManager.get_group_stats("g1")
+        assert set(stats["listeners"]) == {"ok"}
+
+    @pytest.mark.asyncio
+    async def test_sdk_runner_broadcast_and_lag_stats(self):
+        class EchoRunner(sdk_runner.GroupRunner):
+            listener_queue_size = 2
+
+            async def on_agent_join(self, agent):
+                return True
+
+            async def on_agent_leave(self, agent):
+                pass
+
+            async def on_message(self, message):
+                return None
+
+        runner = EchoRunner("g2")
+        queue = runner.register_listener("a1")
+        runner.register_listener("a2")
+        for i in range(3):
+            await runner.broadcast(sdk_runner.Message(
+                type=sdk_runner.MessageType.TEXT, content=i, sender_id="a2",
+                group_id="g2", timestamp=0.0
+            ), exclude=["a2"])
+
+        stats = runner.get_listener_stats()
+        assert stats["a1"]["depth"] == 2 and stats["a1"]["dropped"] == 1
+        assert stats["a2"]["enqueued"] == 0
+        assert (await queue.get())["content"] == 1
+
+
+class TestReplayBuffer:
+    """重放缓冲区测试"""
+
+    def test_since_returns_events_after_seq(self):
+        buffer = ReplayBuffer(maxlen=3)
+        events = [buffer.publish(_msg(i)) for i in range(5)]
+        assert [e.seq for e in events] == [1, 2, 3, 4, 5]
+        assert [e.seq for e in buffer.since(3)] == [4, 5]
+        # 早于缓冲区的续传只能拿到仍保留的事件
+        assert [e.seq for e in buffer.since(0)] == [3, 4, 5]
+        assert buffer.since(5) == []
+
+    def test_frame_is_encoded_once(self):
+        event = ReplayBuffer().publish({"type": "text", "content": "你好"})
+        assert event.frame.startswith(b"id: 1\ndata: ")
+        assert event.frame.endswith(b"\n\n")
+        assert "你好".encode("utf-8") in event.frame
+
+
+async def _read_frames(response, count: int, timeout: float = 1.0):
+    frames = []
+    iterator = response.body_iterator
+    for _ in range(count):
+        frames.append(await asyncio.wait_for(iterator.__anext__(), timeout))
+    await iterator.aclose()
+    return frames
+
+
+class TestGroupSSE:
+    """群组 SSE 连接测试"""
+
+    def teardown_method(self):
+        GlobalGroupManager.clear_groups()
+
+    async def _join(self, group_id: str, agent_id: str):
+        runner = GlobalGroupManager.get_runner(group_id)
+        runner.agents[agent_id] = GroupAgent(id=agent_id, name=agent_id)
+        return runner
+
+    @pytest.mark.asyncio
+    async def test_shared_frames_and_resume(self):
+        GlobalGroupManager.register_runner("sse", GroupRunner)
+        runner = await self._join("sse", "a1")
+        await self._join("sse", "a2")
+
+        first = await GlobalMessageManager.route_group_request(
+            "did", "sse", "connect", {"req_did": "a1"}, None)
+        second = await GlobalMessageManager.route_group_request(
+            "did", "sse", "connect", {"req_did": "a2"}, None)
+        event = await runner.broadcast_message(_msg(1))
+        assert runner.listeners["a1"]._queue[0] is runner.listeners["a2"]._queue[0] is event
+        assert (await _read_frames(first, 1))[0] is event.frame
+        assert (await _read_frames(second, 1))[0] is event.frame
+        assert runner.listeners == {}
+
+        await runner.broadcast_message(_msg(2))
+        await runner.broadcast_message(_msg(3))
+        resumed = await GlobalMessageManager.route_group_request(
+            "did", "sse", "connect", {"req_did": "a1", "last_event_id": "1"}, None)
+        await runner.broadcast_message(_msg(4))
+        frames = await _read_frames(resumed, 3)
+        assert [f.split(b"\n", 1)[0] for f in frames] == [b"id: 2", b"id: 3", b"id: 4"]
+
+    @pytest.mark.asyncio
+    async def test_heartbeat(self):
+        class QuietRunner(GroupRunner):
+            heartbeat_interval = 0.01
+
+        GlobalGroupManager.register_runner("hb", QuietRunner)
+        await self._join("hb", "a1")
+        response = await GlobalMessageManager.route_group_request(
+            "did", "hb", "connect", {"req_did": "a1"}, None)
+        assert await _read_frames(response, 1) == [HEARTBEAT_FRAME]
+
+    @pytest.mark.asyncio
+    async def test_connect_requires_membership(self):
+        GlobalGroupManager.register_runner("closed", GroupRunner)
+        result = await GlobalMessageManager.route_group_request(
+            "did", "closed", "connect", {"req_did": "stranger"}, None)
+        assert result["status"] == "error"
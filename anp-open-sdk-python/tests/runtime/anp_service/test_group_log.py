@@ -0,0 +1,230 @@
+"""
+群组消息持久化日志测试
+
+测试 GroupMessageLog 的偏移量、分段滚动、崩溃恢复、保留策略、游标翻页与后台批量写入，
+以及 GroupRunner 基于日志的重启续传与历史查询
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from anp_runtime.anp_service.anp_sdk_group_log import RECORD_HEADER, GroupMessageLog
+from anp_runtime.global_router_agent_message import (
+    GlobalGroupManager,
+    GlobalMessageManager,
+    GroupAgent,
+    GroupRunner
+)
+
+
+def _data(i: int) -> bytes:
+    return json.dumps({"content": i}).encode()
+
+
+class TestGroupMessageLog:
+    """分段日志测试"""
+
+    def test_offsets_and_segment_roll(self, tmp_path):
+        log = GroupMessageLog(tmp_path, segment_bytes=100)
+        assert log.first_offset == log.next_offset == 1
+        offsets = [log.append(_data(i)) for i in range(10)]
+        assert offsets == list(range(1, 11))
+        log.flush()
+        assert log.stats()["segments"] > 1
+
+        records = log.read(3, limit=5)
+        assert [r.offset for r in records] == [3, 4, 5, 6, 7]
+        assert [json.loads(r.data)["content"] for r in records] == [2, 3, 4, 5, 6]
+        assert log.read(11) == []
+        log.close()
+
+        reopened = GroupMessageLog(tmp_path, segment_bytes=100)
+        assert reopened.next_offset == 11
+        assert reopened.append(_data(10)) == 11
+        assert [r.offset for r in reopened.read(1, limit=100)] == list(range(1, 12))
+        reopened.close()
+
+    def test_truncates_torn_tail(self, tmp_path):
+        log = GroupMessageLog(tmp_path)
+        log.append(_data(0))
+        log.append(_data(1))
+        log.close()
+        segment = next(tmp_path.glob("*.log"))
+        with open(segment, "ab") as f:
+            f.write(RECORD_HEADER.pack(3, 0.0, 100, 0) + b"partial")
+
+        reopened = GroupMessageLog(tmp_path)
+        assert reopened.next_offset == 3
+        assert reopened.append(_data(2)) == 3
+        assert [json.loads(r.data)["content"] for r in reopened.read(1)] == [0, 1, 2]
+        reopened.close()
+
+    def test_retention_by_size_and_time(self, tmp_path):
+        log = GroupMessageLog(tmp_path, segment_bytes=60, retention_seconds=None, retention_bytes=150)
+        for i in range(12):
+            log.append(_data(i), timestamp=1000.0 + i)
+        log.enforce_retention(now=1100.0)
+        assert log.size_bytes <= 150 + 60
+        assert log.first_offset > 1
+        assert log.read(1)[0].offset == log.first_offset
+
+        log.retention_bytes = None
+        log.retention_seconds = 10
+        # 追加时距上次检查超过检查间隔，会顺带执行保留策略
+        log.append(_data(12), timestamp=2000.0)
+        log.flush()
+        assert log.stats()["segments"] == 1
+        assert [r.offset for r in log.read(0)] == [13]
+        log.close()
+
+    def test_cursor_pages(self, tmp_path):
+        log = GroupMessageLog(tmp_path, segment_bytes=80)
+        for i in range(7):
+            log.append(_data(i))
+        cursor = log.cursor()
+        pages = []
+        while cursor.lag:
+            pages.append([r.offset for r in cursor.read(3)])
+        assert pages == [[1, 2, 3], [4, 5, 6], [7]]
+        assert cursor.read(3) == [] and cursor.offset == 8
+        log.close()
+
+    def test_writes_on_background_thread(self, tmp_path):
+        log = GroupMessageLog(tmp_path)
+        threads = []
+        writer = log._writer
+
+        class RecordingWriter:
+            def write(self, data):
+                threads.append(threading.current_thread().name)
+                return writer.write(data)
+
+            def __getattr__(self, name):
+                return getattr(writer, name)
+
+        log._writer = RecordingWriter()
+        offsets = [log.append(_data(i)) for i in range(50)]
+        assert offsets == list(range(1, 51)) and log.next_offset == 51
+        deadline = time.monotonic() + 5
+        while log.stats()["pending"] or log._segments[-1].next_offset < 51:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+        assert threads and set(threads) == {"group-log-writer"}
+        log._writer = writer
+        assert [json.loads(r.data)["content"] for r in log.read(1, 100)] == list(range(50))
+        log.close()
+
+    def test_reads_include_pending_and_write_failure_surfaces(self, tmp_path):
+        log = GroupMessageLog(tmp_path)
+        with log._flush_lock:
+            log.append(_data(0))
+            log.append(_data(1))
+            assert log.stats()["pending"] == 2
+        assert [r.offset for r in log.read(1)] == [1, 2]
+
+        class BrokenWriter:
+            def write(self, data):
+                raise OSError("disk full")
+
+        writer, log._writer = log._writer, BrokenWriter()
+        with log._flush_lock:
+            log.append(_data(2))
+        # 后台线程可能先执行了这次写入；无论由谁写入，错误都已记录
+        try:
+            log.flush()
+        except OSError:
+            pass
+        with pytest.raises(OSError):
+            log.append(_data(3))
+        log._writer = writer
+        log.close()
+        reopened = GroupMessageLog(tmp_path)
+        assert [r.offset for r in reopened.read(1)] == [1, 2]
+        reopened.close()
+
+
+class TestGroupRunnerLog:
+    """群组运行器日志集成测试"""
+
+    def teardown_method(self):
+        GlobalGroupManager.clear_groups()
+
+    @pytest.mark.asyncio
+    async def test_resume_beyond_replay_buffer_after_restart(self, tmp_path):
+        class LoggedRunner(GroupRunner):
+            replay_buffer_size = 2
+            message_log_path = str(tmp_path)
+
+        runner = LoggedRunner("g/1")
+        for i in range(5):
+            event = await runner.broadcast_message({"content": i})
+        assert event.seq == 5
+        runner.close_message_log()
+
+        restarted = LoggedRunner("g/1")
+        event = await restarted.broadcast_message({"content": 5})
+        assert event.seq == 6
+        replay = list(restarted.replay_since(2))
+        assert [e.seq for e in replay] == [3, 4, 5, 6]
+        assert replay[0].frame == b'id: 3\ndata: {"content":2}\n\n'
+        assert replay[-1] is event
+        restarted.close_message_log()
+
+    @pytest.mark.asyncio
+    async def test_history_pages(self, tmp_path):
+        class LoggedRunner(GroupRunner):
+            message_log_path = str(tmp_path)
+
+        GlobalGroupManager.register_runner("hist", LoggedRunner)
+        runner = GlobalGroupManager.get_runner("hist")
+        runner.agents["a1"] = GroupAgent(id="a1", name="a1")
+        for i in range(5):
+            await runner.broadcast_message({"content": i, "timestamp": float(i)})
+
+        page = await GlobalMessageManager.route_group_request(
+            "did", "hist", "history", {"req_did": "a1", "offset": "2", "limit": "2"}, None)
+        assert page["status"] == "success"
+        assert [m["offset"] for m in page["messages"]] == [2, 3]
+        assert page["messages"][0]["message"] == {"content": 1, "timestamp": 1.0}
+        assert page["next_offset"] == 4 and page["end_offset"] == 6
+        assert GlobalGroupManager.get_group_stats("hist")["message_log"]["next_offset"] == 6
+
+        denied = await GlobalMessageManager.route_group_request(
+            "did", "hist", "history", {"req_did": "stranger"}, None)
+        assert denied["status"] == "error"
+
+    @pytest.mark.asyncio
+    async def test_history_without_log_uses_replay_buffer(self):
+        class MemoryRunner(GroupRunner):
+            message_log_enabled = False
+
+        runner = MemoryRunner("memory")
+        for i in range(3):
+            await runner.broadcast_message({"content": i})
+        assert runner.message_log is None
+        page = runner.read_history(0, 10)
+        assert [m["offset"] for m in page["messages"]] == [1, 2, 3]
+        assert page["first_offset"] == 1
+
+    @pytest.mark.asyncio
+    async def test_append_failure_keeps_seq_aligned(self, tmp_path, monkeypatch):
+        class LoggedRunner(GroupRunner):
+            message_log_path = str(tmp_path)
+
+        runner = LoggedRunner("broken")
+        for i in range(2):
+            await runner.broadcast_message({"content": i})
+        log = runner.message_log
+
+        def fail(data, timestamp=None):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(log, "append", fail)
+        event = await runner.broadcast_message({"content": 2})
+        assert event.seq == 3
+        assert runner.message_log is None
+        assert (await runner.broadcast_message({"content": 3})).seq == 4
+        assert [m["offset"] for m in runner.read_history(1)["messages"]] == [1, 2, 3, 4]
@@ -0,0 +1,114 @@
+"""
+群组成员 SDK 测试
+
+GroupMemberSDK 以 HTTP 方式经真实服务端路由（/agent/api/{did}/group/...）完成加入、消息、监听、
+历史、成员增量与批量操作的往返
+"""
+
+import asyncio
+import socket
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+import uvicorn
+from fastapi import FastAPI
+
+from anp_foundation.config import UnifiedConfig, set_global_config
+from anp_foundation.config import unified_config
+from anp_runtime.anp_service.anp_sdk_group_member import GroupMemberSDK
+from anp_runtime.global_router_agent_message import GlobalGroupManager, GroupRunner
+
+REPO_ROOT = Path(__file__).resolve().parents[4]
+
+
+class EchoRunner(GroupRunner):
+    """把收到的消息广播给所有成员"""
+
+    async def on_message(self, message):
+        await self.broadcast_message(message.to_dict())
+        return None
+
+
+def _unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def global_config():
+    previous = unified_config._global_config
+    set_global_config(UnifiedConfig(
+        config_file=str(REPO_ROOT / "unified_config.default.yaml"), app_root=str(REPO_ROOT)))
+    try:
+        yield
+    finally:
+        unified_config._global_config = previous
+
+
+@asynccontextmanager
+async def agent_server():
+    """在本进程启动挂载智能体路由的服务端"""
+    from anp_server.baseline.anp_router_baseline import router_agent
+
+    app = FastAPI()
+    app.include_router(router_agent.router)
+    port = _unused_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield port
+    finally:
+        server.should_exit = True
+        await task
+
+
+class TestGroupMemberHTTP:
+    """HTTP 传输往返测试"""
+
+    @pytest.fixture(autouse=True)
+    def runners(self, tmp_path, global_config):
+        class LoggedRunner(EchoRunner):
+            message_log_path = str(tmp_path)
+
+        for group_id in ("g1", "g2"):
+            GlobalGroupManager.register_runner(group_id, LoggedRunner)
+        yield
+        GlobalGroupManager.clear_groups()
+
+    @pytest.mark.asyncio
+    async def test_round_trip(self):
+        """测试客户端请求命中服务端注册的群组路由"""
+        async with agent_server() as port:
+            sdk = GroupMemberSDK("alice", port, base_url="http://127.0.0.1", use_local_optimization=False)
+            sdk.reconnect_delay = 0.05
+            received = asyncio.Queue()
+
+            async def on_message(message):
+                await received.put(message)
+
+            try:
+                assert await sdk.join_group("g1")
+                await sdk.listen_group("g1", on_message)
+                assert await sdk.send_message("g1", "hello")
+                message = await asyncio.wait_for(received.get(), 2)
+                assert (message.content, message.sender_id) == ("hello", "alice")
+
+                assert [m["id"] for m in await sdk.get_members("g1")] == ["alice"]
+                history = await sdk.get_history("g1", offset=1)
+                assert history["status"] == "success"
+                assert [m["message"]["content"] for m in history["messages"]] == ["hello"]
+
+                changes = await sdk.get_member_changes("g1")
+                assert [m["id"] for m in changes["joined"]] == ["alice"]
+
+                assert await sdk.join_groups(["g1", "g2"]) == {"g1": True, "g2": True}
+                assert await sdk.send_messages([{"group_id": "g2", "content": "batched"}]) == [True]
+                assert await sdk.leave_groups(["g2"]) == {"g2": True}
+                assert await sdk.leave_group("g1")
+                assert await sdk.get_members("g1") == []
+            finally:
+                await sdk.shutdown_all_listeners()
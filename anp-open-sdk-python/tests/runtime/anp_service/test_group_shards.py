@@ -0,0 +1,140 @@
+"""
+群组运行器分片测试
+
+测试同一群组按序执行、不同分片互不阻塞、固定放置与负载指标、分片内重入，
+以及 thread 模式下 CPU 密集的运行器不阻塞服务端事件循环
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from anp_runtime.anp_service.anp_sdk_group_shards import THREAD_MODE, GroupShardPool
+from anp_runtime.global_router_agent_message import (
+    GlobalGroupManager,
+    GlobalMessageManager,
+    GroupAgent,
+    GroupRunner
+)
+
+
+class RecordingRunner(GroupRunner):
+    """记录处理顺序，处理时间随消息内容变化"""
+
+    def __init__(self, group_id: str):
+        super().__init__(group_id)
+        self.handled = []
+        self.gate = None
+
+    async def on_message(self, message):
+        if self.gate is not None:
+            await self.gate.wait()
+        await asyncio.sleep(0.001 * (message.content % 3))
+        self.handled.append(message.content)
+        return None
+
+
+def _register(group_id: str, runner_class=RecordingRunner):
+    GlobalGroupManager.register_runner(group_id, runner_class)
+    runner = GlobalGroupManager.get_runner(group_id)
+    runner.agents["a1"] = GroupAgent(id="a1", name="a1")
+    return runner
+
+
+async def _send(group_id: str, content):
+    return await GlobalMessageManager.route_group_request(
+        "did", group_id, "message", {"req_did": "a1", "content": content}, None)
+
+
+class TestGroupShards:
+    """分片执行测试"""
+
+    def setup_method(self):
+        GlobalGroupManager.clear_groups()
+        GlobalGroupManager._shard_pool = GroupShardPool(shard_count=2)
+
+    def teardown_method(self):
+        GlobalGroupManager.clear_groups()
+
+    @pytest.mark.asyncio
+    async def test_ordered_delivery_per_group(self):
+        runner = _register("ordered")
+        results = await asyncio.gather(*(_send("ordered", i) for i in range(20)))
+        assert all(r["status"] == "success" for r in results)
+        assert runner.handled == list(range(20))
+
+    @pytest.mark.asyncio
+    async def test_slow_group_does_not_block_other_shard(self):
+        slow = _register("slow")
+        fast = _register("fast")
+        assert GlobalGroupManager.place_group("slow", shard=0) == "0"
+        GlobalGroupManager.place_group("fast", shard=1)
+
+        slow.gate = asyncio.Event()
+        pending = asyncio.create_task(_send("slow", 1))
+        await asyncio.wait_for(_send("fast", 2), 1)
+        assert fast.handled == [2] and slow.handled == []
+
+        stats = GlobalGroupManager.get_group_stats("slow")["shard"]
+        assert stats["shard"] == "0" and stats["pinned"]
+        assert stats["submitted"] == 1 and stats["processed"] == 0
+
+        slow.gate.set()
+        await asyncio.wait_for(pending, 1)
+        assert slow.handled == [1]
+
+    @pytest.mark.asyncio
+    async def test_dedicated_placement_and_reentrancy(self):
+        class ReentrantRunner(RecordingRunner):
+            async def on_message(self, message):
+                if message.content == "outer":
+                    # 在分片内再次调用群组接口不会自锁
+                    members = await GlobalMessageManager.route_group_request(
+                        "did", self.group_id, "members", {"req_did": "a1"}, None)
+                    self.handled.append(len(members["members"]))
+                return None
+
+        runner = _register("hot", ReentrantRunner)
+        assert GlobalGroupManager.place_group("hot", dedicated=True) == "dedicated:hot"
+        assert (await asyncio.wait_for(_send("hot", "outer"), 1))["status"] == "success"
+        assert runner.handled == [1]
+        names = [s["shard"] for s in GlobalGroupManager.get_shard_stats()]
+        assert names == ["0", "1", "dedicated:hot"]
+
+        GlobalGroupManager.unplace_group("hot")
+        assert [s["shard"] for s in GlobalGroupManager.get_shard_stats()] == ["0", "1"]
+        assert not GlobalGroupManager.get_group_stats("hot")["shard"]["pinned"]
+
+        with pytest.raises(ValueError):
+            GlobalGroupManager.place_group("hot", shard=5)
+
+    @pytest.mark.asyncio
+    async def test_thread_mode_keeps_event_loop_responsive(self):
+        GlobalGroupManager._shard_pool = GroupShardPool(shard_count=1, mode=THREAD_MODE)
+
+        class BlockingRunner(GroupRunner):
+            async def on_message(self, message):
+                time.sleep(0.2)  # CPU 密集或同步阻塞的处理
+                await self.broadcast_message(message.to_dict())
+                return None
+
+        runner = _register("cpu", BlockingRunner)
+        queue = runner.register_listener("a1")
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        try:
+            result = await asyncio.wait_for(_send("cpu", "work"), 2)
+        finally:
+            ticking.cancel()
+        assert result["status"] == "success"
+        assert ticks >= 5
+        event = queue.get_nowait()
+        assert event.message["content"] == "work" and event.seq == 1
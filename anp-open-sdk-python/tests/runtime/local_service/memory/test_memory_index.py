@@ -0,0 +1,126 @@
+"""
+记忆候选倒排索引测试
+
+测试 MemoryCandidateIndex 的增量维护、过滤条件与 WAND 取前 N 个
+"""
+
+import random
+
+import pytest
+
+from anp_runtime.local_service.memory.memory_index import MemoryCandidateIndex
+from anp_runtime.local_service.memory.memory_models import (
+    MemoryEntry,
+    MemoryType,
+    MemoryMetadata
+)
+
+
+def _memory(memory_id, keywords=(), tags=(), agent="alice", session_id=None, memory_type=MemoryType.CONTEXT):
+    return MemoryEntry(
+        id=memory_id,
+        memory_type=memory_type,
+        title=memory_id,
+        metadata=MemoryMetadata(agent, agent.title(), session_id=session_id,
+                                keywords=list(keywords), tags=list(tags))
+    )
+
+
+class TestMemoryCandidateIndex:
+    """测试记忆候选倒排索引"""
+    
+    @pytest.fixture
+    def index(self):
+        index = MemoryCandidateIndex()
+        index.add(_memory("m1", keywords=["search", "user"], tags=["important"], session_id="s1"))
+        index.add(_memory("m2", keywords=["search"], agent="bob", memory_type=MemoryType.ERROR))
+        index.add(_memory("m3", keywords=["order"], tags=["important"], session_id="s1"))
+        index.add(_memory("m4", keywords=["search", "user"], tags=["frequent"]))
+        return index
+    
+    def test_ranks_by_matched_terms(self, index):
+        """测试命中查询词越多越靠前，得分相同时新的在前"""
+        assert index.top_candidates(keywords=["search", "user"]) == ["m4", "m1", "m2"]
+        assert index.top_candidates(keywords=["search", "user"], tags=["important"]) == ["m1", "m4", "m3", "m2"]
+        assert index.top_candidates(keywords=["search", "user"], limit=1) == ["m4"]
+        assert index.top_candidates(keywords=["missing"]) == []
+    
+    def test_filters(self, index):
+        """测试 Agent、会话、记忆类型过滤与排除"""
+        assert index.top_candidates(keywords=["search"], agent_did="bob") == ["m2"]
+        assert index.top_candidates(keywords=["search", "order"], session_id="s1") == ["m3", "m1"]
+        assert index.top_candidates(keywords=["search"], memory_types=[MemoryType.CONTEXT]) == ["m4", "m1"]
+        assert index.top_candidates(keywords=["search"], exclude=["m4"]) == ["m2", "m1"]
+    
+    def test_newest_without_query_terms(self, index):
+        """测试没有查询词时按写入顺序返回最新的记忆"""
+        assert index.top_candidates(limit=2) == ["m4", "m3"]
+        assert index.top_candidates(session_id="s1") == ["m3", "m1"]
+        assert index.top_candidates(memory_types=[MemoryType.ERROR, MemoryType.PATTERN]) == ["m2"]
+    
+    def test_update_and_remove(self, index):
+        """测试更新记忆替换旧的索引项、删除后不再返回"""
+        index.add(_memory("m2", keywords=["order"], agent="bob"))
+        assert index.top_candidates(keywords=["search"]) == ["m4", "m1"]
+        assert index.top_candidates(keywords=["order"]) == ["m2", "m3"]
+        
+        index.remove(["m2", "m3", "unknown"])
+        assert "m2" not in index
+        assert len(index) == 2
+        assert index.top_candidates(keywords=["order"]) == []
+        assert index.top_candidates() == ["m4", "m1"]
+    
+    def test_compaction_drops_stale_entries(self):
+        """测试失效的倒排项累计过多后被压缩"""
+        index = MemoryCandidateIndex()
+        for i in range(2000):
+            index.add(_memory(f"m{i}", keywords=["common", f"k{i}"]))
+        index.remove([f"m{i}" for i in range(1500)])
+        stats = index.stats()
+        assert stats["memories"] == 500
+        assert stats["stale_entries"] == 0
+        # 每条记忆：全部、类型、Agent 与两个关键词
+        assert stats["live_entries"] == 500 * 5
+        assert index.top_candidates(keywords=["common"], limit=1) == ["m1999"]
+    
+    def test_updates_alone_trigger_compaction(self):
+        """测试只有更新没有删除时倒排表也不会无限增长"""
+        index = MemoryCandidateIndex()
+        for round_ in range(20):
+            for i in range(100):
+                index.add(_memory(f"m{i}", keywords=["common", f"k{round_}"]))
+        stats = index.stats()
+        assert stats["memories"] == 100
+        assert stats["stale_entries"] <= max(stats["live_entries"], 1024)
+        assert sum(len(postings) for postings in index._postings.values()) <= (
+            stats["live_entries"] + stats["stale_entries"])
+        assert index.top_candidates(keywords=["k0"]) == []
+        assert index.top_candidates(keywords=["k19"], limit=1) == ["m99"]
+    
+    def test_wand_matches_exhaustive_scoring(self):
+        """测试 WAND 提前终止的结果与逐条评分排序一致"""
+        rng = random.Random(7)
+        words = [f"w{i}" for i in range(20)]
+        index = MemoryCandidateIndex()
+        fields = {}
+        for i in range(1000):
+            keywords, tags = rng.sample(words, rng.randint(0, 4)), rng.sample(words, rng.randint(0, 2))
+            agent = rng.choice(["alice", "bob"])
+            index.add(_memory(f"m{i}", keywords=keywords, tags=tags, agent=agent))
+            fields[f"m{i}"] = (i, set(keywords), set(tags), agent)
+        
+        for _ in range(50):
+            query_keywords, query_tags = rng.sample(words, 3), rng.sample(words, 1)
+            agent = rng.choice([None, "alice"])
+            expected = sorted(
+                (
+                    (round(sum(0.6 / 3 for w in query_keywords if w in keywords)
+                           + sum(0.4 for w in query_tags if w in tags), 9), order, memory_id)
+                    for memory_id, (order, keywords, tags, memory_agent) in fields.items()
+                    if agent is None or memory_agent == agent
+                ),
+                reverse=True
+            )
+            expected = [memory_id for score, _, memory_id in expected if score > 0][:15]
+            assert index.top_candidates(keywords=query_keywords, tags=query_tags, agent_did=agent, limit=15,
+                                        keyword_weight=0.6, tag_weight=0.4) == expected
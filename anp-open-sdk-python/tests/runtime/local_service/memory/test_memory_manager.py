@@ -21,7 +21,7 @@ from anp_runtime.local_service.memory.memory_manager import (
     get_memory_manager,
     set_memory_manager
 )
-from anp_runtime.local_service.memory.memory_storage import InMemoryStorage
+from anp_runtime.local_service.memory.memory_storage import InMemoryStorage, SQLiteMemoryStorage
 from anp_runtime.local_service.memory.context_session import ContextSessionManager
 from anp_runtime.local_service.memory.memory_models import (
     MemoryEntry,
@@ -409,6 +409,83 @@ class TestMemorySearchEngine:
         assert same_similarity > similarity
 
 
+class TestSearchCacheInvalidation:
+    """测试搜索缓存按写入代数失效"""
+    
+    @pytest.fixture(params=["memory", "sqlite"])
+    def storage(self, request, tmp_path):
+        if request.param == "memory":
+            yield InMemoryStorage()
+            return
+        # 写入停留在后写缓冲中，直到读取时刷新
+        storage = SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db"), write_flush_interval=60),
+            performance=PerformanceConfig(enable_async_operations=False)
+        ))
+        yield storage
+        storage.close()
+    
+    @pytest.fixture
+    def search_engine(self, storage):
+        return MemorySearchEngine(storage, MemoryConfig(
+            performance=PerformanceConfig(enable_search_cache=True, search_cache_size=2)
+        ))
+    
+    @staticmethod
+    def _memory(agent, title):
+        return MemoryEntry(
+            memory_type=MemoryType.CONTEXT,
+            title=title,
+            metadata=MemoryMetadata(agent, agent.title())
+        )
+    
+    @pytest.mark.asyncio
+    async def test_unrelated_writes_keep_entry(self, storage, search_engine):
+        """测试其他智能体的写入不影响缓存，相关写入使缓存失效"""
+        await storage.save_memory(self._memory("alice", "first"))
+        
+        with patch.object(storage, 'search_memories', wraps=storage.search_memories) as spy:
+            assert [m.title for m in await search_engine.search(agent_did="alice")] == ["first"]
+            await storage.save_memory(self._memory("bob", "other"))
+            assert [m.title for m in await search_engine.search(agent_did="alice")] == ["first"]
+            assert spy.call_count == 1
+            
+            await storage.save_memory(self._memory("alice", "second"))
+            titles = [m.title for m in await search_engine.search(agent_did="alice")]
+            assert sorted(titles) == ["first", "second"]
+            assert spy.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_unscoped_search_sees_every_write(self, storage, search_engine):
+        """测试无过滤条件的搜索在任何写入后失效，空结果也会被缓存"""
+        assert await search_engine.search() == []
+        memory = self._memory("bob", "new")
+        await storage.save_memory(memory)
+        assert [m.title for m in await search_engine.search()] == ["new"]
+        
+        await storage.delete_memory(memory.id)
+        assert await search_engine.search() == []
+    
+    @pytest.mark.asyncio
+    async def test_lru_eviction_and_stable_keys(self, search_engine):
+        """测试缓存键稳定且按最近使用淘汰"""
+        key = search_engine._generate_cache_key("q", MemoryType.CONTEXT, None, None, ["a"], None, None, 10, 0, "all")
+        assert key == search_engine._generate_cache_key(
+            "q", MemoryType.CONTEXT, None, None, ["a"], None, None, 10, 0, "all")
+        assert key != search_engine._generate_cache_key(
+            "q", MemoryType.CONTEXT, None, None, ["a"], None, None, 10, 0, "any")
+        
+        await search_engine.search(query="a")
+        await search_engine.search(query="b")
+        await search_engine.search(query="a")
+        await search_engine.search(query="c")
+        
+        cached = list(search_engine._search_cache)
+        assert len(cached) == 2
+        assert search_engine._generate_cache_key("a", None, None, None, None, None, None, 100, 0, "all") in cached
+        assert search_engine._generate_cache_key("b", None, None, None, None, None, None, 100, 0, "all") not in cached
+
+
 class TestMemoryManager:
     """测试记忆管理器"""
     
@@ -692,6 +769,34 @@ class TestMemoryManager:
         assert await memory_manager.get_memory(memory1.id) is None
         assert await memory_manager.get_memory(memory2.id) is None
     
+    @pytest.mark.asyncio
+    async def test_delete_memories_batch_notifies_deleted_only(self, memory_manager, storage):
+        """测试批量删除不计入访问统计，只为实际删除的记忆发送删除事件"""
+        memories = [
+            await memory_manager.create_memory(
+                memory_type=MemoryType.METHOD_CALL,
+                title=f"Delete Batch {i}",
+                content={},
+                source_agent_did="alice",
+                source_agent_name="Alice"
+            )
+            for i in range(3)
+        ]
+        deleted_events = []
+        memory_manager.add_event_listener(
+            MemoryEventType.MEMORY_DELETED, lambda memory, **kwargs: deleted_events.append(memory.id))
+        
+        # 存储只删除第一条记忆
+        delete_memories = storage.delete_memories
+        storage.delete_memories = lambda memory_ids: delete_memories(memory_ids[:1])
+        
+        with patch.object(storage, 'get_memory', wraps=storage.get_memory) as get_memory:
+            assert await memory_manager.delete_memories_batch([m.id for m in memories] + ["missing"]) == 1
+            get_memory.assert_not_called()
+        
+        assert deleted_events == [memories[0].id]
+        assert all(memory.metadata.access_count == 0 for memory in memories)
+    
     @pytest.mark.asyncio
     async def test_create_method_call_memory(self, memory_manager):
         """测试创建方法调用记忆"""
@@ -810,6 +915,30 @@ class TestMemoryManager:
                     mock_lifecycle_close.assert_called_once()
                     mock_session_close.assert_called_once()
                     mock_storage_close.assert_called_once()
+    
+    
+    @pytest.mark.asyncio
+    async def test_close_flushes_write_behind(self, session_manager, config, tmp_path):
+        """测试关闭时写入SQLite后写缓冲中的记忆"""
+        db_path = str(tmp_path / "memory.db")
+        config.storage = StorageConfig(database_path=db_path, write_flush_interval=60)
+        manager = MemoryManager(SQLiteMemoryStorage(config), session_manager, config)
+        created = await manager.create_memories_batch([
+            {"memory_type": MemoryType.METHOD_CALL, "title": f"Flush {i}", "content": {},
+             "source_agent_did": "alice", "source_agent_name": "Alice"}
+            for i in range(3)
+        ])
+        method_memory = await manager.create_method_call_memory(
+            method_name="m", method_key="k", input_args=[], input_kwargs={}, output=None,
+            execution_time=0.1, source_agent_did="alice", source_agent_name="Alice")
+        await manager.close()
+        
+        reopened = SQLiteMemoryStorage(config)
+        try:
+            ids = {m.id for m in await reopened.search_memories(limit=10)}
+            assert ids == {m.id for m in created} | {method_memory.id}
+        finally:
+            reopened.close()
 
 
 class TestMemoryManagerGlobal:
@@ -611,7 +611,8 @@ class TestRecommendationAlgorithms:
         memory_manager.search_memories.assert_called_once_with(
             keywords=context.query_keywords,
             limit=context.max_recommendations * 2,
-            offset=0
+            offset=0,
+            tag_mode="any"
         )
     
     @pytest.mark.asyncio
@@ -628,6 +629,105 @@ class TestRecommendationAlgorithms:
         
         # 不应该调用搜索
         memory_manager.search_memories.assert_not_called()
+    
+    @staticmethod
+    def _random_memories(count):
+        import random
+        rng = random.Random(11)
+        words = ["search", "user", "order", "payment", "profile", "cache"]
+        memories = []
+        for i in range(count):
+            memory_type = rng.choice([MemoryType.METHOD_CALL, MemoryType.CONTEXT, MemoryType.PATTERN])
+            memories.append(MemoryEntry(
+                id=f"mem-{i}",
+                memory_type=memory_type,
+                content={"method_name": rng.choice(["search_users", "search", "pay"])},
+                metadata=MemoryMetadata(
+                    source_agent_did=rng.choice(["alice", "bob"]),
+                    source_agent_name="Agent",
+                    target_agent_did=rng.choice([None, "alice"]),
+                    session_id=rng.choice([None, "s1", "s2"]),
+                    keywords=rng.sample(words, rng.randint(0, 3)),
+                    tags=rng.sample(words, rng.randint(0, 2)),
+                    relevance_score=rng.choice([0.5, 1.0]),
+                    access_count=rng.randint(0, 30)
+                ),
+                created_at=datetime.now() - timedelta(days=rng.randint(0, 90))
+            ))
+        return memories
+    
+    @pytest.mark.asyncio
+    async def test_vectorized_scoring_matches_scalar(self, memory_manager, config):
+        """测试列式评分与逐条评分的结果一致（包括并列分数的顺序）"""
+        pytest.importorskip("numpy")
+        algorithm = HybridRecommendationAlgorithm(config)
+        memory_manager.search_memories = AsyncMock(return_value=self._random_memories(300))
+        context = RecommendationContext(
+            query_keywords=["search", "user"],
+            query_tags=["cache"],
+            current_agent_did="alice",
+            current_session_id="s1",
+            current_method_name="search"
+        )
+        context.max_recommendations = 25
+        
+        vectorized = await algorithm.recommend(memory_manager, context)
+        with patch('anp_runtime.local_service.memory.memory_recommender.np', None):
+            scalar = await algorithm.recommend(memory_manager, context)
+        
+        assert len(vectorized) == 25
+        assert [m.id for m, _ in vectorized] == [m.id for m, _ in scalar]
+        for (_, vector_score), (_, scalar_score) in zip(vectorized, scalar):
+            assert vector_score == pytest.approx(scalar_score)
+    
+    @pytest.mark.asyncio
+    async def test_vectorized_scoring_with_custom_function(self, memory_manager, config, sample_memories):
+        """测试未实现批量评分的自定义评分函数逐条计算"""
+        pytest.importorskip("numpy")
+        
+        class TitleLengthScoring(ScoringFunction):
+            def calculate_score(self, memory, context):
+                return len(memory.title) / 100.0
+        
+        algorithm = HybridRecommendationAlgorithm(config)
+        algorithm.scoring_functions = [TitleLengthScoring(weight=2.0)]
+        memory_manager.search_memories = AsyncMock(return_value=sample_memories)
+        context = RecommendationContext()
+        context.similarity_threshold = 0.0
+        
+        recommendations = await algorithm.recommend(memory_manager, context)
+        expected = sorted(
+            ((m.id, len(m.title) / 100.0 * 2.0 * m.metadata.relevance_score) for m in sample_memories),
+            key=lambda item: item[1], reverse=True
+        )
+        assert [(m.id, pytest.approx(score)) for m, score in recommendations] == expected
+    
+    @pytest.mark.asyncio
+    async def test_candidates_from_inverted_index(self, config):
+        """测试存储提供候选索引时一次索引查询取候选，结果与逐类型搜索一致"""
+        from anp_runtime.local_service.memory.memory_storage import InMemoryStorage
+        
+        storage = InMemoryStorage()
+        memory_manager = MemoryManager(storage=storage)
+        await storage.save_memories(self._random_memories(200))
+        algorithm = HybridRecommendationAlgorithm(config)
+        context = RecommendationContext(
+            query_keywords=["search", "user"],
+            current_agent_did="alice",
+            memory_types=[MemoryType.METHOD_CALL, MemoryType.CONTEXT]
+        )
+        context.max_recommendations = 50
+        context.similarity_threshold = 0.0
+        
+        with patch.object(storage, 'search_memories', wraps=storage.search_memories) as search:
+            indexed = await algorithm.recommend(memory_manager, context)
+            assert search.call_count == 0
+        
+        with patch.object(type(storage), 'candidate_index', None):
+            searched = await algorithm.recommend(memory_manager, context)
+        
+        assert indexed
+        assert [(m.id, pytest.approx(score)) for m, score in indexed] == [(m.id, score) for m, score in searched]
 
 
 class TestMemoryRecommender:
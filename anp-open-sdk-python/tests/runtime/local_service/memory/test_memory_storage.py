@@ -17,6 +17,10 @@ from unittest.mock import Mock, patch, AsyncMock
 from anp_runtime.local_service.memory.memory_storage import (
     MemoryStorageInterface,
     SQLiteMemoryStorage,
+    SQLiteConnectionPool,
+    WriteBehindBuffer,
+    LRUCache,
+    WriteGenerations,
     InMemoryStorage,
     create_storage
 )
@@ -33,6 +37,30 @@ from anp_runtime.local_service.memory.memory_config import (
 )
 
 
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    """内存存储与同步写入的SQLite存储，测试类可定义同名夹具覆盖"""
+    if request.param == "memory":
+        yield InMemoryStorage()
+        return
+    storage = SQLiteMemoryStorage(MemoryConfig(
+        storage=StorageConfig(database_path=str(tmp_path / "memory.db")),
+        performance=PerformanceConfig(enable_async_operations=False)
+    ))
+    yield storage
+    storage.close()
+
+
+def _memory(title, agent="alice", memory_type=MemoryType.CONTEXT, content=None, **metadata):
+    """构造测试记忆，metadata 中的其余字段传给 MemoryMetadata"""
+    return MemoryEntry(
+        memory_type=memory_type,
+        title=title,
+        content=content or {},
+        metadata=MemoryMetadata(agent, agent.title(), **metadata)
+    )
+
+
 class TestMemoryStorageInterface:
     """测试记忆存储接口"""
     
@@ -738,6 +766,888 @@ class TestSQLiteMemoryStorage:
         assert len(keyword_results) == 20  # 所有记忆都有"query"关键词
 
 
+class TestSQLiteConnectionPool:
+    """测试SQLite连接池"""
+    
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        return tmp_path / "memory.db"
+    
+    def test_pragmas_and_readonly_readers(self, db_path):
+        """测试写连接启用WAL，只读连接不可写"""
+        pool = SQLiteConnectionPool(db_path, StorageConfig(), read_pool_size=2)
+        try:
+            with pool.writer() as conn:
+                conn.execute('CREATE TABLE t (v INTEGER)')
+                conn.execute('INSERT INTO t VALUES (1)')
+                assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+                assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+            
+            with pool.reader() as reader:
+                assert reader.execute('SELECT v FROM t').fetchone()['v'] == 1
+                with pytest.raises(sqlite3.OperationalError):
+                    reader.execute('INSERT INTO t VALUES (2)')
+            
+            # 写事务异常时回滚
+            with pytest.raises(RuntimeError):
+                with pool.writer() as conn:
+                    conn.execute('INSERT INTO t VALUES (3)')
+                    raise RuntimeError("boom")
+            with pool.reader() as reader:
+                assert reader.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 1
+        finally:
+            pool.close()
+        assert not Path(f"{db_path}-wal").exists()
+    
+    def test_readers_are_pooled_and_parallel(self, db_path):
+        """测试只读连接复用，且读操作不会被进行中的写事务阻塞"""
+        pool = SQLiteConnectionPool(db_path, StorageConfig(), read_pool_size=2)
+        try:
+            with pool.writer() as conn:
+                conn.execute('CREATE TABLE t (v INTEGER)')
+            
+            with pool.reader() as first, pool.reader() as second:
+                assert first is not second
+            with pool.reader() as again:
+                assert again in (first, second)
+            
+            with pool.writer() as conn:
+                conn.execute('INSERT INTO t VALUES (1)')
+                # 写事务未提交时，其他线程仍可读到上一个快照
+                result = []
+                reader_thread = threading.Thread(
+                    target=lambda: result.append(_count_rows(pool)))
+                reader_thread.start()
+                reader_thread.join(timeout=5)
+                assert result == [0]
+            assert _count_rows(pool) == 1
+        finally:
+            pool.close()
+    
+    @pytest.mark.asyncio
+    async def test_in_memory_database(self):
+        """测试:memory:数据库在写连接上读写"""
+        storage = SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=":memory:"),
+            performance=PerformanceConfig(enable_async_operations=False)
+        ))
+        try:
+            memory = MemoryEntry(title="In Memory", metadata=MemoryMetadata("alice", "Alice"))
+            assert await storage.save_memory(memory)
+            assert [m.id for m in await storage.search_memories(query="In Memory")] == [memory.id]
+        finally:
+            storage.close()
+
+
+def _count_rows(pool: SQLiteConnectionPool) -> int:
+    with pool.reader() as reader:
+        return reader.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+
+
+class TestWriteBehind:
+    """测试SQLite后写缓冲"""
+    
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        return str(tmp_path / "memory.db")
+    
+    def _storage(self, db_path, **storage_kwargs):
+        storage_kwargs.setdefault("write_flush_interval", 60)
+        storage_kwargs.setdefault("cache_size", 2)
+        return SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=db_path, **storage_kwargs),
+            performance=PerformanceConfig(enable_async_operations=False)
+        ))
+    
+    @staticmethod
+    def _row_count(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM memory_entries').fetchone()[0]
+        finally:
+            conn.close()
+    
+    @pytest.mark.asyncio
+    async def test_reads_wait_for_inflight_batch(self, db_path):
+        """测试后台线程正在写入一批记忆时，线程池中的查询与删除等待该批次提交"""
+        storage = SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=db_path, write_flush_interval=60),
+            performance=PerformanceConfig(enable_async_operations=True)
+        ))
+        buffer = storage._write_buffer
+        write_batch = buffer._write_batch
+        entered = threading.Event()
+        
+        def slow_write(memories):
+            entered.set()
+            time.sleep(0.2)
+            write_batch(memories)
+        
+        buffer._write_batch = slow_write
+        
+        async def start_background_flush(memory):
+            entered.clear()
+            assert await storage.save_memory(memory)
+            buffer._wakeup.set()
+            assert await asyncio.get_running_loop().run_in_executor(None, entered.wait, 5)
+            assert len(buffer) == 0
+        
+        try:
+            searched = _memory("Write Behind 0")
+            await start_background_flush(searched)
+            assert [m.id for m in await storage.search_memories(agent_did="alice")] == [searched.id]
+            
+            deleted = _memory("Write Behind 1")
+            await start_background_flush(deleted)
+            assert await storage.delete_memory(deleted.id)
+            await storage.flush()
+            assert self._row_count(db_path) == 1
+        finally:
+            storage.close()
+    
+    @pytest.mark.asyncio
+    async def test_reads_see_buffered_writes(self, db_path):
+        """测试缓冲中的写入对读可见，同一记忆多次写入合并"""
+        storage = self._storage(db_path, batch_write_size=100)
+        try:
+            memories = [_memory(f"Write Behind {i}") for i in range(5)]
+            for memory in memories:
+                assert await storage.save_memory(memory)
+            memories[0].title = "Updated"
+            await storage.update_memory(memories[0])
+            assert len(storage._write_buffer) == 5
+            assert self._row_count(db_path) == 0
+            
+            # 缓存只保留 2 条，其余从缓冲读取
+            assert (await storage.get_memory(memories[0].id)).title == "Updated"
+            results = await storage.search_memories(query="Write Behind")
+            assert len(results) == 4
+            assert self._row_count(db_path) == 5 and len(storage._write_buffer) == 0
+        finally:
+            storage.close()
+    
+    @pytest.mark.asyncio
+    async def test_size_triggered_flush(self, db_path):
+        """测试待写数量达到 batch_write_size 时后台刷新"""
+        storage = self._storage(db_path, batch_write_size=3)
+        try:
+            for i in range(3):
+                await storage.save_memory(_memory(f"Write Behind {i}"))
+            for _ in range(100):
+                if self._row_count(db_path) == 3:
+                    break
+                time.sleep(0.02)
+            assert self._row_count(db_path) == 3
+            assert storage._write_buffer.flushed_batches == 1
+        finally:
+            storage.close()
+    
+    @pytest.mark.asyncio
+    async def test_bulk_save_delete_and_close(self, db_path):
+        """测试批量保存、批量删除以及关闭时写入剩余记忆"""
+        storage = self._storage(db_path, batch_write_size=4)
+        memories = [_memory(f"Write Behind {i}") for i in range(10)]
+        assert await storage.save_memories(memories) == 10
+        assert self._row_count(db_path) == 10
+        
+        pending = _memory("Write Behind pending")
+        await storage.save_memory(pending)
+        deleted = await storage.delete_memories([memories[0].id, pending.id, "missing"])
+        assert deleted == 2
+        assert await storage.get_memory(pending.id) is None
+        
+        last = _memory("Write Behind last")
+        await storage.save_memory(last)
+        storage.close()
+        assert self._row_count(db_path) == 10
+        
+        reopened = self._storage(db_path)
+        try:
+            assert (await reopened.get_memory(last.id)).title == last.title
+        finally:
+            reopened.close()
+    
+    def test_failed_batch_falls_back_to_single_rows(self):
+        """测试批量写入失败时逐条重试并丢弃坏记录"""
+        written = []
+        
+        def write_batch(batch):
+            if any(m.title == "bad" for m in batch):
+                raise sqlite3.IntegrityError("bad row")
+            written.extend(m.id for m in batch)
+        
+        buffer = WriteBehindBuffer(write_batch, batch_size=10, flush_interval=60)
+        good, bad = _memory("Write Behind good"), MemoryEntry(title="bad")
+        buffer.put(good)
+        buffer.put(bad)
+        buffer.close()
+        assert written == [good.id]
+        assert buffer.dropped_rows == 1 and buffer.flushed_rows == 1
+    
+    @pytest.mark.asyncio
+    async def test_dropped_rows_leave_cache(self, db_path):
+        """测试无法写入而被丢弃的记忆移出缓存，读取回到已提交的版本，并计入统计"""
+        storage = self._storage(db_path, cache_size=10)
+        try:
+            committed = _memory("Write Behind committed")
+            await storage.save_memory(committed)
+            await storage.flush()
+            
+            buffer = storage._write_buffer
+            write_batch = buffer._write_batch
+            
+            def failing_write(memories):
+                if any(m.title == "bad" for m in memories):
+                    raise sqlite3.IntegrityError("bad row")
+                write_batch(memories)
+            
+            buffer._write_batch = failing_write
+            update, new = _memory("bad"), _memory("bad")
+            update.id = committed.id
+            good = _memory("Write Behind good")
+            for memory in (update, new, good):
+                await storage.save_memory(memory)
+            await storage.flush()
+            
+            assert (await storage.get_memory(committed.id)).title == committed.title
+            assert await storage.get_memory(new.id) is None
+            assert (await storage.get_memory(good.id)).title == good.title
+            assert (await storage.get_storage_stats())["dropped_writes"] == 2
+        finally:
+            storage.close()
+
+
+class TestAccessTracking:
+    """测试访问统计批量落盘"""
+    
+    @pytest.fixture
+    def storage(self, tmp_path):
+        storage = SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db"), cache_size=1,
+                                  enable_write_behind=False),
+            performance=PerformanceConfig(enable_async_operations=False)
+        ))
+        yield storage
+        storage.close()
+    
+    @staticmethod
+    def _db_access(storage, memory_id):
+        with storage._pool.reader() as conn:
+            return conn.execute(
+                'SELECT access_count, last_accessed, updated_at FROM memory_entries WHERE id = ?', (memory_id,)
+            ).fetchone()
+    
+    @pytest.mark.asyncio
+    async def test_reads_do_not_rewrite_rows(self, storage):
+        """测试读取不重写整行，访问统计在 flush 时批量写入"""
+        memory = MemoryEntry(title="Hot", content={"k": "v"}, metadata=MemoryMetadata("alice", "Alice"))
+        other = MemoryEntry(title="Other", metadata=MemoryMetadata("alice", "Alice"))
+        await storage.save_memories([memory, other])
+        updated_at = self._db_access(storage, memory.id)['updated_at']
+        
+        with patch.object(storage, '_write_memories', wraps=storage._write_memories) as write_memories:
+            # 缓存只保留 1 条：两次读 memory 之间插入 other，使第二次读走数据库
+            await storage.get_memory(memory.id)
+            await storage.get_memory(other.id)
+            reloaded = await storage.get_memory(memory.id)
+            assert write_memories.call_count == 0
+        
+        # 未落盘的计数合并到从数据库读出的记忆上
+        assert reloaded.metadata.access_count == 2
+        assert self._db_access(storage, memory.id)['access_count'] == 0
+        assert len(storage._access_tracker) == 2
+        
+        await storage.flush()
+        row = self._db_access(storage, memory.id)
+        assert row['access_count'] == 2
+        assert row['last_accessed'] == reloaded.metadata.last_accessed.isoformat()
+        assert row['updated_at'] == updated_at
+        assert (await storage.get_storage_stats())['pending_access_updates'] == 0
+    
+    @pytest.mark.asyncio
+    async def test_full_row_writes_do_not_double_count(self, storage):
+        """测试整行写入与访问统计不会重复累加，旧实例也不会回退计数"""
+        memory = MemoryEntry(title="Counted", metadata=MemoryMetadata("alice", "Alice"))
+        await storage.save_memory(memory)
+        stale = MemoryEntry.from_dict(memory.to_dict())
+        
+        await storage.get_memory(memory.id)
+        await storage.update_memory(memory)
+        await storage.flush()
+        assert self._db_access(storage, memory.id)['access_count'] == 1
+        
+        await storage.update_memory(stale)
+        assert self._db_access(storage, memory.id)['access_count'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_batch_flush_without_write_behind(self, tmp_path):
+        """测试未启用后写缓冲时攒满 batch_write_size 条后写入"""
+        storage = SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db"), batch_write_size=3,
+                                  enable_write_behind=False),
+            performance=PerformanceConfig(enable_async_operations=False)
+        ))
+        try:
+            memories = [MemoryEntry(title=f"m{i}", metadata=MemoryMetadata("alice", "Alice")) for i in range(3)]
+            await storage.save_memories(memories)
+            for memory in memories[:2]:
+                await storage.get_memory(memory.id)
+            assert len(storage._access_tracker) == 2
+            await storage.get_memory(memories[2].id)
+            assert len(storage._access_tracker) == 0
+            assert all(self._db_access(storage, m.id)['access_count'] == 1 for m in memories)
+        finally:
+            storage.close()
+
+
+class TestLRUCache:
+    """测试LRU缓存"""
+    
+    def test_evicts_least_recently_used(self):
+        """测试按访问顺序淘汰"""
+        cache = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        
+        assert "b" not in cache
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        assert cache.get("b") is None
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['evictions']) == (3, 1, 1)
+        assert stats['hit_rate'] == 0.75
+    
+    def test_byte_budget(self):
+        """测试按估算字节数限制容量"""
+        cache = LRUCache(max_entries=100, max_bytes=100, sizeof=len)
+        cache.put("a", "x" * 40)
+        cache.put("b", "x" * 40)
+        cache.put("c", "x" * 40)
+        assert len(cache) == 2 and "a" not in cache
+        assert cache.bytes == 80
+        
+        # 覆盖写入时按新大小计算，超过预算的条目不缓存
+        cache.put("b", "x" * 10)
+        assert cache.bytes == 50
+        cache.put("c", "x" * 101)
+        assert "c" not in cache and cache.bytes == 10
+        
+        assert cache.pop("b") == "x" * 10
+        assert cache.bytes == 0
+    
+    def test_discard_if(self):
+        cache = LRUCache(max_entries=10)
+        for i in range(5):
+            cache.put(str(i), i)
+        assert cache.discard_if(lambda value: value % 2 == 0) == 3
+        assert sorted(cache._entries) == ["1", "3"]
+    
+    @pytest.mark.asyncio
+    async def test_storage_cache_stats(self, tmp_path):
+        """测试存储的记忆与会话缓存统计"""
+        storage = SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db"), cache_size=2, session_cache_size=1),
+            performance=PerformanceConfig(enable_async_operations=False)
+        ))
+        try:
+            memories = [MemoryEntry(title=f"m{i}", metadata=MemoryMetadata("alice", "Alice")) for i in range(3)]
+            await storage.save_memories(memories)
+            assert await storage.get_memory(memories[2].id) is not None
+            assert await storage.get_memory(memories[0].id) is not None
+            
+            for name in ("s1", "s2"):
+                await storage.save_session(ContextSession(name=name))
+            
+            stats = await storage.get_storage_stats()
+            assert stats['memory_cache']['hits'] == 1
+            assert stats['memory_cache']['misses'] == 1
+            assert stats['memory_cache']['evictions'] == 2
+            assert stats['memory_cache']['entries'] == 2
+            assert 0 < stats['memory_cache']['bytes'] <= stats['memory_cache']['max_bytes']
+            assert stats['session_cache']['entries'] == 1
+            assert stats['session_cache']['evictions'] == 1
+        finally:
+            storage.close()
+
+
+class TestFullTextSearch:
+    """测试SQLite FTS5全文搜索"""
+    
+    @pytest.fixture
+    def storage(self, tmp_path):
+        storage = SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db")),
+            performance=PerformanceConfig(enable_async_operations=False)
+        ))
+        yield storage
+        storage.close()
+    
+    @pytest.mark.asyncio
+    async def test_cjk_and_prefix_matching(self, storage):
+        """测试中文子串、前缀匹配与关键词检索"""
+        weather = _memory("今天的天气很好", content={"城市": "北京", "note": "Performance report"})
+        travel = _memory("出差计划", content={"目的地": "上海"}, keywords=["天气"])
+        await storage.save_memories([weather, travel])
+        
+        async def ids(query):
+            return [m.id for m in await storage.search_memories(query=query)]
+        
+        assert await ids("北京") == [weather.id]
+        assert await ids("Perf") == [weather.id]
+        assert await ids("天 好") == [weather.id]
+        assert await ids("很天") == []
+        # 标题命中排在只有关键词命中的记忆之前
+        assert await ids("天气") == [weather.id, travel.id]
+        # 没有可索引词元时回退到 LIKE
+        assert len(await ids("%")) == 2
+    
+    @pytest.mark.asyncio
+    async def test_index_follows_updates_and_deletes(self, storage):
+        """测试触发器同步更新与删除"""
+        memory = _memory("初始标题")
+        await storage.save_memory(memory)
+        assert len(await storage.search_memories(query="初始")) == 1
+        
+        memory.title = "修改后的标题"
+        await storage.update_memory(memory)
+        assert await storage.search_memories(query="初始") == []
+        assert len(await storage.search_memories(query="修改")) == 1
+        
+        await storage.delete_memory(memory.id)
+        assert await storage.search_memories(query="修改") == []
+        with storage._pool.writer() as conn:
+            # 外部内容表：删除旧词元后索引与 memory_entries 一致，且不保存文本副本
+            conn.execute("INSERT INTO memory_fts(memory_fts) VALUES ('integrity-check')")
+            assert conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'memory_fts_content'"
+            ).fetchone() is None
+    
+    @pytest.mark.asyncio
+    async def test_snippets(self, storage):
+        """测试命中片段"""
+        await storage.save_memory(_memory("会议纪要", content={"内容": "下周三讨论记忆检索的性能优化方案"}))
+        results = await storage.search_with_snippets("性能优化")
+        assert len(results) == 1
+        assert "[性能优化]" in results[0]['snippet']
+        assert "\u200b" not in results[0]['snippet']
+        assert results[0]['score'] < 0
+    
+    @pytest.mark.asyncio
+    async def test_backfill_existing_database(self, tmp_path):
+        """测试已有数据库首次启用全文索引时回填"""
+        config = MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db")),
+            performance=PerformanceConfig(enable_async_operations=False)
+        )
+        storage = SQLiteMemoryStorage(config)
+        await storage.save_memory(_memory("历史记忆"))
+        with storage._pool.writer() as conn:
+            for name in ("memory_fts_insert", "memory_fts_update", "memory_fts_delete"):
+                conn.execute(f'DROP TRIGGER {name}')
+            conn.execute('DROP TABLE memory_fts')
+        storage.close()
+        
+        reopened = SQLiteMemoryStorage(config)
+        try:
+            assert [m.title for m in await reopened.search_memories(query="历史")] == ["历史记忆"]
+        finally:
+            reopened.close()
+    
+    @pytest.mark.asyncio
+    async def test_plain_connection_can_write(self, storage):
+        """测试未注册任何应用函数的连接也能修改与删除记忆，索引保持一致"""
+        kept, removed = _memory("保留的记忆"), _memory("删除的记忆")
+        await storage.save_memories([kept, removed])
+        await storage.flush()
+        
+        conn = sqlite3.connect(str(storage.db_path))
+        try:
+            with conn:
+                conn.execute("UPDATE memory_entries SET relevance_score = 0.5 WHERE id = ?", (kept.id,))
+                conn.execute("DELETE FROM memory_entries WHERE id = ?", (removed.id,))
+                conn.execute("INSERT INTO memory_fts(memory_fts) VALUES ('integrity-check')")
+        finally:
+            conn.close()
+        assert [m.id for m in await storage.search_memories(query="记忆")] == [kept.id]
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("legacy_sql", [
+        # 自带文本副本的全文表
+        [
+            "CREATE VIRTUAL TABLE memory_fts USING fts5(title, body)",
+            "CREATE TRIGGER memory_fts_delete AFTER DELETE ON memory_entries BEGIN "
+            "DELETE FROM memory_fts WHERE rowid = old.rowid; END",
+        ],
+        # 内容视图与触发器依赖应用注册的 SQL 函数
+        [
+            "CREATE VIEW memory_fts_source AS SELECT rowid AS doc_id, anp_fts_text(title) AS title, "
+            "anp_fts_document(content, keywords) AS body FROM memory_entries",
+            "CREATE VIRTUAL TABLE memory_fts USING fts5(title, body, content = 'memory_fts_source', "
+            "content_rowid = 'doc_id')",
+            "CREATE TRIGGER memory_fts_delete AFTER DELETE ON memory_entries BEGIN "
+            "INSERT INTO memory_fts(memory_fts, rowid, title, body) VALUES "
+            "('delete', old.rowid, anp_fts_text(old.title), anp_fts_document(old.content, old.keywords)); END",
+        ],
+    ], ids=["text-copy", "udf-view"])
+    async def test_rebuilds_legacy_table(self, tmp_path, legacy_sql):
+        """测试旧版全文表与缺少分词列的记忆表在打开时重建并回填"""
+        config = MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db")),
+            performance=PerformanceConfig(enable_async_operations=False)
+        )
+        storage = SQLiteMemoryStorage(config)
+        await storage.save_memory(_memory("历史记忆", content={"城市": "北京"}))
+        await storage.flush()
+        with storage._pool.writer() as conn:
+            for name in ("memory_fts_insert", "memory_fts_update", "memory_fts_delete"):
+                conn.execute(f'DROP TRIGGER {name}')
+            conn.execute('DROP TABLE memory_fts')
+            conn.execute('ALTER TABLE memory_entries DROP COLUMN fts_title')
+            conn.execute('ALTER TABLE memory_entries DROP COLUMN fts_body')
+            for sql in legacy_sql:
+                conn.execute(sql)
+        storage.close()
+        
+        reopened = SQLiteMemoryStorage(config)
+        try:
+            assert [m.title for m in await reopened.search_memories(query="历史")] == ["历史记忆"]
+            assert [m.title for m in await reopened.search_memories(query="北京")] == ["历史记忆"]
+            memory = _memory("新的记忆")
+            await reopened.save_memory(memory)
+            await reopened.delete_memory(memory.id)
+            with reopened._pool.writer() as conn:
+                assert "fts_title" in conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE name = 'memory_fts'"
+                ).fetchone()[0]
+                assert conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'memory_fts_source'"
+                ).fetchone() is None
+                conn.execute("INSERT INTO memory_fts(memory_fts) VALUES ('integrity-check')")
+        finally:
+            reopened.close()
+
+
+class TestTagIndex:
+    """测试标签/关键词倒排索引与标签统计"""
+    
+    @pytest.fixture
+    def memories(self):
+        def make(title, tags, keywords=(), memory_type=MemoryType.CONTEXT):
+            return _memory(title, memory_type=memory_type, tags=list(tags), keywords=list(keywords))
+        return [
+            make("a", ["red", "blue"], ["x"]),
+            make("b", ["red"], ["x", "y"], MemoryType.METHOD_CALL),
+            make("c", ["blue", "green", "blue"], ["y"]),
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_all_and_any_modes(self, storage, memories):
+        """测试 ALL/ANY 标签与关键词匹配"""
+        await storage.save_memories(memories)
+        
+        async def titles(**kwargs):
+            return sorted(m.title for m in await storage.search_memories(**kwargs))
+        
+        assert await titles(tags=["red", "blue"]) == ["a"]
+        assert await titles(tags=["red", "blue"], tag_mode="any") == ["a", "b", "c"]
+        assert await titles(tags=["red", "missing"]) == []
+        assert await titles(keywords=["x", "y"]) == ["b"]
+        assert await titles(tags=["blue"], keywords=["x", "y"], tag_mode="any") == ["a", "c"]
+        with pytest.raises(ValueError):
+            await storage.search_memories(tags=["red"], tag_mode="some")
+    
+    @pytest.mark.asyncio
+    async def test_index_follows_updates_and_deletes(self, storage, memories):
+        """测试更新与删除后索引同步"""
+        await storage.save_memories(memories)
+        memories[0].metadata.tags = ["green"]
+        await storage.update_memory(memories[0])
+        await storage.delete_memory(memories[2].id)
+        
+        assert [m.title for m in await storage.search_memories(tags=["green"])] == ["a"]
+        assert await storage.search_memories(tags=["blue"]) == []
+        assert await storage.get_tag_counts() == {"green": 1, "red": 1}
+    
+    @pytest.mark.asyncio
+    async def test_tag_counts(self, storage, memories):
+        """测试标签/关键词统计"""
+        await storage.save_memories(memories)
+        
+        assert await storage.get_tag_counts() == {"blue": 2, "red": 2, "green": 1}
+        assert await storage.get_tag_counts(limit=1) == {"blue": 2}
+        assert await storage.get_tag_counts("keywords") == {"x": 2, "y": 2}
+        assert await storage.get_tag_counts(memory_type=MemoryType.CONTEXT) == {"blue": 2, "green": 1, "red": 1}
+        assert await storage.get_tag_counts("keywords", tags=["blue"]) == {"x": 1, "y": 1}
+        with pytest.raises(ValueError):
+            await storage.get_tag_counts("title")
+
+
+class TestSQLiteTagTables:
+    """测试SQLite标签/关键词倒排表"""
+    
+    @pytest.fixture
+    def config(self, tmp_path):
+        return MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db")),
+            performance=PerformanceConfig(enable_async_operations=False)
+        )
+    
+    @pytest.mark.asyncio
+    async def test_tag_queries_use_index(self, config):
+        """测试标签查询走倒排表索引"""
+        storage = SQLiteMemoryStorage(config)
+        try:
+            match, conditions, params = storage._build_search("", None, None, None, ["a", "b"], None)
+            sql = f"SELECT m.id FROM memory_entries m WHERE {' AND '.join(conditions)}"
+            with storage._pool.reader() as conn:
+                plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+            assert "memory_tags USING PRIMARY KEY" in plan
+            assert "SCAN m" not in plan
+        finally:
+            storage.close()
+    
+    @pytest.mark.asyncio
+    async def test_backfill_existing_database(self, config):
+        """测试已有数据库首次启用倒排表时回填"""
+        storage = SQLiteMemoryStorage(config)
+        await storage.save_memory(MemoryEntry(
+            title="历史记忆", metadata=MemoryMetadata("alice", "Alice", tags=["old"], keywords=["kw"])))
+        with storage._pool.writer() as conn:
+            for table in ("memory_tags", "memory_keywords"):
+                for suffix in ("insert", "update", "delete"):
+                    conn.execute(f"DROP TRIGGER {table}_{suffix}")
+                conn.execute(f"DROP TABLE {table}")
+        storage.close()
+        
+        reopened = SQLiteMemoryStorage(config)
+        try:
+            assert [m.title for m in await reopened.search_memories(tags=["old"], keywords=["kw"])] == ["历史记忆"]
+        finally:
+            reopened.close()
+
+
+class TestWriteGenerations:
+    """测试记忆写入代数"""
+    
+    def test_query_scopes(self):
+        """测试查询依赖最窄的作用域"""
+        assert WriteGenerations.query_scopes() == (("*", ""),)
+        assert WriteGenerations.query_scopes([MemoryType.CONTEXT, MemoryType.ERROR]) == (
+            ("type", "context"), ("type", "error"))
+        assert WriteGenerations.query_scopes([MemoryType.CONTEXT], "alice") == (("agent", "alice"),)
+        assert WriteGenerations.query_scopes([MemoryType.CONTEXT], "alice", "s1") == (("session", "s1"),)
+    
+    @pytest.mark.asyncio
+    async def test_writes_bump_only_affected_scopes(self, storage):
+        """测试写入只推进受影响作用域的代数"""
+        generations = storage.generations
+        alice = WriteGenerations.query_scopes(agent_did="alice")
+        bob = WriteGenerations.query_scopes(agent_did="bob")
+        everything = WriteGenerations.query_scopes()
+        
+        before = generations.snapshot(alice + bob + everything)
+        memory = _memory("alice 的记忆", "alice", session_id="s1")
+        await storage.save_memory(memory)
+        await storage.wait_for_writes()
+        after_save = generations.snapshot(alice + bob + everything)
+        assert after_save[0] > before[0]
+        assert after_save[1] == before[1]
+        assert after_save[2] > before[2]
+        assert generations.snapshot(WriteGenerations.query_scopes(session_id="s1")) != (0,)
+        
+        await storage.save_memory(_memory("bob 的记忆", "bob"))
+        await storage.wait_for_writes()
+        assert generations.snapshot(alice) == after_save[:1]
+        
+        await storage.delete_memory(memory.id)
+        assert generations.snapshot(alice)[0] > after_save[0]
+    
+    @pytest.mark.asyncio
+    async def test_write_behind_bumps_on_put_and_commit(self, tmp_path):
+        """测试后写缓冲中的写入在放入缓冲与批次提交之后各推进一次代数，提交之后才更新候选索引"""
+        storage = SQLiteMemoryStorage(MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db"), write_flush_interval=60),
+            performance=PerformanceConfig(enable_async_operations=False)
+        ))
+        try:
+            alice = WriteGenerations.query_scopes(agent_did="alice")
+            before = storage.generations.snapshot(alice)
+            first = _memory("alice 的记忆", "alice")
+            await storage.save_memory(first)
+            after_put = storage.generations.snapshot(alice)
+            assert after_put > before
+            assert first.id not in storage.candidate_index
+            
+            await storage.wait_for_writes()
+            after_commit = storage.generations.snapshot(alice)
+            assert after_commit > after_put
+            assert first.id in storage.candidate_index
+            
+            # 替换为另一个智能体的新实例：放入缓冲与提交时旧实例的作用域都推进
+            replacement = _memory("bob 的记忆", "bob")
+            replacement.id = first.id
+            await storage.save_memory(replacement)
+            after_put = storage.generations.snapshot(alice)
+            assert after_put > after_commit
+            await storage.flush()
+            assert storage.generations.snapshot(alice) > after_put
+            assert storage.candidate_index.top_candidates(agent_did="bob") == [first.id]
+        finally:
+            storage.close()
+    
+    @pytest.mark.asyncio
+    async def test_cleanup_bumps_expired_scopes(self, storage):
+        """测试清理过期记忆推进被删除记忆的作用域"""
+        await storage.save_memories([
+            _memory("alice 的记忆", "alice", expiry_time=datetime.now() - timedelta(minutes=1)),
+            _memory("bob 的记忆", "bob")
+        ])
+        alice = WriteGenerations.query_scopes(agent_did="alice")
+        bob = WriteGenerations.query_scopes(agent_did="bob")
+        before = storage.generations.snapshot(alice + bob)
+        
+        assert await storage.cleanup_expired_memories() == 1
+        after = storage.generations.snapshot(alice + bob)
+        assert after[0] > before[0]
+        assert after[1] == before[1]
+
+
+class TestStrategyCleanup:
+    """测试按策略清理记忆"""
+    
+    @pytest.fixture
+    def memories(self):
+        now = datetime.now()
+        
+        def make(title, days_old, access_count, accessed_days_ago=None, memory_type=MemoryType.CONTEXT,
+                 relevance_score=1.0):
+            return MemoryEntry(
+                memory_type=memory_type,
+                title=title,
+                metadata=MemoryMetadata(
+                    "alice", "Alice",
+                    access_count=access_count,
+                    relevance_score=relevance_score,
+                    last_accessed=now - timedelta(days=accessed_days_ago) if accessed_days_ago is not None else None
+                ),
+                created_at=now - timedelta(days=days_old)
+            )
+        return [
+            make("old_unused", 400, 0, memory_type=MemoryType.ERROR, relevance_score=0.1),
+            make("old_popular", 300, 50, accessed_days_ago=1),
+            make("recent_rare", 2, 1, accessed_days_ago=100),
+            make("recent_pattern", 1, 3, accessed_days_ago=0, memory_type=MemoryType.PATTERN),
+        ]
+    
+    async def _remaining(self, storage):
+        return sorted(m.title for m in await storage.search_memories())
+    
+    @pytest.mark.asyncio
+    async def test_lru_and_lfu(self, storage, memories):
+        """测试 LRU 按最后访问时间（无访问记录按创建时间）、LFU 按访问次数清理"""
+        await storage.save_memories(memories)
+        assert await storage.cleanup_memories("lru", 2) == 2
+        assert await self._remaining(storage) == ["old_popular", "recent_pattern"]
+        
+        assert await storage.cleanup_memories("lfu", 1) == 1
+        assert await self._remaining(storage) == ["old_popular"]
+    
+    @pytest.mark.asyncio
+    async def test_time_based_respects_cutoff(self, storage, memories):
+        """测试基于时间的清理只删除早于保留期的记忆"""
+        await storage.save_memories(memories)
+        cutoff = datetime.now() - timedelta(days=30)
+        assert await storage.cleanup_memories("time_based", 1, retention_cutoff=cutoff) == 1
+        assert await storage.cleanup_memories("time_based", 10, retention_cutoff=cutoff) == 1
+        assert await self._remaining(storage) == ["recent_pattern", "recent_rare"]
+    
+    @pytest.mark.asyncio
+    async def test_smart_skips_high_scores(self, storage, memories):
+        """测试智能清理只删除评分不高于阈值的记忆"""
+        await storage.save_memories(memories)
+        assert await storage.cleanup_memories("smart", 1) == 1
+        assert await self._remaining(storage) == ["old_popular", "recent_pattern", "recent_rare"]
+        assert await storage.cleanup_memories("smart", 10) == 2
+        assert await self._remaining(storage) == ["recent_pattern"]
+        
+        with pytest.raises(ValueError):
+            await storage.cleanup_memories("random", 1)
+        assert await storage.cleanup_memories("lru", 0) == 0
+    
+    @pytest.mark.asyncio
+    async def test_cleanup_invalidates_generations(self, storage, memories):
+        """测试策略清理推进被删除记忆的写入代数"""
+        await storage.save_memories(memories)
+        scopes = WriteGenerations.query_scopes(agent_did="alice")
+        before = storage.generations.snapshot(scopes)
+        await storage.cleanup_memories("lfu", 1)
+        assert storage.generations.snapshot(scopes) > before
+
+
+class TestCandidateIndex:
+    """测试存储维护的记忆候选倒排索引"""
+    
+    @pytest.mark.asyncio
+    async def test_index_follows_writes(self, storage):
+        """测试保存、更新、删除与清理后索引与存储一致"""
+        first = _memory("first", keywords=["search"])
+        second = _memory("second", keywords=["search", "user"], agent="bob")
+        expired = _memory("expired", keywords=["search"], expiry_time=datetime.now() - timedelta(minutes=1))
+        await storage.save_memories([first, second, expired])
+        index = storage.candidate_index
+        assert index.top_candidates(keywords=["search", "user"]) == [second.id, expired.id, first.id]
+        
+        first.metadata.keywords = ["order"]
+        await storage.update_memory(first)
+        await storage.wait_for_writes()
+        assert index.top_candidates(keywords=["order"]) == [first.id]
+        
+        await storage.delete_memory(second.id)
+        assert await storage.cleanup_expired_memories() == 1
+        assert index.top_candidates(keywords=["search"]) == []
+        assert len(index) == 1
+    
+    @pytest.mark.asyncio
+    async def test_get_memories_keeps_order(self, storage):
+        """测试批量读取保持传入顺序、跳过不存在的记忆且不计入访问统计"""
+        memories = [_memory(f"m{i}", keywords=["search"]) for i in range(3)]
+        await storage.save_memories(memories)
+        ids = [memories[2].id, "missing", memories[0].id]
+        
+        loaded = await storage.get_memories(ids)
+        assert [m.id for m in loaded] == [memories[2].id, memories[0].id]
+        assert all(m.metadata.access_count == 0 for m in loaded)
+    
+    @pytest.mark.asyncio
+    async def test_sqlite_rebuilds_index_on_open(self, tmp_path):
+        """测试 SQLite 存储重新打开时从数据库建立索引，写入顺序保持不变"""
+        config = MemoryConfig(
+            storage=StorageConfig(database_path=str(tmp_path / "memory.db")),
+            performance=PerformanceConfig(enable_async_operations=False)
+        )
+        storage = SQLiteMemoryStorage(config)
+        memories = [_memory(f"m{i}", keywords=["search"]) for i in range(3)]
+        for memory in memories:
+            await storage.save_memory(memory)
+        storage.close()
+        
+        reopened = SQLiteMemoryStorage(config)
+        try:
+            assert reopened.candidate_index.top_candidates(keywords=["search"]) == [m.id for m in reversed(memories)]
+            loaded = await reopened.get_memories([memories[1].id])
+            assert [m.title for m in loaded] == ["m1"]
+        finally:
+            reopened.close()
+        
+        config.storage.enable_candidate_index = False
+        disabled = SQLiteMemoryStorage(config)
+        try:
+            assert disabled.candidate_index is None
+        finally:
+            disabled.close()
+
+
 class TestStorageFactory:
     """测试存储工厂函数"""
     
@@ -0,0 +1,54 @@
+"""
+智能体内省记录测试
+
+测试 ApiCallRecord、AgentSearchRecord、SessionRecord 的固定容量与按 DID 查询
+"""
+
+import json
+
+from anp_foundation.utils.ring_buffer import RotatingSpill
+from anp_runtime.agent_manager import AgentSearchRecord, ApiCallRecord, SessionRecord
+
+
+class TestAgentRecords:
+    """内省记录测试"""
+
+    def test_api_calls_are_bounded_and_indexed(self):
+        record = ApiCallRecord(capacity=3)
+        for i in range(5):
+            record.record_api_call(f"caller{i % 2}", "target", f"/api/{i}", "POST", {}, {"status": "success"}, i)
+        assert [c["api_path"] for c in record.get_recent_calls(10)] == ["/api/2", "/api/3", "/api/4"]
+        assert [c["api_path"] for c in record.get_calls_for_did("caller1")] == ["/api/3"]
+        assert len(record.get_calls_for_did("target", limit=2)) == 2
+        assert record.api_calls[-1]["success"] and record.api_calls[-1]["duration_ms"] == 4
+
+    def test_searches_spill_to_disk(self, tmp_path):
+        spill = RotatingSpill(tmp_path / "searches.jsonl")
+        record = AgentSearchRecord(capacity=1, spill=spill)
+        record.record_search("did:a", "weather", ["did:w"])
+        record.record_search("did:b", "news", [])
+        spill.close()
+        assert record.get_recent_searches() == [record.search_history[0].to_dict()]
+        assert record.get_searches_by("did:a") == []
+        spilled = json.loads((tmp_path / "searches.jsonl").read_text())
+        assert spilled["query"] == "weather" and spilled["result_count"] == 1
+
+    def test_sessions_active_index_and_expiry(self):
+        sessions = SessionRecord(capacity=2, message_limit=2)
+        first = sessions.create_session("did:a", "did:b")
+        for i in range(3):
+            sessions.add_message(first, {"sender": "did:a", "n": i})
+        assert [m["content"]["n"] for m in sessions.get_session(first)["messages"]] == [1, 2]
+
+        second = sessions.create_session("did:a", "did:c")
+        sessions.close_session(second)
+        assert list(sessions.get_active_sessions()) == [first]
+        assert sessions.get_session(second)["status"] == "closed"
+
+        sessions.create_session("did:x", "did:y")
+        sessions.create_session("did:y", "did:z")
+        # 活跃会话超出容量，最旧的会话被标记为 expired
+        assert sessions.get_session(first)["status"] == "expired"
+        # 已关闭的会话按关闭顺序返回
+        assert [s["session_id"] for s in sessions.get_sessions_for("did:a")] == [second, first]
+        assert len(sessions.get_sessions_for("did:y")) == 2
@@ -0,0 +1,128 @@
+"""
+群组批量接口与成员版本测试
+
+测试 MemberRegistry 的版本号与增量同步、members diff 请求，
+以及 route_group_batch 的按群组顺序执行与结果对齐
+"""
+
+import json
+
+import pytest
+
+from anp_runtime.global_router_agent_message import (
+    MAX_GROUP_BATCH,
+    GlobalGroupManager,
+    GlobalMessageManager,
+    GroupAgent,
+    GroupRunner,
+    MemberRegistry
+)
+from anp_servicepoint.core_service_handler.group_socket_handler import GroupSocketSession
+
+
+def _agent(agent_id: str) -> GroupAgent:
+    return GroupAgent(id=agent_id, name=agent_id)
+
+
+class TestMemberRegistry:
+    """成员版本号测试"""
+
+    def test_changes_since(self):
+        members = MemberRegistry(history_size=4)
+        members["a"] = _agent("a")
+        members["b"] = _agent("b")
+        assert members.version == 2
+        del members["a"]
+        members["c"] = _agent("c")
+        assert members.pop("missing", None) is None and members.version == 4
+
+        diff = members.changes_since(2)
+        assert not diff["full"]
+        assert [m["id"] for m in diff["joined"]] == ["c"]
+        assert diff["left"] == ["a"]
+        assert members.changes_since(4) == {"version": 4, "full": False, "joined": [], "left": []}
+
+        members["d"] = _agent("d")
+        members["e"] = _agent("e")
+        # 版本 1、2 的变更已超出保留范围，返回完整成员列表
+        full = members.changes_since(0)
+        assert full["full"] and sorted(m["id"] for m in full["joined"]) == ["b", "c", "d", "e"]
+        # 客户端版本高于服务端（例如服务端重启）也返回完整列表
+        assert members.changes_since(99)["full"]
+
+
+class TestGroupBatch:
+    """批量群组请求测试"""
+
+    def teardown_method(self):
+        GlobalGroupManager.clear_groups()
+
+    @pytest.mark.asyncio
+    async def test_members_diff_request(self):
+        GlobalGroupManager.register_runner("g", GroupRunner)
+        runner = GlobalGroupManager.get_runner("g")
+        listing = await GlobalMessageManager.route_group_request(
+            "did", "g", "members", {"req_did": "a"}, None)
+        assert listing["version"] == 0
+
+        runner.agents["a"] = _agent("a")
+        runner.agents["b"] = _agent("b")
+        await runner.remove_member("a")
+        diff = await GlobalMessageManager.route_group_request(
+            "did", "g", "members", {"req_did": "b", "action": "diff", "since_version": "1"}, None)
+        assert diff["status"] == "success" and diff["version"] == runner.membership_version == 3
+        assert [m["id"] for m in diff["joined"]] == ["b"] and diff["left"] == ["a"]
+
+    @pytest.mark.asyncio
+    async def test_batch_orders_ops_per_group(self):
+        class RecordingRunner(GroupRunner):
+            def __init__(self, group_id):
+                super().__init__(group_id)
+                self.received = []
+
+            async def on_message(self, message):
+                self.received.append(message.content)
+                return None
+
+        for group_id in ("g1", "g2"):
+            GlobalGroupManager.register_runner(group_id, RecordingRunner)
+
+        ops = [
+            {"op": "join", "group_id": "g1"},
+            {"op": "join", "group_id": "g2", "name": "A"},
+            {"op": "message", "group_id": "g1", "content": 1},
+            {"op": "message", "group_id": "g2", "content": "x"},
+            {"op": "message", "group_id": "g1", "content": 2},
+            {"op": "join", "group_id": "missing"},
+            {"op": "connect", "group_id": "g1"},
+            {"op": "leave", "group_id": "g2"},
+        ]
+        results = await GlobalMessageManager.route_group_batch("did", ops, "agent-a")
+        assert [r["status"] for r in results] == [
+            "success", "success", "success", "success", "success", "error", "error", "success"]
+        assert GlobalGroupManager.get_runner("g1").received == [1, 2]
+        assert GlobalGroupManager.get_runner("g2").received == ["x"]
+        assert GlobalGroupManager.get_runner("g1").is_member("agent-a")
+        assert not GlobalGroupManager.get_runner("g2").is_member("agent-a")
+        assert GlobalGroupManager.get_group_stats("g1")["message_count"] == 2
+
+        with pytest.raises(ValueError):
+            await GlobalMessageManager.route_group_batch("did", [{}] * (MAX_GROUP_BATCH + 1), "a")
+
+    @pytest.mark.asyncio
+    async def test_batch_over_websocket(self):
+        GlobalGroupManager.register_runner("g1", GroupRunner)
+        frames = []
+
+        async def send(data):
+            frames.append(json.loads(data))
+
+        session = GroupSocketSession("did", "agent-a", send)
+        await session.handle_frame(json.dumps({"op": "batch", "id": 7, "ops": [
+            {"op": "join", "group_id": "g1"},
+            {"op": "members", "group_id": "g1", "action": "diff", "since_version": 0},
+        ]}))
+        assert frames[0]["id"] == 7
+        join_result, diff = frames[0]["result"]["results"]
+        assert join_result["status"] == "success"
+        assert [m["id"] for m in diff["joined"]] == ["agent-a"] and diff["version"] == 1
@@ -0,0 +1,54 @@
+"""
+WebSocket 升级认证测试
+
+群组 WebSocket 路由位于默认豁免的 /agent/api/* 之下，升级时仍必须通过 DID/Bearer 认证
+"""
+
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from anp_foundation.config import UnifiedConfig, set_global_config
+from anp_foundation.config import unified_config
+
+REPO_ROOT = Path(__file__).resolve().parents[5]
+GROUP_WS_PATH = "/agent/api/did:wba:localhost%3A9527:wba:user:0000000000000001/group/ws"
+
+
+@pytest.fixture(scope="module")
+def client():
+    """使用仓库默认配置（豁免路径包含 /agent/api/*）挂载智能体路由"""
+    previous = unified_config._global_config
+    if previous is None:
+        set_global_config(UnifiedConfig(
+            config_file=str(REPO_ROOT / "unified_config.default.yaml"), app_root=str(REPO_ROOT)))
+    try:
+        from anp_server.baseline.anp_router_baseline import router_agent
+        from anp_servicepoint.auth_exempt_handler import is_exempt
+
+        assert is_exempt(GROUP_WS_PATH)
+        app = FastAPI()
+        app.include_router(router_agent.router)
+        yield TestClient(app)
+    finally:
+        unified_config._global_config = previous
+
+
+def test_unauthenticated_upgrade_is_rejected(client):
+    """测试豁免路径下的群组 WebSocket 升级没有认证头时被拒绝，查询参数中的 req_did 不被信任"""
+    with client.websocket_connect(f"{GROUP_WS_PATH}?req_did=did:wba:localhost%3A9527:wba:user:evil") as ws:
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            ws.receive_text()
+    assert excinfo.value.code == 4401
+
+
+def test_invalid_bearer_token_is_rejected(client):
+    """测试无效的 Bearer 令牌不能通过升级认证"""
+    headers = {"Authorization": "Bearer invalid-token", "req_did": "did:wba:localhost%3A9527:wba:user:evil"}
+    with client.websocket_connect(f"{GROUP_WS_PATH}?req_did=did:wba:localhost%3A9527:wba:user:evil", headers=headers) as ws:
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            ws.receive_text()
+    assert excinfo.value.code == 4401
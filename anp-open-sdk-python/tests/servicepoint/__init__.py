@@ -0,0 +1,3 @@
+"""
+服务端点模块测试
+"""
\ No newline at end of file
@@ -0,0 +1,3 @@
+"""
+核心服务处理测试
+"""
\ No newline at end of file
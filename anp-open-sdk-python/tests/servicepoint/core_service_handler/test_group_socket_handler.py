@@ -0,0 +1,208 @@
+"""
+群组 WebSocket 会话测试
+
+测试 GroupSocketSession 在一条连接上多路复用多个群组、二进制帧与 last_event_id 续传，
+以及 GroupSocketTransport 客户端经真实 WebSocket 连接的请求匹配与事件分发
+"""
+
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+
+from anp_runtime.anp_service.anp_sdk_group_fanout import LISTENER_REPLACED
+from anp_runtime.anp_service.anp_sdk_group_socket import GroupSocketTransport
+from anp_runtime.global_router_agent_message import GlobalGroupManager, GroupRunner
+from anp_servicepoint.core_service_handler.group_socket_handler import GroupSocketSession
+
+
+class EchoRunner(GroupRunner):
+    """把收到的消息广播给所有成员"""
+
+    async def on_message(self, message):
+        await self.broadcast_message(message.to_dict())
+        return None
+
+
+class FrameCollector:
+    """记录会话发出的帧"""
+
+    def __init__(self):
+        self.frames = []
+        self._event = asyncio.Event()
+
+    async def send(self, data):
+        self.frames.append(data)
+        self._event.set()
+
+    async def wait_for(self, predicate, timeout: float = 1.0):
+        async def _wait():
+            while True:
+                for frame in self.frames:
+                    obj = json.loads(frame)
+                    if predicate(obj):
+                        return obj
+                self._event.clear()
+                await self._event.wait()
+        return await asyncio.wait_for(_wait(), timeout)
+
+
+class TestGroupSocketSession:
+    """服务端会话测试"""
+
+    def setup_method(self):
+        GlobalGroupManager.register_runner("g1", EchoRunner)
+        GlobalGroupManager.register_runner("g2", EchoRunner)
+
+    def teardown_method(self):
+        GlobalGroupManager.clear_groups()
+
+    @pytest.mark.asyncio
+    async def test_multiplexes_groups(self):
+        collector = FrameCollector()
+        session = GroupSocketSession("did", "agent-a", collector.send)
+        try:
+            for i, group_id in enumerate(("g1", "g2")):
+                await session.handle_frame(json.dumps({"op": "join", "id": i, "group_id": group_id}))
+                await session.handle_frame(json.dumps({"op": "subscribe", "id": 10 + i, "group_id": group_id}))
+            assert all(isinstance(f, str) for f in collector.frames)
+            assert json.loads(collector.frames[0])["result"]["status"] == "success"
+
+            await session.handle_frame(json.dumps({"op": "message", "id": 20, "group_id": "g2", "content": "hi"}))
+            await session.handle_frame(json.dumps({"op": "message", "id": 21, "group_id": "g1", "content": "yo"}))
+            g2_event = await collector.wait_for(lambda f: f["op"] == "event" and f["group_id"] == "g2")
+            g1_event = await collector.wait_for(lambda f: f["op"] == "event" and f["group_id"] == "g1")
+            assert g2_event["message"]["content"] == "hi" and g2_event["seq"] == 1
+            assert g1_event["message"]["content"] == "yo"
+
+            members = await collector.wait_for(lambda f: f.get("id") == 20)
+            assert members["result"]["status"] == "success"
+            assert len(GlobalGroupManager.get_runner("g1").listeners) == 1
+        finally:
+            await session.close()
+        assert GlobalGroupManager.get_runner("g1").listeners == {}
+
+    @pytest.mark.asyncio
+    async def test_binary_frames_share_event_encoding(self):
+        collector = FrameCollector()
+        session = GroupSocketSession("did", "agent-a", collector.send, binary=True)
+        try:
+            await session.handle_frame(b'{"op": "join", "id": 1, "group_id": "g1"}')
+            await session.handle_frame(b'{"op": "subscribe", "id": 2, "group_id": "g1"}')
+            event = await GlobalGroupManager.get_runner("g1").broadcast_message({"content": 1})
+            await collector.wait_for(lambda f: f["op"] == "event")
+            assert all(isinstance(f, bytes) for f in collector.frames)
+            assert collector.frames[-1] is event.ws_frame
+        finally:
+            await session.close()
+
+    @pytest.mark.asyncio
+    async def test_resume_and_errors(self):
+        collector = FrameCollector()
+        session = GroupSocketSession("did", "agent-a", collector.send)
+        runner = GlobalGroupManager.get_runner("g1")
+        try:
+            await session.handle_frame('{"op": "subscribe", "id": 1, "group_id": "g1"}')
+            assert json.loads(collector.frames[-1])["result"]["status"] == "error"
+
+            await session.handle_frame('{"op": "join", "id": 2, "group_id": "g1"}')
+            for i in range(3):
+                await runner.broadcast_message({"content": i})
+            await session.handle_frame(
+                '{"op": "subscribe", "id": 3, "group_id": "g1", "last_event_id": 1}')
+            await collector.wait_for(lambda f: f.get("seq") == 3)
+            seqs = [json.loads(f).get("seq") for f in collector.frames if b'"event"' in f.encode()]
+            assert seqs == [2, 3]
+
+            await session.handle_frame("not json")
+            await session.handle_frame('{"op": "bogus", "id": 4, "group_id": "g1"}')
+            assert json.loads(collector.frames[-2])["op"] == "error"
+            assert json.loads(collector.frames[-1])["message"] == "Unknown op: bogus"
+        finally:
+            await session.close()
+
+    @pytest.mark.asyncio
+    async def test_other_transport_replaces_subscription(self):
+        """测试同一 agent 经另一传输（SSE）监听时，WebSocket 订阅被明确取消而不是静默停止"""
+        collector = FrameCollector()
+        session = GroupSocketSession("did", "agent-a", collector.send)
+        runner = GlobalGroupManager.get_runner("g1")
+        try:
+            await session.handle_frame('{"op": "join", "id": 1, "group_id": "g1"}')
+            await session.handle_frame('{"op": "subscribe", "id": 2, "group_id": "g1"}')
+            sse_queue = runner.register_listener("agent-a")
+            frame = await collector.wait_for(lambda f: f["op"] == "unsubscribed")
+            assert frame == {"op": "unsubscribed", "group_id": "g1", "reason": LISTENER_REPLACED}
+
+            await runner.broadcast_message({"content": "hi"})
+            assert sse_queue.get_nowait().message == {"content": "hi"}
+        finally:
+            await session.close()
+        assert runner.listeners == {"agent-a": sse_queue}
+
+
+class TestGroupSocketTransport:
+    """客户端传输经真实 WebSocket 连接的测试"""
+
+    def teardown_method(self):
+        GlobalGroupManager.clear_groups()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("binary", [False, True])
+    async def test_request_and_events(self, binary):
+        GlobalGroupManager.register_runner("g1", EchoRunner)
+        GlobalGroupManager.register_runner("g2", EchoRunner)
+
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            is_binary = request.query.get("encoding") == "binary"
+            session = GroupSocketSession(
+                "did", request.query["req_did"],
+                send=lambda data: ws.send_bytes(data) if isinstance(data, bytes) else ws.send_str(data),
+                binary=is_binary
+            )
+            await session.send_json({"op": "welcome", "req_did": session.req_did})
+            async for msg in ws:
+                await session.handle_frame(msg.data)
+            await session.close()
+            return ws
+
+        app = web.Application()
+        app.router.add_get("/ws", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        transport = GroupSocketTransport(f"http://127.0.0.1:{port}/ws", "agent-a", binary=binary)
+        received = {"g1": [], "g2": []}
+        try:
+            await transport.connect()
+            assert transport.welcome["req_did"] == "agent-a"
+
+            joined = await asyncio.gather(*(transport.request("join", g) for g in ("g1", "g2")))
+            assert [r["status"] for r in joined] == ["success", "success"]
+            for group_id in ("g1", "g2"):
+                async def on_event(message, group_id=group_id):
+                    received[group_id].append(message["content"])
+                assert (await transport.subscribe(group_id, on_event))["status"] == "success"
+
+            await transport.request("message", "g1", content="a")
+            await transport.request("message", "g2", content="b")
+            await transport.request("message", "g1", content="c")
+            for _ in range(100):
+                if len(received["g1"]) == 2 and len(received["g2"]) == 1:
+                    break
+                await asyncio.sleep(0.01)
+            assert received == {"g1": ["a", "c"], "g2": ["b"]}
+            assert transport._last_seq == {"g1": 2, "g2": 1}
+
+            members = await transport.request("members", "g2")
+            assert [m["id"] for m in members["members"]] == ["agent-a"]
+            assert (await transport.unsubscribe("g1"))["status"] == "success"
+        finally:
+            await transport.close()
+            await runner.cleanup()
@@ -0,0 +1,205 @@
+"""
+transformer_server 转发客户端测试
+
+测试 CircuitBreaker 状态流转以及 TransformerProxy 的转发、熔断与指标
+"""
+
+import asyncio
+import socket
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+from anp_servicepoint.core_service_handler import transformer_proxy as proxy_module
+from anp_servicepoint.core_service_handler.transformer_proxy import (
+    CircuitBreaker,
+    TransformerProxy,
+    close_transformer_proxy
+)
+
+
+def _unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@asynccontextmanager
+async def transformer_server():
+    """启动一个模拟的 transformer_server"""
+    calls = []
+
+    async def handle_api(request):
+        calls.append(await request.json())
+        return web.json_response({"status": "success", "path": request.match_info["tail"]})
+
+    async def handle_error(request):
+        return web.json_response({"status": "error"}, status=503)
+
+    async def handle_slow(request):
+        await asyncio.sleep(1)
+        return web.json_response({"status": "success"})
+
+    async def handle_stream(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b"data: {\"n\":1}\n\n")
+        await response.write(b"data: {\"n\":2}\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/agent/api/{tail:.*}", handle_api)
+    app.router.add_post("/broken", handle_error)
+    app.router.add_post("/slow", handle_slow)
+    app.router.add_get("/stream", handle_stream)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = _unused_port()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    try:
+        yield f"http://127.0.0.1:{port}", calls
+    finally:
+        await runner.cleanup()
+
+
+class TestCircuitBreaker:
+    """测试熔断器"""
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow_request()
+        assert breaker.short_circuited == 1
+
+    def test_half_open_single_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        # 探测请求未完成前不再放行
+        assert not breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow_request()
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=0)
+        for _ in range(3):
+            breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.open_count == 2
+
+    def test_abandoned_probe_allows_next(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.abandon_probe()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request()
+
+
+class TestTransformerProxy:
+    """测试转发客户端"""
+
+    @pytest.mark.asyncio
+    async def test_forward_reuses_session(self):
+        async with transformer_server() as (base_url, calls):
+            proxy = TransformerProxy(base_url)
+            try:
+                ok, result = await proxy.forward("api", "/agent/api/did/hello", {"a": 1}, {"req_did": "x"})
+                assert ok and result == {"status": "success", "path": "did/hello"}
+                session = proxy._session
+                ok, _ = await proxy.forward("api", "/agent/api/did/hello", {"a": 2})
+                assert ok
+                assert proxy._session is session
+                assert calls == [{"a": 1}, {"a": 2}]
+                metrics = proxy.get_metrics()
+                assert metrics["routes"]["api"]["count"] == 2
+                assert metrics["breaker"]["state"] == "closed"
+            finally:
+                await proxy.close()
+
+    @pytest.mark.asyncio
+    async def test_server_errors_open_breaker(self):
+        async with transformer_server() as (base_url, _):
+            proxy = TransformerProxy(base_url, failure_threshold=2, recovery_timeout=60)
+            try:
+                for _ in range(2):
+                    ok, message = await proxy.forward("group", "/broken", {})
+                    assert not ok and "503" in message
+                    # 错误响应正文随错误描述返回，供 API 路由的 details 字段使用
+                    assert '"error"' in message.details
+                assert proxy.breaker.state == CircuitBreaker.OPEN
+                ok, message = await proxy.forward("group", "/broken", {})
+                assert not ok and "熔断" in message
+                assert proxy.get_metrics()["routes"]["group"]["errors"] == 2
+            finally:
+                await proxy.close()
+
+    @pytest.mark.asyncio
+    async def test_unreachable_short_circuits(self):
+        proxy = TransformerProxy(f"http://127.0.0.1:{_unused_port()}", failure_threshold=1,
+                                 recovery_timeout=60)
+        try:
+            ok, _ = await proxy.forward("message", "/agent/message/did/post", {})
+            assert not ok
+            started = time.perf_counter()
+            ok, message = await proxy.forward("message", "/agent/message/did/post", {})
+            assert not ok and "熔断" in message
+            assert time.perf_counter() - started < 0.05
+        finally:
+            await proxy.close()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_releases_breaker(self):
+        """半开状态的探测请求被取消后，下一个请求仍能探测并关闭熔断器"""
+        async with transformer_server() as (base_url, _):
+            proxy = TransformerProxy(base_url, failure_threshold=1, recovery_timeout=0)
+            try:
+                proxy.breaker.record_failure()
+                probe = asyncio.create_task(proxy.forward("api", "/slow", {}))
+                await asyncio.sleep(0.1)
+                assert proxy.breaker.state == CircuitBreaker.HALF_OPEN
+                probe.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await probe
+
+                ok, _ = await proxy.forward("api", "/agent/api/did/hello", {})
+                assert ok
+                assert proxy.breaker.state == CircuitBreaker.CLOSED
+            finally:
+                await proxy.close()
+
+    @pytest.mark.asyncio
+    async def test_forward_stream_passthrough(self):
+        async with transformer_server() as (base_url, _):
+            proxy = TransformerProxy(base_url)
+            try:
+                ok, response = await proxy.forward_stream("stream", "/stream")
+                assert ok
+                assert response.media_type == "text/event-stream"
+                body = b"".join([chunk async for chunk in response.body_iterator])
+                assert body == b"data: {\"n\":1}\n\ndata: {\"n\":2}\n\n"
+            finally:
+                await proxy.close()
+
+    @pytest.mark.asyncio
+    async def test_close_singleton(self, monkeypatch):
+        """测试服务端关闭时释放单例的连接池，之后重新创建"""
+        proxy = TransformerProxy("http://127.0.0.1:1")
+        monkeypatch.setattr(proxy_module, "_transformer_proxy", proxy)
+        session = proxy._get_session()
+        await close_transformer_proxy()
+        assert session.closed
+        assert proxy_module._transformer_proxy is None
+        await close_transformer_proxy()
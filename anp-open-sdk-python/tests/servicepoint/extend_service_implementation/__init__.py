@@ -0,0 +1 @@
+"""extend_service_implementation 测试"""
@@ -0,0 +1 @@
+"""did_host 测试"""
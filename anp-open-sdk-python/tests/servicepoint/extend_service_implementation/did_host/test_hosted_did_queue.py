@@ -0,0 +1,283 @@
+"""
+托管DID申请队列测试
+
+测试 HostedDIDQueueManager 的日志持久化、状态流转、排队位置，
+HostedDIDResultManager 的索引查询、批量确认与清理，check_hosted_did_result 的等待参数校验，
+以及 HostedDIDProcessor 由 add_request 触发的事件驱动处理
+"""
+
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import anp_foundation.domain
+from anp_servicepoint.extend_service_handler.host_service_handler import check_hosted_did_result
+from anp_servicepoint.extend_service_implementation.did_host import hosted_did_queue_manager as queue_module
+from anp_servicepoint.extend_service_implementation.did_host import hosted_did_result_manager as result_module
+from anp_servicepoint.extend_service_implementation.did_host.hosted_did_processor import HostedDIDProcessor
+from anp_servicepoint.extend_service_implementation.did_host.hosted_did_queue_manager import (
+    HostedDIDQueueManager,
+    RequestStatus
+)
+from anp_servicepoint.extend_service_implementation.did_host.hosted_did_result_manager import HostedDIDResultManager
+
+HOST, PORT = "queue.test", 9999
+REQUESTER = "did:wba:localhost%3A9527:wba:user:abcdef0123456789"
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """把域名数据目录重定向到临时目录"""
+    domain_manager = SimpleNamespace(get_all_data_paths=lambda host, port: {
+        'base_path': tmp_path,
+        'user_did_path': tmp_path / 'anp_users',
+        'user_hosted_path': tmp_path / 'anp_users_hosted',
+        'agents_cfg_path': tmp_path / 'agents_config_py'
+    })
+    for module in (queue_module, result_module, anp_foundation.domain):
+        monkeypatch.setattr(module, "get_domain_manager", lambda: domain_manager)
+    yield tmp_path
+    for manager_cls in (HostedDIDQueueManager, HostedDIDResultManager):
+        manager = manager_cls._instances.get((HOST, PORT))
+        if manager is not None:
+            manager.close()
+
+
+def _dead_owner() -> str:
+    """本机上一个已退出进程的认领标识"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}"
+
+
+def _request(did_suffix: str = "1"):
+    return SimpleNamespace(
+        requester_did=REQUESTER,
+        did_document={"id": f"did:wba:{HOST}:user:{did_suffix}"},
+        callback_info={}
+    )
+
+
+class TestHostedDIDQueueManager:
+    """队列管理器测试"""
+
+    @pytest.mark.asyncio
+    async def test_add_and_move_status(self, data_dir):
+        manager = HostedDIDQueueManager.create_for_domain(HOST, PORT)
+        assert HostedDIDQueueManager.create_for_domain(HOST, PORT) is manager
+
+        for i in range(3):
+            assert await manager.add_request(f"req-{i}", _request(str(i)))
+
+        assert manager.get_status_counts()[RequestStatus.PENDING.value] == 3
+        assert [r["request_id"] for r in await manager.get_pending_requests()] == ["req-0", "req-1", "req-2"]
+        assert await manager.get_queue_position("req-2") == 3
+
+        assert await manager.move_request_status("req-0", RequestStatus.PENDING, RequestStatus.PROCESSING)
+        # 状态不匹配时不允许重复认领
+        assert not await manager.move_request_status("req-0", RequestStatus.PENDING, RequestStatus.PROCESSING)
+        assert await manager.get_queue_position("req-2") == 2
+        assert await manager.get_queue_position("req-0") is None
+
+        assert await manager.move_request_status("req-0", RequestStatus.PROCESSING, RequestStatus.COMPLETED, "done")
+        status = await manager.get_request_status("req-0")
+        assert status["status"] == "completed"
+        assert status["message"] == "done"
+        assert status["requester_did"] == REQUESTER
+        assert status["process_time"] is not None and status["complete_time"] is not None
+        assert manager.get_status_counts() == {"pending": 2, "processing": 0, "completed": 1, "failed": 0}
+
+        # 不按入队顺序认领时，排在前面的待处理申请仍计入位置
+        assert await manager.move_request_status("req-2", RequestStatus.PENDING, RequestStatus.PROCESSING)
+        assert await manager.add_request("req-3", _request("3"))
+        assert await manager.get_queue_position("req-3") == 2
+
+    @pytest.mark.asyncio
+    async def test_journal_survives_restart(self, data_dir):
+        manager = HostedDIDQueueManager.create_for_domain(HOST, PORT)
+        await manager.add_request("req-a", _request("a"))
+        await manager.add_request("req-b", _request("b"))
+        await manager.move_request_status("req-a", RequestStatus.PENDING, RequestStatus.PROCESSING)
+        manager.close()
+
+        reopened = HostedDIDQueueManager.create_for_domain(HOST, PORT)
+        assert reopened is not manager
+        assert reopened.get_status_counts()["processing"] == 1
+        # 认领的进程仍在运行（本进程）：不重新排队
+        assert await reopened.requeue_interrupted() == 0
+
+        with reopened._lock, reopened._conn:
+            reopened._conn.execute("UPDATE hosted_did_requests SET owner = ?", (_dead_owner(),))
+        assert await reopened.requeue_interrupted() == 1
+        assert await reopened.get_queue_position("req-a") == 1
+        assert await reopened.get_queue_position("req-b") == 2
+
+    @pytest.mark.asyncio
+    async def test_requeue_keeps_live_claims(self, data_dir, monkeypatch):
+        """测试只有认领进程已退出或无法确认且处理超时的申请被重新排队"""
+        manager = HostedDIDQueueManager.create_for_domain(HOST, PORT)
+        for request_id in ("live", "dead", "remote", "legacy"):
+            await manager.add_request(request_id, _request(request_id))
+            await manager.move_request_status(request_id, RequestStatus.PENDING, RequestStatus.PROCESSING)
+        now = queue_module.time.time()
+        stale = now - HostedDIDQueueManager.STALE_PROCESSING_SECONDS - 1
+        with manager._lock, manager._conn:
+            manager._conn.executemany(
+                "UPDATE hosted_did_requests SET owner = ?, process_time = ? WHERE request_id = ?",
+                [(_dead_owner(), now, "dead"), ("other-host:1", now, "remote"), (None, stale, "legacy")]
+            )
+        # 模拟另一个进程启动：原认领进程（本进程）仍在运行
+        monkeypatch.setattr(manager, "owner", "restarted:1")
+
+        assert await manager.requeue_interrupted() == 2
+        assert [r["request_id"] for r in await manager.get_pending_requests()] == ["dead", "legacy"]
+        assert manager.get_status_counts()["processing"] == 2
+
+    @pytest.mark.asyncio
+    async def test_migrates_legacy_directories(self, data_dir):
+        legacy_dir = data_dir / "hosted_did_queue" / "pending"
+        legacy_dir.mkdir(parents=True)
+        with open(legacy_dir / "old-req.json", "w", encoding="utf-8") as f:
+            json.dump({"request_id": "old-req", "requester_did": REQUESTER,
+                       "did_document": {"id": "x"}, "submit_time": 1.0}, f)
+
+        manager = HostedDIDQueueManager.create_for_domain(HOST, PORT)
+        assert not legacy_dir.exists()
+        status = await manager.get_request_status("old-req")
+        assert status["status"] == "pending"
+        assert (await manager.get_request("old-req"))["did_document"] == {"id": "x"}
+
+
+class TestHostedDIDResultManager:
+    """结果管理器测试"""
+
+    @pytest.mark.asyncio
+    async def test_results_indexed_by_requester(self, data_dir):
+        manager = HostedDIDResultManager.create_for_domain(HOST, PORT)
+        other = "did:wba:localhost%3A9527:wba:user:ffff000011112222"
+        await manager.publish_result("1aaaaaaa-1", REQUESTER, {"id": "did:1"})
+        await manager.publish_result("2bbbbbbb-2", other, {}, success=False, error_message="bad")
+        await manager.publish_result("3ccccccc-3", REQUESTER, {"id": "did:3"})
+
+        results = await manager.get_results_for_requester("abcdef0123456789")
+        assert [r["request_id"] for r in results] == ["3ccccccc-3", "1aaaaaaa-1"]
+        assert results[0]["hosted_did_document"] == {"id": "did:3"}
+        failed = await manager.get_results_for_requester("ffff000011112222")
+        assert failed[0]["error_message"] == "bad"
+        assert await manager.get_result_statistics() == {
+            "pending_count": 3, "acknowledged_count": 0, "total_count": 3
+        }
+
+    @pytest.mark.asyncio
+    async def test_batch_acknowledge_and_cleanup(self, data_dir):
+        manager = HostedDIDResultManager.create_for_domain(HOST, PORT)
+        await manager.publish_result("1aaaaaaa-1", REQUESTER, {"id": "did:1"})
+        await manager.publish_result("2bbbbbbb-2", REQUESTER, {"id": "did:2"})
+        result_ids = [r["result_id"] for r in await manager.get_results_for_requester("abcdef0123456789")]
+
+        assert await manager.acknowledge_results(result_ids + ["missing", result_ids[0]]) == 2
+        assert not await manager.acknowledge_result(result_ids[0])
+        assert await manager.get_results_for_requester("abcdef0123456789") == []
+        stats = await manager.get_result_statistics()
+        assert stats["pending_count"] == 0 and stats["acknowledged_count"] == 2
+
+        assert await manager.cleanup_old_results(max_age_days=1) == 0
+        assert await manager.cleanup_old_results(max_age_days=-1) == 2
+        assert (await manager.get_result_statistics())["total_count"] == 0
+
+    @pytest.mark.asyncio
+    async def test_republish_keeps_counts(self, data_dir, monkeypatch):
+        """测试同一秒内重复发布同一请求的结果时替换旧结果，状态计数与结果库一致"""
+        monkeypatch.setattr(result_module.time, "time", lambda: 1000.0)
+        manager = HostedDIDResultManager.create_for_domain(HOST, PORT)
+        await manager.publish_result("1aaaaaaa-1", REQUESTER, {"id": "did:1"})
+        await manager.publish_result("1aaaaaaa-1", REQUESTER, {"id": "did:1"})
+        assert await manager.get_result_statistics() == {
+            "pending_count": 1, "acknowledged_count": 0, "total_count": 1
+        }
+
+        [result] = await manager.get_results_for_requester("abcdef0123456789")
+        assert await manager.acknowledge_result(result["result_id"])
+        await manager.publish_result("1aaaaaaa-1", REQUESTER, {"id": "did:1"})
+        assert await manager.get_result_statistics() == {
+            "pending_count": 1, "acknowledged_count": 0, "total_count": 1
+        }
+
+    @pytest.mark.asyncio
+    async def test_wait_for_results_wakes_on_publish(self, data_dir):
+        manager = HostedDIDResultManager.create_for_domain(HOST, PORT)
+        assert await manager.wait_for_results("abcdef0123456789", timeout=0.05) == []
+
+        waiter = asyncio.create_task(manager.wait_for_results("abcdef0123456789", timeout=5))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await manager.publish_result("1aaaaaaa-1", REQUESTER, {"id": "did:1"})
+        results = await asyncio.wait_for(waiter, 1)
+        assert [r["request_id"] for r in results] == ["1aaaaaaa-1"]
+        assert manager._waiters == {}
+
+    @pytest.mark.asyncio
+    async def test_migrates_legacy_directories(self, data_dir):
+        legacy_dir = data_dir / "hosted_did_results" / "pending"
+        legacy_dir.mkdir(parents=True)
+        with open(legacy_dir / "abcdef0123456789_1_old.json", "w", encoding="utf-8") as f:
+            json.dump({"result_id": "abcdef0123456789_1_old", "request_id": "old",
+                       "requester_id": "abcdef0123456789", "success": True, "created_time": 1.0}, f)
+
+        manager = HostedDIDResultManager.create_for_domain(HOST, PORT)
+        assert not legacy_dir.exists()
+        assert len(await manager.get_results_for_requester("abcdef0123456789")) == 1
+        assert (await manager.get_result_statistics())["pending_count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_check_rejects_non_finite_wait(self, data_dir):
+        """测试长轮询等待秒数为 NaN 或无穷大时直接拒绝"""
+        for wait in (float("nan"), float("inf")):
+            success, result = await asyncio.wait_for(
+                check_hosted_did_result("abcdef0123456789", HOST, PORT, wait=wait), 1)
+            assert not success and "wait" in result["error"]
+
+
+class TestHostedDIDProcessor:
+    """事件驱动处理器测试"""
+
+    @pytest.mark.asyncio
+    async def test_processes_on_add_request(self, data_dir):
+        processor = HostedDIDProcessor.create_for_domain(HOST, PORT, worker_count=2)
+        published = []
+
+        async def fake_business_logic(request_data):
+            return True, {"id": request_data["did_document"]["id"]}, ""
+
+        async def fake_publish(**kwargs):
+            published.append(kwargs["request_id"])
+
+        processor.perform_business_logic = fake_business_logic
+        processor.result_manager.publish_result = fake_publish
+
+        queue_manager = processor.queue_manager
+        await queue_manager.add_request("before-start", _request("0"))
+
+        task = asyncio.create_task(processor.start_processing())
+        try:
+            for i in range(5):
+                await queue_manager.add_request(f"live-{i}", _request(str(i + 1)))
+
+            for _ in range(100):
+                if len(published) == 6:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            processor.stop_processing()
+            await task
+
+        assert sorted(published) == sorted(["before-start"] + [f"live-{i}" for i in range(5)])
+        stats = await processor.get_processing_statistics()
+        assert stats["queue_statistics"]["completed"] == 6
+        assert stats["queue_statistics"]["pending"] == 0
+        assert stats["processor_status"] == "stopped"